@@ -25,11 +25,15 @@ __license__     = """
 import sys
 import pdb 
 import math 
+import heapq
+import multiprocessing
 from collections import deque
+import numpy as np
 
 import dta
+from dta.DtaError import DtaError
 from dta.Utils import isRightTurn, lineSegmentsCross
-from itertools import izip, tee, cycle, ifilter, ifilterfalse
+from itertools import count, izip, tee, cycle, ifilter, ifilterfalse
 
 def all2(seq, pred=None):
     "Returns True if pred(x) is true for every element in the iterable"
@@ -58,17 +62,16 @@ def pairwise(iterable):
 def dfs(net, root=None):
     """
     Non-Recursive depth first search algorithm with 
-    pre and post orderings. At the end of the execution
-    all nodes in the network have a pre and post numbers
-    and predecessor nodes assigned to them.
+    pre and post orderings. Returns the tuple of dictionaries (*pre*, *post*, *pred*)
+    mapping each node in the network to its pre and post numbers and to its predecessor node
+    (None for the roots of the search).
     """
     
     time = 0
-    for node in net.iterNodes():
-        node.pre = 0
-        node.post = 0
-        node.pred = None
-        node.visited = False 
+    pre     = dict((node, 0) for node in net.iterNodes())
+    post    = dict((node, 0) for node in net.iterNodes())
+    pred    = dict((node, None) for node in net.iterNodes())
+    visited = set()
 
     allNodes = [node for node in net.iterNodes()]
     if root:
@@ -79,45 +82,167 @@ def dfs(net, root=None):
 
     for node in allNodes:
         
-        if node.pre == 0:
+        if pre[node] == 0:
             nodesToExamine.append(node)
 
         while nodesToExamine:        
             pivot = nodesToExamine[-1]
-            if pivot.visited == False:            
+            if pivot not in visited:            
                 for downNode in pivot.iterDownstreamNodes():                
-                    if downNode.visited == False:                    
+                    if downNode not in visited:                    
                         nodesToExamine.append(downNode)
-                        downNode.pred = pivot 
-                pivot.visited = True
+                        pred[downNode] = pivot 
+                visited.add(pivot)
                 time += 1
-                pivot.pre = time 
-            elif pivot.post > 0:
+                pre[pivot] = time 
+            elif post[pivot] > 0:
                 nodesToExamine.pop() 
             else:
                 time += 1
-                pivot.post = time
+                post[pivot] = time
+
+    return pre, post, pred
 
 def getMetaGraph(net):
     """
-    Return a network that represents the meta graph of the input network. 
-    At the end of the execution of this algorithm each node points to 
-    its metanode
+    Return the meta graph (condensation) of the input network, whose metanodes are the 
+    strongly connected components of the network, as the tuple (*nodeToMetaNode*, *metaNodeSuccessors*):
+    
+     * *nodeToMetaNode* maps each node of the network to the index of its metanode
+     * *metaNodeSuccessors* is the list of the sets of the metanodes that can be reached from each
+       metanode with one link
+    
+    The strongly connected components are found with a non-recursive version of Tarjan's algorithm,
+    which numbers the metanodes in reverse topological order: every link between two metanodes goes
+    from a metanode to one with a lower index.
+    """
+    nodeToMetaNode      = {}
+    metaNodeSuccessors  = []
+
+    preorder    = {}
+    lowlink     = {}
+    stack       = []
+    onStack     = set()
+    time        = 0
+
+    for root in net.iterNodes():
+        if root in preorder: continue
+
+        preorder[root] = lowlink[root] = time
+        time += 1
+        stack.append(root)
+        onStack.add(root)
+        nodesToExamine = [(root, root.iterDownstreamNodes())]
+
+        while nodesToExamine:
+            pivot, downNodes = nodesToExamine[-1]
+            for downNode in downNodes:
+                if downNode not in preorder:
+                    preorder[downNode] = lowlink[downNode] = time
+                    time += 1
+                    stack.append(downNode)
+                    onStack.add(downNode)
+                    nodesToExamine.append((downNode, downNode.iterDownstreamNodes()))
+                    break
+                elif downNode in onStack:
+                    lowlink[pivot] = min(lowlink[pivot], preorder[downNode])
+            else:
+                # all the downstream nodes of pivot have been examined
+                nodesToExamine.pop()
+                if nodesToExamine:
+                    upNode = nodesToExamine[-1][0]
+                    lowlink[upNode] = min(lowlink[upNode], lowlink[pivot])
+
+                if lowlink[pivot] == preorder[pivot]:
+                    metaNode = len(metaNodeSuccessors)
+                    metaNodeSuccessors.append(set())
+                    while True:
+                        node = stack.pop()
+                        onStack.remove(node)
+                        nodeToMetaNode[node] = metaNode
+                        if node == pivot: break
+
+    for node, metaNode in nodeToMetaNode.iteritems():
+        for downNode in node.iterDownstreamNodes():
+            if nodeToMetaNode[downNode] != metaNode:
+                metaNodeSuccessors[metaNode].add(nodeToMetaNode[downNode])
+
+    return nodeToMetaNode, metaNodeSuccessors
+
+class ReachabilityIndex(object):
+    """
+    Answers :py:func:`hasPath` queries in constant time for a network that doesn't change.
+    
+    It is built once from the meta graph of the network (see :py:func:`getMetaGraph`): for each metanode
+    it keeps the set of the metanodes reachable from it as the bits of an integer, which are
+    the union of the sets of its successors, so a query is the lookup of one bit.  Use
+    :py:meth:`ReachabilityIndex.getReachabilityMatrix` for many origins and destinations at once.
     """
-    pass 
+
+    def __init__(self, net):
+        """
+        Constructor.  Builds the index for the :py:class:`Network` *net*.
+        """
+        self._nodeToMetaNode, metaNodeSuccessors = getMetaGraph(net)
+        
+        # the successors of a metanode have lower indices so they are done first
+        self._reachable = []
+        for metaNode, successors in enumerate(metaNodeSuccessors):
+            reachable = 1 << metaNode
+            for successor in successors:
+                reachable |= self._reachable[successor]
+            self._reachable.append(reachable)
+
+    def getNumMetaNodes(self):
+        """
+        Returns the number of metanodes (strongly connected components) of the network.
+        """
+        return len(self._reachable)
+
+    def getMetaNode(self, node):
+        """
+        Returns the index of the metanode of *node*.
+        """
+        return self._nodeToMetaNode[node]
+
+    def hasPath(self, originNode, destNode):
+        """
+        Return true if the network has a path from the origin node to the destination node
+        """
+        return bool((self._reachable[self._nodeToMetaNode[originNode]] >> self._nodeToMetaNode[destNode]) & 1)
+
+    def getReachabilityMatrix(self, originNodes, destNodes):
+        """
+        Returns a boolean NumPy array with a row for each node in *originNodes* and a column for 
+        each node in *destNodes* that is True where there is a path from the origin to the destination.
+        """
+        originMetaNodes = np.array([self._nodeToMetaNode[node] for node in originNodes], dtype=np.int64)
+        destMetaNodes   = np.array([self._nodeToMetaNode[node] for node in destNodes], dtype=np.int64)
+
+        # the nodes of interest are usually in a handful of metanodes, so do the metanodes first
+        uniqueOrigins, originIndices    = np.unique(originMetaNodes, return_inverse=True)
+        uniqueDests, destIndices        = np.unique(destMetaNodes, return_inverse=True)
+        uniqueDests     = uniqueDests.tolist()
+        metaMatrix = np.array([[(self._reachable[origin] >> dest) & 1 for dest in uniqueDests]
+                               for origin in uniqueOrigins.tolist()], dtype=bool).reshape(len(uniqueOrigins), len(uniqueDests))
+
+        return metaMatrix[originIndices[:, np.newaxis], destIndices[np.newaxis, :]]
 
 
 def hasPath(net, originNode, destNode):
     """
     Return true if the network has a path 
-    from the origin node to the destination node
+    from the origin node to the destination node.
+    
+    This runs a depth first search over the whole network; build a :py:class:`ReachabilityIndex` for
+    more than a few queries.
     """
     
-    dfs(net, originNode) 
+    pre, post, pred = dfs(net, originNode) 
 
     node = destNode
     while node and node != originNode:
-        node = node.pred 
+        node = pred[node] 
 
     if node is None:
         return False
@@ -377,31 +502,104 @@ def isPointInPolygon(point, polygon):
             
 def getClosestNode(net, inputNode):
     """
-    Return the closest node in the input network
+    Return the closest node in the input network, and the distance to it
     """
-    minDist = sys.maxint 
-    closestNode = None
-    for node in net.iterNodes():
-        dist = (node.getX() - inputNode.getX()) ** 2 + (node.getY() - inputNode.getY()) ** 2
-        if dist < minDist:
-            minDist = dist 
-            closestNode = node 
-
-    return closestNode, math.sqrt(minDist)
+    found = net.getSpatialIndex().findNearestNodes(inputNode.getX(), inputNode.getY(), n=1)
+    if len(found) == 0:
+        return None, math.sqrt(sys.maxint)
+    minDist, closestNode = found[0]
+    return closestNode, minDist
 
 def getClosestCentroid(net, inputCent):
     """
-    Return the closest centroid in the input network
+    Return the closest centroid (other than the input one) in the input network, and the distance to it
     """
-    minDist = sys.maxint 
-    closestCent = None
-    for centroid in net.iterCentroids():
-        dist = (centroid.getX() - inputCent.getX()) ** 2 + (centroid.getY() - inputCent.getY()) ** 2
-        if dist < minDist and centroid!=inputCent:
-            minDist = dist 
-            closestCent = centroid
+    found = net.getSpatialIndex().findNearestNodes(inputCent.getX(), inputCent.getY(), n=1,
+                nodeFilter=lambda node: node.isCentroid() and node != inputCent)
+    if len(found) == 0:
+        return None, math.sqrt(sys.maxint)
+    minDist, closestCent = found[0]
+    return closestCent, minDist
+
+def _labelCorrectingOnArrays(linkMovementPtr, movementOutLink, costs, secondaryCosts, sourceLinks, sourceLabel):
+    """
+    Pape's shortest path with labels on links over a link -> movement -> link forward star
+    given as python lists (see :py:meth:`GraphSnapshot.getAdjacencyLists`).  This is the loop behind
+    :py:meth:`ShortestPaths.labelCorrectingOnSnapshot` and :py:meth:`ShortestPaths.getCentroidSkims`;
+    it only deals with lists so that it can run in worker processes.
+    
+    Returns the lists (*labels*, *predLinks*, *secondaryLabels*); *secondaryLabels* is None if
+    *secondaryCosts* is None.
+    """
+    numLinks        = len(linkMovementPtr) - 1
+    labels          = [float("inf")] * numLinks
+    predLinks       = [-1] * numLinks
+    alreadyVisited  = [False] * numLinks
+    inDeque         = [False] * numLinks
+    secondaryLabels = None if secondaryCosts is None else [float("inf")] * numLinks
+
+    edgesToExamine  = deque()
+    for sourceLink in sourceLinks:
+        labels[sourceLink]  = sourceLabel
+        if secondaryLabels is not None: secondaryLabels[sourceLink] = 0.0
+        if inDeque[sourceLink]: continue
+        inDeque[sourceLink] = True
+        edgesToExamine.append(sourceLink)
+
+    while edgesToExamine:
+        pivotEdge = edgesToExamine.popleft()
+        inDeque[pivotEdge]          = False
+        alreadyVisited[pivotEdge]   = True
+        pivotLabel                  = labels[pivotEdge]
+        for movIndex in xrange(linkMovementPtr[pivotEdge], linkMovementPtr[pivotEdge + 1]):
+            newLabel = pivotLabel + costs[movIndex]
+            downstreamEdge = movementOutLink[movIndex]
+            if newLabel < labels[downstreamEdge]:
+                labels[downstreamEdge]      = newLabel
+                predLinks[downstreamEdge]   = pivotEdge
+                if secondaryLabels is not None:
+                    secondaryLabels[downstreamEdge] = secondaryLabels[pivotEdge] + secondaryCosts[movIndex]
+                if inDeque[downstreamEdge]: continue
+                inDeque[downstreamEdge] = True
+                if alreadyVisited[downstreamEdge]:
+                    edgesToExamine.appendleft(downstreamEdge)
+                else:
+                    edgesToExamine.append(downstreamEdge)
+
+    return labels, predLinks, secondaryLabels
+
+# forward star, sink links and costs for the skim worker processes; see _initSkimWorker
+_skimArrays = None
+
+def _initSkimWorker(skimArrays):
+    """
+    Stores the arrays needed by :py:func:`_skimOrigin` in this (worker) process.
+    """
+    global _skimArrays
+    _skimArrays = skimArrays
+
+def _skimOrigin(task):
+    """
+    Runs the search from one origin for one time period and returns the 
+    tuple (*periodIndex*, *originIndex*, *costRow*, *distanceRow*) where the rows are NumPy arrays
+    indexed by destination.  *task* is the tuple (*periodIndex*, *originIndex*, *sourceLinks*).
+    """
+    periodIndex, originIndex, sourceLinks = task
+    linkMovementPtr, movementOutLink, costsByPeriod, movementDistances, sinkLinks, sinkStart, terminalCosts, terminalDistances = _skimArrays
+
+    labels, predLinks, distanceLabels = _labelCorrectingOnArrays(linkMovementPtr, movementOutLink, 
+                                                                 costsByPeriod[periodIndex], movementDistances, sourceLinks, 0.0)
+    # the last element stands in for destinations without sink links
+    labels.append(float("inf"))
+    distanceLabels.append(float("inf"))
 
-    return closestCent, math.sqrt(minDist) 
+    costs       = np.array(labels)[sinkLinks] + terminalCosts
+    distances   = np.array(distanceLabels)[sinkLinks] + terminalDistances
+
+    # sinkLinks are grouped by destination, so order each group by cost and take its first element
+    order       = np.lexsort((costs, np.repeat(np.arange(len(sinkStart)), np.diff(np.append(sinkStart, len(sinkLinks))))))
+    best        = order[sinkStart]
+    return periodIndex, originIndex, costs[best], distances[best]
 
 def getSPPathBetweenLinks(net, pathName, sourceLinkId, destLinkId):
     """
@@ -410,52 +608,64 @@ def getSPPathBetweenLinks(net, pathName, sourceLinkId, destLinkId):
     """
     sourceLink = net.getLinkForId(sourceLinkId)
     destinationLink = net.getLinkForId(destLinkId)
-    ShortestPaths.initializeMovementCostsWithLengthInFeet(net)
-    ShortestPaths.labelCorrectingWithLabelsOnLinks(net, sourceLink)
-    path = ShortestPaths.getShortestPathBetweenLinks(sourceLink, destinationLink)
+    movementCosts = ShortestPaths.initializeMovementCostsWithLength(net)
+    path = ShortestPaths.getShortestPathBetweenLinks(net, sourceLink, destinationLink, movementCosts=movementCosts)
     return dta.Path(net, pathName, path)
 
 
 class ShortestPaths(object):
     """
-    Shortest path algorithms and various utilities
+    Shortest path algorithms and various utilities.
+
+    The costs, labels and predecessors are kept in dictionaries keyed by :py:class:`Movement`,
+    :py:class:`Link` or :py:class:`Node` that are passed to and returned by the algorithms, rather than
+    set on the network objects.
     """
     @staticmethod
     def initialiseMovementCostsWithFFTT(network):
-        """Initialize all the movement costs with the edge free flow travel time in min"""
+        """Returns the dictionary of the movement costs: the free flow travel time of the incoming edge in min"""
+        movementCosts = {}
         for edge in network.iterLinks():
             if edge.isVirtualLink():
                 continue
             for movement in edge.iterOutgoingMovements():
-                movement.cost = edge.getFreeFlowTTInMin()
+                movementCosts[movement] = edge.getFreeFlowTTInMin()
+        return movementCosts
 
     @staticmethod
     def initializeMovementCostsWithLength(network):
+        """Returns the dictionary of the movement costs: the length of the incoming edge"""
+        movementCosts = {}
         for edge in network.iterLinks():
             if edge.isVirtualLink():
                 continue
             for movement in edge.iterOutgoingMovements():
-                movement.cost = edge.getLength()
+                movementCosts[movement] = edge.getLength()
+        return movementCosts
 
     @staticmethod
     def initiaxblizeEdgeCostsWithFFTT(network):
-        """Initialize all the edge costs with the edge free flow travel times in minutes"""
+        """Returns the dictionary of the edge costs: the edge free flow travel times in minutes"""
+        edgeCosts = {}
         for edge in network.iterLinks():
             if edge.isRoadLink():
-                edge.cost = edge.getFreeFlowTTInMin()
+                edgeCosts[edge] = edge.getFreeFlowTTInMin()
             else:
-                edge.cost = sys.maxint 
+                edgeCosts[edge] = sys.maxint 
+        return edgeCosts
             
     @staticmethod
     def initializeEdgeCostsWithLength(network):
-        """Initalize all the edge costs with the edge lengths in feet"""
+        """Returns the dictionary of the edge costs: the edge lengths in feet"""
+        edgeCosts = {}
         for edge in network.iterLinks():
             if edge.isVirtualLink():
                 continue
-            edge.cost = edge.getLength()
+            edgeCosts[edge] = edge.getLength()
+        return edgeCosts
 
     @classmethod
-    def labelCorrectingWithLabelsOnLinks(cls, graph, sourceLink):
+    def labelCorrectingWithLabelsOnLinks(cls, graph, sourceLink, movementCosts):
         """
         Implementation of Pape's shortest path
         using a deque. Links are inserted to the 
@@ -463,33 +673,37 @@ class ShortestPaths(object):
         visited. Otherwise they are inserted to the
         right of the deque.
 
-        Movements need to have a cost attribute
+        *movementCosts* is a dictionary of the costs of the movements
+        (e.g. from :py:meth:`ShortestPaths.initialiseMovementCostsWithFFTT`).
 
+        Returns the tuple of dictionaries (*labels*, *predEdges*) mapping each link to its label
+        (``sys.maxint`` if it can't be reached) and to the previous link on its shortest path (or None).
         """
-        for edge in graph.iterLinks():
-            edge.label = sys.maxint 
-            edge.alreadyVisited = False
-            edge.predEdge = None
+        labels      = dict((edge, sys.maxint) for edge in graph.iterLinks())
+        predEdges   = dict((edge, None) for edge in graph.iterLinks())
+        alreadyVisited = set()
             
-        sourceLink.label = 0
+        labels[sourceLink] = 0
 
         edgesToExamine = deque()
         edgesToExamine.appendleft(sourceLink)
 
         while edgesToExamine:
             pivotEdge = edgesToExamine.popleft()
-            pivotEdge.alreadyVisited = True
+            alreadyVisited.add(pivotEdge)
             for eMovement in pivotEdge.iterOutgoingMovements():
-                newLabel = pivotEdge.label + eMovement.cost
+                newLabel = labels[pivotEdge] + movementCosts[eMovement]
                 downstreamEdge = eMovement.getOutgoingLink()
-                if newLabel < downstreamEdge.label:
-                    downstreamEdge.label = newLabel
-                    downstreamEdge.predEdge = pivotEdge
-                    if downstreamEdge.alreadyVisited:
+                if newLabel < labels[downstreamEdge]:
+                    labels[downstreamEdge] = newLabel
+                    predEdges[downstreamEdge] = pivotEdge
+                    if downstreamEdge in alreadyVisited:
                         edgesToExamine.appendleft(downstreamEdge)
                     else:
                         edgesToExamine.append(downstreamEdge)        
 
+        return labels, predEdges
+
                         
     @classmethod
     def labelCorrectingWithLabelsOnNodes(cls, graph, sourceVertex):
@@ -505,26 +719,21 @@ class ShortestPaths(object):
         :py:class:`VirtualLink` instances and :py:class:`VirtualNode` instances
         are not included in the shortest path.
         
-        :py:class:`Node` instances have the following set:
-        
-        * *label* is set to the cost
-        * *alreadyVisited* is a boolean
-        * *predVertex* references the previous vertex Node
-        
+        Returns the tuple of dictionaries (*labels*, *predVertices*) mapping each :py:class:`Node` to
+        its label, the cost (``sys.maxint`` if it can't be reached), and to the previous vertex Node (or None).
         """
 
-        for vertex in graph.iterNodes():
-            vertex.label = sys.maxint
-            vertex.alreadyVisited = False 
-            vertex.predVertex = None
+        labels          = dict((vertex, sys.maxint) for vertex in graph.iterNodes())
+        predVertices    = dict((vertex, None) for vertex in graph.iterNodes())
+        alreadyVisited  = set()
 
-        sourceVertex.label = 0
+        labels[sourceVertex] = 0
         verticesToExamine = deque()
         verticesToExamine.appendleft(sourceVertex)
         
         while verticesToExamine:
             pivotVertex = verticesToExamine.popleft()
-            pivotVertex.alreadyVisited = True
+            alreadyVisited.add(pivotVertex)
 
             for edge in pivotVertex.iterOutgoingLinks():
 
@@ -537,67 +746,77 @@ class ShortestPaths(object):
                 if downstreamVertex.isVirtualNode(): continue
                 
                 # The edge cost used is given by :py:meth:`Link.euclideanLength`.
-                newLabel = pivotVertex.label + edge.euclideanLength()
+                newLabel = labels[pivotVertex] + edge.euclideanLength()
                 
-                if newLabel < downstreamVertex.label:
-                    downstreamVertex.label = newLabel
-                    downstreamVertex.predVertex = pivotVertex
-                    if downstreamVertex.alreadyVisited:
+                if newLabel < labels[downstreamVertex]:
+                    labels[downstreamVertex] = newLabel
+                    predVertices[downstreamVertex] = pivotVertex
+                    if downstreamVertex in alreadyVisited:
                         verticesToExamine.appendleft(downstreamVertex)
                     else:
                         verticesToExamine.append(downstreamVertex)
 
+        return labels, predVertices
+
 
 
     @classmethod
     def labelSettingWithLabelsOnNodes(cls, graph, sourceVertex, endVertex, includeVirtual=False, sourceLabel=0.0, maxLabel=sys.float_info.max, 
                                           filterRoadLinkEvalStr=None):
         """
-        .. TODO:: document new args
-        
-        Implementation of Pape's shortest path
-        using a deque. Vertices are inserted to the 
-        left of the deque if they have been already 
-        visited. Otherwise they are inserted to the
-        right of the deque
+        Implementation of Dijkstra's label setting shortest path
+        using a binary heap.  Each vertex is pushed onto the heap every time
+        its label improves, and stale heap entries are skipped when popped,
+        so each settle costs O(log n) rather than a scan of all candidates.
 
         *graph* is an instance of a :py:class:`Network`.
-        The edge cost used is given by :py:meth:`Link.euclideanLength`.
-        :py:class:`VirtualLink` instances and :py:class:`VirtualNode` instances
-        are not included in the shortest path.
-        
-        :py:class:`Node` instances have the following set:
+        The edge cost used is given by :py:meth:`RoadLink.euclideanLength` (including shape points).
         
-        * *label* is set to the cost
-        * *alreadySet* is a boolean
-        * *predVertex* references the previous vertex Node
+         * *sourceVertex* is the :py:class:`Node` to start from, and it is given the label *sourceLabel*
+         * *endVertex* is a :py:class:`Node`; the search stops once it is permanently labeled.
+           Pass None to label the whole graph (subject to *maxLabel*).
+         * if *includeVirtual* is False, :py:class:`VirtualLink` instances and :py:class:`VirtualNode`
+           instances are not included in the shortest path.
+         * the search stops once the next vertex to be set has a label greater than *maxLabel*.
+         * *filterRoadLinkEvalStr* is a python expression evaluated with the local variable *roadlink*;
+           :py:class:`RoadLink` instances for which it evaluates to True are not included in the shortest path.
+           e.g. ``"roadlink.getFacilityType() in [1,2,3,8]"``
         
+        Returns the tuple (*labels*, *predVertices*, *labeledVertices*): the dictionaries mapping each
+        :py:class:`Node` to its label, the cost (``sys.float_info.max`` if it wasn't reached), and to the
+        previous vertex Node (or None), and the set of permanently labeled vertices.
         """
 
-        for vertex in graph.iterNodes():
-            vertex.label        = sys.float_info.max
-            vertex.alreadySet   = False
-            vertex.predVertex   = None
-            mincostVertex       = sourceVertex
+        labels                  = dict((vertex, sys.float_info.max) for vertex in graph.iterNodes())
+        predVertices            = dict((vertex, None) for vertex in graph.iterNodes())
 
-        sourceVertex.label      = sourceLabel
+        labels[sourceVertex]    = sourceLabel
         
-        verticesToExamine       = deque()
-        nextPivotVertex         = sourceVertex
+        filterRoadLinkCode      = None
+        if filterRoadLinkEvalStr:
+            filterRoadLinkCode  = compile(filterRoadLinkEvalStr, "<filterRoadLinkEvalStr>", "eval")
+        
+        # heap of (label, insertion order, vertex); the insertion order breaks ties
+        # so vertices themselves are never compared
+        insertionOrder          = count()
+        verticesToExamine       = [(sourceLabel, next(insertionOrder), sourceVertex)]
         
         # these are permanently labeled
-        labeledVertices           = set()
+        labeledVertices         = set()
         
-        while True:
+        while verticesToExamine:
+            
+            pivotLabel, order, pivotVertex = heapq.heappop(verticesToExamine)
+            
+            # stale entry -- the vertex was set already or has since been given a better label
+            if pivotVertex in labeledVertices or pivotLabel > labels[pivotVertex]: continue
             
-            pivotVertex = nextPivotVertex
-            pivotVertex.alreadySet = True
             labeledVertices.add(pivotVertex)
                         
             # end condition if endVertex is passed
             if endVertex and (pivotVertex == endVertex): break
             # end condition if maxLabel is real
-            if pivotVertex.label > maxLabel: break
+            if pivotLabel > maxLabel: break
             
             for edge in pivotVertex.iterOutgoingLinks():
                 
@@ -605,9 +824,7 @@ class ShortestPaths(object):
                 if not includeVirtual and edge.isVirtualLink(): continue
                 
                 # don't include the RoadLink instance if specified
-                localsdict = {}
-                localsdict['roadlink'] = edge
-                if edge.isRoadLink() and filterRoadLinkEvalStr and eval(filterRoadLinkEvalStr, globals(), localsdict): 
+                if filterRoadLinkCode and edge.isRoadLink() and eval(filterRoadLinkCode, globals(), {'roadlink':edge}): 
                     dta.DtaLogger.debug("Skipping edge %10s with ft=%d" % (edge.getId(), edge.getFacilityType()))
                     continue
                 
@@ -616,49 +833,320 @@ class ShortestPaths(object):
                 # don't include VirtualNode instances unless specified
                 if not includeVirtual and downstreamVertex.isVirtualNode(): continue
                 
+                if downstreamVertex in labeledVertices: continue
+                
                 # The edge cost used is given by :py:meth:`Link.euclideanLength`.
-                newLabel = pivotVertex.label + edge.euclideanLength(includeShape=True)
+                newLabel = pivotLabel + edge.euclideanLength(includeShape=True)
                 
-                if newLabel < downstreamVertex.label:
-                    downstreamVertex.label = newLabel
-                    downstreamVertex.predVertex = pivotVertex
-                    if not downstreamVertex.alreadySet:
-                        verticesToExamine.appendleft(downstreamVertex)
+                if newLabel < labels[downstreamVertex]:
+                    labels[downstreamVertex] = newLabel
+                    predVertices[downstreamVertex] = pivotVertex
+                    heapq.heappush(verticesToExamine, (newLabel, next(insertionOrder), downstreamVertex))
+                
+        return labels, predVertices, labeledVertices
+
+    @classmethod
+    def labelCorrectingOnSnapshot(cls, snapshot, sourceLinkIndex, movementCosts=None, sourceLabel=0.0,
+                                  secondaryMovementCosts=None):
+        """
+        Implementation of Pape's shortest path with labels on links, like
+        :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnLinks`, but running on a
+        :py:class:`GraphSnapshot` and keeping the labels in arrays rather than on the links.
+
+         * *sourceLinkIndex* is the snapshot index of the source link, or a list of indices
+           for a search from several source links at once; the source links get the label *sourceLabel*
+         * *movementCosts* is an array of costs indexed by movement; pass None to use
+           :py:attr:`GraphSnapshot.movementCost`.  Movements with an infinite cost are never used.
+         * *secondaryMovementCosts* is an optional second array of costs indexed by movement
+           (e.g. :py:attr:`GraphSnapshot.linkLength` of the incoming links) that is summed along the
+           shortest paths found with *movementCosts*.
+
+        Returns the tuple (*labels*, *predLinks*), NumPy arrays indexed by link, where unreachable links
+        have an infinite label and a predecessor of -1.  If *secondaryMovementCosts* is passed, 
+        returns (*labels*, *predLinks*, *secondaryLabels*).
+        """
+        if movementCosts is None:
+            movementCosts = snapshot.movementCost
+
+        nodeOutPtr, nodeOutLinks, linkEndNode, linkMovementPtr, movementOutLink = snapshot.getAdjacencyLists()
+
+        labels, predLinks, secondaryLabels = _labelCorrectingOnArrays(linkMovementPtr, movementOutLink,
+            movementCosts.tolist(), None if secondaryMovementCosts is None else secondaryMovementCosts.tolist(),
+            np.atleast_1d(sourceLinkIndex).tolist(), sourceLabel)
+
+        if secondaryMovementCosts is None:
+            return np.array(labels, dtype=np.float64), np.array(predLinks, dtype=np.int32)
+        return np.array(labels, dtype=np.float64), np.array(predLinks, dtype=np.int32), np.array(secondaryLabels, dtype=np.float64)
+
+    @classmethod
+    def labelSettingOnSnapshot(cls, snapshot, sourceNodeIndex, endNodeIndex=None, includeVirtual=False, sourceLabel=0.0,
+                               maxLabel=sys.float_info.max, linkCosts=None):
+        """
+        Implementation of Dijkstra's label setting shortest path with labels on nodes using a binary heap,
+        like :py:meth:`ShortestPaths.labelSettingWithLabelsOnNodes`, but running on a :py:class:`GraphSnapshot`
+        and keeping the labels in arrays rather than on the nodes.
+
+         * *sourceNodeIndex* is the snapshot index of the source node, which gets the label *sourceLabel*
+         * the search stops once *endNodeIndex* is permanently labeled (if it's not None), or once the next
+           node to be set has a label greater than *maxLabel*
+         * if *includeVirtual* is False, :py:class:`VirtualLink` instances and :py:class:`VirtualNode`
+           instances are not included in the shortest path
+         * *linkCosts* is an array of costs indexed by link; pass None to use
+           :py:attr:`GraphSnapshot.linkEuclideanLength`.  Links with an infinite cost are never used, so
+           this is also the way to filter links out of the search.
+
+        Returns the tuple (*labels*, *predLinks*, *settled*) where *labels* and *predLinks* are NumPy arrays
+        indexed by node (the predecessor being the index of the link used to reach the node, or -1),
+        and *settled* is the list of permanently labeled node indices in the order they were set.
+        """
+        if linkCosts is None:
+            linkCosts = snapshot.linkEuclideanLength
+        costs       = linkCosts.tolist()
+        
+        nodeOutPtr, nodeOutLinks, linkEndNode, linkMovementPtr, movementOutLink = snapshot.getAdjacencyLists()
+        skipLinks   = snapshot.linkIsVirtual.tolist()
+        skipNodes   = snapshot.nodeIsVirtual.tolist()
+
+        numNodes    = snapshot.getNumNodes()
+        labels      = [float("inf")] * numNodes
+        predLinks   = [-1] * numNodes
+        alreadySet  = [False] * numNodes
+        settled     = []
+
+        labels[sourceNodeIndex] = sourceLabel
+        verticesToExamine       = [(sourceLabel, sourceNodeIndex)]
 
-            mincost = 0
-            if len(verticesToExamine)==0:
-                return labeledVertices
-            for updateVertex in verticesToExamine:
-                if mincost==0:
-                    mincost = updateVertex.label
-                    mincostVertex = updateVertex
+        while verticesToExamine:
+
+            pivotLabel, pivotVertex = heapq.heappop(verticesToExamine)
+            if alreadySet[pivotVertex] or pivotLabel > labels[pivotVertex]: continue
+
+            alreadySet[pivotVertex] = True
+            settled.append(pivotVertex)
+
+            if pivotVertex == endNodeIndex: break
+            if pivotLabel > maxLabel: break
+
+            for linkIndex in nodeOutLinks[nodeOutPtr[pivotVertex]:nodeOutPtr[pivotVertex + 1]]:
+                if not includeVirtual and skipLinks[linkIndex]: continue
+
+                downstreamVertex = linkEndNode[linkIndex]
+                if not includeVirtual and skipNodes[downstreamVertex]: continue
+                if alreadySet[downstreamVertex]: continue
+
+                newLabel = pivotLabel + costs[linkIndex]
+                if newLabel < labels[downstreamVertex]:
+                    labels[downstreamVertex]    = newLabel
+                    predLinks[downstreamVertex] = linkIndex
+                    heapq.heappush(verticesToExamine, (newLabel, downstreamVertex))
+
+        return np.array(labels, dtype=np.float64), np.array(predLinks, dtype=np.int32), settled
+
+    @classmethod
+    def timeDependentLabelCorrectingOnSnapshot(cls, snapshot, sourceLinkIndex, departureTimesInMin,
+                                               timeVaryingCosts, startTimeInMin, timeStepInMin):
+        """
+        Time dependent version of :py:meth:`ShortestPaths.labelCorrectingOnSnapshot` that finds the
+        earliest arrival time at every link for several departure times at once.
+
+         * *sourceLinkIndex* is the snapshot index of the source link, or a list of indices
+         * *departureTimesInMin* is the list of departure times (in minutes) from the source links
+         * *timeVaryingCosts* is a 2-dimensional (time period x movement) array of costs in minutes, as
+           returned by :py:meth:`GraphSnapshot.getTimeVaryingMovementCosts` or :py:meth:`GraphSnapshot.getSimMovementCosts`;
+           time period *p* starts at ``startTimeInMin + p * timeStepInMin``.  The cost of a movement is the
+           one of the time period in which the vehicle enters its incoming link, i.e. the equivalent of
+           :py:meth:`Movement.getTimeVaryingCostAt` at departure time + label.  Times before the first time period
+           use the first one and times after the last time period use the last one.
+
+        Step costs let a vehicle that enters a link later leave it earlier when the cost drops from one time
+        period to the next.  To keep the first-in-first-out (FIFO) property, without which the search would not
+        give earliest arrival times, a vehicle never leaves a link before the vehicles that entered it in
+        an earlier time period.
+
+        Returns the tuple (*labels*, *predLinks*) of 2-dimensional (departure time x link) NumPy arrays, where
+        ``labels[d, i]`` is the travel time from departure *d* to the start of link *i* and ``predLinks[d]``
+        can be passed to :py:meth:`GraphSnapshot.getLinkPath`.  Unreachable links have an infinite label and
+        a predecessor of -1.
+        """
+        departures      = np.asarray(departureTimesInMin, dtype=np.float64)
+        costs           = np.asarray(timeVaryingCosts, dtype=np.float64)
+        if costs.ndim != 2 or costs.shape[1] != snapshot.getNumMovements():
+            raise DtaError("timeDependentLabelCorrectingOnSnapshot: timeVaryingCosts should be a (time period x movement) "
+                           "array with %d movements" % snapshot.getNumMovements())
+        numPeriods      = costs.shape[0]
+
+        # earliest time a vehicle entering in each time period can leave: the latest exit of the earlier periods
+        periodEnds      = startTimeInMin + timeStepInMin * np.arange(1, numPeriods + 1, dtype=np.float64)
+        exitFloors      = np.empty_like(costs)
+        exitFloors[0]   = -np.inf
+        exitFloors[1:]  = np.maximum.accumulate(periodEnds[:, np.newaxis] + costs, axis=0)[:-1]
+        # movement major so that the movements of a link are contiguous
+        costs           = np.ascontiguousarray(costs.T)
+        exitFloors      = np.ascontiguousarray(exitFloors.T)
+
+        nodeOutPtr, nodeOutLinks, linkEndNode, linkMovementPtr, movementOutLink = snapshot.getAdjacencyLists()
+        numLinks        = snapshot.getNumLinks()
+        arrivals        = np.empty((numLinks, len(departures)), dtype=np.float64)
+        arrivals.fill(np.inf)
+        predLinks       = np.empty((numLinks, len(departures)), dtype=np.int32)
+        predLinks.fill(-1)
+        alreadyVisited  = [False] * numLinks
+        inDeque         = [False] * numLinks
+
+        edgesToExamine  = deque()
+        for sourceLink in np.atleast_1d(sourceLinkIndex).tolist():
+            arrivals[sourceLink] = departures
+            if inDeque[sourceLink]: continue
+            inDeque[sourceLink] = True
+            edgesToExamine.append(sourceLink)
+
+        while edgesToExamine:
+            pivotEdge = edgesToExamine.popleft()
+            inDeque[pivotEdge]          = False
+            alreadyVisited[pivotEdge]   = True
+            movStart, movEnd            = linkMovementPtr[pivotEdge], linkMovementPtr[pivotEdge + 1]
+            if movStart == movEnd: continue
+
+            pivotArrivals   = arrivals[pivotEdge]
+            periods         = np.floor((np.where(np.isinf(pivotArrivals), startTimeInMin, pivotArrivals) - startTimeInMin) / timeStepInMin)
+            periods         = np.clip(periods, 0, numPeriods - 1).astype(np.int64)
+            # (outgoing movement x departure) exit times
+            exits           = np.maximum(pivotArrivals + costs[movStart:movEnd, periods], exitFloors[movStart:movEnd, periods])
+
+            for movIndex in xrange(movStart, movEnd):
+                downstreamEdge  = movementOutLink[movIndex]
+                newArrivals     = exits[movIndex - movStart]
+                improved        = newArrivals < arrivals[downstreamEdge]
+                if not improved.any(): continue
+                arrivals[downstreamEdge, improved]  = newArrivals[improved]
+                predLinks[downstreamEdge, improved] = pivotEdge
+                if inDeque[downstreamEdge]: continue
+                inDeque[downstreamEdge] = True
+                if alreadyVisited[downstreamEdge]:
+                    edgesToExamine.appendleft(downstreamEdge)
                 else:
-                    if updateVertex.label<mincost:
-                        mincost = updateVertex.label
-                        mincostVertex = updateVertex
-            verticesToExamine.remove(mincostVertex)
-            nextPivotVertex = mincostVertex
-                
-        return labeledVertices
+                    edgesToExamine.append(downstreamEdge)
+
+        return (arrivals - departures).T, predLinks.T
+
+    @classmethod
+    def getCentroidSkims(cls, network, timeLabels, snapshot=None, movementCosts=None, numProcesses=1):
+        """
+        Computes zone to zone skims by running :py:meth:`ShortestPaths.labelCorrectingOnSnapshot` from every
+        :py:class:`Centroid` (through its connectors, see :py:meth:`GraphSnapshot.getCentroidAccessLinks`)
+        for every time period.
+
+         * *network* is a :py:class:`Network` instance
+         * *timeLabels* are the labels for the time dimension of the skims, e.g. ``list(demand.iterTimePeriods())``
+           for a :py:class:`Demand` instance
+         * *snapshot* is a :py:class:`GraphSnapshot` of the *network*; pass None to build one
+         * *movementCosts* are the movement costs, indexed by the snapshot movement index: pass None to use
+           :py:attr:`GraphSnapshot.movementCost` (free flow travel time) for all time periods, a 1-dimensional
+           array to use it for all time periods, or a 2-dimensional (time period x movement) array.
+         * *numProcesses* is the number of worker processes to run the searches in; if it's 1 they run in this process.
+
+        The cost of the last link of a path (the connector into the destination) is its free flow travel time.
+
+        Returns the tuple (*costSkim*, *distanceSkim*) of :py:class:`MultiArray` instances with dimensions
+        (*timeLabels*, centroid ids, centroid ids), using the same sorted centroid ids as :py:class:`Demand`.
+        *costSkim* holds the shortest path costs and *distanceSkim* the length of those paths in
+        :py:attr:`RoadLink.LENGTH_UNITS`.  Unreachable destinations are set to infinity, and the diagonal is zero.
+        """
+        if snapshot is None:
+            snapshot = network.buildGraphSnapshot()
+        if movementCosts is None:
+            movementCosts = snapshot.movementCost
+
+        numPeriods = len(timeLabels)
+        movementCosts = np.asarray(movementCosts, dtype=np.float64)
+        if movementCosts.ndim == 1:
+            costsByPeriod = [movementCosts.tolist()]
+            periodIndices = [0] * numPeriods
+        elif movementCosts.shape[0] == numPeriods:
+            costsByPeriod = [periodCosts.tolist() for periodCosts in movementCosts]
+            periodIndices = range(numPeriods)
+        else:
+            raise DtaError("getCentroidSkims: movementCosts has %d time periods but there are %d time labels" % 
+                           (movementCosts.shape[0], numPeriods))
+
+        centroidIds, sourcePtr, sourceLinks, sinkPtr, sinkLinks = snapshot.getCentroidAccessLinks()
+        numCentroids = len(centroidIds)
+
+        # destinations without sink links get the extra label at index numLinks, which is infinite
+        noSink      = np.where(np.diff(sinkPtr) == 0)[0]
+        sinkLinks   = np.insert(sinkLinks, sinkPtr[noSink], snapshot.getNumLinks())
+        sinkStart   = sinkPtr[:-1] + np.searchsorted(noSink, np.arange(numCentroids))
+        terminalCosts       = np.append(snapshot.linkFFTT, 0.0)[sinkLinks]
+        terminalDistances   = np.append(snapshot.linkLength, 0.0)[sinkLinks]
+
+        nodeOutPtr, nodeOutLinks, linkEndNode, linkMovementPtr, movementOutLink = snapshot.getAdjacencyLists()
+        skimArrays = (linkMovementPtr, movementOutLink, costsByPeriod, snapshot.linkLength[snapshot.movementInLink].tolist(),
+                      sinkLinks, sinkStart, terminalCosts, terminalDistances)
+
+        tasks = [(periodIndex, originIndex, sourceLinks[sourcePtr[originIndex]:sourcePtr[originIndex + 1]].tolist())
+                 for periodIndex in sorted(set(periodIndices)) for originIndex in xrange(numCentroids)]
+
+        costSkim        = dta.MultiArray("d", [timeLabels, centroidIds, centroidIds])
+        distanceSkim    = dta.MultiArray("d", [timeLabels, centroidIds, centroidIds])
+        costData        = costSkim.getNumpyArray()
+        distanceData    = distanceSkim.getNumpyArray()
+
+        if numProcesses > 1:
+            pool = multiprocessing.Pool(numProcesses, initializer=_initSkimWorker, initargs=(skimArrays,))
+            try:
+                results = pool.imap_unordered(_skimOrigin, tasks, chunksize=max(1, len(tasks) / (4 * numProcesses)))
+                for periodIndex, originIndex, costRow, distanceRow in results:
+                    costData[periodIndex, originIndex, :]       = costRow
+                    distanceData[periodIndex, originIndex, :]   = distanceRow
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            _initSkimWorker(skimArrays)
+            for task in tasks:
+                periodIndex, originIndex, costRow, distanceRow = _skimOrigin(task)
+                costData[periodIndex, originIndex, :]       = costRow
+                distanceData[periodIndex, originIndex, :]   = distanceRow
+            _initSkimWorker(None)
+
+        # time periods sharing the costs of the first one
+        for periodIndex in xrange(1, numPeriods):
+            if periodIndices[periodIndex] != periodIndex:
+                costData[periodIndex]       = costData[periodIndices[periodIndex]]
+                distanceData[periodIndex]   = distanceData[periodIndices[periodIndex]]
+
+        diagonal = np.arange(numCentroids)
+        costData[:, diagonal, diagonal]     = 0.0
+        distanceData[:, diagonal, diagonal] = 0.0
+
+        dta.DtaLogger.info("getCentroidSkims computed skims for %d centroids and %d time periods" % (numCentroids, numPeriods))
+        return costSkim, distanceSkim
 
     @classmethod
-    def getShortestPathBetweenLinks(cls, graph, sourceLink, destinationLink, runSP=False):
+    def getShortestPathBetweenLinks(cls, graph, sourceLink, destinationLink, predEdges=None, movementCosts=None):
         """
         Return the path from the sourceLink to the 
         destinationLink as a list of edges. The return list always contains the 
         destination and the source edge
+
+        *predEdges* is the dictionary of the previous edges returned by
+        :py:meth:`ShortestPaths.labelCorrectingWithLabelsOnLinks` from *sourceLink*; if it is None,
+        the shortest path is run with the *movementCosts* (by default, the movement costs from
+        :py:meth:`ShortestPaths.initializeMovementCostsWithLength`).
         """
         if sourceLink==destinationLink:
             return []
         
-        if runSP:
-            ShortestPaths.labelCorrectingWithLabelsOnLinks(graph, sourceLink)
+        if predEdges is None:
+            if movementCosts is None:
+                movementCosts = ShortestPaths.initializeMovementCostsWithLength(graph)
+            labels, predEdges = ShortestPaths.labelCorrectingWithLabelsOnLinks(graph, sourceLink, movementCosts)
                 
         edge = destinationLink
         path = []
         while edge != sourceLink:
             path.insert(0, edge)
-            edge = edge.predEdge
+            edge = predEdges.get(edge)
             
             if (edge == None):
                 # this is a valid outcome with dead-end links
@@ -670,11 +1158,14 @@ class ShortestPaths(object):
         return path
 
     @classmethod
-    def getShortestPathBetweenNodes(cls, sourceNode, destinationNode):
+    def getShortestPathBetweenNodes(cls, sourceNode, destinationNode, predVertices):
         """
         Return the path from the sourceNode to the 
         destinationNode as a list of nodes. The return list always contains the 
         destination and the source node
+
+        *predVertices* is the dictionary of the previous vertices returned by the shortest path
+        from *sourceNode* (e.g. :py:meth:`ShortestPaths.labelSettingWithLabelsOnNodes`).
         """
         if sourceNode==destinationNode:
             return []
@@ -682,7 +1173,7 @@ class ShortestPaths(object):
         path = []
         while vertex != sourceNode:
             path.insert(0, vertex)
-            vertex = vertex.predVertex
+            vertex = predVertices[vertex]
         path.insert(0, vertex)
         return path
 
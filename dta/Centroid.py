@@ -32,6 +32,8 @@ class Centroid(Node):
 
     .. note:: lmz has read over this, so todos are marked.
     """        
+    __slots__ = ()
+
     def __init__(self, id, x, y, label=None, level=None):
         """
         Constructor.
@@ -38,6 +38,8 @@ class Connector(RoadLink):
     
     #: connectors have a specific facility type
     FACILITY_TYPE = 99
+
+    __slots__ = ("_fromRoadNode",)
         
     def __init__(self, id, startNode, endNode, reverseAttachedLinkId, length,
                  freeflowSpeed, effectiveLengthFactor, responseTimeFactor, numLanes, 
@@ -112,6 +114,7 @@ class Connector(RoadLink):
             
         self._startNode._removeOutgoingLink(self)
         self._startNode = newStartNode
+        self._geometryChanged()
         self._startNode._addOutgoingLink(self)
         
     def setEndNode(self, newEndNode):
@@ -134,6 +137,7 @@ class Connector(RoadLink):
             
         self._endNode._removeIncomingLink(self)
         self._endNode = newEndNode
+        self._geometryChanged()
         self._endNode._addIncomingLink(self)
 
     def getRoadNode(self):
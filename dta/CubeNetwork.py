@@ -246,74 +246,76 @@ ENDRUN
         linksFile = open(linksCsvFilename, "r")
         countConnectors = 0
         countRoadLinks  = 0
-        for line in linksFile:
-            fields = line.strip().split(",")
+        # sort the links of each node once they're all added
+        with self.deferLinkOrdering():
+            for line in linksFile:
+                fields = line.strip().split(",")
             
-            a = int(fields[aIndex])
-            b = int(fields[bIndex])
+                a = int(fields[aIndex])
+                b = int(fields[bIndex])
             
-            if useOldNodeForId:
-                a = N_to_OldNode[a]
-                b = N_to_OldNode[b]
+                if useOldNodeForId:
+                    a = N_to_OldNode[a]
+                    b = N_to_OldNode[b]
                 
-            nodeA = self.getNodeForId(a)
-            nodeB = self.getNodeForId(b)
+                nodeA = self.getNodeForId(a)
+                nodeB = self.getNodeForId(b)
             
-            localsdict = dict(additionalLocals.items())
-            for i,linkVarName in enumerate(linkVariableNames):
-                localsdict[linkVarName] = fields[i].strip("' ") # Cube csv strings are in single quotes
+                localsdict = dict(additionalLocals.items())
+                for i,linkVarName in enumerate(linkVariableNames):
+                    localsdict[linkVarName] = fields[i].strip("' ") # Cube csv strings are in single quotes
 
-            if linkSkipEvalStr and eval(linkSkipEvalStr, globals(), localsdict): continue
+                if linkSkipEvalStr and eval(linkSkipEvalStr, globals(), localsdict): continue
                             
-            newLink = None
-            if isinstance(nodeA, Centroid) or isinstance(nodeB, Centroid):
-                localsdict['isConnector'] = True
-                try: 
-                    newLink = Connector \
-                       (id                      = self._maxLinkId+1,
-                        startNode               = nodeA,
-                        endNode                 = nodeB,
-                        reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
-                        # facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
-                        length                  = eval(linkLengthEvalStr, globals(), localsdict),
-                        freeflowSpeed           = eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
-                        effectiveLengthFactor   = eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
-                        responseTimeFactor      = eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
-                        numLanes                = eval(linkNumLanesEvalStr, globals(), localsdict),
-                        roundAbout              = eval(linkRoundAboutEvalStr, globals(), localsdict),
-                        level                   = eval(linkLevelEvalStr, globals(), localsdict),
-                        label                   = eval(linkLabelEvalStr, globals(), localsdict),
-                        group                   = eval(linkGroupEvalStr, globals(), localsdict))
-                    countConnectors += 1
-                except DtaError, e:
-                    DtaLogger.error("Error adding Connector from %d to %d - skipping: %s" %
-                                    (nodeA.getId(), nodeB.getId(), str(e)))
-                    continue
-            else:
-                localsdict['isConnector'] = False
-                try: 
-                    newLink = RoadLink \
-                       (id                      = self._maxLinkId+1,
-                        startNode               = nodeA,
-                        endNode                 = nodeB,
-                        reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
-                        facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
-                        length                  = eval(linkLengthEvalStr, globals(), localsdict),
-                        freeflowSpeed           = eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
-                        effectiveLengthFactor   = eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
-                        responseTimeFactor      = eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
-                        numLanes                = eval(linkNumLanesEvalStr, globals(), localsdict),
-                        roundAbout              = eval(linkRoundAboutEvalStr, globals(), localsdict),
-                        level                   = eval(linkLevelEvalStr, globals(), localsdict),
-                        label                   = eval(linkLabelEvalStr, globals(), localsdict),
-                        group                   = eval(linkGroupEvalStr, globals(), localsdict))
-                    countRoadLinks += 1
-                except DtaError, e:
-                    DtaLogger.error("Error adding RoadLink from %d to %d - skipping: %s" %
-                                    (nodeA.getId(), nodeB.getId(), str(e)))
-                    continue 
-            self.addLink(newLink)
-            self.additionalLinkVariables[(a,b)] = copy.deepcopy(localsdict)
+                newLink = None
+                if isinstance(nodeA, Centroid) or isinstance(nodeB, Centroid):
+                    localsdict['isConnector'] = True
+                    try: 
+                        newLink = Connector \
+                           (id                      = self._maxLinkId+1,
+                            startNode               = nodeA,
+                            endNode                 = nodeB,
+                            reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
+                            # facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
+                            length                  = eval(linkLengthEvalStr, globals(), localsdict),
+                            freeflowSpeed           = eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
+                            effectiveLengthFactor   = eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
+                            responseTimeFactor      = eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
+                            numLanes                = eval(linkNumLanesEvalStr, globals(), localsdict),
+                            roundAbout              = eval(linkRoundAboutEvalStr, globals(), localsdict),
+                            level                   = eval(linkLevelEvalStr, globals(), localsdict),
+                            label                   = eval(linkLabelEvalStr, globals(), localsdict),
+                            group                   = eval(linkGroupEvalStr, globals(), localsdict))
+                        countConnectors += 1
+                    except DtaError, e:
+                        DtaLogger.error("Error adding Connector from %d to %d - skipping: %s" %
+                                        (nodeA.getId(), nodeB.getId(), str(e)))
+                        continue
+                else:
+                    localsdict['isConnector'] = False
+                    try: 
+                        newLink = RoadLink \
+                           (id                      = self._maxLinkId+1,
+                            startNode               = nodeA,
+                            endNode                 = nodeB,
+                            reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
+                            facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
+                            length                  = eval(linkLengthEvalStr, globals(), localsdict),
+                            freeflowSpeed           = eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
+                            effectiveLengthFactor   = eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
+                            responseTimeFactor      = eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
+                            numLanes                = eval(linkNumLanesEvalStr, globals(), localsdict),
+                            roundAbout              = eval(linkRoundAboutEvalStr, globals(), localsdict),
+                            level                   = eval(linkLevelEvalStr, globals(), localsdict),
+                            label                   = eval(linkLabelEvalStr, globals(), localsdict),
+                            group                   = eval(linkGroupEvalStr, globals(), localsdict))
+                        countRoadLinks += 1
+                    except DtaError, e:
+                        DtaLogger.error("Error adding RoadLink from %d to %d - skipping: %s" %
+                                        (nodeA.getId(), nodeB.getId(), str(e)))
+                        continue 
+                self.addLink(newLink)
+                self.additionalLinkVariables[(a,b)] = copy.deepcopy(localsdict)
             
         DtaLogger.info("Read  %8d %-16s from %s" % (countConnectors, "connectors", linksCsvFilename))
         DtaLogger.info("Read  %8d %-16s from %s" % (countRoadLinks, "roadlinks", linksCsvFilename))
@@ -370,62 +372,65 @@ ENDRUN
         records = sf.records()
 
         fields = [field[0] for field in sf.fields[1:]]
-        for shape, recordValues in izip(shapes, records):
+        # sort the links of each node once they're all added
+        with self.deferLinkOrdering():
+            for shape, recordValues in izip(shapes, records):
 
-            localsdict = dict(zip(fields, recordValues))
-            startNodeId = int(localsdict["A"])
-            endNodeId = int(localsdict["B"])
+                localsdict = dict(zip(fields, recordValues))
+                startNodeId = int(localsdict["A"])
+                endNodeId = int(localsdict["B"])
 
-            try:
-                startNode = self.getNodeForId(startNodeId)
-                endNode = self.getNodeForId(endNodeId)
-            except DtaError, e:
-                print e 
-                continue
-
-            newLink = None
-            if isinstance(startNode, Centroid) or isinstance(endNode, Centroid):
-                localsdict['isConnector'] = True
-                try: 
-                    newLink = Connector \
-                        (id                      = self.getMaxLinkId() + 1,
-                        startNode               = startNode,
-                        endNode                 = endNode,
-                        reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
-                        #facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
-                        length                  = -1, # eval(linkLengthEvalStr, globals(), localsdict),
-                        freeflowSpeed           = 30, #eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
-                        effectiveLengthFactor   = 1.0, #eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
-                        responseTimeFactor      = 1.0, # eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
-                        numLanes                = 1, # eval(linkNumLanesEvalStr, globals(), localsdict),
-                        roundAbout              = 0, # eval(linkRoundAboutEvalStr, globals(), localsdict),
-                        level                   = 0, #eval(linkLevelEvalStr, globals(), localsdict),
-                        label                   = "") # eval(linkLabelEvalStr, globals(), localsdict))
+                try:
+                    startNode = self.getNodeForId(startNodeId)
+                    endNode = self.getNodeForId(endNodeId)
                 except DtaError, e:
-                    DtaLogger.error("%s" % str(e))
+                    print e 
                     continue
-            else:
-                localsdict['isConnector'] = False
-                try: 
-                    newLink = RoadLink \
-                       (id                      = self.getMaxLinkId()+1,
-                        startNode               = startNode,
-                        endNode                 = endNode,
-                        reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
-                        facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
-                        length                  = -1, # eval(linkLengthEvalStr, globals(), localsdict),
-                        freeflowSpeed           = 30, #eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
-                        effectiveLengthFactor   = 1.0, #eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
-                        responseTimeFactor      = 1.0, #eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
-                        numLanes                = 1, #eval(linkNumLanesEvalStr, globals(), localsdict),
-                        roundAbout              = 0, #eval(linkRoundAboutEvalStr, globals(), localsdict),
-                        level                   = 0, #eval(linkLevelEvalStr, globals(), localsdict),
-                        label                   = 0) #eval(linkLabelEvalStr, globals(), localsdict))
-                except DtaError, e:
-                    DtaLogger.error("%s" % str(e))
-                    continue
-            newLink._shapePoints = shape.points
-            self.addLink(newLink)
+
+                newLink = None
+                if isinstance(startNode, Centroid) or isinstance(endNode, Centroid):
+                    localsdict['isConnector'] = True
+                    try: 
+                        newLink = Connector \
+                            (id                      = self.getMaxLinkId() + 1,
+                            startNode               = startNode,
+                            endNode                 = endNode,
+                            reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
+                            #facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
+                            length                  = -1, # eval(linkLengthEvalStr, globals(), localsdict),
+                            freeflowSpeed           = 30, #eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
+                            effectiveLengthFactor   = 1.0, #eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
+                            responseTimeFactor      = 1.0, # eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
+                            numLanes                = 1, # eval(linkNumLanesEvalStr, globals(), localsdict),
+                            roundAbout              = 0, # eval(linkRoundAboutEvalStr, globals(), localsdict),
+                            level                   = 0, #eval(linkLevelEvalStr, globals(), localsdict),
+                            label                   = "") # eval(linkLabelEvalStr, globals(), localsdict))
+                    except DtaError, e:
+                        DtaLogger.error("%s" % str(e))
+                        continue
+                else:
+                    localsdict['isConnector'] = False
+                    try: 
+                        newLink = RoadLink \
+                           (id                      = self.getMaxLinkId()+1,
+                            startNode               = startNode,
+                            endNode                 = endNode,
+                            reverseAttachedLinkId   = eval(linkReverseAttachedIdEvalStr, globals(), localsdict),
+                            facilityType            = eval(linkFacilityTypeEvalStr, globals(), localsdict),
+                            length                  = -1, # eval(linkLengthEvalStr, globals(), localsdict),
+                            freeflowSpeed           = 30, #eval(linkFreeflowSpeedEvalStr, globals(), localsdict),
+                            effectiveLengthFactor   = 1.0, #eval(linkEffectiveLengthFactorEvalStr, globals(), localsdict),
+                            responseTimeFactor      = 1.0, #eval(linkResponseTimeFactorEvalStr, globals(), localsdict),
+                            numLanes                = 1, #eval(linkNumLanesEvalStr, globals(), localsdict),
+                            roundAbout              = 0, #eval(linkRoundAboutEvalStr, globals(), localsdict),
+                            level                   = 0, #eval(linkLevelEvalStr, globals(), localsdict),
+                            label                   = 0) #eval(linkLabelEvalStr, globals(), localsdict))
+                    except DtaError, e:
+                        DtaLogger.error("%s" % str(e))
+                        continue
+                newLink._shapePoints = shape.points
+                newLink._geometryChanged()
+                self.addLink(newLink)
             
     def applyTurnProhibitions(self, fileName):
         """
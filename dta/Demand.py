@@ -24,9 +24,10 @@ from itertools import izip
 import numpy as np
 
 import dta
-from dta.Algorithms import hasPath, getClosestCentroid 
+from dta.Algorithms import getClosestCentroid, ReachabilityIndex
 from dta.DtaError import DtaError
 from dta.MultiArray import MultiArray
+from dta.SparseMultiArray import SparseMultiArray
 from dta.Utils import Time
 
 class Demand(object):
@@ -36,7 +37,7 @@ class Demand(object):
 
     @classmethod
     def readCubeODTable(cls, fileName, net, vehicleClassName, 
-                        startTime, endTime, timeStep, demandPortion):
+                        startTime, endTime, timeStep=None, demandPortion=1.0, sparse=False):
         """
         Reads the demand (linear format) from the input csv file and returns a demand instance.
         
@@ -50,75 +51,114 @@ class Demand(object):
         :type startTime: a :py:class:`dta.Utils.Time` instance
         :param endTime: the simulation end time for this demand will stop being added to the network.
         :type endTime: a :py:class:`dta.Utils.Time` instance
-        :param timeStep: the granularity of time steps at which the demand is represented.
+        :param timeStep: the granularity of time steps at which the demand is represented; defaults to
+           a single time slice from *startTime* to *endTime*.
         :type timeStep: a :py:class:`dta.Utils.Time` instance
+        :param demandPortion: the factor the trips in the table are multiplied by.
+        :param sparse: if True, the demand only stores the nonzero OD pairs (see :py:meth:`Demand.isSparse`).
+        
+        The trips of each OD pair are converted to hourly flows and added to every time slice.  Intrazonal
+        trips are split evenly between the two directions of the pair formed by their zone and the closest
+        other centroid (see :py:func:`dta.Algorithms.getClosestCentroid`).
         
+        The whole table is read into arrays and added to the demand in bulk; the errors for the rows with zones
+        that are not in the network are logged row by row, and these rows are skipped.
         """
         timeSpan = endTime - startTime
-        demand = Demand(net, vehicleClassName, startTime, endTime, timeStep)
-        #demand = Demand(net, vehicleClassName, startTime, endTime, timeSpan)
-        totTrips = 0
-        numIntrazonalTrips = 0
+        if timeStep is None:
+            timeStep = timeSpan
+        demand = Demand(net, vehicleClassName, startTime, endTime, timeStep, sparse=sparse)
+
         inputStream = open(fileName, "r")
-        checkSum = 0 
-    
-        for record in csv.DictReader(inputStream):
-            
-            origin = int(record["O"])
-            destination = int(record["D"])
-            trips = demandPortion*float(record[vehicleClassName])
-            totTrips += trips
-            tripsInHourlyFlows = trips * (60.0 / timeSpan.getMinutes())
-            
-            if tripsInHourlyFlows == 0:
-                continue
-            if origin == destination:
-                origCent = net.getNodeForId(origin)
+        reader = csv.reader(inputStream)
+        fieldNames = reader.next()
+        originColumn        = fieldNames.index("O")
+        destinationColumn   = fieldNames.index("D")
+        tripsColumn         = fieldNames.index(vehicleClassName)
+
+        origins         = []
+        destinations    = []
+        trips           = []
+        for record in reader:
+            if not record: continue
+            origins.append(record[originColumn])
+            destinations.append(record[destinationColumn])
+            trips.append(record[tripsColumn])
+        inputStream.close()
+        dta.DtaLogger.info("The cube table has the following fields: %s" % ",".join(fieldNames))
+
+        origins         = np.array(origins, dtype=np.int64)
+        destinations    = np.array(destinations, dtype=np.int64)
+        trips           = demandPortion * np.array(trips, dtype=np.float64)
+        tripsInHourlyFlows = trips * (60.0 / timeSpan.getMinutes())
+
+        totTrips        = trips.sum()
+        hasTrips        = tripsInHourlyFlows != 0
+        isIntrazonal    = hasTrips & (origins == destinations)
+        numIntrazonalTrips = trips[isIntrazonal].sum()
+
+        # TAZ id -> index in the demand table
+        centroidIds     = np.array(demand._centroidIds, dtype=np.int64)
+        def getCentroidIndices(ids):
+            if len(centroidIds) == 0:
+                return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+            indices = np.minimum(np.searchsorted(centroidIds, ids), len(centroidIds) - 1)
+            return indices, centroidIds[indices] == ids
+        originIndices, originExists             = getCentroidIndices(origins)
+        destinationIndices, destinationExists   = getCentroidIndices(destinations)
+
+        for row in np.flatnonzero(hasTrips & ~isIntrazonal & ~originExists):
+            dta.DtaLogger.error("Origin zone %d does not exist" % origins[row])
+        for row in np.flatnonzero(hasTrips & ~isIntrazonal & originExists & ~destinationExists):
+            dta.DtaLogger.error("Destination zone %s does not exist" % destinations[row])
+
+        # the (origin index, destination index, flow) of one time slice
+        isValid     = hasTrips & ~isIntrazonal & originExists & destinationExists
+        sliceFlows  = [(originIndices[isValid], destinationIndices[isValid], tripsInHourlyFlows[isValid])]
+
+        # intrazonal flows go half each way between the zone and the closest centroid, looked up once per zone
+        if isIntrazonal.any():
+            unknownZones = origins[isIntrazonal & ~originExists]
+            if len(unknownZones) > 0:
+                raise DtaError("Intrazonal trips for zone %d that does not exist" % unknownZones[0])
+            intrazonalFlows = np.bincount(originIndices[isIntrazonal], weights=tripsInHourlyFlows[isIntrazonal],
+                                          minlength=len(centroidIds))
+            for zoneIndex in np.flatnonzero(intrazonalFlows):
+                origCent = net.getNodeForId(int(centroidIds[zoneIndex]))
                 destCent, dist = getClosestCentroid(net, origCent)
-                tripsIntrazonal = tripsInHourlyFlows/2
-                tripsBefore = demand.getTotalNumTrips()
-                for i,timeSlice in enumerate(demand._timePeriods):
-                    tripsOD = demand.getValue(timeSlice, origCent.getId(), destCent.getId())
-                    tripsDO = demand.getValue(timeSlice, destCent.getId(), origCent.getId())
-                    tripsOD += tripsIntrazonal
-                    tripsDO += tripsIntrazonal
-                    demand.setValue(timeSlice, origCent.getId(), destCent.getId(), tripsOD)
-                    demand.setValue(timeSlice, destCent.getId(), origCent.getId(), tripsDO)
-                #dist = dist/5280
-                #dta.DtaLogger.debug("Assigning %f intrazonal trips from zone %s to zone %s, %8.4f miles away." % (tripsInHourlyFlows,origCent.getId(),destCent.getId(),dist))
-                numIntrazonalTrips += trips
-                continue
-            if not net.hasCentroidForId(origin):
-                dta.DtaLogger.error("Origin zone %d does not exist" % origin)
-                continue 
-            if not net.hasCentroidForId(destination):
-                dta.DtaLogger.error("Destination zone %s does not exist" % destination)
-                continue
-            for i,timeSlice in enumerate(demand._timePeriods):
-                tripsOD = demand.getValue(timeSlice, origin, destination)
-                tripsOD += tripsInHourlyFlows
-                demand.setValue(timeSlice, origin, destination, tripsOD)
-            #if destination == 7973:
-            #    checkSum += trips
-
-        dta.DtaLogger.info("The cube table has the following fields: %s" % ",".join(record.keys()))
-          
+                if destCent is None:
+                    raise DtaError("No centroid to reassign the intrazonal trips of zone %d to" % origCent.getId())
+                destIndex = demand._centroidIds.index(destCent.getId())
+                sliceFlows.append(([zoneIndex, destIndex], [destIndex, zoneIndex], [intrazonalFlows[zoneIndex] / 2] * 2))
+
+        sliceOrigins, sliceDestinations, sliceValues = [np.concatenate(column) for column in izip(*sliceFlows)]
+        numSlices = demand.getNumSlices()
+        if demand.isSparse():
+            demand._addNonZero(np.repeat(np.arange(numSlices), len(sliceValues)), np.tile(sliceOrigins, numSlices),
+                               np.tile(sliceDestinations, numSlices), np.tile(sliceValues, numSlices))
+        else:
+            sliceArray = np.zeros((len(centroidIds), len(centroidIds)), dtype=np.float64)
+            np.add.at(sliceArray, (sliceOrigins.astype(np.int64), sliceDestinations.astype(np.int64)), sliceValues)
+            demand._demandTable.getNumpyArray()[:, :, :] += sliceArray
+
         dta.DtaLogger.info("Read %10.2f %-16s from %s" % (totTrips, "%s TRIPS" % vehicleClassName, fileName))
         if numIntrazonalTrips > 0:
             dta.DtaLogger.info("Reassigned %f intrazonal Trips" % numIntrazonalTrips)
         if totTrips - demand.getTotalNumTrips() > 1:
             dta.DtaLogger.error("The total number of trips in the Cube table = %d not equal to the number of trips transfered to Dynameq = %d." % (totTrips,demand.getTotalNumTrips()))
-        #dta.DtaLogger.info("There are %10.2f trips to zone 7973" % checkSum)
                     
         return demand
        
     @classmethod
-    def readDynameqTable(cls, net, fileName):
+    def readDynameqTable(cls, net, fileName, sparse=False):
         """
         Read the dynameq demand stored in the *fileName* that pertains to *net*, a :py:class:`Network` instance.
-        This method reads only rectangular demand tables. 
+        This method reads rectangular (full format) demand tables and linear format ones, which
+        list the origin, destination and value of the nonzero OD pairs of each time slice. 
+        If *sparse* is True, the demand only stores the nonzero OD pairs (see :py:meth:`Demand.isSparse`).
         """
-        DYNAMEQ_FORMAT_FULL = "FORMAT:full" 
+        DYNAMEQ_FORMAT_FULL     = "FORMAT:full" 
+        DYNAMEQ_FORMAT_LINEAR   = "FORMAT:linear"
         
         input = open(fileName, "rb")
         
@@ -126,9 +166,9 @@ class Demand(object):
         input.next() # <VERSION> 
         input.next() # <MATRIX_FILE> 
         input.next() # * comment 
-        line = input.next().strip() 
-        if line != DYNAMEQ_FORMAT_FULL:
-            raise DtaError("I cannot read a demand format other than %s" % Demand.FORMAT_FULL)
+        format = input.next().strip() 
+        if format not in (DYNAMEQ_FORMAT_FULL, DYNAMEQ_FORMAT_LINEAR):
+            raise DtaError("I cannot read a demand format other than %s or %s" % (DYNAMEQ_FORMAT_FULL, DYNAMEQ_FORMAT_LINEAR))
         input.next() # VEH_CLASS 
         line = input.next().strip() 
 
@@ -150,27 +190,58 @@ class Demand(object):
         if timeStep.getMinutes() == 0:
             raise DtaError("The time step defined by the first slice cannot be zero") 
         
-        demand = Demand(net, vehClassName, startTime, endTime, timeStep)
-        _npyArray = demand._demandTable.getNumpyArray()
-
-        timeStepInMin = timeStep.getMinutes()
-
+        demand = Demand(net, vehClassName, startTime, endTime, timeStep, sparse=sparse)
+
+        if format == DYNAMEQ_FORMAT_LINEAR:
+            # origin, destination, value records, and the index of their time slice
+            records     = []
+            slices      = []
+            sliceIndex  = 0
+            for line in input:
+                line = line.strip()
+                if not line: continue
+                if line == "SLICE":
+                    sliceIndex += 1
+                    input.next() # the end of the time slice
+                    continue
+                records.append(line.split())
+                slices.append(sliceIndex)
+            input.close()
+            if sliceIndex >= demand.getNumSlices():
+                raise DtaError("%s has more than the %d time slices from %s to %s" % 
+                               (fileName, demand.getNumSlices(), startTime, endTime))
+
+            records     = np.array(records, dtype=np.float64).reshape(len(records), 3)
+            centroidIds = np.array(demand._centroidIds, dtype=np.int64)
+            zoneIndices = []
+            for zones in (records[:, 0].astype(np.int64), records[:, 1].astype(np.int64)):
+                indices = np.minimum(np.searchsorted(centroidIds, zones), len(centroidIds) - 1)
+                unknownZones = zones[centroidIds[indices] != zones]
+                if len(unknownZones) > 0:
+                    raise DtaError("Zone %d in %s does not exist" % (unknownZones[0], fileName))
+                zoneIndices.append(indices)
+            demand._addNonZero(np.array(slices, dtype=np.int64), zoneIndices[0], zoneIndices[1], records[:, 2])
+            return demand
+
+        _npyArray = demand._demandTable.getNumpyArray() if not sparse else None
         for i, timePeriod in enumerate(demand.iterTimePeriods()):
             if timePeriod != demand.startTime + demand.timeStep: 
                 line = input.next().strip()
                 assert line == "SLICE"
                 line = input.next().strip()            
             destinations = map(int, input.next().strip().split())
-            for j, origin in enumerate(range(net.getNumCentroids())):
-                fields = map(float, input.next().strip().split()) 
-                #_npyArray[i,j,:] = np.array(fields[1:]) / ( 60.0 / timeStepInMin)
-                _npyArray[i,j,:] = np.array(fields[1:])
+            sliceArray = np.array([map(float, input.next().strip().split()[1:]) 
+                                   for origin in range(net.getNumCentroids())], dtype=np.float64)
+            if sparse:
+                origins, dests = np.nonzero(sliceArray)
+                demand._addNonZero(np.repeat(i, len(origins)), origins, dests, sliceArray[origins, dests])
+            else:
+                _npyArray[i, :, :] = sliceArray
+        input.close()
                 
         return demand
 
-
-
-    def __init__(self, net, vehClassName, startTime, endTime, timeStep):
+    def __init__(self, net, vehClassName, startTime, endTime, timeStep, sparse=False):
         """
         Constructor that initializes an empty Demand table that has three dimensions:
         time, origin taz, destination taz. 
@@ -184,6 +255,8 @@ class Demand(object):
         :type endTime: a :py:class:`dta.Utils.Time` instance
         :param timeStep: the granularity of time steps at which the demand is represented.
         :type timeStep: a :py:class:`dta.Utils.Time` instance
+        :param sparse: if True, the table is a :py:class:`SparseMultiArray` that only stores the 
+           nonzero OD pairs, instead of a dense :py:class:`MultiArray`.
         """
         self._net = net 
 
@@ -206,11 +279,55 @@ class Demand(object):
 
         self._centroidIds   = sorted([c.getId() for c in net.iterNodes() if c.isCentroid()]) 
 
-        self._demandTable   = MultiArray("d", [self._timeLabels, self._centroidIds, self._centroidIds])
+        if sparse:
+            self._demandTable = SparseMultiArray("d", [self._timeLabels, self._centroidIds, self._centroidIds])
+        else:
+            self._demandTable = MultiArray("d", [self._timeLabels, self._centroidIds, self._centroidIds])
                                              
         #TODO: what are you going to do with vehicle class names? 
         #self._vehicleClassNames = [vehClass.name for vehClass in self._net.getScenario().vehicleClassNames]
 
+    def isSparse(self):
+        """
+        Return True if the demand table only stores the nonzero OD pairs
+        """
+        return isinstance(self._demandTable, SparseMultiArray)
+
+    def _getNonZero(self):
+        """
+        Return the arrays (*slices*, *origins*, *destinations*, *values*) of the nonzero cells of the demand 
+        table, where the first three are the indices of the time slice, origin and destination.
+        """
+        if self.isSparse():
+            (slices, origins, destinations), values = self._demandTable.getNonZero()
+        else:
+            _npyArray = self._demandTable.getNumpyArray()
+            slices, origins, destinations = np.nonzero(_npyArray)
+            values = _npyArray[slices, origins, destinations]
+        return slices, origins, destinations, values
+
+    def _addNonZero(self, slices, origins, destinations, values):
+        """
+        Add the *values* to the cells of the demand table at the time slice, origin and 
+        destination indices *slices*, *origins* and *destinations*.
+        """
+        if self.isSparse():
+            self._demandTable.addNonZero((slices, origins, destinations), values)
+        else:
+            np.add.at(self._demandTable.getNumpyArray(), (slices, origins, destinations), values)
+
+    def _getSliceArray(self, sliceIndex):
+        """
+        Return the origin x destination values of the time slice at *sliceIndex* as a NumPy array.
+        """
+        if not self.isSparse():
+            return self._demandTable.getNumpyArray()[sliceIndex, :, :]
+        slices, origins, destinations, values = self._getNonZero()
+        inSlice = slices == sliceIndex
+        sliceArray = np.zeros((len(self._centroidIds), len(self._centroidIds)), dtype=np.float64)
+        sliceArray[origins[inSlice], destinations[inSlice]] = values[inSlice]
+        return sliceArray
+
     def iterTimePeriods(self):
         """
         Return an iterator to the time periods associated with the demand time slices
@@ -267,13 +384,9 @@ class Demand(object):
     @classmethod
     def writeDynameqDemandHeader(cls, outputStream, startTime, endTime, vehClassName, format='full'):
         """
-        Write the demand header in the dynameq format
-        .. todo:: implement linear writing
+        Write the demand header in the dynameq format; *format* is ``full`` or ``linear``
+        (see :py:meth:`Demand.writeDynameqTable`)
         """
-        
-        if format != 'full':
-            raise DtaError("Unimplemented Matrix Format specified: %s" % (format))
-            
         FORMAT_LINEAR    = 'FORMAT:linear'
         FORMAT_FULL      = 'FORMAT:full'    
         HEADER_LINE1     = '*DEMAND MATRIX ASCII FILE [FULL FORMAT]- GENERATED'
@@ -301,27 +414,39 @@ class Demand(object):
 
     def writeDynameqTable(self, outputStream, format='full'):
         """
-        Write the demand in Dynameq format
-        .. todo:: implement linear writing
+        Write the demand in Dynameq format.  The ``full`` format writes the whole origin x destination
+        table of each time slice; the ``linear`` format only writes the origin, destination and value 
+        of the nonzero OD pairs, so it doesn't need the dense tables of a sparse demand.  The header written 
+        by :py:meth:`Demand.writeDynameqDemandHeader` must have the same format.
         """
-        
-        if format != 'full':
+        if format not in ('full', 'linear'):
             raise DtaError("Unimplemented Matrix Format specified: %s" % (format))
             
         SLICE_SECTION    = 'SLICE'
-       
-        timeStepInMin = self.timeStep.getMinutes()
 
-        _npyArray = self._demandTable.getNumpyArray()
+        if format == 'linear':
+            slices, origins, destinations, values = self._getNonZero()
+            centroidIds = np.array(self._centroidIds, dtype=np.float64)
+            # the nonzero cells are in time slice order
+            sliceStarts = np.searchsorted(slices, np.arange(len(self._timePeriods) + 1))
+            for i, timePeriod in enumerate(self._timePeriods):
+                outputStream.write("%s\n%s\n" % (SLICE_SECTION, timePeriod.strftime("%H:%M")))
+                inSlice = slice(sliceStarts[i], sliceStarts[i + 1])
+                rows = np.column_stack((centroidIds[origins[inSlice]], centroidIds[destinations[inSlice]], values[inSlice]))
+                np.savetxt(outputStream, rows, fmt=["%d", "%d", "%.2f"], delimiter="\t")
+            return
+       
+        # the rows of a slice, with the origin in the first column 
+        rows = np.empty((len(self._centroidIds), len(self._centroidIds) + 1), dtype=np.float64)
+        rows[:, 0] = self._centroidIds
+        rowFormat = ["%d"] + ["%.2f"] * len(self._centroidIds)
         
         for i, timePeriod in enumerate(self._timePeriods):
-            outputStream.write("SLICE\n%s\n" % timePeriod.strftime("%H:%M"))
+            outputStream.write("%s\n%s\n" % (SLICE_SECTION, timePeriod.strftime("%H:%M")))
             outputStream.write("\t%s\n" % '\t'.join(map(str, self._centroidIds)))
 
-            for j, cent in enumerate(self._centroidIds):
-                outputStream.write("%d\t%s\n" % (cent, "\t".join("%.2f" % elem for elem in _npyArray[i, j, :])))                
-                
-
+            rows[:, 1:] = self._getSliceArray(i)
+            np.savetxt(outputStream, rows, fmt=rowFormat, delimiter="\t")
 
     def __eq__(self, other):
         """
@@ -340,6 +465,9 @@ class Demand(object):
         if self.vehClassName != other.vehClassName:
             return False
 
+        if self.isSparse() or other.isSparse():
+            return all(np.array_equal(mine, others) for mine, others in izip(self._getNonZero(), other._getNonZero()))
+
         if not self._demandTable == other._demandTable:
             return False 
 
@@ -366,35 +494,89 @@ class Demand(object):
         newTimeStepInMin = self.timeStep.getMinutes() / len(factorsInAList)
         newTimeStep = Time.fromMinutes(newTimeStepInMin)
         
-        newDemand = Demand(self._net, self.vehClassName, self.startTime, self.endTime, newTimeStep)
-        #timeSpan = (newDemand.endTime - newDemand.startTime).getMinutes()/60.0
-        oldDemand = 0
-        sliceDemand = []
-        for k, timeSlice in enumerate(newDemand._timePeriods):
-            sliceDemand.append(0)
-        for origin in self._centroidIds:
-            for destination in self._centroidIds:
-                tripsOD_Old = self.getValue(self.endTime, origin, destination)*len(factorsInAList)
-                for k, timeSlice in enumerate(newDemand._timePeriods):
-                    tripsOD = factorsInAList[k]*tripsOD_Old
-                    newDemand.setValue(timeSlice, origin, destination, tripsOD)
+        newDemand = Demand(self._net, self.vehClassName, self.startTime, self.endTime, newTimeStep, sparse=self.isSparse())
+
+        # the values are hourly flows, so each factor is scaled up by the number of new time slices
+        factors = np.array(factorsInAList, dtype=np.float64) * len(factorsInAList)
+        if self.isSparse():
+            slices, origins, destinations, values = self._getNonZero()
+            numSlices = len(factors)
+            newDemand._addNonZero(np.repeat(np.arange(numSlices), len(values)), np.tile(origins, numSlices),
+                                  np.tile(destinations, numSlices), np.outer(factors, values).ravel())
+        else:
+            newDemand._demandTable.getNumpyArray()[:, :, :] = factors[:, np.newaxis, np.newaxis] * \
+                self._demandTable.getNumpyArray()[0, :, :]
                                
         return newDemand                            
 
+    def scale(self, factor):
+        """
+        Multiply all the values of all time slices by *factor*.
+        """
+        self._demandTable.multiplyInPlace(factor)
+
+    def _checkSameStructure(self, other):
+        """
+        Raise a :py:class:`DtaError` if the *other* demand doesn't have the same time slices and centroids.
+        """
+        if self.startTime != other.startTime or self.endTime != other.endTime or self.timeStep != other.timeStep:
+            raise DtaError("Demand for %s from %s to %s by %s doesn't have the same time slices as demand for %s from %s to %s by %s" %
+                           (other.vehClassName, other.startTime, other.endTime, other.timeStep,
+                            self.vehClassName, self.startTime, self.endTime, self.timeStep))
+        if self._centroidIds != other._centroidIds:
+            raise DtaError("Demand for %s doesn't have the same centroids as demand for %s" %
+                           (other.vehClassName, self.vehClassName))
+
+    def addDemand(self, other):
+        """
+        Add the values of the *other* demand (e.g. for another vehicle class) to this one.  
+        Both must have the same time slices and centroids.
+        """
+        self._checkSameStructure(other)
+        if self.isSparse() or other.isSparse():
+            self._addNonZero(*other._getNonZero())
+        else:
+            self._demandTable.getNumpyArray()[:, :, :] += other._demandTable.getNumpyArray()
+
+    def aggregateTimeSlices(self, newTimeStep):
+        """
+        Return a new demand object with time slices of length *newTimeStep*, which must be a multiple
+        of the current time step.  Since the values are hourly flows, the value of each new time slice
+        is the mean of the values of the time slices it covers, so the total number of trips doesn't change.
+        """
+        if newTimeStep % self.timeStep != 0:
+            raise DtaError("The new time step %s is not a multiple of the demand time step %s" % 
+                           (newTimeStep, self.timeStep))
+
+        newDemand = Demand(self._net, self.vehClassName, self.startTime, self.endTime, newTimeStep, sparse=self.isSparse())
+        slicesPerNewSlice = newTimeStep.getMinutes() / self.timeStep.getMinutes()
+
+        if self.isSparse():
+            slices, origins, destinations, values = self._getNonZero()
+            newDemand._addNonZero(slices / slicesPerNewSlice, origins, destinations, values / slicesPerNewSlice)
+            return newDemand
+
+        _npyArray = self._demandTable.getNumpyArray()
+        newDemand._demandTable.getNumpyArray()[:, :, :] = _npyArray.reshape(
+            (newDemand.getNumSlices(), slicesPerNewSlice) + _npyArray.shape[1:]).mean(axis=1)
+        return newDemand
+
     def removeInvalidODPairs(self):
         """
         Examine all the OD interchanges and remove those for which 
-        a path does not exist from origin to destination
+        a path does not exist from origin to destination.  The paths are looked up 
+        in a :py:class:`ReachabilityIndex` built once for the network, and the 
+        OD interchanges are removed from all the time slices at once.
         """
-        
-        for originId in self._centroidIds:
-            for destinationId in self._centroidIds:
-                for timeLabel in self._timeLabels:
-                    if self.getValue(timeLabel, originId, destinationId) > 0:
-                        origin = self._net.getNodeForId(originId)
-                        destination = self._net.getNodeForId(destinationId)
-                        if not hasPath(self._net, origin, destination):
-                            self.setValue(timeLabel, originId, destinationId, 0) 
+        centroids = [self._net.getNodeForId(centroidId) for centroidId in self._centroidIds]
+        reachable = ReachabilityIndex(self._net).getReachabilityMatrix(centroids, centroids)
+
+        if self.isSparse():
+            slices, origins, destinations, values = self._getNonZero()
+            isValid = reachable[origins, destinations]
+            self._demandTable.setNonZero((slices[isValid], origins[isValid], destinations[isValid]), values[isValid])
+        else:
+            self._demandTable.getNumpyArray()[:, ~reachable] = 0
                         
     def getTotalNumTrips(self):
         """
@@ -18,9 +18,13 @@ __license__     = """
 import shapefile
 import pdb
 import math
-from itertools import izip, imap
+from itertools import izip, imap, islice
 import os
 import sys, csv
+import cPickle
+import hashlib
+import tempfile
+import numpy as np
 
 from itertools import chain 
 from .Centroid import Centroid
@@ -30,13 +34,15 @@ from .Logger import DtaLogger
 from .Movement import Movement
 from .Network import Network
 from .Node import Node
+from .ObsCounts import ObsCounts
 from .RoadLink import RoadLink
 from .RoadNode import RoadNode
 from .TimePlan import TimePlan
+from .VehicleType import VehicleType
 from .VirtualLink import VirtualLink
 from .VirtualNode import VirtualNode
 from .VehicleClassGroup import VehicleClassGroup
-from .Utils import Time
+from .Utils import Time, findDynameqFile, readDynameqSections
 
 class DynameqNetwork(Network):
     """
@@ -55,6 +61,25 @@ class DynameqNetwork(Network):
     PRIORITIES_FILE = '%s_prio.dqt'
     #: Dynameq's Toll User Attribute File name
     TOLL_FILE = '%s_toll.dqt'
+    #: Binary network cache file name; see :py:meth:`DynameqNetwork.writeCache`
+    CACHE_FILE = '%s_network.cache'
+    #: Version of the binary network cache format; caches written with another version are ignored.
+    #: Changes to the ``__slots__`` of the cached classes are detected without it; see :py:meth:`DynameqNetwork.writeCache`
+    CACHE_VERSION = 8
+    #: Attributes that are derived from the others (indices, geometry, conflict matrices, turn types, etc.) or that
+    #: reference the simulated results, mapped to the factories of their initial values.  They are not written
+    #: to the cache, and are reset to their initial values when the cache is read.
+    CACHE_TRANSIENT_ATTRIBUTES = {"_spatialIndex"       : lambda: None,
+                                  "_linkGeometry"       : lambda: None,
+                                  "_simResults"         : lambda: None,
+                                  "_simResultsIndex"    : lambda: None,
+                                  "_nodesToSort"        : lambda: None,
+                                  "_spatialIndexRef"    : lambda: None,
+                                  "_geometryCache"      : dict,
+                                  "_conflictMatrix"     : lambda: None,
+                                  "_centerLine"         : lambda: None,
+                                  "_turnType"           : lambda: None,
+                                  "_incomingDirection"  : lambda: None}
     
     #: Dynameq's Base file header
     BASE_HEADER          = """<DYNAMEQ>
@@ -101,94 +126,67 @@ class DynameqNetwork(Network):
         Network.__init__(self, scenario)
         self._dir = None 
                 
-    def read(self, dir, file_prefix):
+    def read(self, dir, file_prefix, useCache=False):
         """
         Reads the network in the given *dir* with the given *file_prefix*.
 
+        If *useCache* is True, the network is loaded from the binary cache file :py:attr:`DynameqNetwork.CACHE_FILE`
+        in *dir* if it is up to date with the Dynameq files (see :py:meth:`DynameqNetwork.readCache`); otherwise
+        the Dynameq files are read and the cache is written for the next time.
         """
         # base file processing
         basefile = os.path.join(dir, DynameqNetwork.BASE_FILE % file_prefix)
-        if not os.path.exists(basefile):
+        if not findDynameqFile(basefile):
             raise DtaError("Base network file %s does not exist" % basefile)
         
         self._dir = dir 
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "NODES", "CENTROIDS"):
-            self.addNode(self._parseNodeFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "NODES", basefile))
 
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "CENTROIDS", "LINKS"):
-            self.addNode(self._parseCentroidFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "CENTROIDS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LINKS", "LANE_PERMS"):
-            self.addLink(self._parseLinkFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LINKS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LANE_PERMS", "LINK_EVENTS"):
-            self._addLanePermissionFromFields(fields)
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LANE_PERMS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LINK_EVENTS", "LANE_EVENTS"):
+        if useCache:
+            cachefile   = os.path.join(dir, DynameqNetwork.CACHE_FILE % file_prefix)
+            sourcefiles = self._getSourceFileNames(dir, file_prefix)
+            if self.readCache(cachefile, sourcefiles):
+                self._dir = dir
+                return
+
+        self._readDynameqFiles(dir, file_prefix)
+
+        if useCache:
+            self.writeCache(cachefile, sourcefiles)
+
+    def _readDynameqFiles(self, dir, file_prefix):
+        """
+        Reads the network from the Dynameq files in the given *dir* with the given *file_prefix*.
+        """
+        def linkEventNotImplemented(fields):
             #TODO: do LINK_EVENTS have to correspond to scenario events?
             raise DtaError("LINK_EVENTS not implemented yet")
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LINK_EVENTS", basefile))
 
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "LANE_EVENTS", "VIRTUAL_LINKS"):
-            #TODO: do LANE_EVENTS have to correspond to scenario events?
-            #raise DtaError("LANE_EVENTS not implemented yet")
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "LANE_EVENTS", basefile))
-            
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "VIRTUAL_LINKS", "MOVEMENTS"):
-            self.addLink(self._parseVirtualLinkFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "VIRTUAL_LINKS", basefile))
-            
-        count = 0                        
-        for fields in self._readSectionFromFile(basefile, "MOVEMENTS", "MOVEMENT_EVENTS"):
-            mov = self._parseMovementFromFields(fields)
-            self.addMovement(self._parseMovementFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "MOVEMENTS", basefile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(basefile, "MOVEMENT_EVENTS", "ENDOFFILE"):
-            #TODO: MOVEMENT_EVENTS
-            #raise DtaError("MOVEMENT_EVENTS not implemented yet")            
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "MOVEMENT_EVENTS", basefile))
+        basefile = findDynameqFile(os.path.join(dir, DynameqNetwork.BASE_FILE % file_prefix))
+        # the links of each node are sorted once they're all read
+        with self.deferLinkOrdering():
+            readDynameqSections(basefile, 
+                [("NODES",           lambda fields: self.addNode(self._parseNodeFromFields(fields))),
+                 ("CENTROIDS",       lambda fields: self.addNode(self._parseCentroidFromFields(fields))),
+                 ("LINKS",           lambda fields: self.addLink(self._parseLinkFromFields(fields))),
+                 ("LANE_PERMS",      self._addLanePermissionFromFields),
+                 ("LINK_EVENTS",     linkEventNotImplemented),
+                 #TODO: do LANE_EVENTS have to correspond to scenario events?
+                 ("LANE_EVENTS",     None),
+                 ("VIRTUAL_LINKS",   lambda fields: self.addLink(self._parseVirtualLinkFromFields(fields))),
+                 ("MOVEMENTS",       lambda fields: self.addMovement(self._parseMovementFromFields(fields))),
+                 #TODO: MOVEMENT_EVENTS
+                 ("MOVEMENT_EVENTS", None)])
         
         # advanced file processing
-        advancedfile = os.path.join(dir, DynameqNetwork.ADVANCED_FILE % file_prefix)
-        if os.path.exists(advancedfile):
-            
-            count = 0
-            for fields in self._readSectionFromFile(advancedfile, "SHIFTS", "VERTICES"):
-                self._addShiftFromFields(fields)
-                count += 1
-            DtaLogger.info("Read  %8d %-16s from %s" % (count, "SHIFTS", advancedfile))
-            
-            count = 0
-            for fields in self._readSectionFromFile(advancedfile, "VERTICES", "ENDOFFILE"):
-                self._addShapePointsToLink(fields)
-                count += 1
-            DtaLogger.info("Read  %8d %-16s from %s" % (count, "VERTICES", advancedfile))
+        advancedfile = findDynameqFile(os.path.join(dir, DynameqNetwork.ADVANCED_FILE % file_prefix))
+        if advancedfile:
+            readDynameqSections(advancedfile,
+                [("SHIFTS",      self._addShiftFromFields),
+                 ("VERTICES",    self._addShapePointsToLink)])
 
         # control file Processing
-        controlfile = os.path.join(dir, DynameqNetwork.CONTROL_FILE % file_prefix)
-        if os.path.exists(controlfile):
+        controlfile = findDynameqFile(os.path.join(dir, DynameqNetwork.CONTROL_FILE % file_prefix))
+        if controlfile:
             
             count = 0
             for tp in TimePlan.readDynameqPlans(self, controlfile):
@@ -196,18 +194,215 @@ class DynameqNetwork(Network):
                 count += 1
             DtaLogger.info("Read  %8d %-16s from %s" % (count, "TIME PLANS", controlfile))
                         
-        # custom priorities file
-        custompriofile = os.path.join(dir, DynameqNetwork.PRIORITIES_FILE % file_prefix)
-        if os.path.exists(custompriofile):
-            
-            count = 0
-            for fields in self._readSectionFromFile(custompriofile, None, "ENDOFFILE"):
-                self._addCustomPrioritiesFromFields(fields)
-                count += 1
-            DtaLogger.info("Read  %8d %-16s from %s" % (count, "CUSTOM PRIOS", custompriofile))
+        # custom priorities file; the records follow the file type
+        custompriofile = findDynameqFile(os.path.join(dir, DynameqNetwork.PRIORITIES_FILE % file_prefix))
+        if custompriofile:
+            readDynameqSections(custompriofile,
+                [("<CUSTOM_PRIORITIES_FILE>", self._addCustomPrioritiesFromFields)])
                        
         ## TODO - what about the public transit file?
         
+    def _getSourceFileNames(self, dir, file_prefix):
+        """
+        Returns the list of the Dynameq files in *dir* that :py:meth:`DynameqNetwork.read` reads the network from.
+        """
+        filenames = [findDynameqFile(os.path.join(dir, filename % file_prefix)) for filename in 
+                     (DynameqNetwork.BASE_FILE, DynameqNetwork.ADVANCED_FILE, DynameqNetwork.CONTROL_FILE, DynameqNetwork.PRIORITIES_FILE)]
+        return [filename for filename in filenames if filename]
+
+    def _getSourceFileSignature(self, filename):
+        """
+        Returns the (name, size, modification time, md5 digest) of *filename*.
+        """
+        md5 = hashlib.md5()
+        inputStream = open(filename, "rb")
+        for block in iter(lambda: inputStream.read(1 << 20), ""):
+            md5.update(block)
+        inputStream.close()
+        return (os.path.basename(filename), os.path.getsize(filename), os.path.getmtime(filename), md5.hexdigest())
+
+    @classmethod
+    def _getSlots(cls, objClass):
+        """
+        Returns the sorted tuple of the names in the ``__slots__`` of *objClass* and its base classes.
+        """
+        slots = set()
+        for baseClass in objClass.__mro__:
+            slots.update(slot for slot in getattr(baseClass, "__slots__", ()) if slot != "__dict__")
+        return tuple(sorted(slots))
+
+    def _getCacheState(self, obj):
+        """
+        Returns the attributes of *obj* (including those in __slots__) as a dictionary,
+        without the ones in :py:attr:`DynameqNetwork.CACHE_TRANSIENT_ATTRIBUTES`.
+        """
+        state = dict(getattr(obj, "__dict__", {}))
+        for slot in DynameqNetwork._getSlots(type(obj)):
+            if hasattr(obj, slot):
+                state[slot] = getattr(obj, slot)
+        for attr in DynameqNetwork.CACHE_TRANSIENT_ATTRIBUTES:
+            state.pop(attr, None)
+        return state
+
+    def _resetTransientAttributes(self, obj):
+        """
+        Sets the attributes of *obj* in :py:attr:`DynameqNetwork.CACHE_TRANSIENT_ATTRIBUTES` to their initial values.
+        """
+        attrs = set(getattr(obj, "__dict__", {})).union(DynameqNetwork._getSlots(type(obj)))
+        for attr, factory in DynameqNetwork.CACHE_TRANSIENT_ATTRIBUTES.iteritems():
+            if attr in attrs:
+                setattr(obj, attr, factory())
+
+    def writeCache(self, cachefile, sourcefiles):
+        """
+        Writes the nodes, links, movements (and everything they hold: shape points, lane permissions,
+        time plans, etc.) of this network to the binary file *cachefile*, along with the size, modification
+        time and md5 digest of each of the *sourcefiles* the network was read from, so that
+        :py:meth:`DynameqNetwork.readCache` can tell if the cache is still up to date.
+
+        The nodes, links and movements are written as flat tables with references between them replaced
+        by table positions, so the size of the network doesn't matter for the pickle recursion depth.
+        The :py:class:`VehicleClassGroup` instances and the :py:class:`Scenario` are referenced by name and
+        are not written; they come from the scenario of the network reading the cache.  Neither are the
+        attributes in :py:attr:`DynameqNetwork.CACHE_TRANSIENT_ATTRIBUTES`, which are rebuilt on demand.
+        The ``__slots__`` of the classes of the objects are written too, so a cache written before any of them
+        changed is out of date.
+
+        The cache is written to a temporary file that is then renamed to *cachefile*, so an interrupted
+        write doesn't leave a truncated cache behind.
+        """
+        nodes       = sorted(self.iterNodes(), key=lambda node: node.getId())
+        links       = sorted(self.iterLinks(), key=lambda link: link.getId())
+        movements   = [mov for link in links if not link.isVirtualLink() for mov in link.iterOutgoingMovements()]
+
+        # id(object) -> persistent id
+        persistentIds = {id(self):("W", None), id(self._scenario):("S", None)}
+        for vcg in self._scenario.iterVehicleClassGroups():
+            persistentIds[id(vcg)] = ("V", vcg.name)
+        for tableName, table in (("N", nodes), ("L", links), ("M", movements)):
+            for position, obj in enumerate(table):
+                persistentIds[id(obj)] = (tableName, position)
+
+        networkState = self._getCacheState(self)
+        classes = set(type(obj) for obj in chain(nodes, links, movements))
+
+        header = {"version"     : DynameqNetwork.CACHE_VERSION,
+                  "units"       : (VehicleType.LENGTH_UNITS, Node.COORDINATE_UNITS, RoadLink.LENGTH_UNITS),
+                  "slots"       : dict((cls, DynameqNetwork._getSlots(cls)) for cls in classes),
+                  "sourcefiles" : [self._getSourceFileSignature(filename) for filename in sourcefiles]}
+
+        (fileDescriptor, tempFileName) = tempfile.mkstemp(prefix=os.path.basename(cachefile), suffix=".tmp",
+                                                          dir=os.path.dirname(os.path.abspath(cachefile)))
+        outputStream = os.fdopen(fileDescriptor, "wb")
+        try:
+            cPickle.dump(header, outputStream, cPickle.HIGHEST_PROTOCOL)
+
+            pickler = cPickle.Pickler(outputStream, cPickle.HIGHEST_PROTOCOL)
+            pickler.dump(([type(obj) for obj in nodes], [type(obj) for obj in links], [type(obj) for obj in movements]))
+            pickler.persistent_id = lambda obj: persistentIds.get(id(obj))
+            pickler.dump((networkState, 
+                          [self._getCacheState(obj) for obj in nodes],
+                          [self._getCacheState(obj) for obj in links],
+                          [self._getCacheState(obj) for obj in movements]))
+            outputStream.close()
+
+            # os.rename() doesn't replace an existing file on Windows
+            if os.path.exists(cachefile):
+                os.remove(cachefile)
+            os.rename(tempFileName, cachefile)
+        except:
+            outputStream.close()
+            os.remove(tempFileName)
+            raise
+        DtaLogger.info("Wrote %8d nodes, %8d links and %8d movements to %s" % (len(nodes), len(links), len(movements), cachefile))
+
+    def readCache(self, cachefile, sourcefiles):
+        """
+        Reads the network written to *cachefile* by :py:meth:`DynameqNetwork.writeCache` into this (empty) network,
+        if the cache is up to date: its format version, units and class ``__slots__`` are the current ones and
+        the *sourcefiles* are the ones it was written for, with the same sizes and either the same modification
+        times or the same contents.
+
+        Returns True if the network was read, False if the cache is missing, out of date or can't be read
+        (e.g. a truncated file); the network is left empty in that case.
+        """
+        if not os.path.exists(cachefile):
+            return False
+
+        inputStream = open(cachefile, "rb")
+        try:
+            header = cPickle.load(inputStream)
+            valid = (header.get("version") == DynameqNetwork.CACHE_VERSION and
+                     header.get("units") == (VehicleType.LENGTH_UNITS, Node.COORDINATE_UNITS, RoadLink.LENGTH_UNITS) and
+                     all(DynameqNetwork._getSlots(cls) == slots for cls, slots in header.get("slots", {}).iteritems()) and
+                     len(header.get("sourcefiles")) == len(sourcefiles))
+        except Exception, e:
+            inputStream.close()
+            DtaLogger.warn("Ignoring network cache %s: %s" % (cachefile, str(e)))
+            return False
+
+        if valid:
+            for (name, size, mtime, digest), filename in izip(header["sourcefiles"], sourcefiles):
+                if name != os.path.basename(filename) or size != os.path.getsize(filename):
+                    valid = False
+                elif mtime != os.path.getmtime(filename) and digest != self._getSourceFileSignature(filename)[3]:
+                    valid = False
+                if not valid: break
+
+        if not valid:
+            inputStream.close()
+            DtaLogger.info("Network cache %s is out of date" % cachefile)
+            return False
+
+        try:
+            (tables, networkState, nodeStates, linkStates, movementStates) = self._readCacheTables(inputStream)
+        except Exception, e:
+            inputStream.close()
+            DtaLogger.warn("Ignoring network cache %s: %s: %s" % (cachefile, e.__class__.__name__, str(e)))
+            return False
+        inputStream.close()
+
+        for tableName, states in (("N", nodeStates), ("L", linkStates), ("M", movementStates)):
+            for obj, state in izip(tables[tableName], states):
+                for attr, value in state.iteritems():
+                    setattr(obj, attr, value)
+                self._resetTransientAttributes(obj)
+
+        scenario = self._scenario
+        for attr, value in networkState.iteritems():
+            setattr(self, attr, value)
+        self._scenario = scenario
+        self._resetTransientAttributes(self)
+
+        DtaLogger.info("Read  %8d nodes, %8d links and %8d movements from %s" % 
+                       (len(nodeStates), len(linkStates), len(movementStates), cachefile))
+        return True
+
+    def _readCacheTables(self, inputStream):
+        """
+        Reads the tables of the objects following the header of a cache file from *inputStream*.
+        Returns (*tables*, *networkState*, *nodeStates*, *linkStates*, *movementStates*) where *tables* maps
+        the table names to the new (empty) objects and the states are the dictionaries of their attributes.
+        """
+        unpickler   = cPickle.Unpickler(inputStream)
+        tables      = {}
+        for tableName, classes in izip(("N", "L", "M"), unpickler.load()):
+            tables[tableName] = [cls.__new__(cls) for cls in classes]
+
+        def persistentLoad(persistentId):
+            tableName, key = persistentId
+            if tableName == "W":
+                return self
+            if tableName == "S":
+                return self._scenario
+            if tableName == "V":
+                return self._scenario.getVehicleClassGroup(key)
+            return tables[tableName][key]
+
+        unpickler.persistent_load = persistentLoad
+        networkState, nodeStates, linkStates, movementStates = unpickler.load()
+        return (tables, networkState, nodeStates, linkStates, movementStates)
+
     def write(self, dir, file_prefix):
         """
         Writes the network into the given *dir* with the given *file_prefix*
@@ -254,43 +449,6 @@ class DynameqNetwork(Network):
         self._writeTollFile(toll_object)
         toll_object.close() 
 
-    def _readSectionFromFile(self, filename, sectionName, nextSectionName):
-        """
-        Generator function, yields fields (array of strings) from the given section of the given file.
-        
-        If *sectionName* is None, starts reading after comments.
-        
-        """
-        lines = open(filename, "r")
-        curLine = ""
-        if sectionName:
-            try:
-                # find the section
-                while curLine != sectionName: curLine = lines.next().strip()
-                
-            except StopIteration:
-                raise DtaError("DynameqNetwork _readSectionFromFile failed to find %s in %s" % 
-                               (sectionName,filename))
-        else:
-            # find the first comment
-            curLine = " "
-            while curLine[0] != "*": curLine = lines.next().strip()
-        
-        # go past the section name
-        curLine = lines.next().strip()
-        # skip any comments
-        while curLine[0] == "*":
-            curLine = lines.next().strip()
-        
-        # these are the ones we want
-        while not curLine == nextSectionName:
-            fields  = curLine.split()
-            yield fields
-            
-            curLine = lines.next().strip()
-        lines.close()
-        raise StopIteration
-
     def _parseNodeFromFields(self, fields):
         """
         Interprets fields and returns a RoadNode or a VirtualNode
@@ -834,10 +992,53 @@ class DynameqNetwork(Network):
         DtaLogger.info("Wrote %8d %-16s to %s" % (count, "CUSTOM PRIOS", customprio_object.name))
     
         
+    def _readMovementResultsFile(self, fileName, numHeaderLines=9, chunkSize=20000):
+        """
+        Reads the Dynameq movement output file *fileName*, whose lines are the at node, from node and to node
+        ids of a movement followed by a value per time period.  The file is read in chunks of *chunkSize* lines
+        that are each parsed in one go by numpy.
+
+        Returns the tuple (*nodeIds*, *values*) of NumPy arrays with a row per line: *nodeIds* has the three
+        node ids and *values* has the values.
+        """
+        nodeIdChunks    = []
+        valueChunks     = []
+        numColumns      = None
+
+        inputStream = open(fileName, 'r')
+        for i in range(numHeaderLines):
+            inputStream.next()
+
+        while True:
+            lines = [line for line in islice(inputStream, chunkSize) if line.strip()]
+            if not lines: break
+
+            if numColumns is None:
+                numColumns = len(lines[0].split())
+            data = np.fromstring(" ".join(lines), dtype=np.float64, sep=" ")
+            if data.size != numColumns * len(lines):
+                raise DtaError("The file %s has lines with different numbers of values; expected %d on each line" %
+                               (fileName, numColumns))
+            data = data.reshape((len(lines), numColumns))
+
+            nodeIdChunks.append(data[:, :3].astype(np.int64))
+            valueChunks.append(data[:, 3:])
+        inputStream.close()
+
+        if not nodeIdChunks:
+            return np.zeros((0, 3), dtype=np.int64), np.zeros((0, 0), dtype=np.float64)
+        return np.vstack(nodeIdChunks), np.vstack(valueChunks)
+
     def _readMovementOutFlowsAndTTs(self):
         """
-        Read the movement travel times (in seconds) add assign them 
-        to the corresponding movement
+        Read the movement flows (in vph) and travel times (in seconds) and 
+        store them in the :py:class:`SimResults` of the network as volumes 
+        per time step and travel times in minutes.
+
+        The three files are read in bulk and the results are assigned to all
+        the movements at once.  Lines for movements that are not in the network
+        (e.g. prohibited movements) are skipped, as are time periods with a 
+        negative travel time.
         """
         if not self._dir:
             raise DtaError("The network directory has not been defined")
@@ -846,211 +1047,166 @@ class DynameqNetwork(Network):
                                             DynameqNetwork.MOVEMENT_FLOW_OUT)
         movementTimeFileName = os.path.join(self._dir,
                                             DynameqNetwork.MOVEMENT_TIME_OUT)
-
         movementFlowInFileName = os.path.join(self._dir,
                                             DynameqNetwork.MOVEMENT_FLOW_IN)
 
+        flowNodeIds, flows      = self._readMovementResultsFile(movementFlowFileName)
+        timeNodeIds, times      = self._readMovementResultsFile(movementTimeFileName)
+        flowInNodeIds, flowsIn  = self._readMovementResultsFile(movementFlowInFileName)
 
-        inputStream1 = open(movementFlowFileName, 'r')
-        inputStream2 = open(movementTimeFileName, 'r')
-        inputStream3 = open(movementFlowInFileName, 'r')        
-
-        for i in range(9):
-            inputStream1.next()
-            inputStream2.next()
-
-        for flowLine, timeLine, flowInLine in izip(inputStream1, inputStream2, inputStream3):
-            
-            flowFields = flowLine.strip().split()
-            timeFields = timeLine.strip().split()
-            flowInFields = flowLine.strip().split()            
-
-            nodeBid, nodeAid, nodeCid = map(int, flowFields[:3])
-
-            if [nodeBid, nodeAid, nodeCid] != map(int, timeFields[:3]):
+        for fileName, nodeIds in ((movementTimeFileName, timeNodeIds), (movementFlowInFileName, flowInNodeIds)):
+            if nodeIds.shape != flowNodeIds.shape or np.any(nodeIds != flowNodeIds):
+                row = 0 if nodeIds.shape != flowNodeIds.shape else np.nonzero(np.any(nodeIds != flowNodeIds, axis=1))[0][0]
                 raise DtaError('The files %s and %s are not in sync. '
-                                      'Movement through %s from %s to %s in the first file is not '
-                                      'in the same line position in the second '
-                                      'file' % (movementFlowFileName,
-                                                movementTimeFileName,
-                                                nodeBid, nodeAid, nodeCid))
-
-            try:
-                link = self.getLinkForNodeIdPair(nodeAid, nodeBid)
-                movement = link.getOutgoingMovement(nodeCid)
-            except DtaError, e:
-                #if the movement does not exist. It could be a prohibited movement
-                #perhaps you need to do more error checking there 
-                if nodeAid == nodeCid:
-                    continue
-                continue
+                               'The movements in line %d of the two files differ' % 
+                               (movementFlowFileName, fileName, row + 1))
+
+        simResults = self.getSimResults()
+        numPeriods = min(flows.shape[1], times.shape[1], flowsIn.shape[1], simResults.getNumTimeBins())
+
+        # (at node, from node, to node) -> movement index in the results store
+        movementIndex = {}
+        for index, movement in enumerate(simResults.iterMovements()):
+            movementIndex[(movement.getAtNode().getId(), movement.getIncomingLink().getStartNode().getId(),
+                           movement.getOutgoingLink().getEndNode().getId())] = index
+
+        rows    = []
+        indices = []
+        for row, nodeIds in enumerate(flowNodeIds.tolist()):
+            index = movementIndex.get(tuple(nodeIds))
+            if index is None: continue
+            rows.append(row)
+            indices.append(index)
+
+        flows   = flows[rows, :numPeriods]
+        times   = times[rows, :numPeriods]
+        flowsIn = flowsIn[rows, :numPeriods]
+
+        #TODO:Dynameq occasionaly reports negative times.
+        hasResults = times >= 0
+        for invalid, message in (((flows == 0) & (times > 0), 'zero flow in the time period begining %d and a positive travel time'),
+                                 ((flows > 0) & (times == 0), 'positive flow in the time period begining %d and a zero travel time')):
+            invalid &= hasResults
+            if invalid.any():
+                row, period = np.argwhere(invalid)[0]
+                raise DtaError('Movement %s has %s' % (simResults.getMovement(indices[row]).getId(),
+                                                       message % (self._simStartTimeInMin + period * self._simTimeStepInMin)))
+        hasResults &= (flows > 0)
+
+        # flows are in vph
+        volumeFactor = self._simTimeStepInMin / 60.0
+        for array, values in ((simResults.outVolume, flows * volumeFactor), 
+                              (simResults.inVolume, flowsIn * volumeFactor),
+                              (simResults.meanTT, times / 60.0)):
+            block = array[indices, :numPeriods]
+            block[hasResults] = values[hasResults]
+            array[indices, :numPeriods] = block
+        simResults.resultsChanged()
+
+        DtaLogger.info("Read simulated flows and travel times for %8d movements from %s" % (len(indices), self._dir))
 
-            simFlows = imap(int, flowFields[3:])
-            simTTs = imap(float, timeFields[3:])
-            simInFlows = imap(int, flowInFields[3:])
-            
-            timePeriodStart = self._simStartTimeInMin
-                    
-            for simFlow, simTT, simInFlow in izip(simFlows, simTTs, simInFlows):
-
-                #TODO:Dynameq occasionaly reports negative times.
-                if simTT < 0:
-                    continue
-
-                if simFlow == 0 and simTT > 0:
-                    raise DtaError('Movement %s has zero flow in the '
-                                   'time period begining %d and a '
-                                   'positive travel time' % 
-                                   (movement.getId(), timePeriodStart))
-                elif simFlow > 0 and simTT == 0:
-                    raise DtaError('Movement %s has positive flow in '
-                                   'the time period begining %d and a '
-                                   'zero travel time' % 
-                                   (movement.getId(), timePeriodStart))
-                
-                elif simFlow == 0 and simTT == 0:
-                    #simTT = movement.getFreeFlowTTInMin()
-                    timePeriodStart += self._simTimeStepInMin
-                    if timePeriodStart >= self._simEndTimeInMin:
-                        break
-                else:
-                    movement.setSimOutVolume(timePeriodStart, timePeriodStart + 
-                                        self._simTimeStepInMin, simFlow / (60 / self._simTimeStepInMin))
-                    movement.setSimInVolume(timePeriodStart, timePeriodStart + 
-                                        self._simTimeStepInMin, simInFlow / (60 / self._simTimeStepInMin))
-
-                    movement.setSimTTInMin(timePeriodStart, timePeriodStart + 
-                                          self._simTimeStepInMin, simTT / 60.0)
-
-                                      
-                    timePeriodStart += self._simTimeStepInMin
-                    if timePeriodStart >= self._simEndTimeInMin:
-                        break
-
-        inputStream1.close()
-        inputStream2.close()
-
-                               
     def readSimResults(self, simStartTimeInMin, simEndTimeInMin, simTimeStepInMin):
         """
-        Read the movement and link travel times and flows
+        Read the movement and link travel times and flows into the :py:class:`SimResults`
+        store of the network (see :py:meth:`Network.initializeSimResults`)
         """
         self._simStartTimeInMin = simStartTimeInMin
         self._simEndTimeInMin = simEndTimeInMin
         self._simTimeStepInMin = simTimeStepInMin
 
-        for link in self.iterLinks():
-            if link.isVirtualLink():
-                continue
-            link.simTimeStepInMin = simTimeStepInMin
-            link.simStartTimeInMin = simStartTimeInMin
-            link.simEndTimeInMin = simEndTimeInMin
-            for mov in link.iterOutgoingMovements():
-                mov.simTimeStepInMin = simTimeStepInMin
-                mov.simStartTimeInMin = simStartTimeInMin
-                mov.simEndTimeInMin = simEndTimeInMin
+        self.initializeSimResults(simStartTimeInMin, simEndTimeInMin, simTimeStepInMin)
 
         self._readMovementOutFlowsAndTTs()
 
-    def readObsMovementCounts(self, countFileNameInDynameqDatFormat):
+    def _readCountFile(self, fileName, headerKeyword, numTimeFieldsToSkip, numIdColumns):
         """
-        Assign the movement counts
+        Reads the count file *fileName* in Dynameq dat format.  Each block of counts starts with a comment line
+        containing *headerKeyword* and listing, after its first *numTimeFieldsToSkip* fields, the start times
+        of the time bins; each of the following data lines has *numIdColumns* node ids followed by a count per time bin.
+        The data lines of a block are parsed in one go by numpy.
+
+        Returns a list of (*startTimeInMin*, *timeStepInMin*, *nodeIds*, *counts*) tuples, one per block, where
+        *nodeIds* and *counts* are NumPy arrays with a row per data line and the counts are NaN where they're
+        missing (negative) in the file.
         """
-
-        startTimeInMin = 0
-        endTimeInMin = 0
-        timeStepInMin = 0
-        for line in open(countFileNameInDynameqDatFormat, "r"):
+        blocks = []
+        def addBlock(times, lines):
+            if not lines: return
+            if times is None:
+                raise DtaError("The count file %s has counts before its header line" % fileName)
+            numColumns = numIdColumns + len(times)
+            data = np.fromstring(" ".join(lines), dtype=np.float64, sep=" ")
+            if data.size != numColumns * len(lines):
+                raise DtaError("The count file %s has lines with a number of values other than the %d "
+                               "node ids and counts expected for its times %s" % (fileName, numColumns, " ".join(times)))
+            data = data.reshape((len(lines), numColumns))
+
+            if len(times) < 2:
+                raise DtaError("The count file %s has a header line with less than two times: %s" % (fileName, " ".join(times)))
+            startTimeInMin  = Time.readFromString(times[0]).getMinutes()
+            timeStepInMin   = Time.readFromString(times[1]).getMinutes() - startTimeInMin
+            counts          = np.trunc(data[:, numIdColumns:])
+            counts[counts < 0] = np.nan
+            blocks.append((startTimeInMin, timeStepInMin, data[:, :numIdColumns].astype(np.int64), counts))
+
+        times = None
+        lines = []
+        for line in open(fileName, "r"):
             if "*" in line:
-                # parse the times from this line
-                if " at " in line:
-                    times = line.strip().split()[4:]
-                    startTimeInMin = Time.readFromString(times[0]).getMinutes()
-                    endTimeInMin = Time.readFromString(times[-1]).getMinutes()
-                    timeStepInMin = Time.readFromString(times[1]).getMinutes() - \
-                                    startTimeInMin
-                    continue
-
-                # don't care about other comments
+                # parse the times from this line, and don't care about other comments
+                if headerKeyword in line:
+                    addBlock(times, lines)
+                    times = line.strip().split()[numTimeFieldsToSkip:]
+                    lines = []
                 continue
-            
-            # this is a data line -- all comment lines have been taken care of already
-            fields = map(int, map(float, line.strip().split()))
-            
-            link1 = self.getLinkForNodeIdPair(fields[1],fields[0])
-            link2 = self.getLinkForNodeIdPair(fields[0],fields[2])
+            if line.strip():
+                lines.append(line)
+        addBlock(times, lines)
+        return blocks
 
-            mov = link1.getOutgoingMovement(link2.getEndNodeId())
-        
+    def _addObsCounts(self, items, startTimeInMin, timeStepInMin, counts):
+        """
+        Attaches the *counts* of the *items* to them as an :py:class:`ObsCounts` store, leaving out the items
+        without any count.  Returns the number of items with counts.
+        """
+        hasCounts = ~np.all(np.isnan(counts), axis=1)
+        if not np.any(hasCounts):
+            return 0
+        ObsCounts([item for item, hasCount in izip(items, hasCounts) if hasCount],
+                  startTimeInMin, timeStepInMin, counts[hasCounts])
+        return int(hasCounts.sum())
 
-            for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[3:]):
-                if count < 0:
-                    continue
-                mov.setObsCount(s,s+timeStepInMin, count) 
-            
-            # next, aggregate to 15-minute and 60-minute bins if needed
-            for aggregateTimeStep in [15, 60]: 
-                if timeStepInMin<aggregateTimeStep: 
-                    for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[3:]):
-                        if s == startTimeInMin: 
-                            aggregateCount = 0            		
-                        elif s % aggregateTimeStep == 0: 
-        				    mov.setObsCount(s-aggregateTimeStep, s, aggregateCount)
-        				    aggregateCount = 0
-                        if count<0: continue
-                        aggregateCount = aggregateCount + count
-            
-                        
+    def readObsMovementCounts(self, countFileNameInDynameqDatFormat):
+        """
+        Assign the movement counts.  The counts of each movement are attached to it as an :py:class:`ObsCounts`
+        store, so the counts for any time window made of whole time bins of the file (e.g. the 15-minute or
+        60-minute windows of a 5-minute count file) are summed from them when asked for.  A window that has
+        a missing count (a negative count in the file) in any of its time bins has no count.
+        """
+        numMovements = 0
+        for startTimeInMin, timeStepInMin, nodeIds, counts in \
+                self._readCountFile(countFileNameInDynameqDatFormat, " at ", 4, 3):
+            movements = []
+            for atNodeId, fromNodeId, toNodeId in nodeIds.tolist():
+                link1 = self.getLinkForNodeIdPair(fromNodeId, atNodeId)
+                link2 = self.getLinkForNodeIdPair(atNodeId, toNodeId)
+                movements.append(link1.getOutgoingMovement(link2.getEndNodeId()))
+            numMovements += self._addObsCounts(movements, startTimeInMin, timeStepInMin, counts)
+
+        DtaLogger.info("Read the counts of %8d %-16s from %s" % (numMovements, "MOVEMENTS", countFileNameInDynameqDatFormat))
 
     def readObsLinkCounts(self, countFileNameInDynameqDatFormat):
         """
-        Assign the link counts
-        """
-
-        startTimeInMin = 0
-        endTimeInMin = 0
-        timeStepInMin = 0
-        #lineNum = 0
-        for line in open(countFileNameInDynameqDatFormat, "r"):
-            #lineNum += 1
-            #if lineNum == 0:
-            if "*" in line:                    
-                if "from" in line:
-                    times = line.strip().split()[3:]
-                    #startTimeInMin = Time.readFromStringWithoutColon(times[0]).getMinutes()
-                    #endTimeInMin = Time.readFromStringWithoutColon(times[-1]).getMinutes()
-                    #timeStepInMin = Time.readFromStringWithoutColon(times[1]).getMinutes() - \
-                    #                startTimeInMin
-                    startTimeInMin = Time.readFromString(times[0]).getMinutes()
-                    endTimeInMin = Time.readFromString(times[-1]).getMinutes()
-                    timeStepInMin = Time.readFromString(times[1]).getMinutes() - \
-                                startTimeInMin
-                    #lineNum += 1
-                    continue
-                else:
-                    continue
-                
-            else:
-                fields = map(int, map(float, line.strip().split()))
-                
-                #link = self.getLinkForId(fields[0])
-                link = self.getLinkForNodeIdPair(fields[0],fields[1])
-            
-                for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[2:]):
-                    if count < 0:
-                        continue
-                    link.setObsCount(s,s+timeStepInMin, count) 
-            
-                # next, aggregate to 15-minute and 60-minute bins if needed
-                for aggregateTimeStep in [15, 60]: 
-                    if timeStepInMin<aggregateTimeStep: 
-                        for s, count in izip(range(startTimeInMin, endTimeInMin + 1, timeStepInMin), fields[3:]):
-                            if s == startTimeInMin: 
-            				aggregateCount = 0            		
-                            elif s % aggregateTimeStep == 0: 
-                                link.setObsCount(s-aggregateTimeStep, s, aggregateCount)
-                                aggregateCount = 0
-                            if count<0: 
-            				continue
-                            aggregateCount = aggregateCount + count
-            		
+        Assign the link counts.  The counts of each link are attached to it as an :py:class:`ObsCounts`
+        store, so the counts for any time window made of whole time bins of the file (e.g. the 15-minute or
+        60-minute windows of a 5-minute count file) are summed from them when asked for.  A window that has
+        a missing count (a negative count in the file) in any of its time bins has no count.
+        """
+        numLinks = 0
+        for startTimeInMin, timeStepInMin, nodeIds, counts in \
+                self._readCountFile(countFileNameInDynameqDatFormat, "from", 3, 2):
+            links = [self.getLinkForNodeIdPair(startNodeId, endNodeId) for startNodeId, endNodeId in nodeIds.tolist()]
+            numLinks += self._addObsCounts(links, startTimeInMin, timeStepInMin, counts)
+
+        DtaLogger.info("Read the counts of %8d %-16s from %s" % (numLinks, "LINKS", countFileNameInDynameqDatFormat))
+
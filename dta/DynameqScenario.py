@@ -21,7 +21,7 @@ import os
 from .DtaError import DtaError
 from .Logger import DtaLogger
 from .Scenario import Scenario
-from .Utils import Time
+from .Utils import Time, findDynameqFile, readDynameqSections
 from .VehicleClassGroup import VehicleClassGroup
 from .VehicleType import VehicleType
 
@@ -66,43 +66,17 @@ class DynameqScenario(Scenario):
         """
         # scenario file processing
         scenariofile = os.path.join(dir, DynameqScenario.SCENARIO_FILE % file_prefix)
-        if not os.path.exists(scenariofile):
+        if not findDynameqFile(scenariofile):
             raise DtaError("Scenario file %s does not exist" % scenariofile)
         
-        for fields in self._readSectionFromFile(scenariofile, "STUDY_PERIOD", "EVENTS"):
-            self._readStudyPeriodFromFields(fields)
-            DtaLogger.info("Read  %8d %-16s from %s" % (1, "STUDY_PERIOD", scenariofile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(scenariofile, "EVENTS",       "VEH_CLASSES"):
-            #self._addEventFromFields(fields)
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "EVENTS", scenariofile))
-                
-        count = 0
-        for fields in self._readSectionFromFile(scenariofile, "VEH_CLASSES",  "VEH_TYPES"):
-            self._readVehicleClassFromFields(fields)
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "VEH_CLASSES", scenariofile))
-        
-        count = 0
-        for fields in self._readSectionFromFile(scenariofile, "VEH_TYPES",  "VEH_CLASS_GROUPS"):
-            self.addVehicleType(self._readVehicleTypeFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "VEH_TYPES", scenariofile))
-
-        count = 0
-        for fields in self._readSectionFromFile(scenariofile, "VEH_CLASS_GROUPS",  "GENERALIZED_COSTS"):
-            self.addVehicleClassGroup(self._readVehicleClassGroupFromFields(fields))
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "VEH_CLASS_GROUPS", scenariofile))
-                 
-        count = 0
-        for fields in self._readSectionFromFile(scenariofile, "GENERALIZED_COSTS", "ENDOFFILE"):
-            self._readGeneralizedCostFromFields(fields)
-            count += 1
-        DtaLogger.info("Read  %8d %-16s from %s" % (count, "GENERALIZED_COSTS", scenariofile))
-
+        readDynameqSections(findDynameqFile(scenariofile),
+            [("STUDY_PERIOD",      self._readStudyPeriodFromFields),
+             #TODO: events
+             ("EVENTS",            None),
+             ("VEH_CLASSES",       self._readVehicleClassFromFields),
+             ("VEH_TYPES",         lambda fields: self.addVehicleType(self._readVehicleTypeFromFields(fields))),
+             ("VEH_CLASS_GROUPS",  lambda fields: self.addVehicleClassGroup(self._readVehicleClassGroupFromFields(fields))),
+             ("GENERALIZED_COSTS", self._readGeneralizedCostFromFields)])
 
     def write(self, dir, file_prefix):
         scenariofile = os.path.join(dir, DynameqScenario.SCENARIO_FILE % file_prefix)
@@ -117,35 +91,6 @@ class DynameqScenario(Scenario):
         self._writeGeneralizedCostsToScenarioFile(scenariofile_object)
         scenariofile_object.close()
         
-    def _readSectionFromFile(self, filename, sectionName, nextSectionName):
-        """
-        Generator function, yields fields (array of strings) from the given section of the given file.
-        """
-        lines = open(filename, "r")
-        curLine = ""
-        try:
-            # find the section
-            while curLine != sectionName:
-                curLine = lines.next().strip()
-        except StopIteration:
-            raise DtaError("DynameqNetwork _readSectionFromFile failed to find %s in %s" % 
-                           (sectionName,filename))
-        
-        # go past the section name
-        curLine = lines.next().strip()
-        # skip any comments
-        while curLine[0] == "*":
-            curLine = lines.next().strip()
-        
-        # these are the ones we want
-        while not curLine == nextSectionName:
-            fields  = curLine.split()
-            yield fields
-            
-            curLine = lines.next().strip()
-        lines.close()
-        raise StopIteration
-
     def _readStudyPeriodFromFields(self, fields):
         """ 
         Reads the study period and sets the :py:attr:`Scenario.startTime` and :py:attr:`Scenario.endTime`
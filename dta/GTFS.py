@@ -0,0 +1,226 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from .DtaError import DtaError
+from .Logger import DtaLogger
+
+class GTFSTripIndex(object):
+    """
+    Index of the trips of a `General Transit Feed Specification <https://developers.google.com/transit/gtfs/>`_
+    schedule (as loaded by the ``transitfeed`` package) by route label and service id.
+
+    The trips and the routes are scanned once when the index is built, so iterating through the trips
+    of every route doesn't scan the whole trip list once per route.  The stop times of each trip
+    are only read when the trip is reached (see :py:meth:`GTFSTripIndex.iterTripsWithStopTimes`).
+    """
+
+    @classmethod
+    def getRouteLabel(cls, route):
+        """
+        Returns the label of the GTFS *route*: its short name and its long name.
+        """
+        return route['route_short_name'].strip() + " " + route['route_long_name'].strip()
+
+    def __init__(self, schedule):
+        """
+        Constructor.  Indexes the trips of the ``transitfeed.Schedule`` instance *schedule*.
+        """
+        self._routes        = {}    # route id -> route
+        self._routeLabels   = {}    # route id -> route label
+        for route in schedule.GetRouteList():
+            self._routes[route['route_id']]         = route
+            self._routeLabels[route['route_id']]    = GTFSTripIndex.getRouteLabel(route)
+
+        # service id -> route label -> list of trips, in the order of the schedule
+        self._trips = {}
+        for trip in schedule.GetTripList():
+            if trip['route_id'] not in self._routeLabels:
+                raise DtaError("GTFS trip %s has an unknown route id %s" % (trip['trip_id'], trip['route_id']))
+            tripsForService = self._trips.setdefault(trip['service_id'], {})
+            tripsForService.setdefault(self._routeLabels[trip['route_id']], []).append(trip)
+
+        DtaLogger.info("Indexed %d GTFS trips of %d routes and %d service ids" %
+                       (self.getNumTrips(), len(self._routes), len(self._trips)))
+
+    def getServiceIds(self):
+        """
+        Returns the sorted list of the service ids of the trips.
+        """
+        return sorted(self._trips.keys())
+
+    def getRoute(self, routeId):
+        """
+        Returns the GTFS route with the given *routeId*.
+        """
+        return self._routes[routeId]
+
+    def getRouteLabels(self, serviceId=None):
+        """
+        Returns the sorted list of the labels of the routes with trips for *serviceId*,
+        or for any service id if *serviceId* is None.
+        """
+        labels = set()
+        for tripsForService in self._getTripsForServices(serviceId):
+            labels.update(tripsForService.iterkeys())
+        return sorted(labels)
+
+    def getNumTrips(self, serviceId=None):
+        """
+        Returns the number of trips for *serviceId*, or for any service id if *serviceId* is None.
+        """
+        return sum(len(trips) for tripsForService in self._getTripsForServices(serviceId)
+                              for trips in tripsForService.itervalues())
+
+    def _getTripsForServices(self, serviceId):
+        """
+        Returns the list of the route label -> trips dictionaries for *serviceId* (or all of them if it is None).
+        """
+        if serviceId is None:
+            return self._trips.values()
+        if serviceId in self._trips:
+            return [self._trips[serviceId]]
+        return []
+
+    def iterTrips(self, serviceId=None):
+        """
+        Iterates through the trips for *serviceId* (or for any service id if it is None), sorted by route label
+        and in the order of the schedule for each route.  Yields (*routeLabel*, *route*, *trip*) tuples.
+        """
+        tripsForServices = self._getTripsForServices(serviceId)
+        for routeLabel in self.getRouteLabels(serviceId):
+            for tripsForService in tripsForServices:
+                for trip in tripsForService.get(routeLabel, []):
+                    yield (routeLabel, self._routes[trip['route_id']], trip)
+
+    def iterTripsWithStopTimes(self, serviceId=None):
+        """
+        Same as :py:meth:`GTFSTripIndex.iterTrips` but yields (*routeLabel*, *route*, *trip*, *stoptimes*) tuples,
+        where *stoptimes* is the list of the stop times of the trip, read as the trip is reached.
+        """
+        for routeLabel, route, trip in self.iterTrips(serviceId):
+            yield (routeLabel, route, trip, trip.GetStopTimes())
+
+
+class GTFSStopLinks(object):
+    """
+    Matches of GTFS stops to the :py:class:`RoadLink` instances of a network, kept up to date as the links are split.
+
+    Each stop is matched once, the first time it's needed, by *matchFunction* (*stop*) which
+    returns the 6-tuple ``(x, y, stopname, roadlink, distance, portion_along_link)``, where the last three values
+    are None if there is no road link for the stop.  When a road link is split with :py:meth:`GTFSStopLinks.splitLink`,
+    the stops matched to it (or to its reverse link) are moved to the closest of the new links, so the
+    matches stay valid and don't have to be recomputed after the links are split.
+    """
+
+    def __init__(self, network, matchFunction):
+        """
+        Constructor.  *network* is the :py:class:`Network` with the road links to match the stops to.
+        """
+        self._network       = network
+        self._matchFunction = matchFunction
+        # stop id -> (x, y, stopname, roadlink, distance, portion_along_link)
+        self._stopIdToLink  = {}
+        # roadlink -> set of stop ids matched to it
+        self._linkToStopIds = {}
+
+    def getNumStops(self):
+        """
+        Returns the number of stops matched so far.
+        """
+        return len(self._stopIdToLink)
+
+    def hasStopId(self, stopId):
+        """
+        Returns True if the stop with the given *stopId* has been matched.
+        """
+        return stopId in self._stopIdToLink
+
+    def getStopIdToLink(self):
+        """
+        Returns the dictionary of stop id -> ``(x, y, stopname, roadlink, distance, portion_along_link)`` for
+        the stops matched so far.
+        """
+        return self._stopIdToLink
+
+    def _setMatch(self, stopId, match):
+        """
+        Sets the *match* tuple for the stop with the given *stopId*, keeping the index of stops by link.
+        """
+        if stopId in self._stopIdToLink and self._stopIdToLink[stopId][3] is not None:
+            self._linkToStopIds[self._stopIdToLink[stopId][3]].discard(stopId)
+        self._stopIdToLink[stopId] = match
+        if match[3] is not None:
+            self._linkToStopIds.setdefault(match[3], set()).add(stopId)
+
+    def getMatch(self, stop):
+        """
+        Returns the ``(x, y, stopname, roadlink, distance, portion_along_link)`` tuple for the GTFS *stop*,
+        matching it if this is the first time it's asked for.
+        """
+        stopId = stop['stop_id']
+        if stopId not in self._stopIdToLink:
+            self._setMatch(stopId, self._matchFunction(stop))
+            if len(self._stopIdToLink) % 500 == 0:
+                DtaLogger.info("%5d stop ids mapped" % len(self._stopIdToLink))
+        return self._stopIdToLink[stopId]
+
+    def getMatchForStopId(self, stopId):
+        """
+        Returns the ``(x, y, stopname, roadlink, distance, portion_along_link)`` tuple for the stop with the given
+        *stopId*, which must have been matched already.
+        """
+        return self._stopIdToLink[stopId]
+
+    def setRoadLink(self, stopId, roadlink):
+        """
+        Matches the stop with the given *stopId*, which must have been matched already, to *roadlink* instead.
+        """
+        (x, y, stopname) = self._stopIdToLink[stopId][:3]
+        (distance, t) = roadlink.getDistanceFromPoint(x, y)
+        self._setMatch(stopId, (x, y, stopname, roadlink, distance, t))
+
+    def _moveStops(self, oldLink, newLinks):
+        """
+        Moves the stops matched to *oldLink* to the closest of the *newLinks*.
+        """
+        for stopId in self._linkToStopIds.pop(oldLink, set()):
+            (x, y, stopname) = self._stopIdToLink[stopId][:3]
+            (distance, t, roadlink) = min(newLink.getDistanceFromPoint(x, y) + (newLink,) for newLink in newLinks)
+            self._stopIdToLink[stopId] = (x, y, stopname, roadlink, distance, t)
+            self._linkToStopIds.setdefault(roadlink, set()).add(stopId)
+
+    def splitLink(self, roadlink, fraction=0.5, splitReverseLink=True):
+        """
+        Splits *roadlink* with :py:meth:`Network.splitLink` and moves the stops matched to it (and to its reverse link,
+        if it's split too) to the new links.  Returns the new node.
+        """
+        startNodeId = roadlink.getStartNode().getId()
+        endNodeId   = roadlink.getEndNode().getId()
+        reverseLink = None
+        if splitReverseLink and self._network.hasLinkForNodeIdPair(endNodeId, startNodeId):
+            reverseLink = self._network.getLinkForNodeIdPair(endNodeId, startNodeId)
+
+        midNode = self._network.splitLink(linkToSplit=roadlink, splitReverseLink=splitReverseLink, fraction=fraction)
+        midNodeId = midNode.getId()
+
+        self._moveStops(roadlink, [self._network.getLinkForNodeIdPair(startNodeId, midNodeId),
+                                   self._network.getLinkForNodeIdPair(midNodeId, endNodeId)])
+        if reverseLink:
+            self._moveStops(reverseLink, [self._network.getLinkForNodeIdPair(endNodeId, midNodeId),
+                                          self._network.getLinkForNodeIdPair(midNodeId, startNodeId)])
+        return midNode
@@ -0,0 +1,304 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class GraphSnapshot(object):
+    """
+    A frozen, integer-indexed copy of the topology of a :py:class:`Network`, stored in
+    NumPy arrays in compressed sparse row (CSR, or forward star) form.  Shortest path
+    algorithms that run on a snapshot (e.g. :py:meth:`ShortestPaths.labelCorrectingOnSnapshot`)
+    keep their labels in arrays, so they leave the :py:class:`Node`, :py:class:`Link` and
+    :py:class:`Movement` instances untouched and can be run repeatedly without a reset pass
+    over the network.
+
+    Nodes and links are indexed in order of their ids; movements are grouped by
+    incoming link.  The arrays are:
+
+     * *nodeIds*, *linkIds*: the ids of the indexed nodes and links
+     * *linkStartNode*, *linkEndNode*: node indices of the ends of each link
+     * *linkLength*: :py:meth:`RoadLink.getLength` in :py:attr:`RoadLink.LENGTH_UNITS` (0 for :py:class:`VirtualLink` instances)
+     * *linkEuclideanLength*: :py:meth:`Link.euclideanLength` including shape points, in :py:attr:`Node.COORDINATE_UNITS`
+     * *linkFFTT*: :py:meth:`RoadLink.getFreeFlowTTInMin` (0 for :py:class:`VirtualLink` instances)
+     * *linkIsVirtual*, *nodeIsVirtual*: boolean flags for :py:class:`VirtualLink` and :py:class:`VirtualNode` instances
+     * *nodeOutPtr*, *nodeOutLinks*: the outgoing links of node *i* are ``nodeOutLinks[nodeOutPtr[i]:nodeOutPtr[i+1]]``
+     * *linkMovementPtr*: the outgoing movements of link *i* are the movement indices ``linkMovementPtr[i]:linkMovementPtr[i+1]``
+     * *movementInLink*, *movementOutLink*: link indices of each movement
+     * *movementProhibited*: True for movements that are prohibited to all vehicle class groups
+     * *movementCost*: the cost of each movement, initialized with the free flow travel time of its incoming link
+       (like :py:meth:`ShortestPaths.initialiseMovementCostsWithFFTT`)
+
+    Time varying movement costs for the time dependent searches are built with
+    :py:meth:`GraphSnapshot.getTimeVaryingMovementCosts` or :py:meth:`GraphSnapshot.getSimMovementCosts`.
+
+    .. note:: The snapshot does not follow subsequent edits to the network; build a new one after
+              adding or removing nodes, links or movements.
+    """
+
+    def __init__(self, network):
+        """
+        Constructor.  Builds the arrays from the nodes, links and movements currently in *network*,
+        an instance of :py:class:`Network`.  Use :py:meth:`Network.buildGraphSnapshot` rather than calling this directly.
+        """
+        self._nodes     = sorted(network.iterNodes(), key=lambda node: node.getId())
+        self._links     = sorted(network.iterLinks(), key=lambda link: link.getId())
+
+        self._nodeIndex = dict((node.getId(), idx) for idx, node in enumerate(self._nodes))
+        self._linkIndex = dict((link.getId(), idx) for idx, link in enumerate(self._links))
+
+        numNodes        = len(self._nodes)
+        numLinks        = len(self._links)
+
+        self.nodeIds        = np.array([node.getId() for node in self._nodes], dtype=np.int64)
+        self.nodeIsVirtual  = np.array([node.isVirtualNode() for node in self._nodes], dtype=np.bool_)
+
+        self.linkIds        = np.array([link.getId() for link in self._links], dtype=np.int64)
+        self.linkStartNode  = np.array([self._nodeIndex[link.getStartNode().getId()] for link in self._links], dtype=np.int32)
+        self.linkEndNode    = np.array([self._nodeIndex[link.getEndNode().getId()] for link in self._links], dtype=np.int32)
+        self.linkIsVirtual  = np.array([link.isVirtualLink() for link in self._links], dtype=np.bool_)
+        self.linkLength     = np.zeros(numLinks, dtype=np.float64)
+        self.linkFFTT       = np.zeros(numLinks, dtype=np.float64)
+        self.linkEuclideanLength = np.array([link.euclideanLength(includeShape=True) for link in self._links], dtype=np.float64)
+
+        for idx, link in enumerate(self._links):
+            if link.isVirtualLink(): continue
+            self.linkLength[idx]    = link.getLength()
+            self.linkFFTT[idx]      = link.getFreeFlowTTInMin()
+
+        # node forward star; links are sorted by id so a stable sort on the start node keeps them in id order
+        self.nodeOutLinks   = np.argsort(self.linkStartNode, kind="mergesort").astype(np.int32)
+        self.nodeOutPtr     = np.zeros(numNodes + 1, dtype=np.int32)
+        np.cumsum(np.bincount(self.linkStartNode, minlength=numNodes), out=self.nodeOutPtr[1:])
+
+        # link forward star through the movements
+        self._movements     = []
+        self.linkMovementPtr = np.zeros(numLinks + 1, dtype=np.int32)
+        for idx, link in enumerate(self._links):
+            if not link.isVirtualLink():
+                self._movements.extend(link.iterOutgoingMovements())
+            self.linkMovementPtr[idx + 1] = len(self._movements)
+
+        self.movementInLink     = np.array([self._linkIndex[mov.getIncomingLink().getId()] for mov in self._movements], dtype=np.int32)
+        self.movementOutLink    = np.array([self._linkIndex[mov.getOutgoingLink().getId()] for mov in self._movements], dtype=np.int32)
+        self.movementProhibited = np.array([mov.isProhibitedToAllVehicleClassGroups() for mov in self._movements], dtype=np.bool_)
+        self.movementCost       = self.linkFFTT[self.movementInLink]
+
+        # python list copies of the forward stars for the pure python search loops; built on demand
+        self._adjacencyLists    = None
+
+    def getNumNodes(self):
+        """
+        Returns the number of nodes in the snapshot.
+        """
+        return len(self._nodes)
+
+    def getNumLinks(self):
+        """
+        Returns the number of links in the snapshot.
+        """
+        return len(self._links)
+
+    def getNumMovements(self):
+        """
+        Returns the number of movements in the snapshot.
+        """
+        return len(self._movements)
+
+    def getNodeIndex(self, nodeId):
+        """
+        Returns the index of the node with the given *nodeId*.
+        Raises :py:class:`DtaError` if not found.
+        """
+        if nodeId in self._nodeIndex:
+            return self._nodeIndex[nodeId]
+        raise DtaError("GraphSnapshot getNodeIndex: none found for id %d" % nodeId)
+
+    def getLinkIndex(self, linkId):
+        """
+        Returns the index of the link with the given *linkId*.
+        Raises :py:class:`DtaError` if not found.
+        """
+        if linkId in self._linkIndex:
+            return self._linkIndex[linkId]
+        raise DtaError("GraphSnapshot getLinkIndex: none found for id %d" % linkId)
+
+    def getNode(self, nodeIndex):
+        """
+        Returns the :py:class:`Node` instance at *nodeIndex*.
+        """
+        return self._nodes[nodeIndex]
+
+    def getLink(self, linkIndex):
+        """
+        Returns the :py:class:`Link` instance at *linkIndex*.
+        """
+        return self._links[linkIndex]
+
+    def getMovement(self, movementIndex):
+        """
+        Returns the :py:class:`Movement` instance at *movementIndex*.
+        """
+        return self._movements[movementIndex]
+
+    def setMovementCostsWithFFTT(self):
+        """
+        Sets the movement costs to the free flow travel time of the incoming link, in minutes.
+        """
+        self.movementCost = self.linkFFTT[self.movementInLink]
+
+    def setMovementCostsWithLength(self):
+        """
+        Sets the movement costs to the length of the incoming link, in :py:attr:`RoadLink.LENGTH_UNITS`.
+        """
+        self.movementCost = self.linkLength[self.movementInLink]
+
+    def getTimeVaryingMovementCosts(self, startTimeInMin, endTimeInMin, timeStepInMin):
+        """
+        Returns a 2-dimensional (time period x movement) array with the cost of each movement in each
+        of the time periods of length *timeStepInMin* from *startTimeInMin* to *endTimeInMin*, for
+        :py:meth:`ShortestPaths.timeDependentLabelCorrectingOnSnapshot`.
+
+        The costs come from :py:meth:`Movement.getTimeVaryingCostAt` at the start of each time period;
+        movements without time varying costs (see :py:meth:`Movement.setTimeVaryingCosts`) keep
+        their :py:attr:`GraphSnapshot.movementCost` in every time period.
+        """
+        periodStarts    = range(startTimeInMin, endTimeInMin, timeStepInMin)
+        costs           = np.tile(self.movementCost, (len(periodStarts), 1))
+
+        for movIndex, mov in enumerate(self._movements):
+            if mov.getTimeVaryingCostTimeStep() is None: continue
+            costs[:, movIndex] = [mov.getTimeVaryingCostAt(periodStart) for periodStart in periodStarts]
+        return costs
+
+    def getSimMovementCosts(self, startTimeInMin, endTimeInMin, timeStepInMin):
+        """
+        Returns a 2-dimensional (time period x movement) array with the simulated travel time in minutes
+        (:py:meth:`Movement.getSimTTInMin`) of each movement in each of the time periods of length
+        *timeStepInMin* from *startTimeInMin* to *endTimeInMin*, for
+        :py:meth:`ShortestPaths.timeDependentLabelCorrectingOnSnapshot`.
+
+        The simulation results must have been read (e.g. with :py:meth:`DynameqNetwork.readSimResults`) and
+        *timeStepInMin* must be a multiple of the simulation time step.
+        """
+        periodStarts    = range(startTimeInMin, endTimeInMin, timeStepInMin)
+        costs           = np.zeros((len(periodStarts), len(self._movements)), dtype=np.float64)
+
+        for movIndex, mov in enumerate(self._movements):
+            costs[:, movIndex] = [mov.getSimTTInMin(periodStart, periodStart + timeStepInMin) for periodStart in periodStarts]
+        return costs
+
+    def getAdjacencyLists(self):
+        """
+        Returns the forward stars as python lists, ``(nodeOutPtr, nodeOutLinks, linkEndNode, linkMovementPtr, movementOutLink)``.
+
+        Element access on python lists is much faster than on NumPy arrays, so the search loops
+        in :py:class:`ShortestPaths` use these.  They are built once and cached.
+        """
+        if self._adjacencyLists is None:
+            self._adjacencyLists = (self.nodeOutPtr.tolist(), self.nodeOutLinks.tolist(), self.linkEndNode.tolist(),
+                                    self.linkMovementPtr.tolist(), self.movementOutLink.tolist())
+        return self._adjacencyLists
+
+    def getCentroidIds(self):
+        """
+        Returns the sorted list of the ids of the :py:class:`Centroid` instances in the snapshot,
+        which is the order used for the zones of a :py:class:`Demand`.
+        """
+        return [node.getId() for node in self._nodes if node.isCentroid()]
+
+    def getCentroidAccessLinks(self):
+        """
+        Returns the links through which trips leave and enter each centroid, for searches with labels on links
+        (:py:class:`VirtualLink` instances have no movements so they are stepped over).
+        The return value is the tuple (*centroidIds*, *sourcePtr*, *sourceLinks*, *sinkPtr*, *sinkLinks*) where
+        
+         * *centroidIds* is as returned by :py:meth:`GraphSnapshot.getCentroidIds`
+         * the source links of the i-th centroid are ``sourceLinks[sourcePtr[i]:sourcePtr[i+1]]``: its outgoing
+           links, or the outgoing links of the :py:class:`VirtualNode` at the end of its outgoing :py:class:`VirtualLink` instances.
+         * the sink links of the i-th centroid are ``sinkLinks[sinkPtr[i]:sinkPtr[i+1]]``: its incoming
+           links, or the incoming links of the :py:class:`VirtualNode` at the start of its incoming :py:class:`VirtualLink` instances.
+        """
+        centroidIds = self.getCentroidIds()
+        sourcePtr   = [0]
+        sourceLinks = []
+        sinkPtr     = [0]
+        sinkLinks   = []
+
+        for centroidId in centroidIds:
+            centroid = self._nodes[self._nodeIndex[centroidId]]
+
+            for link in centroid.iterOutgoingLinks():
+                if not link.isVirtualLink():
+                    sourceLinks.append(self._linkIndex[link.getId()])
+                    continue
+                for accessLink in link.getEndNode().iterOutgoingLinks():
+                    if accessLink.isVirtualLink(): continue
+                    sourceLinks.append(self._linkIndex[accessLink.getId()])
+            sourcePtr.append(len(sourceLinks))
+
+            for link in centroid.iterIncomingLinks():
+                if not link.isVirtualLink():
+                    sinkLinks.append(self._linkIndex[link.getId()])
+                    continue
+                for accessLink in link.getStartNode().iterIncomingLinks():
+                    if accessLink.isVirtualLink(): continue
+                    sinkLinks.append(self._linkIndex[accessLink.getId()])
+            sinkPtr.append(len(sinkLinks))
+
+        return (centroidIds, np.array(sourcePtr, dtype=np.int32), np.array(sourceLinks, dtype=np.int32),
+                np.array(sinkPtr, dtype=np.int32), np.array(sinkLinks, dtype=np.int32))
+
+    def getLinkPath(self, predLinks, sourceLinkIndex, destinationLinkIndex):
+        """
+        Given the *predLinks* array returned by a link based search from *sourceLinkIndex*, returns the
+        list of :py:class:`Link` instances from the source link to the destination link (both included),
+        or None if there is no path.  Returns an empty list if the source and the destination are the same.
+        """
+        if sourceLinkIndex == destinationLinkIndex:
+            return []
+
+        path        = []
+        linkIndex   = destinationLinkIndex
+        while linkIndex != sourceLinkIndex:
+            if linkIndex < 0: return None
+            path.append(self._links[linkIndex])
+            linkIndex = predLinks[linkIndex]
+        path.append(self._links[sourceLinkIndex])
+        path.reverse()
+        return path
+
+    def getNodePath(self, predLinks, sourceNodeIndex, destinationNodeIndex):
+        """
+        Given the *predLinks* array returned by a node based search from *sourceNodeIndex*, returns the
+        list of :py:class:`Node` instances from the source node to the destination node (both included),
+        or None if there is no path.  Returns an empty list if the source and the destination are the same.
+        """
+        if sourceNodeIndex == destinationNodeIndex:
+            return []
+
+        path        = []
+        nodeIndex   = destinationNodeIndex
+        while nodeIndex != sourceNodeIndex:
+            if predLinks[nodeIndex] < 0: return None
+            path.append(self._nodes[nodeIndex])
+            nodeIndex = self.linkStartNode[predLinks[nodeIndex]]
+        path.append(self._nodes[sourceNodeIndex])
+        path.reverse()
+        return path
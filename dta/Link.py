@@ -26,6 +26,10 @@ class Link(object):
     """
     #: Default label is an empty string
     DEFAULT_LABEL = ""
+
+    # no per-instance __dict__, since networks have many links; subclasses declare their own attributes too.
+    # Algorithms keep their state (labels, predecessors, etc) in dictionaries keyed by link rather than on the links.
+    __slots__ = ("_id", "_startNode", "_endNode", "_label", "_geometryCache")
     
     def __init__(self, id, startNode, endNode, label):
         """
@@ -52,6 +56,9 @@ class Link(object):
         self._startNode = startNode
         # a Node instance
         self._endNode   = endNode
+
+        # geometry computed from the nodes (and shape points) by the accessors; dropped by _geometryChanged()
+        self._geometryCache = {}
                 
     def getStartNode(self):
         """
@@ -73,9 +80,24 @@ class Link(object):
         
         *includeShape* is ignored in the generic case; the :py:class:`RoadLink` will use that arg.
         """
-        return math.sqrt( ((self._startNode.getX()-self._endNode.getX())*(self._startNode.getX()-self._endNode.getX())) +
-                          ((self._startNode.getY()-self._endNode.getY())*(self._startNode.getY()-self._endNode.getY())) )
+        if "length" not in self._geometryCache:
+            self._geometryCache["length"] = \
+                math.sqrt( ((self._startNode.getX()-self._endNode.getX())*(self._startNode.getX()-self._endNode.getX())) +
+                           ((self._startNode.getY()-self._endNode.getY())*(self._startNode.getY()-self._endNode.getY())) )
+        return self._geometryCache["length"]
         
+    def _geometryChanged(self):
+        """
+        Called when the geometry of the link changes (e.g. one of its nodes moved): drops the geometry
+        cached by the accessors, and lets the :py:class:`LinkGeometry` of the network know (if it's been built).
+        Subclasses also drop the geometry that depends on the link.
+        """
+        linkGeometryRef = self._geometryCache.get("linkGeometry")    # LinkGeometry.CACHE_KEY
+        if linkGeometryRef and linkGeometryRef():
+            linkGeometryRef().linkChanged(self)
+        # a new dictionary rather than clear(), since shallow copies of the link share it
+        self._geometryCache = {}
+
     def getReferenceAngle(self):
         """
         Visualizing the link as a straight vector from (0,0), returns the angle between <1,0> and this link.
@@ -86,12 +108,15 @@ class Link(object):
         returns 0.
         
         """
+        if "referenceAngle" in self._geometryCache:
+            return self._geometryCache["referenceAngle"]
         if self.euclideanLength() == 0: return 0
         
         angle = math.acos( (self._endNode.getX() - self._startNode.getX()) / self.euclideanLength() )
         # angle is in [0, pi]
         if angle > 0 and self._endNode.getY() > self._startNode.getY():
             angle = 2.0*math.pi - angle
+        self._geometryCache["referenceAngle"] = angle
         return angle
     
     def getReferenceAngleInDegrees(self):
@@ -129,6 +154,13 @@ class Link(object):
         Set the link label
         """
         self._label = label
+        self._labelChanged()
+
+    def _labelChanged(self):
+        """
+        Called when the label of the link changes.  Subclasses drop what depends on the label.
+        """
+        pass
         
     def getLabel(self):
         """
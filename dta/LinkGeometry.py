@@ -0,0 +1,202 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import weakref
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class LinkGeometry(object):
+    """
+    The geometry of a list of :py:class:`RoadLink` instances (connectors included) as contiguous NumPy arrays,
+    for the operations over the whole network (e.g. :py:meth:`Network.snapPointsToRoadLinks`,
+    :py:meth:`Network.computeTurnTypes`) that would otherwise ask every link for its geometry.
+
+    The polyline of road link *i* (start node, shape points, end node) is ``pointXs[pointOffsets[i]:pointOffsets[i+1]]``
+    (and the same for *pointYs*), and its center line (see :py:meth:`RoadLink.getCenterLine`, shape points included)
+    is ``centerXs[centerOffsets[i]:centerOffsets[i+1]]`` (and *centerYs*).  The per-link arrays are:
+
+     * *lengths*, the euclidean lengths including the shape (see :py:meth:`RoadLink.euclideanLength`)
+     * *orientations*, the orientations from the start node to the end node (see :py:meth:`RoadLink.getOrientation`)
+     * *orientationsAtStart* and *orientationsAtEnd*, the orientations of the first and the last sections of the polylines
+
+    Use :py:meth:`Network.getLinkGeometry` rather than building one directly: the network builds it on demand and
+    rebuilds it when links are added or removed.  The road links let their geometry know when they change
+    (see :py:meth:`Link._geometryChanged`), and the network then updates the arrays of just those links with
+    :py:meth:`LinkGeometry.update`, unless their number of shape points changed.
+
+    All coordinates and lengths are in :py:attr:`Node.COORDINATE_UNITS`; orientations are in degrees.
+    """
+
+    #: The key of the geometry in the :py:class:`Link` geometry cache, through which the links report their changes
+    CACHE_KEY = "linkGeometry"
+
+    @classmethod
+    def getOrientationArray(cls, x1, y1, x2, y2):
+        """
+        Returns the array of the angles in degrees from the North measured clockwise (in [0, 360))
+        of the vectors from (*x1*, *y1*) to (*x2*, *y2*), given as arrays; the vectorized
+        version of :py:meth:`RoadLink.getOrientation`.
+        """
+        dx = np.fabs(x2 - x1)
+        dy = np.fabs(y2 - y1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            orientation = np.select([(x2 >  x1) & (y2 <= y1),   # 2nd quarter
+                                     (x2 <= x1) & (y2 <  y1),   # 3th quarter
+                                     (x2 <  x1) & (y2 >= y1),   # 4nd quarter
+                                     (x2 >= x1) & (y2 >  y1)],  # 1st quarter
+                                    [np.arctan(dy / dx) + np.pi/2,
+                                     np.arctan(dx / dy) + np.pi,
+                                     np.arctan(dy / dx) + 3 * np.pi/2,
+                                     np.arctan(dx / dy)], 0.0)
+        return orientation * 180 / np.pi
+
+    def __init__(self, roadlinks):
+        """
+        Constructor.  Gathers the geometry of the list of *roadlinks*.
+        """
+        self.roadlinks      = list(roadlinks)
+        self._linkIndex     = dict((roadlink, index) for index, roadlink in enumerate(self.roadlinks))
+        # the road links whose geometry changed since the arrays were built or updated; see linkChanged()
+        self._changedLinks  = set()
+
+        pointXs, pointYs, pointOffsets     = [], [], [0]
+        centerXs, centerYs, centerOffsets  = [], [], [0]
+        for roadlink in self.roadlinks:
+            pointXs.append(roadlink.getStartNode().getX())
+            pointYs.append(roadlink.getStartNode().getY())
+            for x, y in roadlink.getShapePoints():
+                pointXs.append(x)
+                pointYs.append(y)
+            pointXs.append(roadlink.getEndNode().getX())
+            pointYs.append(roadlink.getEndNode().getY())
+            pointOffsets.append(len(pointXs))
+
+            for x, y in roadlink._getCenterLinePoints():
+                centerXs.append(x)
+                centerYs.append(y)
+            centerOffsets.append(len(centerXs))
+
+        self.pointXs        = np.array(pointXs, dtype=np.float64)
+        self.pointYs        = np.array(pointYs, dtype=np.float64)
+        self.pointOffsets   = np.array(pointOffsets, dtype=np.int64)
+        self.centerXs       = np.array(centerXs, dtype=np.float64)
+        self.centerYs       = np.array(centerYs, dtype=np.float64)
+        self.centerOffsets  = np.array(centerOffsets, dtype=np.int64)
+
+        self._computeLinkArrays()
+        for roadlink in self.roadlinks:
+            self._watch(roadlink)
+
+    def _watch(self, roadlink):
+        """
+        Asks *roadlink* to call :py:meth:`LinkGeometry.linkChanged` the next time its geometry changes.
+        """
+        roadlink._geometryCache[LinkGeometry.CACHE_KEY] = weakref.ref(self)
+
+    def _computeLinkArrays(self):
+        """
+        Computes the per-link arrays (*lengths* and the orientations) from the polylines.
+        """
+        starts  = self.pointOffsets[:-1]
+        ends    = self.pointOffsets[1:] - 1
+        sectionLengths  = np.hypot(np.diff(self.pointXs), np.diff(self.pointYs))
+        # the sections between the polylines are left out
+        sectionLengths[ends[:-1]] = 0.0
+        self.lengths = np.add.reduceat(sectionLengths, starts) if len(self.roadlinks) else np.zeros(0)
+
+        self.orientations           = LinkGeometry.getOrientationArray(self.pointXs[starts], self.pointYs[starts],
+                                                                       self.pointXs[ends], self.pointYs[ends])
+        self.orientationsAtStart    = LinkGeometry.getOrientationArray(self.pointXs[starts], self.pointYs[starts],
+                                                                       self.pointXs[starts + 1], self.pointYs[starts + 1])
+        self.orientationsAtEnd      = LinkGeometry.getOrientationArray(self.pointXs[ends - 1], self.pointYs[ends - 1],
+                                                                       self.pointXs[ends], self.pointYs[ends])
+
+    def getNumLinks(self):
+        """
+        Returns the number of road links.
+        """
+        return len(self.roadlinks)
+
+    def isCurrent(self):
+        """
+        Returns False if the geometry of any of the road links changed since the arrays were built or updated.
+        """
+        return not self._changedLinks
+
+    def linkChanged(self, roadlink):
+        """
+        Called by *roadlink* when its geometry changes; its arrays are out of date until :py:meth:`LinkGeometry.update`.
+        """
+        if roadlink in self._linkIndex:
+            self._changedLinks.add(roadlink)
+
+    def update(self):
+        """
+        Updates the arrays in place for the road links whose geometry changed.  Returns False if the number of
+        shape points of any of them changed, in which case the arrays are left out of date and must be rebuilt.
+        """
+        for roadlink in self._changedLinks:
+            index   = self._linkIndex[roadlink]
+            points  = [(roadlink.getStartNode().getX(), roadlink.getStartNode().getY())] + \
+                      list(roadlink.getShapePoints()) + \
+                      [(roadlink.getEndNode().getX(), roadlink.getEndNode().getY())]
+            centerPoints = roadlink._getCenterLinePoints()
+            start, end              = self.pointOffsets[index], self.pointOffsets[index + 1]
+            centerStart, centerEnd  = self.centerOffsets[index], self.centerOffsets[index + 1]
+            if len(points) != end - start or len(centerPoints) != centerEnd - centerStart:
+                return False
+
+            self.pointXs[start:end]                 = [x for x, y in points]
+            self.pointYs[start:end]                 = [y for x, y in points]
+            self.centerXs[centerStart:centerEnd]    = [x for x, y in centerPoints]
+            self.centerYs[centerStart:centerEnd]    = [y for x, y in centerPoints]
+            self._watch(roadlink)
+
+        self._changedLinks = set()
+        self._computeLinkArrays()
+        return True
+
+    def getLinkIndex(self, roadlink):
+        """
+        Returns the index of *roadlink* in the arrays.
+        """
+        try:
+            return self._linkIndex[roadlink]
+        except KeyError:
+            raise DtaError("LinkGeometry: no geometry for %s" % str(roadlink))
+
+    def getLinkIndices(self, roadlinks):
+        """
+        Returns the array of the indices of the *roadlinks* in the arrays.
+        """
+        return np.array([self.getLinkIndex(roadlink) for roadlink in roadlinks], dtype=np.int64)
+
+    def getCenterLineSegments(self, linkIndices):
+        """
+        Returns the tuple (*startXs*, *startYs*, *endXs*, *endYs*, *offsets*) of the segments of the center lines
+        of the road links at *linkIndices*, where the segments of the *i* th of them are ``offsets[i]`` to ``offsets[i+1]-1``.
+        """
+        linkIndices = np.asarray(linkIndices, dtype=np.int64)
+        numSegments = self.centerOffsets[linkIndices + 1] - self.centerOffsets[linkIndices] - 1
+        offsets     = np.zeros(len(linkIndices) + 1, dtype=np.int64)
+        np.cumsum(numSegments, out=offsets[1:])
+
+        # the index of the start point of each segment
+        starts = np.repeat(self.centerOffsets[linkIndices] - offsets[:-1], numSegments) + np.arange(offsets[-1])
+        return (self.centerXs[starts], self.centerYs[starts], self.centerXs[starts + 1], self.centerYs[starts + 1], offsets)
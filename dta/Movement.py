@@ -20,11 +20,11 @@ import pdb
 import copy
 import math
 from itertools import izip
-from collections import defaultdict
 
 from .DtaError import DtaError
 from .Logger import DtaLogger
 from .Node import Node
+from .ObsCounts import ObsCounts
 from .RoadNode import RoadNode
 from .VehicleClassGroup import VehicleClassGroup
 from .Utils import getMidPoint, lineSegmentsCross, polylinesCross
@@ -61,6 +61,15 @@ class Movement(object):
     #:    time specified by the priority template (if applicable).
     #:
     FOLLOWUP_TIME_DEFAULT = -1
+
+    # no per-instance __dict__, since networks have many movements.  Algorithms keep their state
+    # (costs, labels, etc) in dictionaries keyed by movement rather than on the movements.
+    __slots__ = ("_node", "_incomingLink", "_outgoingLink", "_freeflowSpeed", "_permission", "_numLanes",
+                 "_incomingLane", "_outgoingLane", "_followupTime", "_overrideTurnType",
+                 "_centerLine", "_turnType", "_incomingDirection", "_higherPriorityMovements",
+                 "_simOutVolume", "_simInVolume", "_simMeanTT", "_simResults", "_simResultsIndex",
+                 "_penalty", "_timeVaryingCosts", "_timeStep", "simTimeStepInMin", "simStartTimeInMin", "simEndTimeInMin",
+                 "_obsCount", "_obsCountStores")
     
     @classmethod
     def simpleMovementFactory(cls, incomingLink, outgoingLink, vehicleClassGroup):
@@ -119,24 +128,32 @@ class Movement(object):
         self._followupTime  = followupTime
         self._overrideTurnType = None
         
-        self._centerline    = self.getCenterLine()
+        self._centerLine    = None  # cached by getCenterLine(), dropped by _geometryChanged()
+        self._turnType      = None  # angle-based turn type cached by getTurnType(), dropped by _geometryChanged()
+        self._incomingDirection = None  # direction of the incoming link cached by getDirection()
         
-        self._higherPriorityMovements = [] # list of (Movement, CriticalGapTime(sec), CriticalWaitTime(sec)
+        self._higherPriorityMovements = None # list of (Movement, CriticalGapTime(sec), CriticalWaitTime(sec)
         
-        self._simOutVolume  = defaultdict(int)      # indexed by timeperiod
-        self._simInVolume   = defaultdict(int)      # indexed by timeperiod
-        self._simMeanTT     = defaultdict(float)    # indexed by timeperiod
+        # the containers below are only created when something is stored in them, since most movements have nothing
+        self._simOutVolume  = None      # indexed by timeperiod
+        self._simInVolume   = None      # indexed by timeperiod
+        self._simMeanTT     = None      # indexed by timeperiod
+
+        # the network level :py:class:`SimResults` holding the results instead of the dictionaries above, if any
+        self._simResults        = None
+        self._simResultsIndex   = None
         
         # TODO: what is this used for?!      
         self._penalty   = 0
-        self._timeVaryingCosts = []
+        self._timeVaryingCosts = ()
         self._timeStep  = None
         
         self.simTimeStepInMin = None
         self.simStartTimeInMin = None
         self.simEndTimeInMin = None
 
-        self._obsCount = {}
+        self._obsCount = None
+        self._obsCountStores = ()   # (ObsCounts, index) tuples with the counts read from files
         
     def __repr__(self):
         return "Movement node:%d inlink:%d outlink:%d" % (self._node.getId(), self._incomingLink.getId(), self._outgoingLink.getId())
@@ -228,19 +245,13 @@ class Movement(object):
         """
         Return True if the movement is a left turn
         """
-        if self.getTurnType() == Movement.DIR_LT or \
-           self.getTurnType() == Movement.DIR_LT2:
-            return True
-        return False
+        return self.getTurnType() in (Movement.DIR_LT, Movement.DIR_LT2)
 
     def isRightTurn(self):
         """
         Return True if the movement is a right turn
         """
-        if self.getTurnType() == Movement.DIR_RT or \
-           self.getTurnType() == Movement.DIR_RT2:
-            return True
-        return False
+        return self.getTurnType() in (Movement.DIR_RT, Movement.DIR_RT2)
 
     def setOverrideTurnType(self, turntype):
         """
@@ -268,10 +279,20 @@ class Movement(object):
            
         However, if a Movement type override is set using :py:meth:`Movement.setOverrideTurnType` then that will
         supercede the angle-based analysis.
+
+        The angle-based turn type is computed once and kept until the geometry or the labels of the incoming or
+        outgoing link change; see also :py:meth:`Network.computeTurnTypes` to compute it for all the movements at once.
         """
         if self._overrideTurnType != None:
             return self._overrideTurnType
-                    
+        if self._turnType is None:
+            self._turnType = self._computeTurnType()
+        return self._turnType
+
+    def _computeTurnType(self):
+        """
+        Returns the angle-based turn type of the movement; see :py:meth:`Movement.getTurnType`.
+        """
         angle = self._incomingLink.getAngle(self._outgoingLink)
         if self.isUTurn():
             turnType =  Movement.DIR_UTURN
@@ -292,12 +313,42 @@ class Movement(object):
         """
         Return the direction of the movement as a string
         """
-        return self._incomingLink.getDirection() + self.getTurnType()
+        if self._incomingDirection is None:
+            self._incomingDirection = self._incomingLink.getDirection()
+        return self._incomingDirection + self.getTurnType()
                 
+    def _geometryChanged(self):
+        """
+        Drops the cached center line, turn type and direction of the movement, and the conflicts of the movements
+        of its node which depend on them.  Called when the geometry of the incoming or outgoing link changes.
+        """
+        self._centerLine        = None
+        self._labelChanged()
+        self._movementsChanged()
+
+    def _labelChanged(self):
+        """
+        Drops the cached turn type and direction of the movement, which depend on the labels of the
+        incoming and outgoing links (see :py:meth:`Movement.isUTurn`).  Called when either label changes.
+        """
+        self._turnType          = None
+        self._incomingDirection = None
+
+    def _movementsChanged(self):
+        """
+        Lets the node of the movement know that its movements changed, so it drops its conflict matrix.
+        """
+        if isinstance(self._node, RoadNode):
+            self._node._movementsChanged()
+
     def getCenterLine(self):
         """
-        Get a list of points representing the movement
+        Get a list of points representing the movement.  The list is computed once and kept
+        until the geometry of the incoming or outgoing link changes, so it should not be modified.
         """
+        if self._centerLine is not None:
+            return self._centerLine
+
         inlink_cline  = self._incomingLink.getCenterLine(atStart=False, atEnd=True)
         outlink_cline = self._outgoingLink.getCenterLine(atStart=True, atEnd=False)
 
@@ -312,7 +363,17 @@ class Movement(object):
 
     def isInConflict(self, other):
         """
-        Return true if the current movement is conflicting with the other one
+        Return true if the current movement is conflicting with the other one.
+        Movements of the same :py:class:`RoadNode` are looked up in its conflict matrix
+        (see :py:meth:`RoadNode.getConflictMatrix`).
+        """
+        if self._node == other._node and isinstance(self._node, RoadNode):
+            return self._node.hasConflict(self, other)
+        return self._computeConflict(other)
+
+    def _computeConflict(self, other):
+        """
+        Return true if the current movement is conflicting with the other one, from their center lines.
         """
         line1 = self.getCenterLine()
         line2 = other.getCenterLine()
@@ -392,6 +453,8 @@ class Movement(object):
         if not isinstance(higherprio_movement, Movement):
             DtaLogger.debug("addHigherPriorityMovement called with non-movement: %s" % str(higherprio_movement))
 
+        if self._higherPriorityMovements is None:
+            self._higherPriorityMovements = []
         self._higherPriorityMovements.append( (higherprio_movement, critical_gap, critical_wait) )
         
     def iterHigherPriorityMovements(self):
@@ -404,7 +467,7 @@ class Movement(object):
               print "Movement = %s, critical_gap = %f, critical_wait = %f" % (str(higherprio_movement, critical_gap, critical_wait)
             
         """
-        return iter(self._higherPriorityMovements)
+        return iter(self._higherPriorityMovements or [])
     
     def _checkInputTimeStep(self, startTimeInMin, endTimeInMin):
         """The input time step should always be equal to the sim time step"""
@@ -446,10 +509,14 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
+        if self._simResults:
+            return self._simResults.getOutVolume(self._simResultsIndex, startTimeInMin, endTimeInMin)
+
         result = 0
+        if not self._simOutVolume: return result
         for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
                                              self.simTimeStepInMin)):
-            result += self._simOutVolume[stTime, enTime]
+            result += self._simOutVolume.get((stTime, enTime), 0)
         return result
 
     def getSimOutFlow(self, startTimeInMin, endTimeInMin):
@@ -467,10 +534,14 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
+        if self._simResults:
+            return self._simResults.getInVolume(self._simResultsIndex, startTimeInMin, endTimeInMin)
+
         result = 0
+        if not self._simInVolume: return result
         for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
                                              self.simTimeStepInMin)):
-            result += self._simInVolume[stTime, enTime]
+            result += self._simInVolume.get((stTime, enTime), 0)
         return result
 
     def getSimInFlow(self, startTimeInMin, endTimeInMin):
@@ -489,17 +560,27 @@ class Movement(object):
 
         totalFlow = 0
         totalTime = 0
+
+        if self._simResults:
+            meanTT, totalFlow = self._simResults.getMeanTTAndVolume(self._simResultsIndex, startTimeInMin, endTimeInMin)
+            if meanTT is not None and endTimeInMin - startTimeInMin == self.simTimeStepInMin:
+                return meanTT
+            if meanTT is not None:
+                return meanTT + self._penalty
+            return (self._incomingLink.getLength() / 
+                float(self._incomingLink.getFreeFlowSpeedInMPH()) * 60 + self._penalty)
         
-        if (startTimeInMin, endTimeInMin) in self._simMeanTT:
-            return self._simMeanTT[startTimeInMin, endTimeInMin]
+        simMeanTT = self._simMeanTT or {}
+        if (startTimeInMin, endTimeInMin) in simMeanTT:
+            return simMeanTT[startTimeInMin, endTimeInMin]
 
-        for (stTime, enTime), flow in self._simOutVolume.iteritems():
+        for (stTime, enTime), flow in (self._simOutVolume or {}).iteritems():
             if stTime >= startTimeInMin and enTime <= endTimeInMin:
-                binTT = self._simMeanTT[(stTime, enTime)]
+                binTT = simMeanTT.get((stTime, enTime), 0.0)
 
                 if binTT > 0 and flow > 0:
                     totalFlow += flow
-                    totalTime += self._simMeanTT[(stTime, enTime)] * flow
+                    totalTime += binTT * flow
                 elif binTT == 0 and flow == 0:
                     continue
                 else:
@@ -559,6 +640,11 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkInputTimeStep(startTimeInMin, endTimeInMin)
 
+        if self._simResults:
+            self._simResults.setOutVolume(self._simResultsIndex, startTimeInMin, flow)
+            return
+        if self._simOutVolume is None:
+            self._simOutVolume = {}
         self._simOutVolume[startTimeInMin, endTimeInMin] = flow
 
     def setSimInVolume(self, startTimeInMin, endTimeInMin, flow):
@@ -568,6 +654,11 @@ class Movement(object):
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkInputTimeStep(startTimeInMin, endTimeInMin)
 
+        if self._simResults:
+            self._simResults.setInVolume(self._simResultsIndex, startTimeInMin, flow)
+            return
+        if self._simInVolume is None:
+            self._simInVolume = {}
         self._simInVolume[startTimeInMin, endTimeInMin] = flow
 
     def setSimTTInMin(self, startTimeInMin, endTimeInMin, averageTTInMin):
@@ -593,6 +684,11 @@ class Movement(object):
         if self.getSimOutFlow(startTimeInMin, endTimeInMin) == 0:
             raise DtaError('Cannot set the travel time on a movement with zero flow')
 
+        if self._simResults:
+            self._simResults.setMeanTT(self._simResultsIndex, startTimeInMin, averageTTInMin)
+            return
+        if self._simMeanTT is None:
+            self._simMeanTT = {}
         self._simMeanTT[startTimeInMin, endTimeInMin] = averageTTInMin
 
     def setTimeVaryingCosts(self, timeVaryingCosts, timeStep):
@@ -658,24 +754,37 @@ class Movement(object):
         if count < 0:
             raise DtaError('Count for time period from %d to %d cannot be '
                                    'negative' % (startTimeInMin, endTimeInMin))
+        if self._obsCount is None:
+            self._obsCount = {}
         self._obsCount[startTimeInMin, endTimeInMin] = count
 
     def getObsCount(self, startTimeInMin, endTimeInMin):
         """Return the number of vehicles executing the
-        movement in the input time window. 
+        movement in the input time window, or None if there is no count for it.
+        The counts set with :py:meth:`setObsCount` take precedence over the ones read from count files
+        (see :py:class:`ObsCounts`), which are summed over their time bins for coarser time windows.
         """
 
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        try:
-            return self._obsCount[startTimeInMin, endTimeInMin]            
-        except KeyError:
-            return None
+        if self._obsCount and (startTimeInMin, endTimeInMin) in self._obsCount:
+            return self._obsCount[startTimeInMin, endTimeInMin]
+        for obsCounts, index in reversed(self._obsCountStores):
+            count = obsCounts.getCount(index, startTimeInMin, endTimeInMin)
+            if count is not None:
+                return count
+        return None
+
+    def getObsCountArray(self, startTimesInMin, durationInMin):
+        """Return the array of the number of vehicles executing the movement in the time windows of
+        *durationInMin* minutes starting at *startTimesInMin*, with NaN for the windows without a count.
+        """
+        return ObsCounts.getItemCountArray(self, startTimesInMin, durationInMin)
 
     def hasCountInfo(self):
         """Return True if the movement contains count information else false"""
-        return True if len(self._obsCount) else False
+        return True if self._obsCount or self._obsCountStores else False
 
     def hasObsCount(self, startTimeInMin, endTimeInMin):
         """Return True if there is a count for the input time period  
@@ -86,6 +86,33 @@ class MultiArray(object):
         numpyArray = data['arr_%d' % (numArrays - 1)]
         ma = MultiArray('d', dimElements, numpyArray=numpyArray)
         return ma
+
+    @classmethod
+    def _getLabelsFileName(cls, fileName):
+        """Return the name of the file with the dimention elements of the array in the .npy file *fileName*"""
+        return fileName + ".labels"
+
+    @classmethod
+    def openMemoryMapped(cls, fileName, mode='r'):
+        """Open the multiArray saved with :py:meth:`MultiArray.writeMemoryMapped` in the .npy file *fileName*
+        without reading its data, which is memory mapped with the given *mode* ('r' for read only, 'r+' to
+        write to the file, 'c' for copy on write; see :py:class:`numpy.memmap`).  Its items are 
+        only read from disk when they are accessed, e.g. through a slice of the array.""" 
+        data = np.load(fileName, mmap_mode=mode)
+        inputStream = open(cls._getLabelsFileName(fileName), 'rb')
+        dimElements = pickle.load(inputStream)
+        inputStream.close()
+        return MultiArray(data.dtype, dimElements, numpyArray=data)
+
+    @classmethod
+    def createMemoryMapped(cls, fileName, dtype, dimElements):
+        """Create and return a multiArray of zeros with the given *dtype* and *dimElements* whose data is
+        the memory mapped .npy file *fileName*, so it doesn't have to fit in memory; see 
+        :py:meth:`MultiArray.openMemoryMapped`"""
+        data = np.lib.format.open_memmap(fileName, mode='w+', dtype=dtype, shape=tuple(map(len, dimElements)))
+        ma = MultiArray(dtype, dimElements, numpyArray=data)
+        ma._writeLabels(fileName)
+        return ma
         
     def __init__(self, dtype, dimElements, numpyArray=None, isBase=True):
         
@@ -96,7 +123,7 @@ class MultiArray(object):
             # you instantiate a numpy array 
             self._data = np.zeros(self._shape, dtype=dtype)
         elif len(dimElements) > 0 and numpyArray is not None:
-            if type(numpyArray) != np.ndarray:
+            if not isinstance(numpyArray, np.ndarray):
                 raise ValueError("A numpy array is expected")
             if numpyArray.shape != self._shape:
                 raise ValueError("The shape of the numpy array provided: %s is not "
@@ -112,6 +139,36 @@ class MultiArray(object):
         self._translation = [dict(izip(element, count())) for element in dimElements]
         self._base = isBase
         self._elementsOfAllDimentions = self.getElementsOfAllDimentions()
+        # dimIndex -> (sorted integer elements, their indices) or None; see translateElementArray()
+        self._sortedElements = {}
+
+    def __getstate__(self):
+        """Return the state of the array for pickling.  A memory mapped array is pickled by
+        the name of its file, so that it can be shared between processes without copying its data"""
+        state = self.__dict__.copy()
+        if self.isMemoryMapped() and self._base:
+            # files opened for writing are reopened without truncating them
+            mode = 'r+' if self._data.mode == 'w+' else self._data.mode
+            state['_data'] = (self._data.filename, mode)
+            state['_memoryMapped'] = True
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state of the array after unpickling"""
+        if state.pop('_memoryMapped', False):
+            fileName, mode = state['_data']
+            state['_data'] = np.load(fileName, mmap_mode=mode)
+        state.setdefault('_sortedElements', {})
+        self.__dict__.update(state)
+
+    def isMemoryMapped(self):
+        """Return True if the data of the array is a memory mapped file"""
+        return isinstance(self._data, np.memmap)
+
+    def flush(self):
+        """Write the changes to the data of a memory mapped array to its file"""
+        if self.isMemoryMapped():
+            self._data.flush()
 
     def getNumDim(self):
         """Return the number of dimentions"""
@@ -162,6 +219,7 @@ class MultiArray(object):
             newElement = oldElementsToNew[oldElement]
             newMapping[newElement] = internalIndex
         self._translation[dimIndex] = newMapping
+        self._sortedElements.pop(dimIndex, None)
         
     def __str__(self):
         """Convert the array into its string numpy representation"""
@@ -218,29 +276,94 @@ class MultiArray(object):
         return tuple([self._translateElement(dimIndex, elem) \
                     for dimIndex, elem in enumerate(args)])
 
+    def translateElementArray(self, dimIndex, elements):
+        """Return a numpy array with the indices of the given sequence of *elements* of dimention *dimIndex*.
+        Raises an IndexError if any of them is not an element of the dimention."""
+        translation = self._translation[dimIndex]
+        if isinstance(elements, np.ndarray) and elements.dtype.kind in "iu":
+            # integer elements are looked up by binary search
+            if dimIndex not in self._sortedElements:
+                dimElements = self.getElementsOfDimention(dimIndex)
+                if all(isinstance(elem, (int, long, np.integer)) for elem in dimElements):
+                    sortedElements = np.array(dimElements, dtype=np.int64)
+                    order = np.argsort(sortedElements, kind="mergesort")
+                    self._sortedElements[dimIndex] = (sortedElements[order],
+                        np.array([translation[elem] for elem in dimElements], dtype=np.int64)[order])
+                else:
+                    self._sortedElements[dimIndex] = None
+            if self._sortedElements[dimIndex] is not None:
+                sortedElements, sortedIndices = self._sortedElements[dimIndex]
+                positions = np.minimum(np.searchsorted(sortedElements, elements), max(len(sortedElements) - 1, 0))
+                missing = sortedElements[positions] != elements
+                if missing.any():
+                    raise IndexError("Dim %d does not have element %s" % (dimIndex, str(elements[missing][0])))
+                return sortedIndices[positions]
+        try:
+            return np.array([translation[elem] for elem in elements], dtype=np.int64)
+        except KeyError, e:
+            raise IndexError("Dim %d does not have element %s" % (dimIndex, str(e.args[0])))
+
+    def _translateFancyIndex(self, viewElements):
+        """Return the tuple of indices for numpy fancy indexing corresponding to *viewElements*,
+        which are single elements or sequences (lists or numpy arrays) of elements"""
+        indices = []
+        for dimIndex, elem in enumerate(viewElements):
+            if isinstance(elem, slice):
+                raise ValueError("Not implemented yet: slices mixed with lists of elements")
+            if isinstance(elem, (list, np.ndarray)):
+                indices.append(self.translateElementArray(dimIndex, elem))
+            else:
+                indices.append(self._translateElement(dimIndex, elem))
+        return tuple(indices)
+
+    def _isFancyIndex(self, viewElements):
+        """Return True if any of the *viewElements* is a list or a numpy array of elements"""
+        for elem in viewElements:
+            if isinstance(elem, (list, np.ndarray)):
+                return True
+        return False
+
     def __getitem__(self, viewElements):
+        """Return the item with the given elements, e.g. ``array[element0, element1]``.  
+
+        * if any of the elements is a slice (of elements, without a step), return a 
+          MultiArray that is a view of the corresponding part of this array
+        * if any of the elements is a list or numpy array of elements, return a numpy array of the items
+          at those elements, broadcast together like numpy fancy indexing
+        """
+        # the most common case: a single item.  Slices and lists are not hashable and
+        # missing elements are reported by the general case
+        if isinstance(viewElements, tuple) and len(viewElements) == len(self._translation):
+            try:
+                index = tuple([translation[elem] for translation, elem in izip(self._translation, viewElements)])
+            except (TypeError, KeyError):
+                pass
+            else:
+                return self._data.item(index)
+        return self._getItems(viewElements)
+
+    def _getItems(self, viewElements):
+        """The general case of :py:meth:`MultiArray.__getitem__`"""
 
         #if you have a one dimentional array
         if isinstance(viewElements, str) or isinstance(viewElements, int):
             if self.getNumDim() != 1:
                 raise IndexError("Invalid Index")
-            return deepcopy(self._data.item(self._translateElement(0, viewElements)))
+            return self._data.item(self._translateElement(0, viewElements))
         
         if len(viewElements) != self.getNumDim():
             raise IndexError("Invalid Index")
         
-        #if instead of a slice a list is entered raise an error
-        if any(viewElements, pred=lambda elem: isinstance(elem, list)):
-            raise ValueError("Not implemented yet")
+        if self._isFancyIndex(viewElements):
+            return self._data[self._translateFancyIndex(viewElements)]
         #if any of the indices entered is a slice then translate the slice and return a new MultiArray
         #with a referece to the data
         elif any(viewElements, pred=lambda elem: isinstance(elem, slice)):
             viewObj, newDimElements = self._translateViewObject(viewElements)
-            return MultiArray("d", newDimElements, numpyArray=self._data[viewObj], isBase=False)
-        #if no slice object is ented => the user has asked for an individual element. So,
-        #return a deepcopy of the element
+            return MultiArray("d", newDimElements, numpyArray=self._data[tuple(viewObj)], isBase=False)
+        #if no slice object is ented => the user has asked for an individual element. 
         else:
-            return deepcopy(self._data.item(*self._translateElements(*viewElements)))
+            return self._data.item(*self._translateElements(*viewElements))
 
     def _translateViewObject(self, eViewObject):
         """Translate the external view object to the internal one"""
@@ -270,14 +393,28 @@ class MultiArray(object):
         return translatedViewObj, newDimElements
 
     def __setitem__(self, viewElements, value):
+        """Set the item with the given elements, e.g. ``array[element0, element1] = value``.  Like 
+        :py:meth:`MultiArray.__getitem__`, the elements can include slices or lists/numpy arrays of elements, 
+        in which case *value* must be a scalar or have the corresponding shape."""
+
+        # the most common case: a single item
+        if isinstance(viewElements, tuple) and len(viewElements) == len(self._translation):
+            try:
+                index = tuple([translation[elem] for translation, elem in izip(self._translation, viewElements)])
+            except (TypeError, KeyError):
+                pass
+            else:
+                self._data[index] = value
+                return
 
         if len(viewElements) != self.getNumDim():
             raise IndexError("Invalid Index dimentions")
 
-        if any(viewElements, pred=lambda elem: isinstance(elem, list)):
-            raise ValueError("Not implemented yet")
+        if self._isFancyIndex(viewElements):
+            self._data[self._translateFancyIndex(viewElements)] = value
         elif any(viewElements, pred=lambda elem: isinstance(elem, slice)):
             viewObj, newDimElements = self._translateViewObject(viewElements)
+            viewObj = tuple(viewObj)
             if isinstance(value, MultiArray):
                 if self._data[viewObj].shape != value.getShape():
                     raise ValueError("The MultiArray's shape %s is not the same with the view's "
@@ -417,6 +554,13 @@ class MultiArray(object):
         """Return a reference to the stored data as multidimentional numpy array"""
         return self._data
 
+    def toNumpyArray(self):
+        """
+        Return a copy of the stored data as multidimentional numpy array, like
+        :py:meth:`SparseMultiArray.toNumpyArray`
+        """
+        return self._data.copy()
+
     def getSum(self):
         """return the sum of all the items in the array"""
         return np.sum(self._data)
@@ -426,15 +570,17 @@ class MultiArray(object):
 #        else:
 #            raise ValueError("Not implemented yet")
 
+    def addInPlace(self, viewElements, values):
+        """Add the *values* to the items with the given elements, which are single elements or 
+        lists/numpy arrays of elements like in :py:meth:`MultiArray.__getitem__`.  Unlike 
+        ``array[elements] += values``, the values of repeated items are all added up."""
+        if len(viewElements) != self.getNumDim():
+            raise IndexError("Invalid Index dimentions")
+        np.add.at(self._data, self._translateFancyIndex(viewElements), values)
+
     def copy(self):
-        
-        """Return a copy of the current Multi Array"""
-        if not self._base:
-            raise ValueError("Not implemented yet")
-        
-        raise ValueError("not implemented yet")
-        copyData = self._data.copy()
-        return MultiArray("d", self._elementsOfAllDimentions, copyData)
+        """Return a copy of the current Multi Array, with its own copy of the data"""
+        return MultiArray(self.getDataType(), self.getElementsOfAllDimentions(), self._data.copy())
 
     def expand(self, alphaToBeta):
         """Expands the current dimentions of multiArray.
@@ -453,22 +599,9 @@ class MultiArray(object):
             raise ValueError("The beta values are not the same with the elements of the"
                              "MultiArray")
 
-        numAlphas = len(alphaToBeta)
-        percentages = np.zeros((numAlphas, 1))
-        for i in xrange(numAlphas):
-            percentages[i, 0] = alphaToBeta[i]["percentage"]
-        newData = np.dot(percentages, percentages.transpose())
-
-        betas = list(self.getElementsOfDimention(0))
-        betaIndex = [0] * numAlphas
-        for i, beta in enumerate(alphaToBeta["beta"]):
-            betaIndex[i] = betas.index(beta)
-
-        
-        for i in xrange(numAlphas):
-            betaI = betaIndex[i]
-            for j in xrange(numAlphas):
-                newData[i, j] *= self._data[betaI, betaIndex[j]]
+        percentages = np.asarray(alphaToBeta["percentage"], dtype=np.float64)
+        betaIndex = self.translateElementArray(0, alphaToBeta["beta"])
+        newData = np.outer(percentages, percentages) * self._data[np.ix_(betaIndex, betaIndex)]
 
         result = MultiArray("d", [alphaToBeta["alpha"], alphaToBeta["alpha"]], newData)            
         return result
@@ -477,22 +610,29 @@ class MultiArray(object):
         """Collapses the current array into fewer dimensions
         input: a numpy array with the following fields "alpha", "beta", 
         "percentage". The current zoneIds are in the "alpha" fields, the 
-        new ones in the "beta" fields."""
-        
-        #check that you have all the alphas
-        #check that you have a 2D array
+        new ones in the "beta" fields.  The elements of the new array are 
+        the sorted beta values and each of its items is the sum of the items of 
+        the alphas that belong to the corresponding betas."""
+        if self.getNumDim() != 2:
+            raise ValueError("I can only collapse a 2D array")
+        alphas = self.getElementsOfDimention(0)
+        if alphas != self.getElementsOfDimention(1):
+            raise ValueError("The elements of the two dimentions of the array are not the same"
+                             "and as a consequence the array cannot be collapsed")
 
-        newDimention = len(set(alphaToBeta["beta"]))
-        result = numpy.zeros(newDimention **2, "d")
         a2b = dict(izip(alphaToBeta["alpha"], alphaToBeta["beta"]))
-
-        for alphaOrigin in self.getDimIndices(0):
-            for alphaDestination in self.getDimIndices(1):
-                betaOrigin = a2b[alphaOrigin]
-                betaDestination = a2b[alphaDestination]
-                value = self.getValue(alphaOrigin, alphaDestination)
-                result.addInPlace(betaOrigin, betaDestination, value)
-        return result
+        missing = [alpha for alpha in alphas if alpha not in a2b]
+        if missing:
+            raise ValueError("The alpha values do not include the elements %s of the MultiArray" % 
+                             str(missing[:10]))
+
+        betas = sorted(set(a2b[alpha] for alpha in alphas))
+        betaPosition = dict(izip(betas, count()))
+        betaIndex = np.array([betaPosition[a2b[alpha]] for alpha in alphas], dtype=np.int64)
+
+        newData = np.zeros((len(betas), len(betas)), dtype=self.getDataType())
+        np.add.at(newData, (betaIndex[:, np.newaxis], betaIndex[np.newaxis, :]), self._data)
+        return MultiArray(self.getDataType(), [betas, betas], newData)
     
     def writeToCSV(self, fileName):
         """Save the multiarry as a comma delimited text file"""
@@ -512,4 +652,19 @@ class MultiArray(object):
             data.append(dimElements)
         data.append(self._data)
         np.savez(fileName, *data)
+
+    def _writeLabels(self, fileName):
+        """Write the dimention elements of the array next to the .npy file *fileName*"""
+        outputStream = open(MultiArray._getLabelsFileName(fileName), 'wb')
+        pickle.dump([list(self.getElementsOfDimention(dim)) for dim in range(self.getNumDim())], 
+                    outputStream, pickle.HIGHEST_PROTOCOL)
+        outputStream.close()
+
+    def writeMemoryMapped(self, fileName):
+        """Write the data of the array to the .npy file *fileName* and its dimention elements to 
+        *fileName*.labels, so that it can be opened with :py:meth:`MultiArray.openMemoryMapped`"""
+        outputStream = open(fileName, 'wb')
+        np.save(outputStream, self._data)
+        outputStream.close()
+        self._writeLabels(fileName)
             
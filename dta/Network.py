@@ -17,23 +17,30 @@ __license__     = """
 """
 import pdb 
 import collections
+import contextlib
 import copy
 import random
 import difflib
 import operator
 import shapefile
 import sys 
+import numpy as np
+from itertools import izip
 
 from .Centroid import Centroid
 from .Connector import Connector
 from .DtaError import DtaError
+from .GraphSnapshot import GraphSnapshot
 from .Link import Link
+from .LinkGeometry import LinkGeometry
 from .RoadLink import RoadLink
 from .Logger import DtaLogger
 from .Node import Node
 from .RoadNode import RoadNode
 from .TimePlan import PlanCollectionInfo
 from .Scenario import Scenario
+from .SimResults import SimResults
+from .SpatialIndex import SpatialIndex
 from .VirtualLink import VirtualLink
 from .VirtualNode import VirtualNode
 from .VehicleType import VehicleType
@@ -84,6 +91,18 @@ class Network(object):
         
         self._nodeType = random.randint(0, 100000)
         self._linkType = random.randint(0, 100000)
+
+        # :py:class:`SpatialIndex` over the nodes and road links; built on demand by getSpatialIndex()
+        self._spatialIndex = None
+
+        # :py:class:`SimResults` holding the simulated movement results; see initializeSimResults()
+        self._simResults = None
+
+        # set of the nodes whose link lists need sorting, while in deferLinkOrdering()
+        self._nodesToSort = None
+
+        # :py:class:`LinkGeometry` of the road links; built on demand by getLinkGeometry()
+        self._linkGeometry = None
         
     def __del__(self):
         pass
@@ -104,14 +123,15 @@ class Network(object):
             cNode._outgoingLinks = []
             self.addNode(cNode)
 
-        for link in originNetwork.iterLinks():
-            cLink = copy.copy(link)
-            cLink._startNode = self.getNodeForId(link._startNode.getId())
-            cLink._endNode = self.getNodeForId(link._endNode.getId())
-            if isinstance(link, RoadLink):                
-                cLink._outgoingMovements = []
-                cLink._incomingMovements = [] 
-            self.addLink(cLink) 
+        with self.deferLinkOrdering():
+            for link in originNetwork.iterLinks():
+                cLink = copy.copy(link)
+                cLink._startNode = self.getNodeForId(link._startNode.getId())
+                cLink._endNode = self.getNodeForId(link._endNode.getId())
+                if isinstance(link, RoadLink):                
+                    cLink._outgoingMovements = []
+                    cLink._incomingMovements = [] 
+                self.addLink(cLink) 
 
         for link in originNetwork.iterLinks():
             if isinstance(link, RoadLink):                
@@ -192,6 +212,8 @@ class Network(object):
         
         if newNode.getId() > self._maxNodeId: self._maxNodeId = newNode.getId()
 
+        if self._spatialIndex: self._spatialIndex.addNode(newNode)
+
     def getNumNodes(self):
         """
         Returns the number of nodes in the network
@@ -289,6 +311,53 @@ class Network(object):
         
         DtaLogger.info("addAllMovements() added %d movements" % movements_added)
     
+    def computeTurnTypes(self):
+        """
+        Computes the angle-based turn types (see :py:meth:`Movement.getTurnType`) and the directions
+        (see :py:meth:`Movement.getDirection`) of all the movements of the network at once, from the orientation
+        arrays of the :py:class:`LinkGeometry` of the network, and caches them on the movements.  Returns the number of movements.
+        """
+        geometry    = self.getLinkGeometry()
+        movements   = [mov for roadlink in geometry.roadlinks for mov in roadlink.iterOutgoingMovements()]
+        if not movements: return 0
+
+        orientation         = geometry.orientations
+        orientationAtEnd    = geometry.orientationsAtEnd
+        orientationAtStart  = geometry.orientationsAtStart
+
+        inIndex     = geometry.getLinkIndices([mov.getIncomingLink() for mov in movements])
+        outIndex    = geometry.getLinkIndices([mov.getOutgoingLink() for mov in movements])
+
+        # angles between the incoming and the outgoing links, see RoadLink.getAngle()
+        angle = orientation[outIndex] - orientation[inIndex]
+        angle = np.where(angle > 180, angle - 360.0, np.where(angle <= -180, angle + 360.0, angle))
+
+        # u-turns, see Movement.isUTurn()
+        uturnAngle  = orientationAtEnd[inIndex] - orientationAtStart[outIndex]
+        uturnAngle  = np.where(uturnAngle > 360, uturnAngle - 360, uturnAngle)
+        uturnAngle  = np.where(uturnAngle < 0, uturnAngle + 360, uturnAngle)
+        sameNode    = np.array([mov.getIncomingLink().getStartNode() == mov.getOutgoingLink().getEndNode()
+                                for mov in movements], dtype=np.bool_)
+        sameLabel   = np.array([mov.getIncomingLink().getLabel() == mov.getOutgoingLink().getLabel()
+                                for mov in movements], dtype=np.bool_)
+        uturn       = sameNode | (sameLabel & (uturnAngle > 160) & (uturnAngle <= 180))
+
+        turnTypes   = [Movement.DIR_UTURN, Movement.DIR_TH, Movement.DIR_RT, Movement.DIR_RT2, Movement.DIR_LT, Movement.DIR_LT2]
+        turnType    = np.select([uturn, (-45 <= angle) & (angle < 45), (45 <= angle) & (angle < 135), 135 <= angle,
+                                 (-135 <= angle) & (angle < -45), angle < -135], range(len(turnTypes)))
+
+        # directions of the incoming links, see RoadLink.getDirection()
+        directions  = [RoadLink.DIR_NB, RoadLink.DIR_EB, RoadLink.DIR_SB, RoadLink.DIR_WB]
+        direction   = np.select([(315 <= orientationAtEnd) | (orientationAtEnd < 45), orientationAtEnd < 135,
+                                 orientationAtEnd < 225], range(3), 3)[inIndex]
+
+        for mov, movTurnType, movDirection in izip(movements, turnType.tolist(), direction.tolist()):
+            mov._turnType           = turnTypes[movTurnType]
+            mov._incomingDirection  = directions[movDirection]
+
+        DtaLogger.info("computeTurnTypes() classified %d movements, %d u-turns" % (len(movements), uturn.sum()))
+        return len(movements)
+
     def setMovementTurnTypeOverrides(self, overrides):
         """
         Sets movement turn type overrides.  *overrides* is specified as a list of overrides, where each override
@@ -396,8 +465,53 @@ class Network(object):
         if newLink.getId() > self._maxLinkId:
             self._maxLinkId = newLink.getId()
         
-        newLink.getStartNode()._addOutgoingLink(newLink)
-        newLink.getEndNode()._addIncomingLink(newLink)
+        if self._nodesToSort is None:
+            newLink.getStartNode()._addOutgoingLink(newLink)
+            newLink.getEndNode()._addIncomingLink(newLink)
+        else:
+            newLink.getStartNode()._addOutgoingLink(newLink, deferSort=True)
+            newLink.getEndNode()._addIncomingLink(newLink, deferSort=True)
+            self._nodesToSort.add(newLink.getStartNode())
+            self._nodesToSort.add(newLink.getEndNode())
+
+        if self._spatialIndex: self._spatialIndex.addLink(newLink)
+        self._linkGeometry = None
+
+    def addLinks(self, links):
+        """
+        Adds each of the *links* (an iterable) with :py:meth:`Network.addLink`, sorting the link lists of their
+        nodes once at the end (see :py:meth:`Network.deferLinkOrdering`).  Returns the number of links added.
+        """
+        numLinks = 0
+        with self.deferLinkOrdering():
+            for link in links:
+                self.addLink(link)
+                numLinks += 1
+        return numLinks
+
+    @contextlib.contextmanager
+    def deferLinkOrdering(self):
+        """
+        Context manager for building the network in bulk.  The links added with :py:meth:`Network.addLink` inside
+        the context are appended to the incoming and outgoing link lists of their nodes rather than inserted
+        in order of reference angle, and the lists of the nodes involved are sorted once when the context exits,
+        so adding the links doesn't cost a scan of the links of each node with an angle computation per link.
+
+        Inside the context, the order of the links of the nodes (e.g. :py:meth:`Node.iterIncomingLinks`)
+        is the order in which they were added.  The contexts can be nested; the lists are sorted when the outermost one exits.
+        """
+        if self._nodesToSort is not None:
+            yield
+            return
+
+        self._nodesToSort = set()
+        try:
+            yield
+        finally:
+            nodesToSort = self._nodesToSort
+            self._nodesToSort = None
+            for node in nodesToSort:
+                node._sortLinks()
 
     
     def getLinkForId(self, linkId):
@@ -659,8 +773,7 @@ class Network(object):
                              (original_loc[0]-moveVirtualNodeDist, original_loc[1]-moveVirtualNodeDist)])
         
         for try_loc in try_locs:
-            virtualNode._x = try_loc[0]
-            virtualNode._y = try_loc[1]
+            virtualNode.setCoordinates(try_loc[0], try_loc[1])
             
             candidateLinks = roadNode.getCandidateLinksForSplitting(connector, disallowConnectorEvalStr)
             
@@ -722,8 +835,7 @@ class Network(object):
         # if we got here, we failed to find any candidate links
         if moveVirtualNodeDist:
             # put it back
-            virtualNode._x = original_loc[0]
-            virtualNode._y = original_loc[1]
+            virtualNode.setCoordinates(original_loc[0], original_loc[1])
             
         raise DtaError("No candidate links found for roadNode %d" % roadNode.getId())
 
@@ -962,6 +1074,82 @@ class Network(object):
             for movement in self._linksById[linkId].iterOutgoingMovements():
                 yield movement
 
+    def buildGraphSnapshot(self):
+        """
+        Returns a :py:class:`GraphSnapshot` of the current nodes, links and movements of this network:
+        an integer-indexed, array-backed copy of the topology for the shortest path algorithms that
+        run on snapshots (e.g. :py:meth:`ShortestPaths.labelCorrectingOnSnapshot`).
+        
+        The snapshot does not follow subsequent edits to the network.
+        """
+        return GraphSnapshot(self)
+
+    def getSpatialIndex(self):
+        """
+        Returns the :py:class:`SpatialIndex` over the nodes and :py:class:`RoadLink` instances of this network,
+        building it first if necessary.  The index follows nodes and links added and removed through
+        :py:meth:`Network.addNode`, :py:meth:`Network.addLink`, :py:meth:`Network.removeLink`, :py:meth:`Network.removeNode`
+        (and so :py:meth:`Network.splitLink` etc.) and nodes moved by :py:meth:`Node.setCoordinates`; code that
+        changes shape points directly should call :py:meth:`Network.invalidateSpatialIndex`.
+        """
+        if self._spatialIndex is None:
+            self._spatialIndex = SpatialIndex.buildForNetwork(self)
+        return self._spatialIndex
+
+    def initializeSimResults(self, simStartTimeInMin, simEndTimeInMin, simTimeStepInMin):
+        """
+        Sets up the network for simulated results in time bins of *simTimeStepInMin* minutes from
+        *simStartTimeInMin* to *simEndTimeInMin*: sets the simulation time attributes of the links and
+        movements and creates the :py:class:`SimResults` store for all the movements currently in the network
+        (in the order of :py:meth:`Network.iterMovements`), which is returned.
+        """
+        for link in self.iterLinks():
+            if link.isVirtualLink():
+                continue
+            link.simTimeStepInMin = simTimeStepInMin
+            link.simStartTimeInMin = simStartTimeInMin
+            link.simEndTimeInMin = simEndTimeInMin
+            for mov in link.iterOutgoingMovements():
+                mov.simTimeStepInMin = simTimeStepInMin
+                mov.simStartTimeInMin = simStartTimeInMin
+                mov.simEndTimeInMin = simEndTimeInMin
+
+        self._simResults = SimResults(self.iterMovements(), simStartTimeInMin, simEndTimeInMin, simTimeStepInMin)
+        return self._simResults
+
+    def getSimResults(self):
+        """
+        Returns the :py:class:`SimResults` store created by :py:meth:`Network.initializeSimResults`, or None.
+        """
+        return self._simResults
+
+    def invalidateSpatialIndex(self):
+        """
+        Drops the :py:class:`SpatialIndex` so that it gets rebuilt the next time it's needed.
+        """
+        self._spatialIndex = None
+
+    def getLinkGeometry(self):
+        """
+        Returns the :py:class:`LinkGeometry` of the :py:class:`RoadLink` instances of this network (connectors included),
+        building it first if necessary.  It's rebuilt after links are added or removed through :py:meth:`Network.addLink`
+        and :py:meth:`Network.removeLink`, and updated (see :py:meth:`LinkGeometry.update`) after the geometry of some
+        of its links changes through the methods of the nodes and links (e.g. :py:meth:`Node.setCoordinates`,
+        :py:meth:`RoadLink.addShapePoint`); code that changes the coordinates or the shape points directly should
+        call :py:meth:`Network.invalidateLinkGeometry`.
+        """
+        if self._linkGeometry is not None and not self._linkGeometry.isCurrent() and not self._linkGeometry.update():
+            self._linkGeometry = None
+        if self._linkGeometry is None:
+            self._linkGeometry = LinkGeometry([link for link in self.iterLinks() if isinstance(link, RoadLink)])
+        return self._linkGeometry
+
+    def invalidateLinkGeometry(self):
+        """
+        Drops the :py:class:`LinkGeometry` so that it gets rebuilt the next time it's needed.
+        """
+        self._linkGeometry = None
+
     def hasCustomPriorities(self):
         """
         Does this network have custom priorities?  i.e. Were custom priorities set via :py:meth:`Movement.addHigherPriorityMovement` ?
@@ -1016,30 +1204,35 @@ class Network(object):
 
     def findNodeNearestCoords(self, x, y, quick_dist=None):
         """
-        Iterates though :py:class:`RoadNode` instances and returns 
-        the node closest to (*x*, *y*), as well as the distance.
+        Returns the :py:class:`RoadNode` instance closest to (*x*, *y*), as well as the distance.
         
-        Uses *quick_dist* (if passed) to skip skip distance calcs and ignore anything
-        greater than *quick_dist* difference in either coordinate.
+        Uses *quick_dist* (if passed) to ignore anything greater than *quick_dist* difference in either coordinate.
         
-        So the return is a tuple: (distance, RoadNode)
+        So the return is a tuple: (distance, RoadNode), or (sys.float_info.max, None) if none found.
         
         *x*,*y* and *quick_dist* are  in :py:attr:`Node.COORDINATE_UNITS`
         """
-        min_dist     = sys.float_info.max
-        closest_node = None
-        
-        for roadnode in self.iterRoadNodes():
-            
-            if quick_dist and abs(roadnode.getX()-x) > quick_dist: continue
-            if quick_dist and abs(roadnode.getY()-y) > quick_dist: continue
-            
-            dist = math.sqrt( (roadnode.getX()-x)**2 + (roadnode.getY()-y)**2 )
-            if dist < min_dist:
-                min_dist = dist
-                closest_node = roadnode
+        if quick_dist:
+            nodeFilter = lambda node: node.isRoadNode() and abs(node.getX()-x) <= quick_dist and abs(node.getY()-y) <= quick_dist
+            maxDist    = quick_dist*math.sqrt(2.0)
+        else:
+            nodeFilter = lambda node: node.isRoadNode()
+            maxDist    = None
+
+        found = self.getSpatialIndex().findNearestNodes(x, y, n=1, maxDist=maxDist, nodeFilter=nodeFilter)
+        if len(found) == 0:
+            return (sys.float_info.max, None)
+        return found[0]
+
+    def findNodesWithinRadius(self, x, y, radius, nodeFilter=None):
+        """
+        Returns a list of (distance, node) tuples for the nodes within *radius* of (*x*, *y*), sorted by distance.
+        If passed, *nodeFilter* is a function of a node that returns False for the nodes to skip
+        (e.g. ``lambda node: node.isRoadNode()``).
         
-        return (min_dist, closest_node)
+        *x*,*y* and *radius* are  in :py:attr:`Node.COORDINATE_UNITS`
+        """
+        return self.getSpatialIndex().findNodesWithinRadius(x, y, radius, nodeFilter=nodeFilter)
 
     def findNodeForRoadLabels(self, road_label_list, CUTOFF):
         """ 
@@ -1199,8 +1392,7 @@ class Network(object):
 
     def findNRoadLinksNearestCoords(self, x, y, n=1, quick_dist = None):
         """
-        Iterates though :py:class:`RoadLink` instances and returns the *n* closest
-        road links to the given (*x*, *y*) coordinates.
+        Returns the *n* closest :py:class:`RoadLink` instances to the given (*x*, *y*) coordinates.
         
         If *n* = 1, returns a 3-tuple (*roadlink*, *distance*, *t*).  
         The *roadlink* is the closest :py:class:`RoadLink` instance to (*x*, *y*),
@@ -1211,38 +1403,12 @@ class Network(object):
         If *n* > 1: returns a list of 3-tuples as described above, sorted by the *distance*
         values.
         
-        Uses *quick_dist* (if passed) to skip skip distance calcs and ignore anything
-        greater than *quick_dist* difference in either coordinate.
+        Uses *quick_dist* (if passed) to ignore road links further than *quick_dist* away.
         Returns (None, None, None) if none found and *n* = 1, or an empty list for *n* > 1
                 
         *x*,*y* and *quick_dist* are  in :py:attr:`Node.COORDINATE_UNITS`
         """
-        min_dist            = sys.float_info.max
-        return_tuples       = []
-        
-        for roadlink in self.iterRoadLinks():
-            # quickly rule out if a quick_dist is specified
-            if quick_dist:
-                # real dist threshhold - it could be a long link and the (x,y) is in the center
-                dthres = max(quick_dist, 1.25*roadlink.getLengthInCoordinateUnits())
-                     
-                if x + dthres < min(roadlink.getStartNode().getX(), roadlink.getEndNode().getX()): continue
-                if x - dthres > max(roadlink.getStartNode().getX(), roadlink.getEndNode().getX()): continue
-                if y + dthres < min(roadlink.getStartNode().getY(), roadlink.getEndNode().getY()): continue
-                if y - dthres > max(roadlink.getStartNode().getY(), roadlink.getEndNode().getY()): continue
-
-            (dist, t) = roadlink.getDistanceFromPoint(x,y)
-            if dist < min_dist:
-                return_tuples.append( (roadlink, dist, t))
-                
-                # sort
-                return_tuples = sorted(return_tuples, key=operator.itemgetter(1))
-                
-                # kick out extras
-                if len(return_tuples) > n:
-                    return_tuples.pop()
-                    
-                min_dist            = return_tuples[-1][1]
+        return_tuples = self.getSpatialIndex().findNearestRoadLinks(x, y, n=n, maxDist=quick_dist)
         
         if n==1:
             if len(return_tuples) == 0: 
@@ -1250,6 +1416,112 @@ class Network(object):
             return return_tuples[0]
 
         return return_tuples
+
+    def findRoadLinksWithinRadius(self, x, y, radius):
+        """
+        Returns a list of (*roadlink*, *distance*, *t*) tuples as described in :py:meth:`Network.findNRoadLinksNearestCoords`
+        for all the :py:class:`RoadLink` instances within *radius* of (*x*, *y*), sorted by distance.
+        The distances are measured to the center line of the road links, including shape points.
+        
+        *x*,*y* and *radius* are  in :py:attr:`Node.COORDINATE_UNITS`
+        """
+        return self.getSpatialIndex().findRoadLinksWithinRadius(x, y, radius)
+
+    def snapPointsToRoadLinks(self, xs, ys, k=1, maxDist=None, linkFilter=None):
+        """
+        Finds the *k* closest :py:class:`RoadLink` instances to each of the points (*xs* [i], *ys* [i]) at once,
+        measuring the distances to the center lines of the road links (shape points included) like
+        :py:meth:`RoadLink.getDistanceFromPoint`, with NumPy over all the segments of all the center lines.
+
+        Returns the tuple of (number of points x *k*) arrays (*roadlinks*, *distances*, *ts*), sorted by distance
+        for each point, where *roadlinks* is an object array of :py:class:`RoadLink` instances and *distances*
+        and *ts* are as in :py:meth:`Network.findNRoadLinksNearestCoords`.  If there are fewer than *k* road links
+        (within *maxDist*, if passed) for a point, the rest of its row has None road links and NaN distances and ts.
+
+        *linkFilter*, if passed, is a function of a road link that returns False for road links to exclude.
+
+        *xs*, *ys* and *maxDist* are in :py:attr:`Node.COORDINATE_UNITS`
+        """
+        xs = np.asarray(xs, dtype=np.float64).ravel()
+        ys = np.asarray(ys, dtype=np.float64).ravel()
+        if len(xs) != len(ys):
+            raise DtaError("Network.snapPointsToRoadLinks: got %d x coordinates and %d y coordinates" % (len(xs), len(ys)))
+
+        roadlinks   = [roadlink for roadlink in self.iterRoadLinks() if not linkFilter or linkFilter(roadlink)]
+        numPoints   = len(xs)
+        numLinks    = len(roadlinks)
+
+        resultLinks = np.empty((numPoints, k), dtype=object)
+        resultDists = np.empty((numPoints, k), dtype=np.float64)
+        resultTs    = np.empty((numPoints, k), dtype=np.float64)
+        resultDists.fill(np.nan)
+        resultTs.fill(np.nan)
+        if numPoints == 0 or numLinks == 0 or k < 1:
+            return resultLinks, resultDists, resultTs
+
+        # the segments of the center lines; the segments of road link i are offsets[i] to offsets[i+1]-1
+        geometry    = self.getLinkGeometry()
+        startXs, startYs, endXs, endYs, offsets = geometry.getCenterLineSegments(geometry.getLinkIndices(roadlinks))
+        dxs         = endXs - startXs
+        dys         = endYs - startYs
+        lengthsSq   = dxs * dxs + dys * dys
+        lengths     = np.sqrt(lengthsSq)
+        lengthsSq[lengthsSq == 0] = 1.0
+        numSegments = len(startXs)
+
+        # the distance along the center line to the start of each segment, and the length of each center line
+        linkIndices     = np.repeat(np.arange(numLinks), np.diff(offsets))
+        cumLengths      = np.cumsum(lengths) - lengths
+        distsBefore     = cumLengths - cumLengths[offsets[linkIndices]]
+        totalLengths    = np.add.reduceat(lengths, offsets[:-1])
+        totalLengths[totalLengths == 0] = 1.0
+
+        # the segments of each road link, padded to the largest number of segments
+        maxSegments     = int(np.diff(offsets).max())
+        linkSegments    = offsets[:-1, np.newaxis] + np.arange(maxSegments)[np.newaxis, :]
+        linkSegmentsOk  = linkSegments < offsets[1:, np.newaxis]
+        linkSegments    = np.minimum(linkSegments, numSegments - 1)
+
+        linkArray       = np.empty(numLinks, dtype=object)
+        linkArray[:]    = roadlinks
+        numBest         = min(k, numLinks)
+        maxDistSq       = None if maxDist is None else maxDist * maxDist
+        # bound the size of the (points x segments) arrays
+        chunkSize       = max(1, (1 << 21) / numSegments)
+        for first in xrange(0, numPoints, chunkSize):
+            pointXs = xs[first:first + chunkSize, np.newaxis]
+            pointYs = ys[first:first + chunkSize, np.newaxis]
+            rows    = np.arange(len(pointXs))[:, np.newaxis]
+
+            # project the points on all the segments, parameterized as start + t(end - start)
+            ts      = ((pointXs - startXs) * dxs + (pointYs - startYs) * dys) / lengthsSq
+            clipped = np.clip(ts, 0.0, 1.0)
+            distsSq = (startXs + clipped * dxs - pointXs) ** 2 + (startYs + clipped * dys - pointYs) ** 2
+
+            linkDistsSq = np.minimum.reduceat(distsSq, offsets[:-1], axis=1)
+            if maxDistSq is not None:
+                linkDistsSq[linkDistsSq > maxDistSq] = np.inf
+
+            if numBest < numLinks:
+                best = np.argpartition(linkDistsSq, numBest - 1, axis=1)[:, :numBest]
+            else:
+                best = np.tile(np.arange(numLinks), (len(pointXs), 1))
+            best        = best[rows, np.argsort(linkDistsSq[rows, best], axis=1, kind="mergesort")]
+            bestDistsSq = linkDistsSq[rows, best]
+
+            # the closest segment of each of the best road links (the first one, for ties)
+            segments    = linkSegments[best]
+            segDistsSq  = np.where(linkSegmentsOk[best], distsSq[rows[:, :, np.newaxis], segments], np.inf)
+            closest     = segments[rows, np.arange(numBest)[np.newaxis, :], np.argmin(segDistsSq, axis=2)]
+            alongs      = distsBefore[closest] + ts[rows, closest] * lengths[closest]
+
+            found = np.isfinite(bestDistsSq)
+            chunk = slice(first, first + len(pointXs))
+            resultLinks[chunk, :numBest] = np.where(found, linkArray[best], None)
+            resultDists[chunk, :numBest] = np.where(found, np.sqrt(bestDistsSq), np.nan)
+            resultTs[chunk, :numBest]    = np.where(found, np.clip(alongs / totalLengths[best], 0.0, 1.0), np.nan)
+
+        return resultLinks, resultDists, resultTs
                             
     def findLinksForRoadLabels(self, on_street_label, on_direction,
                                        from_street_label, to_street_label,
@@ -1543,6 +1815,9 @@ class Network(object):
         del self._linksById[linkToRemove.getId()]
         del self._linksByNodeIdPair[linkToRemove.getStartNode().getId(),
                                 linkToRemove.getEndNode().getId()]
+
+        if self._spatialIndex: self._spatialIndex.removeLink(linkToRemove)
+        self._linkGeometry = None
         #TODO: do you want to update the maxIds?
 
     def removeNode(self, nodeToRemove):
@@ -1560,6 +1835,8 @@ class Network(object):
             self.removeLink(link) 
         
         del self._nodes[nodeToRemove.getId()] 
+
+        if self._spatialIndex: self._spatialIndex.removeNode(nodeToRemove)
         
         #TODO: do you want to update the maxIds? 
 
@@ -1591,6 +1868,7 @@ class Network(object):
         newLink1._lanePermissions = copy.copy(linkToSplit._lanePermissions)
         newLink1.setTollLink(linkToSplit.getTollLink())
         newLink1._shapePoints = linkToSplit._shapePoints[:shapelen1]
+        newLink1._geometryChanged()
         self.addLink(newLink1)
 
         newLink2 = RoadLink(self._maxLinkId + 1,
@@ -1612,6 +1890,7 @@ class Network(object):
         shapelen2 = len(linkToSplit._shapePoints) - shapelen1
         if shapelen2 > 0:
             newLink2._shapePoints = linkToSplit._shapePoints[-shapelen2:]
+            newLink2._geometryChanged()
         self.addLink(newLink2) 
 
         for inMov in linkToSplit.iterIncomingMovements():
@@ -2030,58 +2309,151 @@ class Network(object):
 
             DtaLogger.info("Moved virtual node %8d associated with connector %8d to avoid overlapping links" % (virtualNode.getId(), link.getId()))
 
+    def findOverlappingLinks(self, nodes=None):
+        """
+        Finds the pairs of incoming links and the pairs of outgoing links of each node (of *nodes*, if passed)
+        that overlap, like :py:meth:`RoadLink.isOverlapping` with *usingShapepoints*: the orientations of their sections
+        touching the node are at most :py:attr:`RoadLink.OVERLAPPING_MAX_ANGLE` apart.
+
+        The orientations come from the :py:class:`LinkGeometry` of the network, and the overlapping pairs are found
+        in one pass over the link ends sorted by node and orientation, as only the link ends within the maximum
+        angle of each other in that order can overlap, rather than by comparing all the pairs of links of every node.
+
+        Returns the report table as a list of (*node*, *incoming*, *link1*, *link2*, *angle*) tuples sorted by node id,
+        incoming pairs first, then by link ids, where *incoming* is True for a pair of incoming links, the id of *link1*
+        is lower than the id of *link2*, and *angle* is ``link1.getAngle(link2, usingShapepoints=True)``.
+        """
+        geometry    = self.getLinkGeometry()
+        numLinks    = geometry.getNumLinks()
+        maxAngle    = RoadLink.OVERLAPPING_MAX_ANGLE
+        startIds    = np.array([roadlink.getStartNode().getId() for roadlink in geometry.roadlinks], dtype=np.int64)
+        endIds      = np.array([roadlink.getEndNode().getId() for roadlink in geometry.roadlinks], dtype=np.int64)
+
+        # the link ends: the incoming links at their end nodes and the outgoing links at their start nodes
+        nodeIds     = np.concatenate([endIds, startIds])
+        incoming    = np.concatenate([np.ones(numLinks, dtype=np.bool_), np.zeros(numLinks, dtype=np.bool_)])
+        bearings    = np.concatenate([geometry.orientationsAtEnd, geometry.orientationsAtStart])
+        linkIndices = np.concatenate([np.arange(numLinks), np.arange(numLinks)])
+        if nodes is not None:
+            selected    = np.in1d(nodeIds, [node.getId() for node in nodes])
+            nodeIds, incoming, bearings, linkIndices = \
+                nodeIds[selected], incoming[selected], bearings[selected], linkIndices[selected]
+
+        # the ends just East of North again past 360 degrees, so they follow the ends just West of North
+        wrapped     = bearings <= maxAngle
+        copies      = np.concatenate([np.zeros(len(bearings), dtype=np.bool_), np.ones(wrapped.sum(), dtype=np.bool_)])
+        nodeIds     = np.concatenate([nodeIds, nodeIds[wrapped]])
+        incoming    = np.concatenate([incoming, incoming[wrapped]])
+        sortKeys    = np.concatenate([bearings, bearings[wrapped] + 360.0])
+        linkIndices = np.concatenate([linkIndices, linkIndices[wrapped]])
+
+        order       = np.lexsort((sortKeys, incoming, nodeIds))
+        nodeIds, incoming, sortKeys, linkIndices, copies = \
+            nodeIds[order], incoming[order], sortKeys[order], linkIndices[order], copies[order]
+
+        # compare each end with the next ones of the same node and direction, as long as any of them are close enough
+        firstLinks, secondLinks, pairIncoming = [], [], []
+        lag = 1
+        while lag < len(sortKeys):
+            first   = np.arange(len(sortKeys) - lag)
+            second  = first + lag
+            close   = (nodeIds[first] == nodeIds[second]) & (incoming[first] == incoming[second]) & \
+                      (sortKeys[second] - sortKeys[first] <= maxAngle + 1e-9)
+            if not close.any(): break
+            close  &= ~(copies[first] & copies[second])
+            firstLinks.append(linkIndices[first[close]])
+            secondLinks.append(linkIndices[second[close]])
+            pairIncoming.append(incoming[first[close]])
+            lag += 1
+
+        if not firstLinks: return []
+        firstLinks      = np.concatenate(firstLinks)
+        secondLinks     = np.concatenate(secondLinks)
+        pairIncoming    = np.concatenate(pairIncoming)
+
+        # link1 is the one with the lower id
+        linkIds         = np.array([roadlink.getId() for roadlink in geometry.roadlinks], dtype=np.int64)
+        swap            = linkIds[firstLinks] > linkIds[secondLinks]
+        firstLinks, secondLinks = np.where(swap, secondLinks, firstLinks), np.where(swap, firstLinks, secondLinks)
+
+        # the angles as in RoadLink.getAngle(), from the orientations at the node
+        angles  = np.where(pairIncoming, geometry.orientationsAtEnd[secondLinks] - geometry.orientationsAtEnd[firstLinks],
+                                         geometry.orientationsAtStart[secondLinks] - geometry.orientationsAtStart[firstLinks])
+        angles  = np.where(angles > 180, angles - 360.0, np.where(angles <= -180, angles + 360.0, angles))
+        overlap = np.fabs(angles) <= maxAngle
+        firstLinks, secondLinks, pairIncoming, angles = \
+            firstLinks[overlap], secondLinks[overlap], pairIncoming[overlap], angles[overlap]
+
+        pairNodeIds = np.where(pairIncoming, endIds[firstLinks], startIds[firstLinks])
+        order       = np.lexsort((linkIds[secondLinks], linkIds[firstLinks], ~pairIncoming, pairNodeIds))
+        return [(self._nodes[nodeId], isIncoming, geometry.roadlinks[link1], geometry.roadlinks[link2], angle)
+                for nodeId, isIncoming, link1, link2, angle in izip(pairNodeIds[order].tolist(), pairIncoming[order].tolist(),
+                                                                   firstLinks[order].tolist(), secondLinks[order].tolist(),
+                                                                   angles[order].tolist())]
+
     def handleOverlappingLinks(self, warn, moveVirtualNodeDist=None):
         """
-        For each node, checks if any incoming links overlap, and if any outgoing links overlap.
+        For each node, checks if any incoming links overlap, and if any outgoing links overlap,
+        using :py:meth:`Network.findOverlappingLinks`.
         
         If *moveVirtualNodeDist* is passed, if the overlapping links includes a c:py:class:`Connector`,
         the :py:class:`VirtualNode` instance will be moved +- *moveVirtualNodeDist* in each direction
         to see if that resolves the overlap.  If not, the node retains its original location.
+        Since moving a virtual node changes the connectors at other nodes too, the nodes of the connectors of
+        the moved virtual nodes are checked again afterwards.
         
         *moveVirtualNodeDist* is in :py:attr:`Node.COORDINATE_UNITS`
         
         (order attempted: (0,+dist), (+dist,0), (0,-dist), (-dist,0), 
                           (+dist,-dist), (+dist,+dist), (-dist,+dist), (-dist,-dist))
         
+        Returns the report table of the overlapping links found (see :py:meth:`Network.findOverlappingLinks`).
         """
-        
-        # going through the nodes in sequential order
-        nodeIds = sorted(self._nodes.keys())
-        for nodeId in nodeIds:
-            node = self._nodes[nodeId]
-            
-            # check incoming links
-            for link1 in node.iterIncomingLinks():
-                if link1.isVirtualLink(): continue
-                
-                for link2 in node.iterIncomingLinks():
-                    
-                    self._handleOverlappingLinkPair(node, link1, link2, warn, moveVirtualNodeDist, incoming=True)
+        report  = self.findOverlappingLinks()
+        pairs   = report
+        handled = set()
+        while pairs:
+            movedNodes = set()
+            for node, incoming, link1, link2, angle in pairs:
+                handled.add((node, incoming, link1, link2))
+
+                movedNode = self._handleOverlappingLinkPair(node, link1, link2, warn, moveVirtualNodeDist, incoming=incoming)
+                # the other way around, to try moving the virtual node of link2 first
+                if moveVirtualNodeDist and not movedNode:
+                    movedNode = self._handleOverlappingLinkPair(node, link2, link1, warn, moveVirtualNodeDist, incoming=incoming)
+                if movedNode: movedNodes.add(movedNode)
+
+            nodesToCheck = set(movedNodes)
+            for movedNode in movedNodes:
+                for link in movedNode.iterAdjacentLinks():
+                    nodesToCheck.add(link.getStartNode())
+                    nodesToCheck.add(link.getEndNode())
+
+            pairs = []
+            if nodesToCheck:
+                pairs = [row for row in self.findOverlappingLinks(nodesToCheck) if row[:4] not in handled]
+                report.extend(pairs)
+
+        DtaLogger.info("handleOverlappingLinks() found %d pairs of overlapping links" % len(report))
+        return report
 
-            # check outgoing links
-            for link1 in node.iterOutgoingLinks():
-                if link1.isVirtualLink(): continue
-                
-                for link2 in node.iterOutgoingLinks():
-                    
-                    self._handleOverlappingLinkPair(node, link1, link2, warn, moveVirtualNodeDist, incoming=False)                
-                    
     def _handleOverlappingLinkPair(self, node, link1, link2, warn, moveVirtualNodeDist, incoming=True):
         """
-        Helper method to avoid repeating code; handles a single pair of overlapping links
+        Helper method to avoid repeating code; handles a single pair of overlapping links.
+        Returns the :py:class:`VirtualNode` moved to fix the overlap, or None.
         """
         # virtual links are not a concern
-        if link2.isVirtualLink(): return
+        if link2.isVirtualLink(): return None
                     
         # they're the same
-        if link1 == link2: return
+        if link1 == link2: return None
 
         # not overlapping
         try:
-            if not link1.isOverlapping(link2, usingShapepoints=True): return
+            if not link1.isOverlapping(link2, usingShapepoints=True): return None
         except DtaError, e:
             # DtaLogger.warn("Couldn't determine link overlap: "+str(e))
-            return
+            return None
 
         warn_str = None
         if warn:
@@ -2089,6 +2461,7 @@ class Network(object):
                         (node.getId(), "incoming" if incoming else "outgoing", \
                          link1.getId(), link2.getId(), link1.getAngle(link2, True))
 
+        fixed = False
         if moveVirtualNodeDist:
             toMove = None
             if link1.getStartNode().isVirtualNode():
@@ -2114,8 +2487,7 @@ class Network(object):
                 
                 fixed = False
                 for try_loc in try_locs:
-                    toMove._x = try_loc[0]
-                    toMove._y = try_loc[1]
+                    toMove.setCoordinates(try_loc[0], try_loc[1])
                     
                     if not link1.isOverlapping(link2, usingShapepoints=True):
                         # fixed! stop here
@@ -2125,11 +2497,11 @@ class Network(object):
                     
                 # failed to fix
                 if not fixed:
-                    toMove._x = original_loc[0]
-                    toMove._y = original_loc[1]
+                    toMove.setCoordinates(original_loc[0], original_loc[1])
                     if warn_str: warn_str += "; failed to fix"
         
         if warn_str: DtaLogger.warn(warn_str)
+        return toMove if fixed else None
 
         
     def handleShortLinks(self, minLength, warn, setLength):
@@ -2460,10 +2832,12 @@ class Network(object):
                     # don't include the first and last, they're already there
                     link._shapePoints = shape.points[1:-1]
                     if direction == "reverse": link._shapePoints.reverse()
+                    link._geometryChanged()
                     shapepoints_added += len(shape.points)-2
                     
                     links_done[(startNodeId, endNodeId)] = True
 
+        self.invalidateSpatialIndex()
         DtaLogger.info("Read %d shape points for %d links from %s" % (shapepoints_added, links_found, linkShapefile))            
                 
     def removeShapePoints(self):
@@ -2698,6 +3072,7 @@ class Network(object):
         
             pLink._outgoingMovements = []
             pLink._incomingMovements = [] 
+            pLink._geometryChanged()
             
             if not self.hasLinkForNodeIdPair(pLink.getStartNodeId(), pLink.getEndNodeId()):
                 self.addLink(pLink) 
@@ -2725,6 +3100,7 @@ class Network(object):
 
             pLink._outgoingMovements = []
             pLink._incomingMovements = [] 
+            pLink._geometryChanged()
 
             if not self.hasLinkForNodeIdPair(pLink.getStartNodeId(), pLink.getEndNodeId()):                   
                 self.addLink(pLink)
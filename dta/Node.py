@@ -49,6 +49,11 @@ class Node(object):
                                        GEOMETRY_TYPE_VIRTUAL,
                                        GEOMETRY_TYPE_CENTROID]
 
+    # no per-instance __dict__, since networks have many nodes; subclasses declare their own attributes too.
+    # Algorithms keep their state (labels, predecessors, etc) in dictionaries keyed by node rather than on the nodes.
+    __slots__ = ("_id", "_x", "_y", "_geometryType", "_label", "_level", "_incomingLinks", "_outgoingLinks",
+                 "_spatialIndexRef")
+
     def __init__(self, id, x, y, geometryType, label=None, level=None):
         """
         Constructor.
@@ -81,6 +86,9 @@ class Node(object):
         
         # List of outgoing link objects, in clockwise order starting from <1,0>
         self._outgoingLinks = []
+
+        # weak reference to the :py:class:`SpatialIndex` holding this node, so it can follow setCoordinates()
+        self._spatialIndexRef = None
     
     @property
     def geometryType(self):
@@ -107,10 +115,11 @@ class Node(object):
         """
         return "Node of type %s, id=%s, x,y=(%f,%f)" % (self.__class__, self._id, self._x, self._y)
     
-    def _addIncomingLink(self, link):
+    def _addIncomingLink(self, link, deferSort=False):
         """
         Verify that the given link ends in this node, and adds it to the list of
-        incoming links.
+        incoming links.  If *deferSort*, the link is appended to the list, which
+        must be sorted with :py:meth:`Node._sortLinks` once all the links are added.
         """
         #if not isinstance(link, Link):
         #    raise DtaError("Node.addIncomingLink called with an invalid link: %s" % str(link))
@@ -118,6 +127,10 @@ class Node(object):
         if link.getEndNode() != self:
             raise DtaError("Node.addIncomingLink called for link that doesn't end here: %s" % str(link))
 
+        if deferSort:
+            self._incomingLinks.append(link)
+            return
+
         angle = link.getReferenceAngle()
         
         position = 0
@@ -135,10 +148,11 @@ class Node(object):
             raise DtaError("Node.removeIncomingLink called for link not in incoming links list: %s" % str(link))
         self._incomingLinks.remove(link)
     
-    def _addOutgoingLink(self, link):
+    def _addOutgoingLink(self, link, deferSort=False):
         """
         Verify that the given link starts with this node, and adds it to the list of
-        outgoing links.
+        outgoing links.  If *deferSort*, the link is appended to the list, which
+        must be sorted with :py:meth:`Node._sortLinks` once all the links are added.
         """
         #if not isinstance(link, Link):
         #    raise DtaError("Node.addOutgoingLink called with an invalid link: %s" % str(link))
@@ -146,6 +160,10 @@ class Node(object):
         if link.getStartNode() != self:
             raise DtaError("Node.addOutgoingLink called for link that doesn't start here: %s" % str(link))
 
+        if deferSort:
+            self._outgoingLinks.append(link)
+            return
+
         angle = link.getReferenceAngle()
         
         position = 0
@@ -163,6 +181,14 @@ class Node(object):
             raise DtaError("Node.removeOutgoingLink called for link not in outgoing links list: %s" % str(link))
         self._outgoingLinks.remove(link)
 
+    def _sortLinks(self):
+        """
+        Sorts the incoming and outgoing links by reference angle, computing the angle of each link once;
+        links with the same angle keep the order in which they were added, like when they're added one by one.
+        """
+        self._incomingLinks.sort(key=lambda link: link.getReferenceAngle())
+        self._outgoingLinks.sort(key=lambda link: link.getReferenceAngle())
+
     def iterIncomingLinks(self):
         """
         Returns iterator for the incoming links.
@@ -213,6 +239,18 @@ class Node(object):
         """
         return self._y
 
+    def setCoordinates(self, x, y):
+        """
+        Moves this node to (*x*, *y*), letting the adjacent links and the :py:class:`SpatialIndex`
+        holding this node know that their geometry changed.
+        """
+        self._x = x
+        self._y = y
+        for link in self.iterAdjacentLinks():
+            link._geometryChanged()
+        if self._spatialIndexRef and self._spatialIndexRef():
+            self._spatialIndexRef().nodeMoved(self)
+
     def getLabel(self):
         """
         Return the node label
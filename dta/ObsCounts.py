@@ -0,0 +1,165 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class ObsCounts(object):
+    """
+    Store of the observed counts of a set of :py:class:`RoadLink` or :py:class:`Movement` instances (the items),
+    as read from a count file: a dense (item x time bin) array of the counts in bins of *timeStepInMin* minutes from
+    *startTimeInMin*, with NaN for the missing counts.
+
+    Each bin has a count, and so does any coarser window that spans whole bins and is aligned to its own duration
+    (i.e. its start time is a multiple of its duration, like the 15-minute windows starting on the quarter hour):
+    its count is the sum of the counts of its bins, and is only available if none of them is missing.  The coarser
+    counts are derived on demand this way, from cumulative sums over the bins, rather than stored.
+
+    The store is attached to its items, whose :py:meth:`RoadLink.getObsCount` and :py:meth:`Movement.getObsCount`
+    then read it.  The counts set with their ``setObsCount`` methods take precedence, and the stores attached
+    last take precedence over the ones attached earlier.
+    """
+
+    def __init__(self, items, startTimeInMin, timeStepInMin, counts):
+        """
+        Constructor.  *counts* is the (item x time bin) array of the counts of the list of *items*,
+        with NaN for the missing counts.  Attaches itself to the items.
+        """
+        self.counts = np.array(counts, dtype=np.float64, ndmin=2)
+        if self.counts.shape[0] != len(items):
+            raise DtaError("ObsCounts: got %d rows of counts for %d items" % (self.counts.shape[0], len(items)))
+        if timeStepInMin <= 0:
+            raise DtaError("ObsCounts: the time step must be positive: %d" % timeStepInMin)
+
+        self._items             = list(items)
+        self.startTimeInMin     = startTimeInMin
+        self.timeStepInMin      = timeStepInMin
+
+        # cumulative sums of the counts and of the missing counts over the time bins; see _getCumulative()
+        self._cumulative        = None
+
+        for index, item in enumerate(self._items):
+            item._obsCountStores = item._obsCountStores + ((self, index),)
+
+    def getNumItems(self):
+        """
+        Returns the number of items in the store.
+        """
+        return len(self._items)
+
+    def getItem(self, index):
+        """
+        Returns the item at *index*.
+        """
+        return self._items[index]
+
+    def getNumTimeBins(self):
+        """
+        Returns the number of time bins.
+        """
+        return self.counts.shape[1]
+
+    def getEndTimeInMin(self):
+        """
+        Returns the end of the last time bin, in minutes.
+        """
+        return self.startTimeInMin + self.getNumTimeBins() * self.timeStepInMin
+
+    def countsChanged(self):
+        """
+        Drops the cumulative sums so that they are recomputed from the counts the next time they are needed.
+        """
+        self._cumulative = None
+
+    def _getCumulative(self):
+        """
+        Returns the (item x time bin + 1) cumulative sums (*counts*, *missing*) of the counts (the missing ones as zero)
+        and of the number of missing counts.
+        """
+        if self._cumulative is None:
+            missing = np.isnan(self.counts)
+            self._cumulative = []
+            for values in (np.where(missing, 0.0, self.counts), missing):
+                cumulative = np.zeros((self.counts.shape[0], self.counts.shape[1] + 1), dtype=np.float64)
+                np.cumsum(values, axis=1, dtype=np.float64, out=cumulative[:, 1:])
+                self._cumulative.append(cumulative)
+        return self._cumulative
+
+    def _getBins(self, startTimesInMin, durationInMin):
+        """
+        Returns the arrays (*firstBins*, *valid*) of the first time bins of the windows of *durationInMin* minutes
+        starting at *startTimesInMin*, where *valid* is False for the windows that are not made of whole bins of the store,
+        and for the windows spanning several bins that don't start at a multiple of *durationInMin*.
+        """
+        startTimesInMin = np.asarray(startTimesInMin, dtype=np.int64)
+        offsets     = startTimesInMin - self.startTimeInMin
+        numBins     = durationInMin / self.timeStepInMin
+        firstBins   = offsets / self.timeStepInMin
+        valid       = (offsets % self.timeStepInMin == 0) & (durationInMin % self.timeStepInMin == 0) & \
+                      (durationInMin > 0) & (firstBins >= 0) & (firstBins + numBins <= self.getNumTimeBins())
+        if numBins > 1:
+            # the coarser windows are aligned to their duration, so they don't overlap
+            valid   &= (startTimesInMin % durationInMin == 0)
+        return np.where(valid, firstBins, 0), valid
+
+    def getCountTable(self, indices, startTimesInMin, durationInMin):
+        """
+        Returns the (item x window) array of the counts of the items at *indices* for the windows of *durationInMin*
+        minutes starting at *startTimesInMin*, with NaN where a window has no count (see :py:meth:`ObsCounts._getBins`)
+        or has missing counts.
+        """
+        firstBins, valid = self._getBins(startTimesInMin, durationInMin)
+        lastBins    = firstBins + (durationInMin / self.timeStepInMin if durationInMin > 0 else 0)
+        lastBins    = np.where(valid, lastBins, 0)
+        indices     = np.asarray(indices, dtype=np.int64)[:, np.newaxis]
+
+        counts, missing = self._getCumulative()
+        table       = counts[indices, lastBins] - counts[indices, firstBins]
+        available   = valid & (missing[indices, lastBins] == missing[indices, firstBins])
+        return np.where(available, table, np.nan)
+
+    def getCount(self, index, startTimeInMin, endTimeInMin):
+        """
+        Returns the count of the item at *index* from *startTimeInMin* to *endTimeInMin*, or None if the window
+        has no count (see :py:meth:`ObsCounts._getBins`) or has missing counts.
+        """
+        count = self.getCountTable([index], [startTimeInMin], endTimeInMin - startTimeInMin)[0, 0]
+        if np.isnan(count):
+            return None
+        return int(count)
+
+    @classmethod
+    def getItemCountArray(cls, item, startTimesInMin, durationInMin):
+        """
+        Returns the array of the counts of *item* (a :py:class:`RoadLink` or a :py:class:`Movement`) for the windows
+        of *durationInMin* minutes starting at *startTimesInMin*, with NaN for the windows without a count: the counts
+        set for the item take precedence, then the stores attached to it, the last one first.
+        """
+        result = np.empty(len(startTimesInMin), dtype=np.float64)
+        result.fill(np.nan)
+        for obsCounts, index in item._obsCountStores:
+            table = obsCounts.getCountTable([index], startTimesInMin, durationInMin)[0]
+            result = np.where(np.isnan(table), result, table)
+        if not item._obsCount:
+            return result
+        for position, startTime in enumerate(startTimesInMin):
+            count = item._obsCount.get((startTime, startTime + durationInMin))
+            if count is not None:
+                result[position] = count
+        return result
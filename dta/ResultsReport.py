@@ -0,0 +1,242 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+from .Logger import DtaLogger
+from .Utils import Time
+
+class ResultsReport(object):
+    """
+    Reports of the simulated results of a network against its observed counts, for reporting intervals of
+    *reportingTimeStepInMin* minutes starting at every simulation time step.
+
+    The simulated volumes of all the movements for all the intervals are computed at once from the
+    :py:class:`SimResults` store of the network (see :py:meth:`SimResults.getOutVolumeTable`) and the
+    observed counts are gathered into (movement x interval) arrays, so the reports don't query the links and
+    movements once per interval.  The reports are written to CSV files in bulk.
+
+    As with :py:meth:`RoadLink.hasObsCount` and :py:meth:`Movement.hasObsCount`, a zero count is no count.
+    """
+
+    LINK_COUNTS_HEADER      = "LinkID,Label,FacilityType,FreeflowSpeed,NumLanes,StartTime,EndTime,CountVolume,ModelVolume\n"
+    MOVEMENT_COUNTS_HEADER  = "LinkID,OutoingLinkID,Label,OutgoingLinkLabel,FacilityType,FreeflowSpeed,NumLanes," \
+                              "StartNode,AtNode,EndNode,TurnType,StartTime,EndTime,CountVolume,ModelVolume\n"
+
+    def __init__(self, network, reportingTimeStepInMin):
+        """
+        Constructor.  *network* is a :py:class:`Network` with simulated results
+        (see :py:meth:`Network.initializeSimResults`).
+
+        The reporting intervals start at every simulation time step and end before the end of the simulation.
+        """
+        self._network       = network
+        self._simResults    = network.getSimResults()
+        if self._simResults is None:
+            raise DtaError("ResultsReport: the network has no simulated results")
+
+        simStartTimeInMin   = self._simResults.simStartTimeInMin
+        simEndTimeInMin     = self._simResults.simEndTimeInMin
+        simTimeStepInMin    = self._simResults.simTimeStepInMin
+        if reportingTimeStepInMin <= 0 or reportingTimeStepInMin % simTimeStepInMin != 0:
+            raise DtaError("ResultsReport: the reporting time step %d is not a multiple of the simulation time step %d" %
+                           (reportingTimeStepInMin, simTimeStepInMin))
+
+        self._reportingTimeStepInMin = reportingTimeStepInMin
+        self._startTimesInMin = [startTime for startTime in range(simStartTimeInMin, simEndTimeInMin - 1, simTimeStepInMin)
+                                 if startTime + reportingTimeStepInMin < simEndTimeInMin]
+        self._timeLabels = ["%s,%s" % (Time.fromMinutes(startTime), Time.fromMinutes(startTime + reportingTimeStepInMin))
+                            for startTime in self._startTimesInMin]
+
+    def getReportingTimeStepInMin(self):
+        """
+        Returns the length of the reporting intervals in minutes.
+        """
+        return self._reportingTimeStepInMin
+
+    def getIntervalStartTimes(self):
+        """
+        Returns the list of the start times of the reporting intervals, in minutes.
+        """
+        return list(self._startTimesInMin)
+
+    def getMovementVolumes(self, movements, startTimesInMin=None, durationInMin=None):
+        """
+        Returns the (movement x interval) array of the simulated outgoing volumes of the list of :py:class:`Movement`
+        instances *movements* for the reporting intervals, or for the intervals of *durationInMin* minutes starting
+        at *startTimesInMin* if they are passed.
+        """
+        if startTimesInMin is None:
+            startTimesInMin, durationInMin = self._startTimesInMin, self._reportingTimeStepInMin
+
+        inStore = [index for index, movement in enumerate(movements) if getattr(movement, "_simResults", None) is self._simResults]
+        volumes = np.zeros((len(movements), len(startTimesInMin)), dtype=np.float64)
+        if inStore:
+            volumes[inStore] = self._simResults.getOutVolumeTable(startTimesInMin, durationInMin,
+                np.array([movements[index]._simResultsIndex for index in inStore], dtype=np.int64))
+
+        # movements added to the network after the store was created
+        for index in set(range(len(movements))) - set(inStore):
+            volumes[index] = [movements[index].getSimOutVolume(startTime, startTime + durationInMin)
+                              for startTime in startTimesInMin]
+        return volumes
+
+    def getLinkVolumes(self, roadlinks, startTimesInMin=None, durationInMin=None):
+        """
+        Returns the (link x interval) array of the simulated outgoing volumes of the list of :py:class:`RoadLink`
+        instances *roadlinks*, i.e. the sums of the volumes of their outgoing movements, for the intervals
+        as in :py:meth:`ResultsReport.getMovementVolumes`.
+        """
+        if startTimesInMin is None:
+            startTimesInMin, durationInMin = self._startTimesInMin, self._reportingTimeStepInMin
+
+        movements   = []
+        linkIndices = []
+        for linkIndex, roadlink in enumerate(roadlinks):
+            for movement in roadlink.iterOutgoingMovements():
+                movements.append(movement)
+                linkIndices.append(linkIndex)
+
+        volumes = np.zeros((len(roadlinks), len(startTimesInMin)), dtype=np.float64)
+        if movements:
+            np.add.at(volumes, np.array(linkIndices, dtype=np.int64),
+                      self.getMovementVolumes(movements, startTimesInMin, durationInMin))
+
+        # links without movements keep their own volumes
+        for linkIndex, roadlink in enumerate(roadlinks):
+            if roadlink.getNumOutgoingMovements() == 0:
+                volumes[linkIndex] = [roadlink.getSimOutVolume(startTime, startTime + durationInMin)
+                                      for startTime in startTimesInMin]
+        return volumes
+
+    def _getObsCounts(self, items):
+        """
+        Returns the (item x interval) array of the observed counts of the links or movements in *items*,
+        with zeros for the intervals without counts.
+        """
+        counts = np.zeros((len(items), len(self._startTimesInMin)), dtype=np.float64)
+        for itemIndex, item in enumerate(items):
+            if not item.hasCountInfo(): continue
+            counts[itemIndex] = item.getObsCountArray(self._startTimesInMin, self._reportingTimeStepInMin)
+        counts[np.isnan(counts)] = 0
+        return counts
+
+    def getLinkCountsVsVolumes(self):
+        """
+        Returns the tuple (*roadlinks*, *counts*, *volumes*) for the :py:class:`RoadLink` instances with link
+        or movement counts, where *counts* and *volumes* are (link x interval) arrays of the observed counts and the
+        simulated volumes.  The count of a link for an interval is its link count or, if it has none, the sum of the
+        counts of its outgoing movements if they all have one; it is NaN otherwise.
+        """
+        roadlinks = [roadlink for roadlink in self._network.iterRoadLinks()
+                     if roadlink.hasCountInfo() or roadlink.hasMovementCountInfo()]
+
+        counts = self._getObsCounts(roadlinks)
+        for linkIndex, roadlink in enumerate(roadlinks):
+            movementCounts = self._getObsCounts(list(roadlink.iterOutgoingMovements()))
+            useMovements   = (counts[linkIndex] == 0) & np.all(movementCounts > 0, axis=0)
+            counts[linkIndex, useMovements] = movementCounts[:, useMovements].sum(axis=0)
+            counts[linkIndex, (counts[linkIndex] == 0) & ~useMovements] = np.nan
+
+        return roadlinks, counts, self.getLinkVolumes(roadlinks)
+
+    def getMovementCountsVsVolumes(self):
+        """
+        Returns the tuple (*movements*, *counts*, *volumes*) for the :py:class:`Movement` instances with counts,
+        where *counts* and *volumes* are (movement x interval) arrays of the observed counts (NaN for the intervals
+        without counts) and the simulated volumes.
+        """
+        movements = [movement for roadlink in self._network.iterRoadLinks()
+                     for movement in roadlink.iterOutgoingMovements() if movement.hasCountInfo()]
+        counts = self._getObsCounts(movements)
+        counts[counts == 0] = np.nan
+        return movements, counts, self.getMovementVolumes(movements)
+
+    def _writeRows(self, fileName, header, rowPrefixes, counts, volumes):
+        """
+        Writes the *header* and a line for each item and interval with a count to *fileName*:
+        the item's prefix in *rowPrefixes*, the interval's start and end time, the count and the volume.
+        """
+        items, intervals = np.nonzero(~np.isnan(counts))
+        lines = ["%s,%s,%d,%d\n" % (rowPrefixes[item], self._timeLabels[interval], count, volume)
+                 for item, interval, count, volume in zip(items.tolist(), intervals.tolist(),
+                                                         counts[items, intervals].tolist(), volumes[items, intervals].tolist())]
+        outputStream = open(fileName, "w")
+        outputStream.write(header)
+        outputStream.write("".join(lines))
+        outputStream.close()
+        return len(lines)
+
+    def writeLinkCountsVsVolumes(self, fileName):
+        """
+        Writes the link counts and simulated volumes of :py:meth:`ResultsReport.getLinkCountsVsVolumes` to the CSV file
+        *fileName*, one line per link and interval with a count.
+        """
+        roadlinks, counts, volumes = self.getLinkCountsVsVolumes()
+        rowPrefixes = ["%d,%s,%d,%d,%d" % (roadlink.getId(), roadlink.getLabel(), roadlink.getFacilityType(),
+                                           roadlink.getFreeFlowSpeedInMPH(), roadlink.getNumLanes())
+                       for roadlink in roadlinks]
+        numLines = self._writeRows(fileName, ResultsReport.LINK_COUNTS_HEADER, rowPrefixes, counts, volumes)
+        DtaLogger.info("Wrote %8d %-16s to %s" % (numLines, "LINK COUNTS", fileName))
+
+    def writeMovementCountsVsVolumes(self, fileName):
+        """
+        Writes the movement counts and simulated volumes of :py:meth:`ResultsReport.getMovementCountsVsVolumes` to the
+        CSV file *fileName*, one line per movement and interval with a count.
+        """
+        movements, counts, volumes = self.getMovementCountsVsVolumes()
+        rowPrefixes = []
+        for movement in movements:
+            incomingLink = movement.getIncomingLink()
+            outgoingLink = movement.getOutgoingLink()
+            rowPrefixes.append("%d,%d,%s,%s,%d,%d,%d,%d,%d,%d,%s" %
+                               (incomingLink.getId(), outgoingLink.getId(), incomingLink.getLabel(), outgoingLink.getLabel(),
+                                incomingLink.getFacilityType(), incomingLink.getFreeFlowSpeedInMPH(), incomingLink.getNumLanes(),
+                                movement.getStartNodeId(), movement.getAtNode().getId(), movement.getEndNodeId(),
+                                movement.getTurnType()))
+        numLines = self._writeRows(fileName, ResultsReport.MOVEMENT_COUNTS_HEADER, rowPrefixes, counts, volumes)
+        DtaLogger.info("Wrote %8d %-16s to %s" % (numLines, "MOVEMENT COUNTS", fileName))
+
+    def writeLinkVolumes(self, fileName, startTimeInMin, endTimeInMin, otherPeriods=[]):
+        """
+        Writes the simulated volume and mean travel time (see :py:meth:`RoadLink.getSimTTInMin`) of every
+        :py:class:`RoadLink` from *startTimeInMin* to *endTimeInMin* to the CSV file *fileName*, followed by
+        the volumes for the *otherPeriods*, a list of (*columnName*, *startTimeInMin*, *endTimeInMin*) tuples.
+        """
+        roadlinks = list(self._network.iterRoadLinks())
+        periods   = [("ModelVolume", startTimeInMin, endTimeInMin)] + list(otherPeriods)
+        volumes   = np.hstack([self.getLinkVolumes(roadlinks, [periodStart], periodEnd - periodStart)
+                               for (columnName, periodStart, periodEnd) in periods])
+
+        timeLabel = "%s,%s" % (Time.fromMinutes(startTimeInMin), Time.fromMinutes(endTimeInMin))
+        lines = []
+        for roadlink, linkVolumes in zip(roadlinks, volumes.tolist()):
+            lines.append("%d,%d,%d,%f,%s,%d,%d,%d,%s,%d,%f%s\n" %
+                         (roadlink.getStartNode().getId(), roadlink.getEndNode().getId(), roadlink.getId(),
+                          roadlink.getLength(), roadlink.getLabel(), roadlink.getFacilityType(),
+                          roadlink.getFreeFlowSpeedInMPH(), roadlink.getNumLanes(), timeLabel, linkVolumes[0],
+                          roadlink.getSimTTInMin(startTimeInMin, endTimeInMin),
+                          "".join([",%d" % volume for volume in linkVolumes[1:]])))
+
+        outputStream = open(fileName, "w")
+        outputStream.write("ANode,BNode,LinkID,LengthInMiles,Label,FacilityType,FreeflowSpeed,NumLanes,StartTime,EndTime,"
+                           "ModelVolume,TravelTime%s\n" % "".join(["," + columnName for (columnName, periodStart, periodEnd) in otherPeriods]))
+        outputStream.write("".join(lines))
+        outputStream.close()
+        DtaLogger.info("Wrote %8d %-16s to %s" % (len(lines), "LINK VOLUMES", fileName))
@@ -19,13 +19,13 @@ import copy
 import pdb 
 import math
 import sys
-from collections import defaultdict 
 
 from .DtaError import DtaError
 from .Link import Link
 from .Logger import DtaLogger
 from .Movement import Movement
 from .Node import Node
+from .ObsCounts import ObsCounts
 from .VehicleClassGroup import VehicleClassGroup
 from .Utils import polylinesCross, lineSegmentsCross
 from .Algorithms import pairwise
@@ -43,6 +43,8 @@ class RoadLink(Link):
     DEFAULT_LEVEL = 0
     #: default lane width in :py:attr:`Node.COORDINATE_UNITS`
     DEFAULT_LANE_WIDTH = 12
+    #: largest angle in degrees between links that overlap; see :py:meth:`RoadLink.isOverlapping`
+    OVERLAPPING_MAX_ANGLE = 0.86
 
     #: Eastbound return value for :py:meth:`RoadLink.getDirection`
     DIR_EB = "EB"
@@ -53,6 +55,12 @@ class RoadLink(Link):
     #: Southbound return value for :py:meth:`RoadLink.getDirection`
     DIR_SB = "SB"
 
+    __slots__ = ("_reverseAttachedLinkId", "_facilityType", "_freeflowSpeed", "_effectiveLengthFactor",
+                 "_responseTimeFactor", "_group", "_numLanes", "_roundAbout", "_level", "_length",
+                 "_lanePermissions", "_outgoingMovements", "_incomingMovements", "_startShift", "_endShift",
+                 "_shapePoints", "_simOutVolume", "_simMeanTT", "_obsCount", "_obsCountStores", "_tollLink",
+                 "simTimeStepInMin", "simStartTimeInMin", "simEndTimeInMin")
+
     
     def __init__(self, id, startNode, endNode, reverseAttachedLinkId, facilityType, length,
                  freeflowSpeed, effectiveLengthFactor, responseTimeFactor, numLanes, 
@@ -115,9 +123,11 @@ class RoadLink(Link):
         self._endShift                  = None
         self._shapePoints               = []  # sequenceNum -> (x,y)
 
-        self._simOutVolume = defaultdict(int)
-        self._simMeanTT = defaultdict(float)
-        self._obsCount = {}
+        # the simulated results and the observed counts are only created when set, since most links have none
+        self._simOutVolume = None   # (startTimeInMin, endTimeInMin) -> volume
+        self._simMeanTT = None      # (startTimeInMin, endTimeInMin) -> mean travel time
+        self._obsCount = None       # (startTimeInMin, endTimeInMin) -> count
+        self._obsCountStores = ()   # (ObsCounts, index) tuples with the counts read from files
         self._tollLink = 0
     
     def __repr__(self):
@@ -186,9 +196,10 @@ class RoadLink(Link):
                         for mov in self.iterOutgoingMovements()])
         else:
             result = 0
+            if not self._simOutVolume: return result
             for stTime, enTime in pairwise(range(startTimeInMin, endTimeInMin + 1, 
                                                  self.simTimeStepInMin)):
-                result += self._simOutVolume[stTime, enTime]
+                result += self._simOutVolume.get((stTime, enTime), 0)
             return result
 
     def getSimInFlow(self, startTimeInMin, endTimeInMin):
@@ -239,7 +250,7 @@ class RoadLink(Link):
             for (stTime, enTime), flow in self._simOutVolume.iteritems():
                 if stTime >= startTimeInMin and enTime <= endTimeInMin:
 
-                    binTT = self._simMeanTT[(stTime, enTime)]
+                    binTT = self._simMeanTT.get((stTime, enTime), 0.0)
 
                     if flow == 0 and binTT == 0:
                         continue
@@ -304,6 +315,8 @@ class RoadLink(Link):
             for emanatingMovement in self.iterOutgoingMovements():
                 emanatingMovement.setSimVolume(startTimeInMin, endTimeInMin, volume)
         else:
+            if self._simOutVolume is None:
+                self._simOutVolume = {}
             self._simOutVolume[startTimeInMin, endTimeInMin] = volume
         
     def setSimTTInMin(self, startTimeInMin, endTimeInMin, averageTTInMin):
@@ -338,6 +351,8 @@ class RoadLink(Link):
             if self.getSimVolume(startTimeInMin, endTimeInMin) == 0:
                 raise DtaError('Cannot set the travel time on edge %s because it has zero flow' % self.iid_)
 
+            if self._simMeanTT is None:
+                self._simMeanTT = {}
             self._simMeanTT[startTimeInMin, endTimeInMin] = averageTTInMin
                         
     def addLanePermission(self, laneId, vehicleClassGroup):
@@ -398,6 +413,7 @@ class RoadLink(Link):
         if addShapepoints and len(self._shapePoints) < 2:
             self._shapePoints.append(self.coordinatesAlongLink(fromStart=True, distance=self.euclideanLength()*0.33, goPastEnd=False))
             self._shapePoints.append(self.coordinatesAlongLink(fromStart=True, distance=self.euclideanLength()*0.66, goPastEnd=False))
+        self._geometryChanged()
 
     def getNumOutgoingMovements(self):
         """
@@ -419,6 +435,7 @@ class RoadLink(Link):
         such as showing curvature.
         """
         self._shapePoints.append((x,y))
+        self._geometryChanged()
 
     def getNumShapePoints(self):
         """
@@ -529,6 +546,7 @@ class RoadLink(Link):
 
         self._outgoingMovements.append(movement)
         movement.getOutgoingLink()._incomingMovements.append(movement)
+        movement._movementsChanged()
     
     def iterOutgoingMovements(self):
         """
@@ -586,6 +604,7 @@ class RoadLink(Link):
         #movementToRemove.setProhibited()
         self._outgoingMovements.remove(movementToRemove)
         movementToRemove.getOutgoingLink()._incomingMovements.remove(movementToRemove)
+        movementToRemove._movementsChanged()
 
     def iterIncomingMovements(self):
         """
@@ -615,6 +634,8 @@ class RoadLink(Link):
         """
         if not includeShape or self.getNumShapePoints() == 0:
             return Link.euclideanLength(self)
+        if "shapeLength" in self._geometryCache:
+            return self._geometryCache["shapeLength"]
         
         points = [[self._startNode.getX(),self._startNode.getY()]]
         points.extend(self._shapePoints)
@@ -626,6 +647,7 @@ class RoadLink(Link):
             pointB = points[point_idx+1]
             distance += math.sqrt( (pointA[0]-pointB[0])*(pointA[0]-pointB[0]) + 
                                    (pointA[1]-pointB[1])*(pointA[1]-pointB[1]))
+        self._geometryCache["shapeLength"] = distance
         return distance
     
     def euclideanLengthInLengthUnits(self, includeShape=False):
@@ -691,8 +713,34 @@ class RoadLink(Link):
         
         If neither is True, then shapepoints are included iff *wholeLineShapePoints* (and a list is
         returned rather than a tuple of two points). 
+
+        The center lines are computed once and kept until the geometry of the link changes.
+        """
+        if not atStart and not atEnd and wholeLineShapePoints:
+            return copy.deepcopy(self._getCenterLinePoints())
+
+        key = ("centerline", atStart, atEnd)
+        if key not in self._geometryCache:
+            self._geometryCache[key] = self._computeCenterLine(atStart, atEnd)
+        return self._geometryCache[key]
+
+    def _getCenterLinePoints(self):
+        """
+        Returns the cached list of the points of the center line, shape points included; see :py:meth:`RoadLink.getCenterLine`.
+        It must not be modified.
         """
+        if "centerlinePoints" not in self._geometryCache:
+            centerline = self.getCenterLine()
+            centerline_with_shape = copy.deepcopy(self._shapePoints)
+            centerline_with_shape.insert(0, centerline[0])
+            centerline_with_shape.append(centerline[1])
+            self._geometryCache["centerlinePoints"] = centerline_with_shape
+        return self._geometryCache["centerlinePoints"]
 
+    def _computeCenterLine(self, atStart, atEnd):
+        """
+        Computes the center line of the link; see :py:meth:`RoadLink.getCenterLine`.
+        """
         start_point = [ self._startNode.getX(), self._startNode.getY() ]
         end_point   = [ self._endNode.getX()  , self._endNode.getY()   ]
         
@@ -722,14 +770,6 @@ class RoadLink(Link):
 
         centerline = ((start_point[0] + dy*(start_shift/length), start_point[1] - dx*(start_shift/length)),
                       (end_point[0]   + dy*(end_shift  /length), end_point[1]   - dx*(end_shift  /length)))
-        
-        if not atStart and not atEnd:
-            if wholeLineShapePoints:
-                centerline_with_shape = copy.deepcopy(self._shapePoints)
-                centerline_with_shape.insert(0, centerline[0])
-                centerline_with_shape.append(centerline[1])
-                return centerline_with_shape
-            
         return centerline
 
     def getDistanceFromPoint(self, x, y):
@@ -740,7 +780,7 @@ class RoadLink(Link):
                 
         *x*,*y* are in :py:attr:`Node.COORDINATE_UNITS`
         """
-        centerline = self.getCenterLine(wholeLineShapePoints = True)
+        centerline = self._getCenterLinePoints()
        
         # do it for real
         min_dist_sq = sys.float_info.max
@@ -860,6 +900,28 @@ class RoadLink(Link):
         Sets the number of lanes to the given value
         """ 
         self._numLanes = numLanes 
+        self._geometryChanged()
+
+    def _geometryChanged(self):
+        """
+        Drops the geometry cached by the link, and by its incoming and outgoing movements since their
+        center lines, turn types and directions depend on the geometry of the link.
+        """
+        Link._geometryChanged(self)
+        for movement in self._incomingMovements:
+            movement._geometryChanged()
+        for movement in self._outgoingMovements:
+            movement._geometryChanged()
+
+    def _labelChanged(self):
+        """
+        Drops the turn types and directions cached by the incoming and outgoing movements, since they
+        depend on the label of the link (see :py:meth:`Movement.isUTurn`).
+        """
+        for movement in self._incomingMovements:
+            movement._labelChanged()
+        for movement in self._outgoingMovements:
+            movement._labelChanged()
     
     def getAngle(self, other, usingShapepoints=False):
         """
@@ -908,7 +970,7 @@ class RoadLink(Link):
         See :py:meth:`RoadLink.getAngle()` for explanation of *usingShapePoints*.
         """
         # oriented the same way -- small angle
-        if abs(self.getAngle(other, usingShapepoints)) <= 0.86:
+        if abs(self.getAngle(other, usingShapepoints)) <= RoadLink.OVERLAPPING_MAX_ANGLE:
             return True
 
         return False
@@ -923,6 +985,17 @@ class RoadLink(Link):
         If there are shape points, and *atEnd* is True, then the orientation
         is evaluated at the end point of the link, otherwise it's evaluated at
         the start of the link.
+
+        The orientations are computed once and kept until the geometry of the link changes.
+        """
+        key = ("orientation", atEnd, usingShapepoints)
+        if key not in self._geometryCache:
+            self._geometryCache[key] = self._computeOrientation(atEnd, usingShapepoints)
+        return self._geometryCache[key]
+
+    def _computeOrientation(self, atEnd, usingShapepoints):
+        """
+        Computes the orientation of the link; see :py:meth:`RoadLink.getOrientation`.
         """
         if self._shapePoints and usingShapepoints:
             if atEnd:
@@ -1089,20 +1162,33 @@ class RoadLink(Link):
         if count < 0:
             raise DtaError('Count for time period from %d to %d cannot be '
                                    'negative' % (startTimeInMin, endTimeInMin))
+        if self._obsCount is None:
+            self._obsCount = {}
         self._obsCount[startTimeInMin, endTimeInMin] = count
 
     def getObsCount(self, startTimeInMin, endTimeInMin):
         """Return the number of vehicles traversing the
-        link in the input time window. 
+        link in the input time window, or None if there is no count for it.
+        The counts set with :py:meth:`setObsCount` take precedence over the ones read from count files
+        (see :py:class:`ObsCounts`), which are summed over their time bins for coarser time windows.
         """
 
         self._validateInputTimes(startTimeInMin, endTimeInMin)
         self._checkOutputTimeStep(startTimeInMin, endTimeInMin)
 
-        try:
-            return self._obsCount[startTimeInMin, endTimeInMin]            
-        except KeyError:
-            return None
+        if self._obsCount and (startTimeInMin, endTimeInMin) in self._obsCount:
+            return self._obsCount[startTimeInMin, endTimeInMin]
+        for obsCounts, index in reversed(self._obsCountStores):
+            count = obsCounts.getCount(index, startTimeInMin, endTimeInMin)
+            if count is not None:
+                return count
+        return None
+
+    def getObsCountArray(self, startTimesInMin, durationInMin):
+        """Return the array of the number of vehicles traversing the link in the time windows of
+        *durationInMin* minutes starting at *startTimesInMin*, with NaN for the windows without a count.
+        """
+        return ObsCounts.getItemCountArray(self, startTimesInMin, durationInMin)
 
     def getSumOfAllMovementCounts(self, startTimeInMin, endTimeInMin):
         """Return the sum of all outgoing movement counts"""
@@ -1116,7 +1202,7 @@ class RoadLink(Link):
     
     def hasCountInfo(self):
         """Return True if the link contains count information else false"""
-        return True if len(self._obsCount) else False
+        return True if self._obsCount or self._obsCountStores else False
         
     def hasMovementCountInfo(self):
         """Return True if any outgoing movement on the link
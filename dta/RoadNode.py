@@ -18,6 +18,8 @@ __license__     = """
 import pdb
 
 import math
+import numpy as np
+
 from .DtaError import DtaError
 from .Logger import DtaLogger
 from .Node import Node
@@ -74,6 +76,8 @@ class RoadNode(Node):
                                        PRIORITY_TEMPLATE_ROUNDABOUT,
                                        PRIORITY_TEMPLATE_MERGE,
                                        PRIORITY_TEMPLATE_SIGNALIZED]
+
+    __slots__ = ("_control", "_priority", "_timePlans", "_conflictMatrix")
         
     def __init__(self, id, x, y, geometryType, control, priority, label=None, level=None):
         """
@@ -108,8 +112,11 @@ class RoadNode(Node):
         self._control    = control
         self._priority   = priority
         
-        # indexed by the :py:class:`PlanCollectionInfo`
-        self._timePlans = {}
+        # indexed by the :py:class:`PlanCollectionInfo`; created with the first time plan
+        self._timePlans = None
+
+        # (movements, movement -> index, conflicts) computed by getConflictMatrix()
+        self._conflictMatrix = None
 
     def isRoadNode(self):
         """
@@ -128,6 +135,42 @@ class RoadNode(Node):
         Return True if this Node is a VirtualNode
         """
         return False
+
+    def _movementsChanged(self):
+        """
+        Drops the conflict matrix; called when movements are added or removed, or when their geometry changes.
+        """
+        self._conflictMatrix = None
+
+    def getConflictMatrix(self):
+        """
+        Returns the tuple (*movements*, *conflicts*) where *movements* is the list of the :py:class:`Movement`
+        instances of the node and *conflicts* is a square boolean NumPy array such that ``conflicts[i, j]`` is
+        True iff ``movements[i]`` conflicts with ``movements[j]``.
+
+        The matrix is computed once from the center lines of the movements and kept until the movements
+        of the node or the geometry of its links change.
+        """
+        if self._conflictMatrix is None:
+            movements   = list(self.iterMovements())
+            conflicts   = np.zeros((len(movements), len(movements)), dtype=np.bool_)
+            for i, mov1 in enumerate(movements):
+                for j, mov2 in enumerate(movements):
+                    if i == j: continue
+                    conflicts[i, j] = mov1._computeConflict(mov2)
+            self._conflictMatrix = (movements, dict((mov, i) for i, mov in enumerate(movements)), conflicts)
+        return self._conflictMatrix[0], self._conflictMatrix[2]
+
+    def hasConflict(self, movement1, movement2):
+        """
+        Return True if the :py:class:`Movement` instances *movement1* and *movement2* of this node are in conflict,
+        looking them up in the conflict matrix (see :py:meth:`RoadNode.getConflictMatrix`).
+        """
+        self.getConflictMatrix()
+        movementIndex, conflicts = self._conflictMatrix[1:]
+        if movement1 not in movementIndex or movement2 not in movementIndex:
+            return movement1._computeConflict(movement2)
+        return bool(conflicts[movementIndex[movement1], movementIndex[movement2]])
     
     def getCandidateLinksForSplitting(self, connector, disallowConnectorEvalStr):
         """
@@ -278,6 +321,8 @@ class RoadNode(Node):
             if raiseValidateError:
                 raise e
                         
+        if self._timePlans is None:
+            self._timePlans = {}
         self._timePlans[timePlan.getPlanInfo()] = timePlan
         self._control = RoadNode.CONTROL_TYPE_SIGNALIZED
         self._priority = RoadNode.PRIORITY_TEMPLATE_SIGNALIZED
@@ -288,24 +333,25 @@ class RoadNode(Node):
         """
         if not planInfo:
             return True if self._timePlans else False
-        return True if planInfo in self._timePlans else False
+        return True if self._timePlans and planInfo in self._timePlans else False
 
     def getTimePlan(self, planInfo):
         """
         Return the :py:class:`TimePlan` for the specific time period defined by *planInfo*, an instance of
         :py:class:`PlanCollectionInfo`.
         """
-        try:
+        if self._timePlans and planInfo in self._timePlans:
             return self._timePlans[planInfo]
-        except KeyError:
-            raise DtaError("Node %d does not have a timeplan between %d and %d" %
-                           (self.getId(), planInfo.getTimePeriod()[0],
-                            planInfo.getTimePeriod()[1]))
+        raise DtaError("Node %d does not have a timeplan between %d and %d" %
+                       (self.getId(), planInfo.getTimePeriod()[0],
+                        planInfo.getTimePeriod()[1]))
 
     def iterTimePlans(self):
         """
         Return an iterator over the :py:class:`TimePlan` instances corresponding to this node.
         """
+        if not self._timePlans:
+            return iter([])
         return iter(self._timePlans.itervalues())
 
     def setAllWayStopControl(self):
@@ -0,0 +1,232 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+from .DtaError import DtaError
+
+class SimResults(object):
+    """
+    Network level store of the simulated movement results: dense (movement x time bin) NumPy arrays
+    of the outgoing volume, the incoming volume and the mean travel time (in minutes) for each time bin of
+    length *simTimeStepInMin* from *simStartTimeInMin* to *simEndTimeInMin*.
+
+    The store is attached to its :py:class:`Movement` instances, whose simulated result getters and setters
+    (e.g. :py:meth:`Movement.getSimOutVolume`, :py:meth:`Movement.setSimTTInMin`) then read and write these arrays,
+    so the results don't have to be kept in per-movement dictionaries.  Interval queries are answered with
+    cumulative sums over the time bins, which are computed once after the results change.
+
+    Bins without results have zero volume and zero travel time, like the unset bins of the dictionaries.
+
+    The arrays are:
+
+     * *outVolume*, *inVolume*: the outgoing and incoming volume of each movement in each time bin
+     * *meanTT*: the mean travel time in minutes of the vehicles leaving each movement in each time bin
+
+    They can be filled in bulk; call :py:meth:`SimResults.resultsChanged` after writing to them directly.
+    Queries for a single time bin read the arrays directly, so setting the results bin by bin and checking
+    them as they are set (like :py:meth:`Movement.setSimTTInMin` does) doesn't recompute the cumulative sums.
+    """
+
+    def __init__(self, movements, simStartTimeInMin, simEndTimeInMin, simTimeStepInMin):
+        """
+        Constructor.  Allocates the arrays for the list of :py:class:`Movement` instances *movements*
+        (the index of a movement in the arrays is its position in this list) and attaches itself to them.
+        """
+        if simTimeStepInMin <= 0 or (simEndTimeInMin - simStartTimeInMin) % simTimeStepInMin != 0:
+            raise DtaError("SimResults: the simulation time window from %d to %d is not a multiple of "
+                           "the time step %d" % (simStartTimeInMin, simEndTimeInMin, simTimeStepInMin))
+
+        self._movements         = list(movements)
+        self.simStartTimeInMin  = simStartTimeInMin
+        self.simEndTimeInMin    = simEndTimeInMin
+        self.simTimeStepInMin   = simTimeStepInMin
+
+        shape = (len(self._movements), (simEndTimeInMin - simStartTimeInMin) / simTimeStepInMin)
+        self.outVolume  = np.zeros(shape, dtype=np.float32)
+        self.inVolume   = np.zeros(shape, dtype=np.float32)
+        self.meanTT     = np.zeros(shape, dtype=np.float32)
+
+        # cumulative sums over the time bins; see _getCumulative()
+        self._cumulative = None
+
+        for index, movement in enumerate(self._movements):
+            movement._simResults        = self
+            movement._simResultsIndex   = index
+
+    def getNumMovements(self):
+        """
+        Returns the number of movements in the store.
+        """
+        return len(self._movements)
+
+    def getNumTimeBins(self):
+        """
+        Returns the number of time bins.
+        """
+        return self.outVolume.shape[1]
+
+    def getMovement(self, index):
+        """
+        Returns the :py:class:`Movement` instance at *index*.
+        """
+        return self._movements[index]
+
+    def iterMovements(self):
+        """
+        Returns an iterator to the :py:class:`Movement` instances in the store, in index order.
+        """
+        return iter(self._movements)
+
+    def getTimeBin(self, timeInMin):
+        """
+        Returns the index of the time bin starting at *timeInMin*.
+        """
+        return (timeInMin - self.simStartTimeInMin) / self.simTimeStepInMin
+
+    def resultsChanged(self):
+        """
+        Drops the cumulative sums so that they are recomputed from the arrays the next time they are needed.
+        """
+        self._cumulative = None
+
+    def _getCumulative(self):
+        """
+        Returns the (movement x time bin + 1) cumulative sums (*outVolume*, *inVolume*, *ttVolume*, *invalid*) where
+        *ttVolume* is the travel time multiplied by the outgoing volume and *invalid* counts the bins that have
+        a volume but no travel time or vice versa.
+        """
+        if self._cumulative is None:
+            numMovements, numBins = self.outVolume.shape
+            hasVolume   = self.outVolume > 0
+            hasTT       = self.meanTT > 0
+            ttVolume    = np.where(hasVolume & hasTT, self.meanTT.astype(np.float64) * self.outVolume, 0.0)
+
+            self._cumulative = []
+            for values in (self.outVolume, self.inVolume, ttVolume, hasVolume != hasTT):
+                cumulative = np.zeros((numMovements, numBins + 1), dtype=np.float64)
+                np.cumsum(values, axis=1, dtype=np.float64, out=cumulative[:, 1:])
+                self._cumulative.append(cumulative)
+        return self._cumulative
+
+    def _getBinRange(self, startTimeInMin, endTimeInMin):
+        """
+        Returns the bin indices (first, last + 1) for the time period from *startTimeInMin* to *endTimeInMin*.
+        """
+        return self.getTimeBin(startTimeInMin), self.getTimeBin(endTimeInMin)
+
+    def setOutVolume(self, index, startTimeInMin, volume):
+        """
+        Sets the outgoing volume of the movement at *index* for the time bin starting at *startTimeInMin*.
+        """
+        self.outVolume[index, self.getTimeBin(startTimeInMin)] = volume
+        self._cumulative = None
+
+    def setInVolume(self, index, startTimeInMin, volume):
+        """
+        Sets the incoming volume of the movement at *index* for the time bin starting at *startTimeInMin*.
+        """
+        self.inVolume[index, self.getTimeBin(startTimeInMin)] = volume
+        self._cumulative = None
+
+    def setMeanTT(self, index, startTimeInMin, averageTTInMin):
+        """
+        Sets the mean travel time of the movement at *index* for the time bin starting at *startTimeInMin*.
+        """
+        self.meanTT[index, self.getTimeBin(startTimeInMin)] = averageTTInMin
+        self._cumulative = None
+
+    def getOutVolume(self, index, startTimeInMin, endTimeInMin):
+        """
+        Returns the outgoing volume of the movement at *index* from *startTimeInMin* to *endTimeInMin*.
+        *index* can also be an array of indices, for which an array of volumes is returned.
+        """
+        first, last = self._getBinRange(startTimeInMin, endTimeInMin)
+        if last - first == 1:
+            return self.outVolume[index, first].astype(np.float64)
+        cumulative = self._getCumulative()[0]
+        return cumulative[index, last] - cumulative[index, first]
+
+    def getInVolume(self, index, startTimeInMin, endTimeInMin):
+        """
+        Returns the incoming volume of the movement at *index* from *startTimeInMin* to *endTimeInMin*.
+        *index* can also be an array of indices, for which an array of volumes is returned.
+        """
+        first, last = self._getBinRange(startTimeInMin, endTimeInMin)
+        if last - first == 1:
+            return self.inVolume[index, first].astype(np.float64)
+        cumulative = self._getCumulative()[1]
+        return cumulative[index, last] - cumulative[index, first]
+
+    def getMeanTTAndVolume(self, index, startTimeInMin, endTimeInMin):
+        """
+        Returns the tuple (*meanTT*, *volume*) for the movement at *index* from *startTimeInMin* to *endTimeInMin*,
+        where *meanTT* is the mean of the travel times of the time bins weighted by their outgoing volume.  *meanTT*
+        is None if the *volume* is zero.
+
+        Raises a :py:class:`DtaError` if one of the time bins has a volume but no travel time or vice versa.
+        """
+        first, last = self._getBinRange(startTimeInMin, endTimeInMin)
+        if last - first == 1:
+            volume      = float(self.outVolume[index, first])
+            meanTT      = float(self.meanTT[index, first])
+            isInvalid   = (volume > 0) != (meanTT > 0)
+        else:
+            outVolume, inVolume, ttVolume, invalid = self._getCumulative()
+            volume      = outVolume[index, last] - outVolume[index, first]
+            isInvalid   = invalid[index, last] != invalid[index, first]
+            meanTT      = (ttVolume[index, last] - ttVolume[index, first]) / volume if volume > 0 else None
+
+        if isInvalid:
+            raise DtaError("Movement %s has a time bin with flow and no travel time (or vice versa) "
+                           "for time period from %d to %d" % (self._movements[index].getId(),
+                                                                startTimeInMin, endTimeInMin))
+        if volume <= 0:
+            return None, 0
+        return meanTT, volume
+
+    def getOutVolumes(self, startTimeInMin, endTimeInMin):
+        """
+        Returns an array of the outgoing volumes of all the movements from *startTimeInMin* to *endTimeInMin*.
+        """
+        return self.getOutVolume(slice(None), startTimeInMin, endTimeInMin)
+
+    def getInVolumes(self, startTimeInMin, endTimeInMin):
+        """
+        Returns an array of the incoming volumes of all the movements from *startTimeInMin* to *endTimeInMin*.
+        """
+        return self.getInVolume(slice(None), startTimeInMin, endTimeInMin)
+
+    def getOutVolumeTable(self, startTimesInMin, durationInMin, index=slice(None)):
+        """
+        Returns the (movement x window) array of the outgoing volumes of the movements at *index* (an array of
+        indices, or all of them by default) for the time windows of *durationInMin* minutes starting at each of
+        the *startTimesInMin*, computed at once from the cumulative sums.
+        """
+        if durationInMin <= 0 or durationInMin % self.simTimeStepInMin != 0:
+            raise DtaError("SimResults: the time window of %d minutes is not a multiple of the time step %d" %
+                           (durationInMin, self.simTimeStepInMin))
+        firstBins = np.array([self.getTimeBin(startTime) for startTime in startTimesInMin], dtype=np.int64)
+        numBins   = durationInMin / self.simTimeStepInMin
+        if len(firstBins) and (firstBins.min() < 0 or firstBins.max() + numBins > self.getNumTimeBins()):
+            raise DtaError("SimResults: the time windows of %d minutes starting from %d to %d are out of the simulation time" %
+                           (durationInMin, min(startTimesInMin), max(startTimesInMin)))
+        if numBins == 1:
+            return self.outVolume[index][:, firstBins].astype(np.float64)
+        cumulative = self._getCumulative()[0][index]
+        return cumulative[:, firstBins + numBins] - cumulative[:, firstBins]
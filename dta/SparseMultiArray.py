@@ -0,0 +1,208 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+from itertools import izip, count
+
+class SparseMultiArray(object):
+    """
+    Sparse counterpart of :py:class:`MultiArray`: a multidimensional array indexed by the elements of
+    its dimensions that only stores its nonzero items, as a sorted array of their flat (C order) indices
+    and an array of their values.
+
+    Single items are read and written with the same ``array[element0, element1, ...]`` syntax as
+    :py:class:`MultiArray` (slices are not supported); writes are buffered and merged into the sorted arrays
+    when the items are next read in bulk.  :py:meth:`SparseMultiArray.getNonZero`, :py:meth:`SparseMultiArray.setNonZero`
+    and :py:meth:`SparseMultiArray.addNonZero` read and write all the items at once, by the internal indices
+    (the positions of the elements in their dimensions).
+    """
+
+    def __init__(self, dtype, dimElements):
+        """
+        Constructor.  Initializes an array of zeros of type *dtype* whose dimensions have the
+        elements in the list of sequences *dimElements*.
+        """
+        if len(dimElements) == 0:
+            raise ValueError("Wrong arguments in the SparseMultiArray constructor")
+
+        self._shape = tuple(map(len, dimElements))
+        self._dtype = np.dtype(dtype)
+        # the translation is a list dict of pairs dimElements found in the *args and
+        # their index. Example HBW:0, HBO:1....
+        self._translation = [dict(izip(element, count())) for element in dimElements]
+        self._elementsOfAllDimentions = tuple(tuple(element) for element in dimElements)
+
+        self._keys      = np.zeros(0, dtype=np.int64)
+        self._values    = np.zeros(0, dtype=self._dtype)
+        # flat index -> value written since the last merge
+        self._pending   = {}
+
+    def getNumDim(self):
+        """Return the number of dimentions"""
+        return len(self._shape)
+
+    def getShape(self):
+        """Return a tuple of integers indicating the size of the array in
+        each dimention"""
+        return self._shape
+
+    def getSize(self):
+        """Return the number of items in the array, zeros included"""
+        return int(np.prod(self._shape))
+
+    def getDataType(self):
+        """Return the data type of the elements in the array"""
+        return self._dtype
+
+    def getElementsOfDimention(self, dimIndex):
+        """Returns a tuple of all the indices of the dimention provided"""
+        return self._elementsOfAllDimentions[dimIndex]
+
+    def getElementsOfAllDimentions(self):
+        """Return a tuple with the elements of all dimentions"""
+        return self._elementsOfAllDimentions
+
+    def _translateElement(self, dimIndex, element):
+        """Return the corresponding index of the provided element and dimention"""
+        try:
+            return self._translation[dimIndex][element]
+        except KeyError, e:
+            raise IndexError("Dim %d does not have element %s" % (dimIndex, str(element)))
+
+    def _flatIndex(self, viewElements):
+        """Return the flat index of the item with the given elements"""
+        if len(viewElements) != self.getNumDim():
+            raise IndexError("Invalid Index dimentions")
+        flatIndex = 0
+        for dimIndex, element in enumerate(viewElements):
+            if isinstance(element, (slice, list)):
+                raise ValueError("Not implemented: SparseMultiArray only supports single items")
+            flatIndex = flatIndex * self._shape[dimIndex] + self._translateElement(dimIndex, element)
+        return flatIndex
+
+    def _merge(self):
+        """Merge the pending writes into the sorted arrays and drop the zeros"""
+        if not self._pending: return
+
+        pendingKeys     = np.fromiter(self._pending.iterkeys(), dtype=np.int64, count=len(self._pending))
+        pendingValues   = np.fromiter(self._pending.itervalues(), dtype=self._dtype, count=len(self._pending))
+        self._pending   = {}
+
+        # the pending values replace the stored ones
+        keep    = ~np.in1d(self._keys, pendingKeys)
+        keys    = np.concatenate((self._keys[keep], pendingKeys))
+        values  = np.concatenate((self._values[keep], pendingValues))
+        order   = np.argsort(keys, kind="mergesort")
+        nonZero = values[order] != 0
+        self._keys      = keys[order][nonZero]
+        self._values    = values[order][nonZero]
+
+    def __getitem__(self, viewElements):
+        """Return the value of the item with the given elements"""
+        flatIndex = self._flatIndex(viewElements)
+        if flatIndex in self._pending:
+            return self._pending[flatIndex]
+        position = np.searchsorted(self._keys, flatIndex)
+        if position < len(self._keys) and self._keys[position] == flatIndex:
+            return self._values.item(position)
+        return self._dtype.type(0).item()
+
+    def __setitem__(self, viewElements, value):
+        """Set the value of the item with the given elements"""
+        self._pending[self._flatIndex(viewElements)] = value
+
+    def getNumNonZero(self):
+        """Return the number of nonzero items"""
+        self._merge()
+        return len(self._keys)
+
+    def getNonZero(self):
+        """
+        Return the tuple (*indices*, *values*) of the nonzero items in C order, where *indices* is a tuple
+        with an array of internal indices for each dimension, like :py:func:`numpy.nonzero`.
+        """
+        self._merge()
+        return np.unravel_index(self._keys, self._shape), self._values.copy()
+
+    def setNonZero(self, indices, values):
+        """
+        Replace the contents of the array with the items at the internal *indices* (a tuple with an array
+        of indices for each dimension) with the given *values*; the values of repeated items are added up.
+        """
+        self._pending   = {}
+        self._keys      = np.zeros(0, dtype=np.int64)
+        self._values    = np.zeros(0, dtype=self._dtype)
+        self.addNonZero(indices, values)
+
+    def addNonZero(self, indices, values):
+        """
+        Add the *values* to the items at the internal *indices* (a tuple with an array of indices for each dimension).
+        """
+        self._merge()
+        keys    = np.ravel_multi_index(tuple(np.asarray(index, dtype=np.int64) for index in indices), self._shape)
+        keys    = np.concatenate((self._keys, keys))
+        values  = np.concatenate((self._values, np.asarray(values, dtype=self._dtype)))
+
+        uniqueKeys, inverse = np.unique(keys, return_inverse=True)
+        uniqueValues = np.zeros(len(uniqueKeys), dtype=self._dtype)
+        np.add.at(uniqueValues, inverse, values)
+        nonZero = uniqueValues != 0
+        self._keys      = uniqueKeys[nonZero]
+        self._values    = uniqueValues[nonZero]
+
+    def multiplyInPlace(self, value):
+        """Multiply all the items of the array with the provided value"""
+        self._merge()
+        self._values *= value
+        nonZero = self._values != 0
+        self._keys      = self._keys[nonZero]
+        self._values    = self._values[nonZero]
+
+    def getSum(self):
+        """return the sum of all the items in the array"""
+        self._merge()
+        return self._values.sum()
+
+    def getNumpyArray(self):
+        """
+        Unlike :py:meth:`MultiArray.getNumpyArray`, there's no dense data to return a reference to,
+        so this raises a ValueError rather than return a copy that writes would be lost to;
+        use :py:meth:`SparseMultiArray.toNumpyArray` for a copy.
+        """
+        raise ValueError("A SparseMultiArray has no dense numpy array to view; use toNumpyArray() for a copy")
+
+    def toNumpyArray(self):
+        """
+        Return the items as a new dense multidimentional numpy array.  It is a copy:
+        writing to it doesn't change this array.
+        """
+        self._merge()
+        data = np.zeros(self._shape, dtype=self._dtype)
+        data.flat[self._keys] = self._values
+        return data
+
+    def __eq__(self, other):
+        """Return true if the two arrays have the same elements and values"""
+        if not isinstance(other, SparseMultiArray):
+            raise ValueError("I cannot compare a SparseMultiArray with an object of"
+                             "type: %s" % type(other))
+        if self.getElementsOfAllDimentions() != other.getElementsOfAllDimentions():
+            return False
+        self._merge()
+        other._merge()
+        return np.array_equal(self._keys, other._keys) and np.array_equal(self._values, other._values)
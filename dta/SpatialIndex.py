@@ -0,0 +1,277 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import heapq
+import math
+import weakref
+
+from .DtaError import DtaError
+
+class SpatialIndex(object):
+    """
+    A uniform grid over the nodes and the :py:class:`RoadLink` instances of a network, for nearest neighbor
+    and radius queries that only look at the grid cells around the query point instead of scanning
+    every node or link.
+
+    Nodes are stored in the cell containing them.  Road links are stored in every cell overlapped by
+    the bounding box of their center line (see :py:meth:`RoadLink.getCenterLine`, shape points included), since
+    distances to road links are measured to that line by :py:meth:`RoadLink.getDistanceFromPoint`.
+
+    Nearest neighbor queries search square rings of cells of increasing size around the query point; everything in
+    a ring further out than *r* cells is at least *r* x *cellSize* away, so the search stops as soon as the
+    candidates found are closer than that.
+
+    Use :py:meth:`Network.getSpatialIndex` rather than building one directly: the network builds it
+    on demand and keeps it up to date as nodes and links are added and removed.  Nodes hold a weak reference
+    to the index, so that nodes moved by :py:meth:`Node.setCoordinates` (and their road links) move in the index too.
+
+    All coordinates and distances are in :py:attr:`Node.COORDINATE_UNITS`.
+    """
+
+    def __init__(self, cellSize):
+        """
+        Constructor.  Initializes an empty index with square cells of side *cellSize*.
+        """
+        if cellSize <= 0:
+            raise DtaError("SpatialIndex cellSize must be positive: %s" % str(cellSize))
+
+        self._cellSize  = float(cellSize)
+        # (column, row) -> list of nodes, list of road links
+        self._nodeCells = {}
+        self._linkCells = {}
+        # node -> the (column, row) cell it is stored in
+        self._cellForNode  = {}
+        # road link -> list of the (column, row) cells it is stored in
+        self._cellsForLink = {}
+        # bounds of the occupied cells, (minColumn, minRow, maxColumn, maxRow); they only grow
+        self._nodeBounds = None
+        self._linkBounds = None
+
+    @classmethod
+    def buildForNetwork(cls, network, cellSize=None):
+        """
+        Builds and returns the index for all the nodes and :py:class:`RoadLink` instances of *network*.
+
+        If *cellSize* is None, it is picked so that the cells hold a couple of nodes each on average.
+        """
+        nodes = list(network.iterNodes())
+        if cellSize is None:
+            cellSize = 1.0
+            if len(nodes) > 1:
+                xs = [node.getX() for node in nodes]
+                ys = [node.getY() for node in nodes]
+                area = max(max(xs) - min(xs), 1.0) * max(max(ys) - min(ys), 1.0)
+                cellSize = max(math.sqrt(2.0 * area / len(nodes)), 1.0)
+
+        index = cls(cellSize)
+        for node in nodes:
+            index.addNode(node)
+        for link in network.iterRoadLinks():
+            index.addLink(link)
+        return index
+
+    def getCellSize(self):
+        """
+        Returns the length of the side of the grid cells.
+        """
+        return self._cellSize
+
+    def _cellFor(self, x, y):
+        """
+        Returns the (column, row) of the cell containing (*x*, *y*).
+        """
+        return (int(math.floor(x / self._cellSize)), int(math.floor(y / self._cellSize)))
+
+    def _growBounds(self, bounds, minCell, maxCell):
+        """
+        Returns *bounds* grown to include the cells from *minCell* to *maxCell*.
+        """
+        if bounds is None:
+            return (minCell[0], minCell[1], maxCell[0], maxCell[1])
+        return (min(bounds[0], minCell[0]), min(bounds[1], minCell[1]),
+                max(bounds[2], maxCell[0]), max(bounds[3], maxCell[1]))
+
+    def addNode(self, node):
+        """
+        Adds the :py:class:`Node` instance *node* to the index.
+        """
+        cell = self._cellFor(node.getX(), node.getY())
+        self._nodeCells.setdefault(cell, []).append(node)
+        self._cellForNode[node] = cell
+        self._nodeBounds = self._growBounds(self._nodeBounds, cell, cell)
+        node._spatialIndexRef = weakref.ref(self)
+
+    def removeNode(self, node):
+        """
+        Removes the :py:class:`Node` instance *node* from the index.
+        """
+        cell = self._cellForNode.pop(node, None)
+        if cell is None:
+            raise DtaError("SpatialIndex.removeNode: node %d is not in the index" % node.getId())
+        self._nodeCells[cell].remove(node)
+        if not self._nodeCells[cell]:
+            del self._nodeCells[cell]
+        if node._spatialIndexRef and node._spatialIndexRef() is self:
+            node._spatialIndexRef = None
+
+    def nodeMoved(self, node):
+        """
+        Moves the :py:class:`Node` instance *node* to the cell of its current coordinates, and re-indexes
+        its adjacent road links.  Called by :py:meth:`Node.setCoordinates`; nodes that are not in the index are ignored.
+        """
+        if node not in self._cellForNode: return
+
+        self.removeNode(node)
+        self.addNode(node)
+        for link in node.iterAdjacentLinks():
+            if link in self._cellsForLink:
+                self.removeLink(link)
+                self.addLink(link)
+
+    def addLink(self, link):
+        """
+        Adds the :py:class:`RoadLink` instance *link* to the index.  Other kinds of links are ignored.
+        """
+        if not link.isRoadLink(): return
+
+        centerline = link.getCenterLine(wholeLineShapePoints=True)
+        minCell = self._cellFor(min(point[0] for point in centerline), min(point[1] for point in centerline))
+        maxCell = self._cellFor(max(point[0] for point in centerline), max(point[1] for point in centerline))
+
+        cells = [(column, row) for column in xrange(minCell[0], maxCell[0] + 1)
+                               for row in xrange(minCell[1], maxCell[1] + 1)]
+        for cell in cells:
+            self._linkCells.setdefault(cell, []).append(link)
+        self._cellsForLink[link] = cells
+        self._linkBounds = self._growBounds(self._linkBounds, minCell, maxCell)
+
+    def removeLink(self, link):
+        """
+        Removes the :py:class:`RoadLink` instance *link* from the index.  Links that are not in the index are ignored.
+        """
+        cells = self._cellsForLink.pop(link, None)
+        if cells is None: return
+
+        for cell in cells:
+            self._linkCells[cell].remove(link)
+            if not self._linkCells[cell]:
+                del self._linkCells[cell]
+
+    def _iterRing(self, cells, center, radius, bounds):
+        """
+        Yields the items in the cells of *cells* that are exactly *radius* cells away from
+        the *center* cell (i.e. the square ring of cells at that distance), clipped to *bounds*.
+        """
+        minColumn = max(center[0] - radius, bounds[0])
+        maxColumn = min(center[0] + radius, bounds[2])
+        minRow    = max(center[1] - radius, bounds[1])
+        maxRow    = min(center[1] + radius, bounds[3])
+
+        for column in xrange(minColumn, maxColumn + 1):
+            onEdge = (column == center[0] - radius or column == center[0] + radius)
+            rows = xrange(minRow, maxRow + 1) if onEdge else \
+                   [row for row in (center[1] - radius, center[1] + radius) if minRow <= row <= maxRow]
+            for row in rows:
+                for item in cells.get((column, row), ()):
+                    yield item
+
+    def _maxRadius(self, center, bounds):
+        """
+        Returns the ring radius (in cells) around *center* beyond which there are no occupied cells.
+        """
+        return max(abs(center[0] - bounds[0]), abs(center[0] - bounds[2]),
+                   abs(center[1] - bounds[1]), abs(center[1] - bounds[3]))
+
+    def _searchRings(self, cells, bounds, x, y, n, maxDist, distanceFunc):
+        """
+        Generic ring search.  *distanceFunc* (item) returns a tuple whose first element is the distance from
+        (*x*, *y*) to the item, or None to skip the item.  Returns the (at most *n*, or all if *n* is None) tuples
+        that are within *maxDist* (if not None), sorted by distance.
+        """
+        if bounds is None: return []
+
+        center      = self._cellFor(x, y)
+        maxRadius   = self._maxRadius(center, bounds)
+        if maxDist is not None:
+            maxRadius = min(maxRadius, int(math.ceil(maxDist / self._cellSize)) + 1)
+
+        seen        = set()
+        results     = []   # heap of (-distance, order, tuple) for the n best
+        order       = 0
+        for radius in xrange(maxRadius + 1):
+            for item in self._iterRing(cells, center, radius, bounds):
+                if item in seen: continue
+                seen.add(item)
+
+                result = distanceFunc(item)
+                if result is None: continue
+                if maxDist is not None and result[0] > maxDist: continue
+
+                order += 1
+                if n is None or len(results) < n:
+                    heapq.heappush(results, (-result[0], order, result))
+                elif result[0] < -results[0][0]:
+                    heapq.heapreplace(results, (-result[0], order, result))
+
+            # everything beyond this ring is at least radius*cellSize away
+            if n is not None and len(results) == n and -results[0][0] <= radius * self._cellSize:
+                break
+
+        return [result for negDist, order, result in sorted(results, key=lambda entry: (-entry[0], entry[1]))]
+
+    def findNearestNodes(self, x, y, n=1, maxDist=None, nodeFilter=None):
+        """
+        Returns a list of up to *n* (distance, node) tuples for the nodes closest to (*x*, *y*), sorted by distance.
+
+         * *maxDist*, if passed, excludes nodes further away than that
+         * *nodeFilter*, if passed, is a function of a node that returns False for nodes to exclude
+        """
+        def nodeDistance(node):
+            if nodeFilter and not nodeFilter(node): return None
+            return (math.sqrt((node.getX() - x) ** 2 + (node.getY() - y) ** 2), node)
+
+        return self._searchRings(self._nodeCells, self._nodeBounds, x, y, n, maxDist, nodeDistance)
+
+    def findNodesWithinRadius(self, x, y, radius, nodeFilter=None):
+        """
+        Returns the list of (distance, node) tuples for all the nodes within *radius* of (*x*, *y*), sorted by distance.
+        *nodeFilter* is as in :py:meth:`SpatialIndex.findNearestNodes`.
+        """
+        return self.findNearestNodes(x, y, n=None, maxDist=radius, nodeFilter=nodeFilter)
+
+    def findNearestRoadLinks(self, x, y, n=1, maxDist=None, linkFilter=None):
+        """
+        Returns a list of up to *n* (roadlink, distance, t) tuples for the road links closest to (*x*, *y*),
+        sorted by distance, where *distance* and *t* are as returned by :py:meth:`RoadLink.getDistanceFromPoint`.
+
+         * *maxDist*, if passed, excludes road links further away than that
+         * *linkFilter*, if passed, is a function of a road link that returns False for road links to exclude
+        """
+        def linkDistance(roadlink):
+            if linkFilter and not linkFilter(roadlink): return None
+            (dist, t) = roadlink.getDistanceFromPoint(x, y)
+            return (dist, roadlink, t)
+
+        results = self._searchRings(self._linkCells, self._linkBounds, x, y, n, maxDist, linkDistance)
+        return [(roadlink, dist, t) for (dist, roadlink, t) in results]
+
+    def findRoadLinksWithinRadius(self, x, y, radius, linkFilter=None):
+        """
+        Returns the list of (roadlink, distance, t) tuples for all the road links within *radius* of (*x*, *y*),
+        sorted by distance.  *linkFilter* is as in :py:meth:`SpatialIndex.findNearestRoadLinks`.
+        """
+        return self.findNearestRoadLinks(x, y, n=None, maxDist=radius, linkFilter=linkFilter)
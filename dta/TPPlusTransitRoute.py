@@ -416,15 +416,15 @@ class TPPlusTransitRoute(object):
                 
                 # dta.DtaLogger.debug('Running the SP from node %d to %d' % (dNodeA.getId(), dNodeB.getId()))
                 try:
-                    dta.ShortestPaths.labelSettingWithLabelsOnNodes(dtaNetwork, dNodeA, dNodeB)
-                    assert(dNodeB.label < sys.maxint)
+                    labels, predVertices, labeledVertices = dta.ShortestPaths.labelSettingWithLabelsOnNodes(dtaNetwork, dNodeA, dNodeB)
+                    assert(labels[dNodeB] < sys.maxint)
                 except:
                     dta.DtaLogger.error("Error: %s" % str(sys.exc_info()))
                     dta.DtaLogger.error("Tpplus route %-15s No shortest path found from %d to %d" %
                                         (self.name, dNodeA.getId(), dNodeB.getId()))
                     continue
 
-                pathNodes = dta.ShortestPaths.getShortestPathBetweenNodes(dNodeA, dNodeB)
+                pathNodes = dta.ShortestPaths.getShortestPathBetweenNodes(dNodeA, dNodeB, predVertices)
                 
                 # Warn on this because it's a little odd
                 if len(pathNodes)-1 > maxShortestPathLen:
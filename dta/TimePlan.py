@@ -21,7 +21,7 @@ import pdb
 from .Phase import Phase
 from .DtaError import DtaError
 from .Logger import DtaLogger
-from .Utils import Time
+from .Utils import Time, openDynameqFile
 
 
 __all__ = ["PlanCollectionInfo", "TimePlan"]
@@ -88,7 +88,7 @@ class TimePlan(object):
         """
 
         try:
-            lineIter = open(fileName, "r")
+            lineIter = openDynameqFile(fileName)
             while not lineIter.next().strip().startswith("PLAN_INFO"):
                 continue
             currentLine = lineIter.next().strip()
@@ -302,12 +302,13 @@ class TimePlan(object):
                            (self._node.getId(), error_str))
         
         #check that if two conflicting movements exist one of them is permitted or right turn
+        #(the conflicts come from the conflict matrix of the node, computed once for all the plans)
         for phase in self.iterPhases():
             for mov1 in phase.iterPhaseMovements():
                 for mov2 in phase.iterPhaseMovements():
                     
                    if mov1.getMovement().getId() == mov2.getMovement().getId(): continue
-                   if not mov1.getMovement().isInConflict(mov2.getMovement()): continue
+                   if not self._node.hasConflict(mov1.getMovement(), mov2.getMovement()): continue
                    
                    if mov1.isProtected() and mov2.isProtected():
                        if mov1.getMovement().isRightTurn() or mov2.getMovement().isRightTurn(): continue
@@ -332,7 +333,7 @@ class TimePlan(object):
                     if mov1.getMovement().getId() == mov2.getMovement().getId(): continue
                     
                     # no conflict
-                    if not mov1.getMovement().isInConflict(mov2.getMovement()):  continue
+                    if not self._node.hasConflict(mov1.getMovement(), mov2.getMovement()):  continue
                    
                     # two thru movements in conflict
                     if mov1.getMovement().isThruTurn() and mov2.getMovement().isThruTurn():
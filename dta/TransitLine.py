@@ -415,9 +415,10 @@ def correctTransitLineUsingSP(net, transitLine):
                           transitLine.vtype, transitLine.stime, transitLine.hway,
                           transitLine.dep)
 
+    movementCosts = {}
     for edge in net.iterEdges():
         for mov in edge.iterEmanatingMovements():
-            mov.cost = edge.length
+            movementCosts[mov] = edge.length
     
     for segment1, segment2 in pairwise(transitLine.iterSegments()):
         
@@ -427,7 +428,7 @@ def correctTransitLineUsingSP(net, transitLine):
             newLine.addSegment(segment1.link, segment1.dwell)
         else:
 
-            ShortestPaths.labelCorrectingWithLabelsOnEdges(net, segment1.link)
+            ShortestPaths.labelCorrectingWithLabelsOnEdges(net, segment1.link, movementCosts)
             newLine.addSegment(segment1.link, segment1.dwell)
 
             path = ShortestPaths.getShortestPath2(segment1.link, segment2.link)
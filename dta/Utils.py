@@ -21,9 +21,12 @@ __license__     = """
     along with DTA.  If not, see <http://www.gnu.org/licenses/>.
 """
 import copy
+import gzip
+import os
 import re
 import sys
 import datetime
+import time
 
 import dta
 import shapefile
@@ -73,6 +76,80 @@ def parseTextRecord(iterable, is_separator=re.compile(r"^a"),
         yield joiner(record)
 
 
+def findDynameqFile(filename):
+    """
+    Returns *filename* if it exists, or the name of its gzip-compressed version *filename*.gz if that
+    exists instead.  Returns None if neither exists.
+    """
+    if os.path.exists(filename):
+        return filename
+    if os.path.exists(filename + ".gz"):
+        return filename + ".gz"
+    return None
+
+def openDynameqFile(filename):
+    """
+    Opens the Dynameq text file *filename* for reading and returns the file object.  Files with names
+    ending in ``.gz``, or that only exist as *filename*.gz (see :py:func:`findDynameqFile`), are
+    read through :py:mod:`gzip`.
+    """
+    actualFilename = findDynameqFile(filename)
+    if actualFilename is None:
+        raise dta.DtaError("Dynameq file %s does not exist" % filename)
+    if actualFilename.endswith(".gz"):
+        return gzip.open(actualFilename, "rb")
+    return open(actualFilename, "r")
+
+def readDynameqSections(filename, sections):
+    """
+    Reads the sectioned Dynameq text file *filename* (e.g. the base network file) in a single pass.
+
+    *sections* is a list of (*sectionName*, *handler*) tuples, one for each section of the file.  The
+    records of a section are the lines between its name and the name of the next section (or the end
+    of the file), comments and blank lines excluded.  The fields (list of strings) of each record are
+    passed to the *handler* of its section, which can be None for sections that are only counted.
+
+    Logs the number of records read and the time spent on each section, and raises a :py:class:`DtaError`
+    if one of the *sections* is not in the file.
+    """
+    handlers    = dict(sections)
+    counts      = dict((sectionName, 0) for sectionName, handler in sections)
+    seconds     = dict((sectionName, 0.0) for sectionName, handler in sections)
+    found       = set()
+
+    inputStream = openDynameqFile(filename)
+    sectionName = None
+    handler     = None
+    startTime   = time.time()
+    for line in inputStream:
+        line = line.strip()
+        if not line or line[0] == "*":
+            continue
+
+        if line in handlers:
+            now = time.time()
+            if sectionName: seconds[sectionName] += now - startTime
+            sectionName = line
+            handler     = handlers[line]
+            startTime   = now
+            found.add(sectionName)
+            continue
+
+        # file header
+        if sectionName is None:
+            continue
+
+        if handler: handler(line.split())
+        counts[sectionName] += 1
+    if sectionName: seconds[sectionName] += time.time() - startTime
+    inputStream.close()
+
+    for sectionName, handler in sections:
+        if sectionName not in found:
+            raise dta.DtaError("readDynameqSections failed to find %s in %s" % (sectionName, filename))
+        dta.DtaLogger.info("Read  %8d %-16s from %s in %.2f seconds" % 
+                           (counts[sectionName], sectionName, filename, seconds[sectionName]))
+
 def militaryTimeToDateTime(militaryTime):
     """
     Return a datetime.time object that corresponds
@@ -504,6 +581,12 @@ class Time(datetime.time):
 
         datetime.time.__init__(hour, minute, second)
 
+    def __reduce__(self):
+        """
+        Pickle support; the default one for :py:class:`datetime.time` doesn't go through our constructor
+        """
+        return (Time, (self.hour, self.minute, self.second))
+
     def __lt__(self, other):
         """
         Implementation of the less than < operator
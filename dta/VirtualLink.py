@@ -39,6 +39,8 @@ class VirtualLink(Link):
     LANES           = 1
     RABOUT          = 0
     LEVEL           = 0
+
+    __slots__ = ()
         
     def __init__(self, id, startNode, endNode, label):
         """
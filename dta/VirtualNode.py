@@ -31,6 +31,8 @@ class VirtualNode(Node):
     DEFAULT_CONTROL  = 0 # value to use if we must
     DEFAULT_PRIORITY = 0 # value to use if we must
 
+    __slots__ = ()
+
     def __init__(self, id, x, y, label=None, level=None):
         """
         Constructor.
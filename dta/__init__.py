@@ -33,7 +33,7 @@ __license__     = """
     along with DTA.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from .Algorithms import ShortestPaths
+from .Algorithms import ReachabilityIndex, ShortestPaths
 from .Centroid import Centroid
 from .Connector import Connector
 from .CorridorPlots import CountsVsVolumes
@@ -42,18 +42,26 @@ from .Demand import Demand
 from .DtaError import DtaError
 from .DynameqNetwork import DynameqNetwork
 from .DynameqScenario import DynameqScenario
+from .GraphSnapshot import GraphSnapshot
+from .GTFS import GTFSStopLinks, GTFSTripIndex
 from .Link import Link
+from .LinkGeometry import LinkGeometry
 from .Logger import DtaLogger, setupLogging
 from .Movement import Movement
 from .MultiArray import MultiArray
 from .Network import Network
 from .Node import Node
+from .ObsCounts import ObsCounts
 from .Phase import Phase
 from .PhaseMovement import PhaseMovement
 from .RoadLink import RoadLink
 from .RoadNode import RoadNode
 from .Path import Path
+from .ResultsReport import ResultsReport
 from .Scenario import Scenario
+from .SimResults import SimResults
+from .SpatialIndex import SpatialIndex
+from .SparseMultiArray import SparseMultiArray
 from .TimePlan import PlanCollectionInfo, TimePlan
 from .TPPlusTransitRoute import TPPlusTransitNode, TPPlusTransitRoute
 from .TransitLine import TransitLine, TransitSegment
@@ -73,6 +81,9 @@ __all__ = ['DtaError', 'DtaLogger', 'setupLogging',
            'Link', 'RoadLink', 'Connector', 'VirtualLink', 'DynameqDemand',
            'PlanCollectionInfo', 'TimePlan', 'PhaseMovement',
            'TPPlusTransitNode', 'TPPlusTransitRoute', 'TransitLine', 'TransitSegment',
+           'GTFSTripIndex', 'GTFSStopLinks',
            'Route', 'Phase', 'MultiArray',
-           'crossProduct', 'direction', 'lineSegmentsCross', 'onSegment', 'Time', 'CountsVsVolumes', 'ShortestPaths'
+           'crossProduct', 'direction', 'lineSegmentsCross', 'onSegment', 'Time', 'CountsVsVolumes', 'ShortestPaths',
+           'GraphSnapshot', 'SpatialIndex', 'SimResults', 'ReachabilityIndex', 'ResultsReport',
+           'SparseMultiArray', 'ObsCounts', 'LinkGeometry'
 ]
@@ -0,0 +1,145 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+from collections import defaultdict
+
+import dta
+
+USAGE = r"""
+
+ python benchmarkNetworkMemory.py dynameq_net_dir dynameq_net_prefix
+
+ e.g.
+
+ python benchmarkNetworkMemory.py . sf_stops
+
+ Reads the given Dynameq network and reports the bytes per node, link and movement
+ used by their slotted layout (the object and the containers it owns), compared with the
+ same objects laid out with a per-instance __dict__ and the result containers
+ (simulated volumes and travel times, counts, time plans, etc.) created up front.
+
+ The objects they reference (other nodes, links and movements, vehicle class groups,
+ shape point tuples, etc.) are not counted in either case.
+ """
+
+# attribute -> container factory for the containers that are only created once they are needed
+EAGER_CONTAINERS = {dta.RoadNode: [("_timePlans",               dict)],
+                    dta.RoadLink: [("_simOutVolume",            lambda: defaultdict(int)),
+                                   ("_simMeanTT",               lambda: defaultdict(float)),
+                                   ("_obsCount",                dict),
+                                   ("_obsCountStores",          list)],
+                    dta.Movement: [("_higherPriorityMovements", list),
+                                   ("_simOutVolume",            lambda: defaultdict(int)),
+                                   ("_simInVolume",             lambda: defaultdict(int)),
+                                   ("_simMeanTT",               lambda: defaultdict(float)),
+                                   ("_timeVaryingCosts",        list),
+                                   ("_obsCount",                dict),
+                                   ("_obsCountStores",          list)]}
+
+class DictLayout(object):
+    """
+    A plain object with a per-instance __dict__.
+    """
+    pass
+
+def getSlotState(obj):
+    """
+    Returns the dictionary of the attributes in the __slots__ of *obj*.
+    """
+    state = {}
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if hasattr(obj, slot):
+                state[slot] = getattr(obj, slot)
+    return state
+
+def getContainersSize(state):
+    """
+    Returns the bytes used by the containers in the values of *state*; empty tuples are shared, so they're not counted.
+    """
+    size = 0
+    for value in state.itervalues():
+        if isinstance(value, (list, dict, set)) or (isinstance(value, tuple) and value):
+            size += sys.getsizeof(value)
+    return size
+
+def getSlottedSize(obj):
+    """
+    Returns the bytes used by *obj* and the containers it owns.
+    """
+    return sys.getsizeof(obj) + getContainersSize(getSlotState(obj))
+
+def getDictLayoutSize(obj):
+    """
+    Returns the bytes *obj* would use with a per-instance __dict__ and its result containers created up front.
+    """
+    state = getSlotState(obj)
+    for cls, containers in EAGER_CONTAINERS.iteritems():
+        if not isinstance(obj, cls): continue
+        for attr, factory in containers:
+            if state.get(attr) is None or state.get(attr) == ():
+                state[attr] = factory()
+
+    instance = DictLayout()
+    instance.__dict__.update(state)
+    return sys.getsizeof(instance) + sys.getsizeof(instance.__dict__) + getContainersSize(state)
+
+def reportMemory(name, objects):
+    """
+    Logs the number of *objects* and their average bytes for both layouts.
+    """
+    if len(objects) == 0:
+        dta.DtaLogger.info("%-10s none" % name)
+        return
+    slottedBytes    = sum(getSlottedSize(obj) for obj in objects)
+    dictBytes       = sum(getDictLayoutSize(obj) for obj in objects)
+    dta.DtaLogger.info("%-10s %8d objects  %7.1f bytes each (slotted)  %7.1f bytes each (__dict__)  %5.1f%% saved  %8.1f kB total saved" %
+                       (name, len(objects), float(slottedBytes)/len(objects), float(dictBytes)/len(objects),
+                        100.0*(dictBytes - slottedBytes)/dictBytes, (dictBytes - slottedBytes)/1024.0))
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 3:
+        print USAGE
+        sys.exit(2)
+
+    INPUT_DYNAMEQ_NET_DIR         = sys.argv[1]
+    INPUT_DYNAMEQ_NET_PREFIX      = sys.argv[2]
+
+    dta.VehicleType.LENGTH_UNITS= "feet"
+    dta.Node.COORDINATE_UNITS   = "feet"
+    dta.RoadLink.LENGTH_UNITS   = "miles"
+
+    dta.setupLogging("benchmarkNetworkMemory.INFO.log", "benchmarkNetworkMemory.DEBUG.log", logToConsole=True)
+
+    scenario = dta.DynameqScenario()
+    scenario.read(INPUT_DYNAMEQ_NET_DIR, INPUT_DYNAMEQ_NET_PREFIX)
+    net = dta.DynameqNetwork(scenario)
+    net.read(INPUT_DYNAMEQ_NET_DIR, INPUT_DYNAMEQ_NET_PREFIX)
+
+    nodes       = list(net.iterNodes())
+    links       = list(net.iterLinks())
+    movements   = list(net.iterMovements())
+
+    reportMemory("Nodes",       nodes)
+    reportMemory("RoadNodes",   [node for node in nodes if node.isRoadNode()])
+    reportMemory("Links",       links)
+    reportMemory("RoadLinks",   [link for link in links if link.isRoadLink() and not link.isConnector()])
+    reportMemory("Connectors",  [link for link in links if link.isConnector()])
+    reportMemory("Movements",   movements)
@@ -148,7 +148,7 @@ if __name__ == "__main__":
             dta.DtaLogger.info("No centroid for %d -- Skipping" % taz)
             continue
         
-        vertices_set = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, sourceVertex=centroid, endVertex=None, sourceLabel=0.0, includeVirtual=True,
+        labels, predVertices, vertices_set = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, sourceVertex=centroid, endVertex=None, sourceLabel=0.0, includeVirtual=True,
                                                                        maxLabel=5280.0/2.0, filterRoadLinkEvalStr="roadlink.getFacilityType() in [1,2,3,8]") #1,2,3,8
 
         dta.DtaLogger.debug("TAZ %d" % taz)
@@ -156,18 +156,18 @@ if __name__ == "__main__":
             continue
         for node in vertices_set:
 ##            dta.DtaLogger.debug("  Node %7d  Dist %10.3f  PrevNode %7d  stopids? %s" % 
-##                                (node.getId(), node.label, node.predVertex.getId() if node.predVertex else 0,
+##                                (node.getId(), labels[node], predVertices[node].getId() if predVertices[node] else 0,
 ##                                str(nodeid_to_stopidset[node.getId()]) if (node and node.getId() in nodeid_to_stopidset) else ""))
 
             if (node and node.getId() in nodeid_to_stopidset):
                 for nodestop in nodeid_to_stopidset[node.getId()]:
                     # ignore if further than a half mile
-                    if (node.label + nodestop[1])/(5280.0) > 0.5: continue
+                    if (labels[node] + nodestop[1])/(5280.0) > 0.5: continue
 
                     if (taz, nodestop[0]) not in access_links:
-                        access_links[(taz, nodestop[0])] = (node.label + nodestop[1])/(5280.0)
-                    elif (node.label + nodestop[1])/(5280.0) < access_links[(taz, nodestop[0])]:
-                        access_links[(taz, nodestop[0])] = (node.label + nodestop[1])/(5280.0)
+                        access_links[(taz, nodestop[0])] = (labels[node] + nodestop[1])/(5280.0)
+                    elif (labels[node] + nodestop[1])/(5280.0) < access_links[(taz, nodestop[0])]:
+                        access_links[(taz, nodestop[0])] = (labels[node] + nodestop[1])/(5280.0)
 
         if taz%100==0:  dta.DtaLogger.info("Processed %4d tazs" % taz)
     dta.DtaLogger.info( "%d\tAccess Links were generated\n" % (len(access_links)))
@@ -199,7 +199,7 @@ if __name__ == "__main__":
         dist_from_end   = (1.0-prop)*linklen
 
         # find transfer links from the startnode
-        vertices_set = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, sourceVertex=start_node, endVertex=None, sourceLabel=dist_from_start, includeVirtual=True,
+        labels, predVertices, vertices_set = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, sourceVertex=start_node, endVertex=None, sourceLabel=dist_from_start, includeVirtual=True,
                                                                        maxLabel=5280.0/4.0, filterRoadLinkEvalStr="roadlink.getFacilityType() in [1,2,3,8]") #1,2,3,8
         if len(vertices_set) != 0:
           for node in vertices_set:
@@ -207,16 +207,16 @@ if __name__ == "__main__":
             if (node and node.getId() in nodeid_to_stopidset):
                 for nodestop in nodeid_to_stopidset[node.getId()]:
 
-                    transfer_dist = (node.label + nodestop[1])/(5280.0)
+                    transfer_dist = (labels[node] + nodestop[1])/(5280.0)
                     if transfer_dist > 0.25:
                         continue
                     if (from_stop, nodestop[0]) not in transfer_links:
                         transfer_links[(from_stop, nodestop[0])] = transfer_dist
-                    elif (node.label + nodestop[1])/(5280.0) < transfer_links[(from_stop, nodestop[0])]:
+                    elif (labels[node] + nodestop[1])/(5280.0) < transfer_links[(from_stop, nodestop[0])]:
                         transfer_links[(from_stop, nodestop[0])] = transfer_dist
 
         # find transfer links from the endnode
-        vertices_set = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, sourceVertex=end_node, endVertex=None, sourceLabel=dist_from_end, includeVirtual=True,
+        labels, predVertices, vertices_set = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, sourceVertex=end_node, endVertex=None, sourceLabel=dist_from_end, includeVirtual=True,
                                                                        maxLabel=5280.0/4.0, filterRoadLinkEvalStr="roadlink.getFacilityType() in [1,2,3,8]") #1,2,3,8
         if len(vertices_set) != 0:
           for node in vertices_set:
@@ -224,7 +224,7 @@ if __name__ == "__main__":
             if (node and node.getId() in nodeid_to_stopidset):
                 for nodestop in nodeid_to_stopidset[node.getId()]:
 
-                    transfer_dist = (node.label + nodestop[1])/(5280.0)
+                    transfer_dist = (labels[node] + nodestop[1])/(5280.0)
                     if transfer_dist > 0.25:
                         continue
                     if (from_stop, nodestop[0]) not in transfer_links:
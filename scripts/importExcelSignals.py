@@ -1861,6 +1861,8 @@ if __name__ == "__main__":
     scenario.read(INPUT_DYNAMEQ_NET_DIR, INPUT_DYNAMEQ_NET_PREFIX) 
     net = dta.DynameqNetwork(scenario)
     net.read(INPUT_DYNAMEQ_NET_DIR, INPUT_DYNAMEQ_NET_PREFIX)
+    # classify all the movements at once rather than as they're mapped
+    net.computeTurnTypes()
     
     if MOVEMENT_TURN_OVERRIDES:
         overrides = []
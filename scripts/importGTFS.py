@@ -19,6 +19,7 @@ import datetime
 import dta
 import getopt
 import itertools
+import numpy
 import os
 import sys
 
@@ -50,7 +51,7 @@ def convertLongitudeLatitudeToXY(longitude,latitude):
     Converts longitude and latitude to an x,y coordinate pair in
     NAD83 Datum (most of our GIS and CUBE files)
     
-    Returns (x,y) in feet.
+    Returns (x,y) in feet.  *longitude* and *latitude* can also be arrays, for arrays of x and y.
     """
     FEET_TO_METERS = 0.3048006096012192
 
@@ -102,28 +103,44 @@ def stopOnWrongSide(roadlink, x, y, portion_along_link):
     
     
 
-def addStopIdToLinkToDict(stop, network, stopid_to_link):
+def snapStopsToLinks(stops, network):
     """
-    Maps the given *stop* (a :py:class:`transitfeed.stop` instance) to a link in 
-    the given *network* (a :py:class:`Network` instance).
+    Finds the candidate road links for all the given *stops* (a list of :py:class:`transitfeed.stop` instances)
+    in the given *network* (a :py:class:`Network` instance) at once, with :py:meth:`Network.snapPointsToRoadLinks`.
     
-    Sets the 6-tuple: ``(x, y, stopname, roadlink, distance, portion_along_link)`` into the 
-    *stopid_to_link* dictionary for the stop id key.  If something is already there, then this does nothing.
+    Returns a dictionary of stop id -> ``(x, y, closest_tuples)``, where *closest_tuples* is the list
+    of up to 6 ``(roadlink, distance, portion_along_link)`` tuples for the road links within QUICK_DIST
+    of the stop, sorted by distance.  For use with :py:func:`matchStopToLink`.
+    """
+    QUICK_DIST = 200 # feet
+    
+    (xs, ys) = convertLongitudeLatitudeToXY(numpy.array([stop['stop_lon'] for stop in stops], dtype=numpy.float64),
+                                            numpy.array([stop['stop_lat'] for stop in stops], dtype=numpy.float64))
+    (roadlinks, distances, ts) = network.snapPointsToRoadLinks(xs, ys, k=6, maxDist=QUICK_DIST)
+    
+    stopid_to_candidates = {}
+    for idx, stop in enumerate(stops):
+        closest_tuples = [(roadlinks[idx, col], distances[idx, col], ts[idx, col])
+                          for col in range(roadlinks.shape[1]) if roadlinks[idx, col] is not None]
+        stopid_to_candidates[stop['stop_id']] = (xs[idx], ys[idx], closest_tuples)
+    dta.DtaLogger.info("Snapped %d stops to the road links" % len(stops))
+    return stopid_to_candidates
+
+def matchStopToLink(stop, x, y, closest_tuples):
+    """
+    Maps the given *stop* (a :py:class:`transitfeed.stop` instance) at (*x*, *y*) to one of the 
+    road links in *closest_tuples* (see :py:func:`snapStopsToLinks`).
+    
+    Returns the 6-tuple: ``(x, y, stopname, roadlink, distance, portion_along_link)``.
+    For use as the match function of a :py:class:`dta.GTFSStopLinks` instance.
     
     The last three values will be None if no roadlink is found.
     """
     stop_id = stop['stop_id']
-    if stop_id in stopid_to_link: return
-    
-    QUICK_DIST = 200 # feet
-            
-    (x,y) = convertLongitudeLatitudeToXY(stop['stop_lon'], stop['stop_lat'])
-
-    closest_tuples = network.findNRoadLinksNearestCoords(x,y, n=6, quick_dist=QUICK_DIST)
     
     # none found - bummer!
     if len(closest_tuples) == 0:
-        stopid_to_link[stop_id] = (x, y, stop['stop_name'], None, None, None)
+        return (x, y, stop['stop_name'], None, None, None)
     else:
         # check if the stop name changes things
         stop_name_parts = stop['stop_name'].split(" ")
@@ -204,21 +221,18 @@ def addStopIdToLinkToDict(stop, network, stopid_to_link):
                                                                  closest_tuples[idx][0].getLabel(),
                                                                  scores[idx]))
 
-        stopid_to_link[stop['stop_id']] = (x,y,stop['stop_name'],
-                                           closest_tuples[max_score_idx][0],
-                                           closest_tuples[max_score_idx][1],
-                                           closest_tuples[max_score_idx][2])
-        
-    if len(stopid_to_link) % 500 == 0:
-        dta.DtaLogger.info("%5d stop ids mapped" % len(stopid_to_link))
+        return (x,y,stop['stop_name'],
+                closest_tuples[max_score_idx][0],
+                closest_tuples[max_score_idx][1],
+                closest_tuples[max_score_idx][2])
 
 def writeStopsShpFile(stopid_to_link, shapefilename):
     """
     Write stops to *shapefilename* for debugging.
     
     * *stoplist* is a list of transitfeed stops
-    * *stopid_to_link* is a map of { stopid -> (x, y, roadlink, distance, portion_along_link) }
-       from :py:func:`mapStopIdToLink`
+    * *stopid_to_link* is a map of { stopid -> (x, y, stopname, roadlink, distance, portion_along_link) }
+       from :py:meth:`dta.GTFSStopLinks.getStopIdToLink`
     
     """
     import shapefile
@@ -330,179 +344,171 @@ if __name__ == "__main__":
     output_file = open(output_filename,mode="w+")
     output_file.write(dta.TransitLine.getDynameqFileHeaderStr())
 
-    # iterate through the routes -- first, determine a sort order
-    route_list = schedule.GetRouteList()
-    route_labels = []
-    for route in route_list:
-        route_label = route['route_short_name'].strip() + " " + route['route_long_name'].strip()
-        route_labels.append(route_label)
-    
+    # index the trips by route label and service id once, and select the ones we'll import,
+    # sorted by route label
+    trip_index = dta.GTFSTripIndex(schedule)
+    selected_trips = []
+    for (route_label, route, trip, stoptimes) in trip_index.iterTripsWithStopTimes(service_period.service_id):
+        
+        line_departure = dta.Time.fromSeconds(stoptimes[0].GetTimeSecs())
+        
+        # Skip if it's not running during simulation time
+        if line_departure > scenario.endTime: continue
+        if line_departure < scenario.startTime: continue
+        
+        route_type_str = transitfeed.Route._ROUTE_TYPES[int(route['route_type'])]['name']
+        # for now, skip LRT because they run off-street and we don't handle that yet
+        if route_type_str == "Tram": continue
+        
+        selected_trips.append( (route_label, route, trip, stoptimes, line_departure, route_type_str) )
+    dta.DtaLogger.info("Selected %d trips running during the simulation" % len(selected_trips))
 
     # We could read the override file but we need this one
     #              rom Dir, From,        Over,        To Dir,    To St,          desig,    [permission],[lanes]
     overrides = [ ["EB",    "Market St","Sansome St","NB",      "Sansome St",   "LT",      "Transit"] ]
     net.setMovementTurnTypeOverrides(overrides)
     
+    # snap all the stops of the selected trips at once, before any link is split
+    stops = {}
+    for (route_label, route, trip, stoptimes, line_departure, route_type_str) in selected_trips:
+        for stoptime in stoptimes:
+            stops[stoptime.stop['stop_id']] = stoptime.stop
+    stopid_to_candidates = snapStopsToLinks(stops.values(), net)
+    
+    # the stop to link matches are kept across the phases; splitting a link moves the stops matched to it
+    # to the new links
+    stop_links = dta.GTFSStopLinks(net, lambda stop: matchStopToLink(stop, *stopid_to_candidates[stop['stop_id']]))
+    for stop in stops.itervalues():
+        stop_links.getMatch(stop)
+    
     # Do this in a two-phase way -- first, we have to do all of our split links
     # Then, we actually create the transit lines
     # If we create the transit lines as we go along, a line that causes a split link later in the
     # list will invalidate the transit lines that traversed that link already
     for phase in ["splitlink", "createtransit"]:
         
-        # iterate through the routes
-        stopid_to_link = {}  # we'll fill this twice. it feels wasteful but splitting links could invalidate some
-
         if phase == "createtransit":
             line_shp = defineLinesShpFile()  # do the shapefile during the createtransit phase
             line_shp_done = set()            # (route_label, trip_headsign)        
 
-        for route_label in sorted(route_labels):
+        for (route_label, route, trip, stoptimes, line_departure, route_type_str) in selected_trips:
             
-            # iterate through the trips and find those for this route
-            trip_list = schedule.GetTripList()
-            for trip in trip_list:
-                            
-                # skip if irrelevant service period
-                if trip['service_id'] != service_period.service_id: continue
-                route_id = trip['route_id']
-                route = schedule.GetRoute(route_id)
+            # create the transit line
+            route_id = trip['route_id']
+            label = "%s_%s_route%s_trip%s" % (route_label, trip['trip_headsign'], route_id, trip['trip_id'])
+            transit_line_id = int(trip['trip_id']) # try this even though they're not sequential
+                                    
+            dta.DtaLogger.debug("Processing %s (%s)" % (label, route_type_str))
+            
+            if phase == "createtransit":
+                dta_transit_line = dta.TransitLine(net, id=transit_line_id,
+                                                   label=label,
+                                                   litype=GTFS_ROUTE_TYPE_TO_LINE_TYPE[route_type_str],
+                                                   vtype=GTFS_ROUTE_TYPE_TO_VTYPE[route_type_str],
+                                                   stime=line_departure,
+                                                   level=0,
+                                                   active=dta.TransitLine.LINE_ACTIVE,
+                                                   hway=60*6, #run once -- make this cleaner
+                                                   dep=1)
+                                                           
+            prev_roadlink = None
+            prev_stopid   = None
+            for stoptime in stoptimes:
                 
-                # only do the trips for the given route_label
-                trip_route_label = route['route_short_name'].strip() + " " + route['route_long_name'].strip()
-                if trip_route_label != route_label: continue
-        
-                # create the transit line
-                label = "%s_%s_route%s_trip%s" % (route_label, trip['trip_headsign'], route_id, trip['trip_id'])
-                transit_line_id = int(trip['trip_id']) # try this even though they're not sequential
-                stoptimes = trip.GetStopTimes()
-                line_departure = dta.Time.fromSeconds(stoptimes[0].GetTimeSecs())
+                stopid = stoptime.stop['stop_id']
+                
+                # curious - not sure why this should happen but it does with Trip 5141123 Stop 5245
+                if stopid == prev_stopid: continue
                 
-                # Skip if it's not running during simulation time
-                if line_departure > scenario.endTime: continue
-                if line_departure < scenario.startTime: continue
+                stop_roadlink = stop_links.getMatch(stoptime.stop)[3]
                 
-                route_type_str = transitfeed.Route._ROUTE_TYPES[int(route['route_type'])]['name']
-                # for now, skip LRT because they run off-street and we don't handle that yet
-                if route_type_str == "Tram": continue
-                                        
-                dta.DtaLogger.debug("Processing %s (%s)" % (label, route_type_str))
+                if stop_roadlink == None:
+                    # todo handle this better
+                    continue
                 
-                if phase == "createtransit":
-                    dta_transit_line = dta.TransitLine(net, id=transit_line_id,
-                                                       label=label,
-                                                       litype=GTFS_ROUTE_TYPE_TO_LINE_TYPE[route_type_str],
-                                                       vtype=GTFS_ROUTE_TYPE_TO_VTYPE[route_type_str],
-                                                       stime=line_departure,
-                                                       level=0,
-                                                       active=dta.TransitLine.LINE_ACTIVE,
-                                                       hway=60*6, #run once -- make this cleaner
-                                                       dep=1)
-                                                               
-                prev_roadlink = None
-                prev_stopid   = None
-                for stoptime in stoptimes:
+                # split link phase: split if the previous stop's roadlink is the same as
+                # this stop's road link
+                if phase == "splitlink" and prev_roadlink == stop_roadlink:
+                    fraction = 0.5*(stop_links.getMatchForStopId(prev_stopid)[5] + stop_links.getMatchForStopId(stopid)[5])
+                    dta.DtaLogger.debug("Two stops (%s %s) on trip %s on link %d (%d-%d)! splitting @ %f  shapepoints=%d" % 
+                                        (prev_stopid, stopid, label,
+                                         prev_roadlink.getId(), 
+                                         prev_roadlink.getStartNode().getId(), 
+                                         prev_roadlink.getEndNode().getId(),
+                                         fraction, prev_roadlink.getNumShapePoints()))
+                    dta.DtaLogger.debug("Old link centerline = %s" % str(stop_roadlink.getCenterLine(wholeLineShapePoints = True)))
                     
-                    stopid = stoptime.stop['stop_id']
+                    # split the link
+                    start_node  = stop_roadlink.getStartNode()
+                    end_node    = stop_roadlink.getEndNode()
+                    midnode     = stop_links.splitLink(stop_roadlink, fraction=fraction, splitReverseLink=True)
                     
-                    # curious - not sure why this should happen but it does with Trip 5141123 Stop 5245
-                    if stopid == prev_stopid: continue
+                    # the previous stop is on the first half and this one on the second half
+                    prev_roadlink = net.getLinkForNodeIdPair(start_node.getId(), midnode.getId())
+                    stop_links.setRoadLink(prev_stopid, prev_roadlink)
+                    stop_roadlink = net.getLinkForNodeIdPair(midnode.getId(), end_node.getId())
+                    stop_links.setRoadLink(stopid, stop_roadlink)
                     
-                    addStopIdToLinkToDict(stoptime.stop, net, stopid_to_link) # lazy updating
-                    stop_roadlink = stopid_to_link[stopid][3]
+                    dta.DtaLogger.debug("New links are %d and %d" % (prev_roadlink.getId(), stop_roadlink.getId()))
+                    dta.DtaLogger.debug("  centerline for %d (%d): %s" %
+                                        (prev_roadlink.getId(), prev_roadlink.getNumShapePoints(),
+                                         str(prev_roadlink.getCenterLine(wholeLineShapePoints = True))))
+                    dta.DtaLogger.debug("  centerline for %d (%d): %s" %
+                                        (stop_roadlink.getId(), stop_roadlink.getNumShapePoints(),
+                                         str(stop_roadlink.getCenterLine(wholeLineShapePoints = True))))
                     
-                    if stop_roadlink == None:
-                        # todo handle this better
-                        continue
+                # createtransit phase: connect this stoplink from previous stoplink
+                if phase == "createtransit" and prev_roadlink:
                     
-                    # split link phase: split if the previous stop's roadlink is the same as
-                    # this stop's road link
-                    if phase == "splitlink" and prev_roadlink == stop_roadlink:
-                        fraction = 0.5*(stopid_to_link[prev_stopid][5] + stopid_to_link[stopid][5])
-                        dta.DtaLogger.debug("Two stops (%s %s) on trip %s on link %d (%d-%d)! splitting @ %f  shapepoints=%d" % 
-                                            (prev_stopid, stopid, label,
-                                             prev_roadlink.getId(), 
-                                             prev_roadlink.getStartNode().getId(), 
-                                             prev_roadlink.getEndNode().getId(),
-                                             fraction, prev_roadlink.getNumShapePoints()))
-                        dta.DtaLogger.debug("Old link centerline = %s" % str(stop_roadlink.getCenterLine(wholeLineShapePoints = True)))
-                        
-                        # split the link
-                        start_node  = stop_roadlink.getStartNode()
-                        end_node    = stop_roadlink.getEndNode()
-                        midnode     = net.splitLink(linkToSplit=stop_roadlink,splitReverseLink=True, fraction=fraction)
-                        # the prev_roadlink is now the first half - update that one
-                        prev_roadlink = net.getLinkForNodeIdPair(start_node.getId(), midnode.getId())
-                        old_tuple     = stopid_to_link[prev_stopid]
-                        new_distinfo  = prev_roadlink.getDistanceFromPoint(old_tuple[0], old_tuple[1])
-                        # update (x, y, stopname, roadlink, distance, portion_along_link)
-                        stopid_to_link[prev_stopid] = (old_tuple[0], old_tuple[1], old_tuple[2],
-                                                       prev_roadlink, new_distinfo[0], new_distinfo[1])
-                        
-                        # associate this one to the second half
-                        stop_roadlink = net.getLinkForNodeIdPair(midnode.getId(), end_node.getId())
-                        old_tuple     = stopid_to_link[stopid]
-                        new_distinfo  = stop_roadlink.getDistanceFromPoint(old_tuple[0], old_tuple[1])
-                        stopid_to_link[stopid] = (old_tuple[0], old_tuple[1], old_tuple[2],
-                                                  stop_roadlink, new_distinfo[0], new_distinfo[1])
-                        
-                        dta.DtaLogger.debug("New links are %d and %d" % (prev_roadlink.getId(), stop_roadlink.getId()))
-                        dta.DtaLogger.debug("  centerline for %d (%d): %s" %
-                                            (prev_roadlink.getId(), prev_roadlink.getNumShapePoints(),
-                                             str(prev_roadlink.getCenterLine(wholeLineShapePoints = True))))
-                        dta.DtaLogger.debug("  centerline for %d (%d): %s" %
-                                            (stop_roadlink.getId(), stop_roadlink.getNumShapePoints(),
-                                             str(stop_roadlink.getCenterLine(wholeLineShapePoints = True))))
-                        
-                    # createtransit phase: connect this stoplink from previous stoplink
-                    if phase == "createtransit" and prev_roadlink:
-                        
-                        if prev_roadlink == stop_roadlink:
-                            error = "create transit but two stops (%s %s) on trip %s are still on the same link %d (%d-%d)" % \
-                                    (prev_stopid, stopid, label,
-                                     prev_roadlink.getId(), prev_roadlink.getStartNode().getId(), prev_roadlink.getEndNode().getId())
-                            dta.DtaLogger.fatal(error)
-                            raise dta.DtaError(error)
-                        
-                        # shortest path connecting stop links
-                        try:
+                    if prev_roadlink == stop_roadlink:
+                        error = "create transit but two stops (%s %s) on trip %s are still on the same link %d (%d-%d)" % \
+                                (prev_stopid, stopid, label,
+                                 prev_roadlink.getId(), prev_roadlink.getStartNode().getId(), prev_roadlink.getEndNode().getId())
+                        dta.DtaLogger.fatal(error)
+                        raise dta.DtaError(error)
+                    
+                    # shortest path connecting stop links
+                    try:
+                        labels, predVertices, labeledVertices = \
                             dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, 
-                                                                            prev_roadlink.getEndNode(), 
-                                                                            stop_roadlink.getStartNode())
-                            path_nodes = dta.ShortestPaths.getShortestPathBetweenNodes(prev_roadlink.getEndNode(), 
-                                                                                       stop_roadlink.getStartNode())
-            
-                        except:
-                            dta.DtaLogger.error("Error: %s" % str(sys.exc_info()))
-                            dta.DtaLogger.error("route %-25s No shortest path found from %d to %d" %
-                                               (label, prev_roadlink.getEndNode().getId(), stop_roadlink.getStartNode().getId()))
-                            continue
-                        
-                        node_num_list = [ prev_roadlink.getEndNode().getId() ]
-                        for path_node_A, path_node_B in itertools.izip(path_nodes, path_nodes[1:]):
-                            node_num_list.append(path_node_B.getId())
-                            newlink = net.getLinkForNodeIdPair(path_node_A.getId(), path_node_B.getId())
-                            newseg  = dta_transit_line.addSegment(newlink, 0, label="nostop")
-        
-                    # add this link
-                    if phase == 'createtransit':
-                        dta_transit_line.addSegment(stop_roadlink,
-                                                    label="%s,%5.4f" % (stopid, stopid_to_link[stopid][5]),
-                                                    lane=dta.TransitSegment.TRANSIT_LANE_UNSPECIFIED,
-                                                    dwell=15, # todo: put in a better default
-                                                    stopside=dta.TransitSegment.STOP_OUTSIDE)
-                    prev_roadlink = stop_roadlink
-                    prev_stopid   = stopid
+                                                                        prev_roadlink.getEndNode(), 
+                                                                        stop_roadlink.getStartNode())
+                        path_nodes = dta.ShortestPaths.getShortestPathBetweenNodes(prev_roadlink.getEndNode(), 
+                                                                                   stop_roadlink.getStartNode(),
+                                                                                   predVertices)
         
-                # check if the movements are allowed
-                if phase=="createtransit":
-                    dta_transit_line.checkMovementsAreAllowed(enableMovement=True)
+                    except:
+                        dta.DtaLogger.error("Error: %s" % str(sys.exc_info()))
+                        dta.DtaLogger.error("route %-25s No shortest path found from %d to %d" %
+                                           (label, prev_roadlink.getEndNode().getId(), stop_roadlink.getStartNode().getId()))
+                        continue
                     
-                    output_file.write(dta_transit_line.getDynameqStr())
+                    node_num_list = [ prev_roadlink.getEndNode().getId() ]
+                    for path_node_A, path_node_B in itertools.izip(path_nodes, path_nodes[1:]):
+                        node_num_list.append(path_node_B.getId())
+                        newlink = net.getLinkForNodeIdPair(path_node_A.getId(), path_node_B.getId())
+                        newseg  = dta_transit_line.addSegment(newlink, 0, label="nostop")
+    
+                # add this link
+                if phase == 'createtransit':
+                    dta_transit_line.addSegment(stop_roadlink,
+                                                label="%s,%5.4f" % (stopid, stop_links.getMatchForStopId(stopid)[5]),
+                                                lane=dta.TransitSegment.TRANSIT_LANE_UNSPECIFIED,
+                                                dwell=15, # todo: put in a better default
+                                                stopside=dta.TransitSegment.STOP_OUTSIDE)
+                prev_roadlink = stop_roadlink
+                prev_stopid   = stopid
+    
+            # check if the movements are allowed
+            if phase=="createtransit":
+                dta_transit_line.checkMovementsAreAllowed(enableMovement=True)
                 
-                    # only once per (route_label, trip_headsign)
-                    if (route_label, trip['trip_headsign']) not in line_shp_done:
-                        writeLineToShapefile(line_shp, dta_transit_line)
-                        line_shp_done.add( (route_label, trip['trip_headsign']) )
+                output_file.write(dta_transit_line.getDynameqStr())
+            
+                # only once per (route_label, trip_headsign)
+                if (route_label, trip['trip_headsign']) not in line_shp_done:
+                    writeLineToShapefile(line_shp, dta_transit_line)
+                    line_shp_done.add( (route_label, trip['trip_headsign']) )
 
         if phase=="splitlink" and OUTPUT_LINK_SHAPEFILE:
             net.writeLinksToShp(OUTPUT_LINK_SHAPEFILE)
@@ -518,4 +524,4 @@ if __name__ == "__main__":
     dta.DtaLogger.info("Wrote GTFS lines to shapefile sf_gtfs_lines.shp")
     
     if OUTPUT_STOP_SHAPEFILE:
-        writeStopsShpFile(stopid_to_link, OUTPUT_STOP_SHAPEFILE)
+        writeStopsShpFile(stop_links.getStopIdToLink(), OUTPUT_STOP_SHAPEFILE)
@@ -109,83 +109,12 @@ if __name__ == "__main__":
     DtaLogger.info("Reading 5-minute movement counts")
     net.readObsMovementCounts(COUNT_DIR + "/" + MOVEMENT_COUNT_FILE_5MIN)
 
-    # print 15-minute link counts           
+    # print the link and movement counts vs the simulated volumes
+    report = dta.ResultsReport(net, reportingTimeStep)
     DtaLogger.info("Writing %d-minute link counts" % reportingTimeStep)
-        
-    # start with the header
-    outputStream = open(LINK_OUT_FILE, "w") 
-    outputStream.write("LinkID,Label,FacilityType,FreeflowSpeed,NumLanes,StartTime,EndTime,CountVolume,ModelVolume\n")
-        
-    # now loop through all links that have a count    
-    for link in net.iterRoadLinks():     
-        if not (link.hasCountInfo() or link.hasMovementCountInfo()):
-            continue
-          
-        # writes once every specified interval minutes interval, aggregating  to specified min intervals   
-        for sTime in range(simStartTime, simEndTime-1, simTimeStep):
-            if sTime + reportingTimeStep >= simEndTime:
-                continue
-
-            # first try writing any link counts
-            if link.hasObsCount(sTime, sTime + reportingTimeStep):   
-                outputStream.write("%d," % link.getId())
-                outputStream.write("%s," % link.getLabel())
-                outputStream.write("%d," % link.getFacilityType())
-                outputStream.write("%d," % link.getFreeFlowSpeedInMPH())
-                outputStream.write("%d," % link.getNumLanes())
-                outputStream.write("%s," % Time.fromMinutes(sTime))
-                outputStream.write("%s," % Time.fromMinutes(sTime + reportingTimeStep))
-                outputStream.write("%d," % link.getObsCount(sTime, sTime + reportingTimeStep))         
-                outputStream.write("%d\n" % link.getSimOutVolume(sTime, sTime + reportingTimeStep))
-            # then try summing the movement counts
-            elif link.hasAllMovementCounts(sTime, sTime + reportingTimeStep): 
-                outputStream.write("%d," % link.getId())
-                outputStream.write("%s," % link.getLabel())
-                outputStream.write("%d," % link.getFacilityType())
-                outputStream.write("%d," % link.getFreeFlowSpeedInMPH())
-                outputStream.write("%d," % link.getNumLanes())
-                outputStream.write("%s," % Time.fromMinutes(sTime))
-                outputStream.write("%s," % Time.fromMinutes(sTime + reportingTimeStep))
-                outputStream.write("%d," % link.getSumOfAllMovementCounts(sTime, sTime + reportingTimeStep))         
-                outputStream.write("%d\n" % link.getSimOutVolume(sTime, sTime + reportingTimeStep))
-                          
-    outputStream.close()
-        
-    # print 15-minute movement counts               
+    report.writeLinkCountsVsVolumes(LINK_OUT_FILE)
     DtaLogger.info("Writing %d-minute movement counts" % reportingTimeStep)
-    
-    # start with the header
-    outputStream = open(MOVEMENT_OUT_FILE, "w") 
-    outputStream.write("LinkID,OutoingLinkID,Label,OutgoingLinkLabel,FacilityType,FreeflowSpeed,NumLanes,StartNode,AtNode,EndNode,TurnType,StartTime,EndTime,CountVolume,ModelVolume\n")
-        
-    # now loop through all movements that have a count    
-    for link in net.iterRoadLinks():
-        for mov in link.iterOutgoingMovements():
-            if not mov.hasCountInfo():
-                continue
-                
-            # writes once every specified minutes interval, aggregating to specified min intervals   
-            for sTime in range(simStartTime, simEndTime-1, simTimeStep):
-                if sTime + reportingTimeStep >= simEndTime:
-                    continue
-                if mov.hasObsCount(sTime, sTime + reportingTimeStep):                               
-                    outputStream.write("%d," % link.getId())
-                    outputStream.write("%d," % mov.getOutgoingLink().getId())
-                    outputStream.write("%s," % link.getLabel())
-                    outputStream.write("%s," % mov.getOutgoingLink().getLabel())
-                    outputStream.write("%d," % link.getFacilityType())
-                    outputStream.write("%d," % link.getFreeFlowSpeedInMPH())
-                    outputStream.write("%d," % link.getNumLanes())
-                    outputStream.write("%d," % mov.getStartNodeId())
-                    outputStream.write("%d," % mov.getAtNode().getId())
-                    outputStream.write("%d," % mov.getEndNodeId())
-                    outputStream.write("%s," % mov.getTurnType())
-                    outputStream.write("%s," % Time.fromMinutes(sTime))
-                    outputStream.write("%s," % Time.fromMinutes(sTime + reportingTimeStep))
-                    outputStream.write("%d," % mov.getObsCount(sTime, sTime + reportingTimeStep))
-                    outputStream.write("%d\n" % mov.getSimOutVolume(sTime, sTime + reportingTimeStep))
-    
-    outputStream.close()         
+    report.writeMovementCountsVsVolumes(MOVEMENT_OUT_FILE)
  
     # write the shape file   
     DtaLogger.info("Writing shape files")  
@@ -197,35 +126,16 @@ if __name__ == "__main__":
     # write out the total volume on all links  
     DtaLogger.info("Writing total volumes")    
     
-    # start with the header
-    outputStream = open(LINK_VOLUME_FILE_TOTAL, "w") 
-    outputStream.write("ANode,BNode,LinkID,LengthInMiles,Label,FacilityType,FreeflowSpeed,NumLanes,StartTime,EndTime,ModelVolume,TravelTime,ModelVolume4to6,ModelVolume5to6\n")
-
     reportStartTime = Time.readFromString(START_TIME).getMinutes()
     reportEndTime = Time.readFromString(END_TIME).getMinutes()
         
-    # now loop through all links 
-    for link in net.iterRoadLinks():
-        outputStream.write("%d," % link.getStartNode().getId())
-        outputStream.write("%d," % link.getEndNode().getId())
-        outputStream.write("%d," % link.getId())
-        outputStream.write("%f," % link.getLength())
-        outputStream.write("%s," % link.getLabel())
-        outputStream.write("%d," % link.getFacilityType())
-        outputStream.write("%d," % link.getFreeFlowSpeedInMPH())
-        outputStream.write("%d," % link.getNumLanes())
-        outputStream.write("%s," % Time.fromMinutes(reportStartTime))
-        outputStream.write("%s," % Time.fromMinutes(reportEndTime))
-        outputStream.write("%d," % link.getSimOutVolume(reportStartTime, reportEndTime))
-        outputStream.write("%f," % link.getSimTTInMin(reportStartTime, reportEndTime))
-        outputStream.write("%d," % link.getSimOutVolume(7*60, 9*60))
-        outputStream.write("%d\n" % link.getSimOutVolume(8*60, 9*60))
+    report.writeLinkVolumes(LINK_VOLUME_FILE_TOTAL, reportStartTime, reportEndTime,
+                            [("ModelVolume4to6", 7*60, 9*60), ("ModelVolume5to6", 8*60, 9*60)])
 
     # done in a separate script
     #link1 = gearyWBStart = net.getLinkForId(18394)
     #link2 = gearyWBEnd = net.getLinkForId(27449)
-    #dta.Algorithms.ShortestPaths.initializeMovementCostsWithLength(net) 
-    #pathLinks = dta.Algorithms.ShortestPaths.getShortestPathBetweenLinks(net, link1, link2, runSP=True)
+    #pathLinks = dta.Algorithms.ShortestPaths.getShortestPathBetweenLinks(net, link1, link2)
     #path = dta.Path(net, "test", pathLinks)    
     #volumesVsCounts = dta.CorridorPlots.CountsVsVolumes(net, path, False)
     #
@@ -17,7 +17,9 @@ __license__     = """
 """
 
 import os
+import sys
 import nose 
+import numpy as np
 from itertools import izip
 
 import dta
@@ -29,7 +31,7 @@ from dta.DynameqNetwork import DynameqNetwork
 
 from dta.Utils import *
 
-from dta.Algorithms import dfs, hasPath, getConvexHull, \
+from dta.Algorithms import dfs, hasPath, getMetaGraph, ReachabilityIndex, getConvexHull, \
     getConvexHull2, getTightHull, getConvexHull3, pairwise, isPointInPolygon, getConvexHullGrahamScan, getContainingPolygon
 
 dta.VehicleType.LENGTH_UNITS= "feet"
@@ -56,9 +58,10 @@ class TestAlgorithms:
         net = getTestNet()
         root = net.getNodeForId(9)
 
-        dfs(net, root)
+        pre, post, pred = dfs(net, root)
 
-        assert root.pred == None
+        assert pred[root] == None
+        assert len(pre) == len(post) == net.getNumNodes()
 
         assert hasPath(net, root, net.getNodeForId(26520))
         assert not hasPath(net, root, net.getNodeForId(66))
@@ -67,6 +70,200 @@ class TestAlgorithms:
         #for node in sorted(net.iterNodes(), key=lambda n:n.getId()):
         #    print node.getId(), node.visited, node.pre, node.post
 
+    def test_reachabilityIndex(self):
+
+        net = getTestNet()
+
+        nodeToMetaNode, metaNodeSuccessors = getMetaGraph(net)
+        assert len(nodeToMetaNode) == net.getNumNodes()
+        for node in net.iterNodes():
+            for downNode in node.iterDownstreamNodes():
+                assert nodeToMetaNode[downNode] <= nodeToMetaNode[node]
+                if nodeToMetaNode[downNode] != nodeToMetaNode[node]:
+                    assert nodeToMetaNode[downNode] in metaNodeSuccessors[nodeToMetaNode[node]]
+
+        index = ReachabilityIndex(net)
+        assert index.getNumMetaNodes() == len(metaNodeSuccessors)
+
+        root = net.getNodeForId(9)
+        assert index.hasPath(root, net.getNodeForId(26520))
+        assert not index.hasPath(root, net.getNodeForId(66))
+
+        nodes = sorted(net.iterNodes(), key=lambda node: node.getId())[::10]
+        matrix = index.getReachabilityMatrix(nodes, nodes[::3])
+        assert matrix.shape == (len(nodes), len(nodes[::3]))
+        for i, origin in enumerate(nodes):
+            for j, destination in enumerate(nodes[::3]):
+                assert matrix[i, j] == hasPath(net, origin, destination) == index.hasPath(origin, destination)
+
+    def test_labelSettingWithLabelsOnNodes(self):
+
+        net = getTestNet()
+        root = net.getNodeForId(24422)
+
+        labels, predVertices, labeled = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, root, None)
+
+        assert len(labeled) == net.getNumRoadNodes()
+        assert labels[root] == 0.0
+        for node in labeled:
+            if node == root: continue
+            link = net.getLinkForNodeIdPair(predVertices[node].getId(), node.getId())
+            assert abs(labels[node] - (labels[predVertices[node]] + link.euclideanLength(includeShape=True))) < 0.001
+            # no outgoing edge of a labeled node can improve a label
+            for edge in node.iterOutgoingLinks():
+                if edge.isVirtualLink() or edge.getEndNode().isVirtualNode(): continue
+                assert labels[edge.getEndNode()] <= labels[node] + edge.euclideanLength(includeShape=True) + 0.001
+
+        # early termination stops at the end vertex, with the same label
+        endNode = max(labeled, key=lambda node: labels[node])
+        endLabel = labels[endNode]
+        subsetLabels, subsetPredVertices, subset = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, root, endNode)
+        assert endNode in subset
+        assert len(subset) <= len(labeled)
+        assert abs(subsetLabels[endNode] - endLabel) < 0.001
+        path = dta.ShortestPaths.getShortestPathBetweenNodes(root, endNode, subsetPredVertices)
+        assert path[0] == root and path[-1] == endNode
+
+        # labels beyond maxLabel are not set
+        limitedLabels, limitedPredVertices, limited = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, root, None, maxLabel=endLabel)
+        assert len([node for node in limited if limitedLabels[node] > endLabel]) <= 1
+
+    def test_labelCorrectingOnSnapshot(self):
+
+        net = getTestNet()
+        snapshot = net.buildGraphSnapshot()
+
+        assert snapshot.getNumNodes() == net.getNumNodes()
+        assert snapshot.getNumLinks() == net.getNumLinks()
+        assert snapshot.getNumMovements() == len(list(net.iterMovements()))
+
+        movementCosts = dta.ShortestPaths.initializeMovementCostsWithLength(net)
+        snapshot.setMovementCostsWithLength()
+
+        sourceLink = net.getLinkForNodeIdPair(26497, 26503)
+        linkLabels, predEdges = dta.ShortestPaths.labelCorrectingWithLabelsOnLinks(net, sourceLink, movementCosts)
+        labels, predLinks = dta.ShortestPaths.labelCorrectingOnSnapshot(snapshot, snapshot.getLinkIndex(sourceLink.getId()))
+
+        for link in net.iterLinks():
+            linkIndex = snapshot.getLinkIndex(link.getId())
+            if linkLabels[link] == sys.maxint:
+                assert labels[linkIndex] == float("inf")
+                assert predLinks[linkIndex] == -1
+            else:
+                assert abs(labels[linkIndex] - linkLabels[link]) < 0.00001
+
+        destLinkIndex = int(np.argmax(np.where(np.isinf(labels), -1, labels)))
+        path = snapshot.getLinkPath(predLinks, snapshot.getLinkIndex(sourceLink.getId()), destLinkIndex)
+        assert path[0] == sourceLink
+        assert path[-1] == snapshot.getLink(destLinkIndex)
+        for upLink, downLink in izip(path, path[1:]):
+            assert upLink.getOutgoingMovementForLinkId(downLink.getId())
+
+    def test_labelSettingOnSnapshot(self):
+
+        net = getTestNet()
+        snapshot = net.buildGraphSnapshot()
+        root = net.getNodeForId(24422)
+        rootIndex = snapshot.getNodeIndex(root.getId())
+
+        nodeLabels, predVertices, labeled = dta.ShortestPaths.labelSettingWithLabelsOnNodes(net, root, None)
+        labels, predLinks, settled = dta.ShortestPaths.labelSettingOnSnapshot(snapshot, rootIndex)
+
+        assert set(snapshot.getNode(nodeIndex) for nodeIndex in settled) == labeled
+        for node in labeled:
+            assert abs(labels[snapshot.getNodeIndex(node.getId())] - nodeLabels[node]) < 0.001
+
+        endNode = snapshot.getNode(settled[-1])
+        nodePath = snapshot.getNodePath(predLinks, rootIndex, settled[-1])
+        assert nodePath == dta.ShortestPaths.getShortestPathBetweenNodes(root, endNode, predVertices)
+
+        # early termination
+        labels2, predLinks2, settled2 = dta.ShortestPaths.labelSettingOnSnapshot(snapshot, rootIndex, endNodeIndex=settled[10])
+        assert settled2 == settled[:11]
+
+    def test_getCentroidSkims(self):
+
+        net = getTestNet()
+        snapshot = net.buildGraphSnapshot()
+        timeLabels = [Time(0, 15), Time(0, 30)]
+        costSkim, distanceSkim = dta.ShortestPaths.getCentroidSkims(net, timeLabels, snapshot=snapshot)
+
+        centroidIds, sourcePtr, sourceLinks, sinkPtr, sinkLinks = snapshot.getCentroidAccessLinks()
+        assert costSkim.getShape() == (2, net.getNumCentroids(), net.getNumCentroids())
+        assert costSkim.getElementsOfDimention(1) == tuple(sorted(c.getId() for c in net.iterCentroids()))
+
+        movementCosts = dta.ShortestPaths.initialiseMovementCostsWithFFTT(net)
+        numChecked = 0
+        for origIndex, origId in enumerate(centroidIds):
+            if sourcePtr[origIndex + 1] - sourcePtr[origIndex] != 1: continue
+            sourceLink = snapshot.getLink(sourceLinks[sourcePtr[origIndex]])
+            linkLabels, predEdges = dta.ShortestPaths.labelCorrectingWithLabelsOnLinks(net, sourceLink, movementCosts)
+
+            for destIndex, destId in enumerate(centroidIds):
+                if destIndex == origIndex: continue
+                best = float("inf")
+                for sinkLink in sinkLinks[sinkPtr[destIndex]:sinkPtr[destIndex + 1]]:
+                    link = snapshot.getLink(sinkLink)
+                    if linkLabels[link] == sys.maxint: continue
+                    best = min(best, linkLabels[link] + link.getFreeFlowTTInMin())
+                if best == float("inf"):
+                    assert costSkim[timeLabels[0], origId, destId] == best
+                else:
+                    assert abs(costSkim[timeLabels[0], origId, destId] - best) < 0.00001
+                assert costSkim[timeLabels[1], origId, destId] == costSkim[timeLabels[0], origId, destId]
+                numChecked += 1
+
+        assert numChecked > 0
+        assert costSkim[timeLabels[0], centroidIds[0], centroidIds[0]] == 0
+        assert distanceSkim[timeLabels[0], centroidIds[0], centroidIds[1]] > 0
+
+        # time varying costs: double the costs in the second period
+        movementCosts = np.vstack([snapshot.movementCost, 2 * snapshot.movementCost])
+        costSkim2, distanceSkim2 = dta.ShortestPaths.getCentroidSkims(net, timeLabels, snapshot=snapshot, movementCosts=movementCosts)
+        assert np.all(costSkim2.getNumpyArray()[0] == costSkim.getNumpyArray()[0])
+        assert np.all(costSkim2.getNumpyArray()[1] >= costSkim.getNumpyArray()[1])
+
+    def test_timeDependentLabelCorrectingOnSnapshot(self):
+
+        net = getTestNet()
+        snapshot = net.buildGraphSnapshot()
+        sourceLinkIndex = snapshot.getLinkIndex(net.getLinkForNodeIdPair(26497, 26503).getId())
+        departures = [0, 5, 10, 15, 20]
+
+        # constant costs give the static labels for every departure time
+        staticLabels, staticPredLinks = dta.ShortestPaths.labelCorrectingOnSnapshot(snapshot, sourceLinkIndex)
+        costs = snapshot.getTimeVaryingMovementCosts(0, 30, 15)
+        assert costs.shape == (2, snapshot.getNumMovements())
+        labels, predLinks = dta.ShortestPaths.timeDependentLabelCorrectingOnSnapshot(snapshot, sourceLinkIndex, departures, costs, 0, 15)
+        assert labels.shape == (len(departures), snapshot.getNumLinks())
+        for row in labels:
+            assert np.all(np.isinf(row) == np.isinf(staticLabels))
+            reachable = np.isfinite(row)
+            assert np.all(np.abs(row[reachable] - staticLabels[reachable]) < 0.00001)
+
+        # costs that drop between periods: arrival times still increase with the departure time (FIFO)
+        costs = np.vstack([10 * snapshot.movementCost + 1, snapshot.movementCost])
+        labels, predLinks = dta.ShortestPaths.timeDependentLabelCorrectingOnSnapshot(snapshot, sourceLinkIndex, departures, costs, 0, 15)
+        arrivals = labels + np.array(departures, dtype=np.float64)[:, np.newaxis]
+        reachable = np.isfinite(arrivals[0])
+        assert np.all(np.diff(arrivals[:, reachable], axis=0) >= -0.00001)
+        assert np.all(labels[-1, reachable] <= labels[0, reachable] + 0.00001)
+
+        destLinkIndex = int(np.argmax(np.where(reachable, labels[0], -1)))
+        path = snapshot.getLinkPath(predLinks[0], sourceLinkIndex, destLinkIndex)
+        assert path[-1] == snapshot.getLink(destLinkIndex)
+        for upLink, downLink in izip(path, path[1:]):
+            assert upLink.getOutgoingMovementForLinkId(downLink.getId())
+
+        # movements with time varying costs
+        movIndex = snapshot.linkMovementPtr[sourceLinkIndex]
+        mov = snapshot.getMovement(movIndex)
+        mov.simStartTimeInMin = 0
+        mov.setTimeVaryingCosts([1.0, 2.0], 15)
+        costs = snapshot.getTimeVaryingMovementCosts(0, 30, 15)
+        assert costs[0, movIndex] == 1.0 and costs[1, movIndex] == 2.0
+        assert costs[1, movIndex + 1] == snapshot.movementCost[movIndex + 1]
+
     def test_reverse(self):
 
         net = getTestNet()
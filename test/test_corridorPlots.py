@@ -76,7 +76,6 @@ def getGearySubNet():
             for start, end in izip(range(0, 60, 15), range(15, 61, 15)):
                 mov.setSimOutVolume(start, end, random.randint(20, 50))
                 mov.setSimInVolume(start, end, random.randint(20, 50))
-                mov.cost = link.euclideanLength()
                 randInt = random.randint(2,4) 
                 tt = mov.getFreeFlowTTInMin() * float(randInt)
                 mov.setSimTTInMin(start, end, tt)
@@ -154,7 +153,7 @@ class TestCorridorPlots:
         link1 = net.getLinkForId(14834)
         link2 = net.getLinkForId(14539)
         
-        pathLinks = dta.Algorithms.ShortestPaths.getShortestPathBetweenLinks(net, link1, link2, runSP=True)
+        pathLinks = dta.Algorithms.ShortestPaths.getShortestPathBetweenLinks(net, link1, link2)
 
         path = dta.Path(net, "test", pathLinks)
         print [link.getId() for link in pathLinks]
@@ -20,6 +20,8 @@ import dta
 import os
 import pdb
 import random
+import shutil
+import tempfile
 
 import nose.tools 
 import numpy as np
@@ -133,6 +135,166 @@ class TestDemand:
         assert demand.getValue(Time(8, 0), 2, 6) == 1000
         assert demand.getValue(Time(8, 0), 6, 2) == 4000
 
+    def test_readCubeDemandInBulk(self):
+
+        fileName = os.path.join(os.path.dirname(__file__), "cubeDemandTest.csv")
+        outputStream = open(fileName, "w")
+        outputStream.write("O,D,TRUCK,AUTO\n"
+                           "2,6,5,100\n"
+                           "2,6,1,20\n"
+                           "3,3,0,40\n"
+                           "9999,2,0,7\n"
+                           "2,9999,0,8\n"
+                           "4,2,0,0\n")
+        outputStream.close()
+
+        net = getTestNet()
+        demand = Demand.readCubeODTable(fileName, net, "AUTO", Time(7,0), Time(8, 0), Time(0, 30), 0.5)
+        sparseDemand = Demand.readCubeODTable(fileName, net, "AUTO", Time(7,0), Time(8, 0), Time(0, 30), 0.5, sparse=True)
+        os.remove(fileName)
+        assert sparseDemand == demand
+
+        assert demand.getNumSlices() == 2
+        closest, dist = dta.Algorithms.getClosestCentroid(net, net.getNodeForId(3))
+        for timeLabel in (Time(7, 30), Time(8, 0)):
+            # duplicate rows are added up
+            assert demand.getValue(timeLabel, 2, 6) == 60
+            # intrazonal trips are split with the closest centroid
+            assert demand.getValue(timeLabel, 3, closest.getId()) == 10
+            assert demand.getValue(timeLabel, closest.getId(), 3) == 10
+            assert demand.getValue(timeLabel, 4, 2) == 0
+        # the rows with zones that are not in the network are dropped
+        assert demand.getTotalNumTrips() == 80
+
+    def test_removeInvalidODPairs(self):
+
+        net = getTestNet()
+        demand = Demand(net, "AUTO", Time(7, 0), Time(8, 0), Time(0, 30))
+        _npyArray = demand._demandTable.getNumpyArray()
+        _npyArray[:] = 1.0
+
+        demand.removeInvalidODPairs()
+        assert 0 < _npyArray.sum() < _npyArray.size
+
+        index = dta.ReachabilityIndex(net)
+        for i, originId in enumerate(demand._centroidIds):
+            for j, destinationId in enumerate(demand._centroidIds):
+                isValid = index.hasPath(net.getNodeForId(originId), net.getNodeForId(destinationId))
+                assert (_npyArray[:, i, j] == (1.0 if isValid else 0.0)).all()
+
+    def test_demandArithmetic(self):
+
+        fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
+                                'dynameqNetwork_gearySubset', 'gearysubnet_matx.dqt')
+        net = getTestNet() 
+        demand = Demand.readDynameqTable(net, fileName)
+        totalTrips = demand.getTotalNumTrips()
+
+        # aggregate the four 15 minute slices into one
+        hourly = demand.aggregateTimeSlices(Time(1, 0))
+        assert hourly.getNumSlices() == 1
+        assert abs(hourly.getTotalNumTrips() - totalTrips) < 0.001
+        assert hourly.getValue(Time(1, 0), 56, 8) == sum(demand.getValue(timePeriod, 56, 8) 
+                                                         for timePeriod in demand.iterTimePeriods()) / 4.0
+        nose.tools.assert_raises(dta.DtaError, demand.aggregateTimeSlices, Time(0, 20))
+
+        # and split it again
+        split = hourly.applyTimeOfDayFactors([0.25, 0.75])
+        assert split.getNumSlices() == 2
+        assert abs(split.getTotalNumTrips() - totalTrips) < 0.001
+        assert abs(split.getValue(Time(0, 30), 56, 8) - 0.5 * hourly.getValue(Time(1, 0), 56, 8)) < 0.0001
+        assert abs(split.getValue(Time(1, 0), 56, 8) - 1.5 * hourly.getValue(Time(1, 0), 56, 8)) < 0.0001
+
+        demand2 = Demand.readDynameqTable(net, fileName)
+        demand2.scale(0.5)
+        demand.addDemand(demand2)
+        assert abs(demand.getTotalNumTrips() - 1.5 * totalTrips) < 0.001
+        nose.tools.assert_raises(dta.DtaError, demand.addDemand, hourly)
+
+    def test_writeAndRead(self):
+
+        fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
+                                'dynameqNetwork_gearySubset', 'gearysubnet_matx.dqt')
+        net = getTestNet() 
+        demand = Demand.readDynameqTable(net, fileName)
+
+        outFileName = os.path.join(os.path.dirname(__file__), "testDemandWrite.dqt")
+        outputStream = open(outFileName, "w")
+        Demand.writeDynameqDemandHeader(outputStream, demand.startTime, demand.endTime, demand.vehClassName)
+        demand.writeDynameqTable(outputStream)
+        outputStream.close()
+
+        demand2 = Demand.readDynameqTable(net, outFileName)
+        os.remove(outFileName)
+        assert demand == demand2
+
+    def test_sparseDemand(self):
+
+        fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
+                                'dynameqNetwork_gearySubset', 'gearysubnet_matx.dqt')
+        net = getTestNet() 
+        dense = Demand.readDynameqTable(net, fileName)
+        sparse = Demand.readDynameqTable(net, fileName, sparse=True)
+
+        assert sparse.isSparse() and not dense.isSparse()
+        assert sparse == dense
+        assert sparse._demandTable.getNumNonZero() == np.count_nonzero(dense._demandTable.getNumpyArray())
+        assert np.array_equal(sparse._demandTable.toNumpyArray(), dense._demandTable.getNumpyArray())
+        # there is no view of the sparse data to write to
+        nose.tools.assert_raises(ValueError, sparse._demandTable.getNumpyArray)
+        copied = sparse._demandTable.toNumpyArray()
+        copied[:] = 0
+        assert sparse == dense
+        assert sparse.getTotalNumTrips() == dense.getTotalNumTrips()
+        assert sparse.getValue(Time(0, 15), 56, 8) == 4000
+
+        sparse.setValue(Time(0, 45), 8, 2, 35)
+        assert sparse.getValue(Time(0, 45), 8, 2) == 35
+        sparse.setValue(Time(0, 45), 8, 2, 0)
+        assert sparse.getValue(Time(0, 45), 8, 2) == 0
+        dense.setValue(Time(0, 45), 8, 2, 0)
+        assert sparse == dense
+
+        hourly = sparse.aggregateTimeSlices(Time(1, 0))
+        assert hourly.isSparse()
+        assert hourly == dense.aggregateTimeSlices(Time(1, 0))
+        assert hourly.applyTimeOfDayFactors([0.25, 0.75]) == \
+            dense.aggregateTimeSlices(Time(1, 0)).applyTimeOfDayFactors([0.25, 0.75])
+
+        sparse.addDemand(dense)
+        sparse.scale(0.5)
+        assert sparse == dense
+
+        sparse.removeInvalidODPairs()
+        dense.removeInvalidODPairs()
+        assert sparse == dense
+
+    def test_writeAndReadLinear(self):
+
+        fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
+                                'dynameqNetwork_gearySubset', 'gearysubnet_matx.dqt')
+        net = getTestNet() 
+
+        outDir = tempfile.mkdtemp()
+        try:
+            for sparse in (False, True):
+                demand = Demand.readDynameqTable(net, fileName, sparse=sparse)
+
+                outFileName = os.path.join(outDir, "testDemandLinear.dqt")
+                outputStream = open(outFileName, "w")
+                Demand.writeDynameqDemandHeader(outputStream, demand.startTime, demand.endTime, demand.vehClassName, format='linear')
+                demand.writeDynameqTable(outputStream, format='linear')
+                outputStream.close()
+
+                # only the nonzero cells are written 
+                numLines = len(open(outFileName, "r").readlines())
+                assert numLines == 10 + 2 * demand.getNumSlices() + np.count_nonzero(demand._getNonZero()[3])
+
+                demand2 = Demand.readDynameqTable(net, outFileName, sparse=not sparse)
+                assert demand == demand2
+        finally:
+            shutil.rmtree(outDir)
+
     def NOtest_applyTimeOfDayFactors(self):
 
         fileName = os.path.join(os.path.dirname(__file__), '..', 'testdata', 
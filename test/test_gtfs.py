@@ -0,0 +1,140 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+
+import dta
+from dta.DynameqScenario import DynameqScenario
+from dta.DynameqNetwork import DynameqNetwork
+from dta.GTFS import GTFSTripIndex, GTFSStopLinks
+from dta.Utils import Time
+
+dta.VehicleType.LENGTH_UNITS= "feet"
+dta.Node.COORDINATE_UNITS   = "feet"
+dta.RoadLink.LENGTH_UNITS   = "miles"
+
+def getTestNet():
+
+    projectFolder = os.path.join(os.path.dirname(__file__), '..', 'testdata', 'dynameqNetwork_gearySubset')
+    prefix = 'smallTestNet'
+
+    scenario = DynameqScenario(Time(0,0), Time(12,0))
+    scenario.read(projectFolder, prefix)
+    net = DynameqNetwork(scenario)
+    net.read(projectFolder, prefix)
+
+    return net
+
+class TestTrip(dict):
+    """A trip with the interface of a transitfeed trip"""
+
+    def __init__(self, stopTimes, **fields):
+        dict.__init__(self, **fields)
+        self.stopTimes = stopTimes
+        self.numCalls  = 0
+
+    def GetStopTimes(self):
+        self.numCalls += 1
+        return self.stopTimes
+
+class TestSchedule(object):
+    """A schedule with the interface of a transitfeed schedule"""
+
+    def __init__(self, routes, trips):
+        self.routes = routes
+        self.trips  = trips
+
+    def GetRouteList(self):
+        return self.routes
+
+    def GetTripList(self):
+        return self.trips
+
+class TestGTFS:
+
+    def test_tripIndex(self):
+
+        routes = [{'route_id':'1', 'route_short_name':'38 ', 'route_long_name':'GEARY'},
+                  {'route_id':'2', 'route_short_name':'1',   'route_long_name':' CALIFORNIA '}]
+        trips  = [TestTrip(["a"], trip_id='10', route_id='1', service_id='WKDY'),
+                  TestTrip(["b"], trip_id='11', route_id='2', service_id='WKDY'),
+                  TestTrip(["c"], trip_id='12', route_id='1', service_id='SAT'),
+                  TestTrip(["d"], trip_id='13', route_id='1', service_id='WKDY')]
+        index = GTFSTripIndex(TestSchedule(routes, trips))
+
+        assert index.getServiceIds() == ['SAT', 'WKDY']
+        assert index.getRouteLabels() == ['1 CALIFORNIA', '38 GEARY']
+        assert index.getRouteLabels('SAT') == ['38 GEARY']
+        assert index.getNumTrips() == 4
+        assert index.getNumTrips('WKDY') == 3
+        assert index.getNumTrips('SUN') == 0
+        assert index.getRoute('2')['route_long_name'] == ' CALIFORNIA '
+
+        assert [(label, trip['trip_id']) for (label, route, trip) in index.iterTrips('WKDY')] == \
+            [('1 CALIFORNIA', '11'), ('38 GEARY', '10'), ('38 GEARY', '13')]
+        assert sum(trip.numCalls for trip in trips) == 0
+
+        stopTimes = [(route['route_id'], stoptimes) for (label, route, trip, stoptimes) in index.iterTripsWithStopTimes('WKDY')]
+        assert stopTimes == [('2', ["b"]), ('1', ["a"]), ('1', ["d"])]
+        assert [trip.numCalls for trip in trips] == [1, 1, 0, 1]
+
+    def test_stopLinks(self):
+
+        net = getTestNet()
+        roadlink = net.getLinkForNodeIdPair(26628, 26607)
+        reverseLink = net.getLinkForNodeIdPair(26607, 26628)
+
+        # stops a quarter and three quarters along the link, and one next to its reverse link
+        stops = {}
+        for stopId, t in [('1', 0.25), ('2', 0.75), ('3', 0.5)]:
+            x = roadlink.getStartNode().getX() + t * (roadlink.getEndNode().getX() - roadlink.getStartNode().getX())
+            y = roadlink.getStartNode().getY() + t * (roadlink.getEndNode().getY() - roadlink.getStartNode().getY())
+            stops[stopId] = {'stop_id':stopId, 'stop_name':'stop %s' % stopId, 'x':x, 'y':y}
+
+        numMatches = []
+        def matchFunction(stop):
+            numMatches.append(stop['stop_id'])
+            link = reverseLink if stop['stop_id'] == '3' else roadlink
+            distance, t = link.getDistanceFromPoint(stop['x'], stop['y'])
+            return (stop['x'], stop['y'], stop['stop_name'], link, distance, t)
+
+        stopLinks = GTFSStopLinks(net, matchFunction)
+        for stopId in ['1', '2', '3', '1']:
+            stopLinks.getMatch(stops[stopId])
+        assert numMatches == ['1', '2', '3']
+        assert stopLinks.getNumStops() == 3
+        assert stopLinks.getMatchForStopId('1')[3] == roadlink
+
+        midNode = stopLinks.splitLink(roadlink, fraction=0.5)
+        assert not net.hasLinkForId(roadlink.getId())
+
+        # the stops are moved to the halves of the split links
+        startId, endId, midId = 26628, 26607, midNode.getId()
+        assert stopLinks.getMatchForStopId('1')[3] == net.getLinkForNodeIdPair(startId, midId)
+        assert stopLinks.getMatchForStopId('2')[3] == net.getLinkForNodeIdPair(midId, endId)
+        assert stopLinks.getMatchForStopId('3')[3].getEndNode().getId() in (startId, midId)
+        assert stopLinks.getMatchForStopId('3')[3].getStartNode().getId() in (endId, midId)
+        for stopId in stops:
+            match = stopLinks.getMatchForStopId(stopId)
+            assert net.hasLinkForId(match[3].getId())
+            assert (match[4], match[5]) == match[3].getDistanceFromPoint(match[0], match[1])
+        assert numMatches == ['1', '2', '3']
+
+        stopLinks.setRoadLink('1', net.getLinkForNodeIdPair(midId, endId))
+        assert stopLinks.getMatchForStopId('1')[3] == net.getLinkForNodeIdPair(midId, endId)
+        assert len(stopLinks.getStopIdToLink()) == 3
@@ -0,0 +1,132 @@
+__copyright__   = "Copyright 2011-2014 SFCTA"
+__license__     = """
+    This file is part of DTA.
+
+    DTA is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    DTA is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with DTA.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+from dta.MultiArray import MultiArray
+from dta.Utils import Time
+
+def getTestArray():
+
+    ma = MultiArray("d", [[Time(7, 30), Time(8, 0)], [1, 2, 3], [1, 2, 3]])
+    ma.getNumpyArray()[:] = np.arange(18).reshape(2, 3, 3)
+    return ma
+
+class TestMultiArray:
+
+    def test_memoryMapped(self):
+
+        arrayDir = tempfile.mkdtemp()
+        fileName = os.path.join(arrayDir, "testMultiArray.npy")
+        try:
+            ma = getTestArray()
+            ma.writeMemoryMapped(fileName)
+
+            mapped = MultiArray.openMemoryMapped(fileName)
+            assert mapped.isMemoryMapped() and not ma.isMemoryMapped()
+            assert mapped == ma
+            assert mapped.getElementsOfAllDimentions() == ma.getElementsOfAllDimentions()
+            assert mapped[Time(8, 0), 2, 3] == 14
+
+            view = mapped[Time(8, 0), :, :]
+            assert view.getShape() == (3, 3)
+            assert view[3, 1] == 15
+
+            # pickled by file name, not by value
+            pickled = pickle.dumps(mapped, pickle.HIGHEST_PROTOCOL)
+            assert len(pickled) < len(pickle.dumps(ma, pickle.HIGHEST_PROTOCOL))
+            unpickled = pickle.loads(pickled)
+            assert unpickled.isMemoryMapped()
+            assert unpickled == ma
+
+            writable = MultiArray.openMemoryMapped(fileName, mode='r+')
+            writable[Time(7, 30), 1, 1] = 100
+            writable.flush()
+            assert MultiArray.openMemoryMapped(fileName)[Time(7, 30), 1, 1] == 100
+            del mapped, view, unpickled, writable
+
+            created = MultiArray.createMemoryMapped(fileName, "d", [[1, 2], ["a", "b", "c"]])
+            created[2, "b"] = 5
+            created.flush()
+            assert pickle.loads(pickle.dumps(created))[2, "b"] == 5
+            reopened = MultiArray.openMemoryMapped(fileName)
+            assert reopened.getSum() == 5
+            assert reopened.getElementsOfDimention(1) == ("a", "b", "c")
+            del created, reopened
+        finally:
+            shutil.rmtree(arrayDir)
+
+    def test_indexing(self):
+
+        ma = getTestArray()
+        assert ma[Time(8, 0), 2, 3] == 14
+        ma[Time(8, 0), 2, 3] = 50
+        assert ma.getNumpyArray()[1, 1, 2] == 50
+        try:
+            ma[Time(9, 0), 2, 3]
+            assert False
+        except IndexError:
+            pass
+
+        # lists and arrays of elements are translated together
+        assert list(ma.translateElementArray(1, np.array([3, 1, 1]))) == [2, 0, 0]
+        assert list(ma.translateElementArray(0, [Time(8, 0), Time(7, 30)])) == [1, 0]
+        try:
+            ma.translateElementArray(1, np.array([1, 4]))
+            assert False
+        except IndexError:
+            pass
+
+        values = ma[Time(7, 30), [1, 2, 3], np.array([3, 2, 1])]
+        assert list(values) == [2, 4, 6]
+        ma[Time(7, 30), [1, 3], [1, 3]] = 0
+        assert ma[Time(7, 30), 1, 1] == 0 and ma[Time(7, 30), 3, 3] == 0
+
+        ma.addInPlace((Time(7, 30), np.array([2, 2, 3]), np.array([1, 1, 2])), np.array([1.0, 2.0, 3.0]))
+        assert ma[Time(7, 30), 2, 1] == 6
+        assert ma[Time(7, 30), 3, 2] == 10
+
+    def test_copyCollapseExpand(self):
+
+        ma = MultiArray("d", [[1, 2, 3], [1, 2, 3]])
+        ma.getNumpyArray()[:] = np.arange(9).reshape(3, 3)
+
+        copied = ma.copy()
+        copied[1, 1] = 100
+        assert ma[1, 1] == 0 and copied[1, 1] == 100
+
+        alphaToBeta = np.array([(1, 10, 0.5), (2, 10, 0.5), (3, 20, 1.0)],
+                               dtype=[("alpha", int), ("beta", int), ("percentage", float)])
+        collapsed = ma.collapse(alphaToBeta)
+        assert collapsed.getElementsOfAllDimentions() == ((10, 20), (10, 20))
+        assert collapsed[10, 10] == 0 + 1 + 3 + 4
+        assert collapsed[10, 20] == 2 + 5
+        assert collapsed[20, 20] == 8
+        assert collapsed.getSum() == ma.getSum()
+
+        expanded = collapsed.expand(alphaToBeta)
+        assert expanded.getElementsOfAllDimentions() == ((1, 2, 3), (1, 2, 3))
+        assert expanded[1, 2] == 0.25 * collapsed[10, 10]
+        assert expanded[2, 3] == 0.5 * collapsed[10, 20]
+        assert expanded[3, 3] == collapsed[20, 20]
+        assert abs(expanded.getSum() - ma.getSum()) < 1e-9
@@ -18,11 +18,16 @@ __license__     = """
 
 import pdb
 import nose.tools
+import copy
 import math
 import difflib 
+import gzip
 import os
 import shutil
+import sys
+import tempfile
 
+import numpy as np
 from itertools import izip 
 
 import dta
@@ -1047,6 +1052,135 @@ class TestNetwork(object):
 
         assert mov152.getDirection() == "EBLT"
 
+    def test_computeTurnTypes(self):
+
+        net = getGearySubNet()
+        expected = [(mov._computeTurnType(), mov.getIncomingLink().getDirection()) for mov in net.iterMovements()]
+        assert net.computeTurnTypes() == len(expected)
+        assert [(mov._turnType, mov._incomingDirection) for mov in net.iterMovements()] == expected
+        assert [(mov.getTurnType(), mov.getDirection()) for mov in net.iterMovements()] == \
+            [(turnType, direction + turnType) for turnType, direction in expected]
+
+        # the cached turn types are dropped when the geometry or labels change
+        net = getSimpleNet()
+        addAllMovements(net)
+        link15 = net.getLinkForNodeIdPair(1, 5)
+        mov154 = link15.getOutgoingMovement(4)
+        assert mov154.getTurnType() == dta.Movement.DIR_TH
+        assert mov154.getDirection() == "EBTH"
+
+        net.getNodeForId(4).setCoordinates(net.getNodeForId(5).getX(), net.getNodeForId(5).getY() - 100)
+        assert mov154.getTurnType() == net.getLinkForNodeIdPair(1, 5).getOutgoingMovement(4)._computeTurnType()
+        assert mov154.getTurnType() != dta.Movement.DIR_TH
+
+        mov154.setOverrideTurnType(dta.Movement.DIR_TH)
+        assert mov154.isThruTurn() and not mov154.isLeftTurn() and not mov154.isRightTurn()
+
+    def test_linkGeometry(self):
+
+        net = getGearySubNet()
+        geometry = net.getLinkGeometry()
+        assert net.getLinkGeometry() is geometry
+        assert geometry.getNumLinks() == len([link for link in net.iterLinks() if isinstance(link, RoadLink)])
+
+        # the arrays match the geometry of each link
+        for roadlink in geometry.roadlinks:
+            index = geometry.getLinkIndex(roadlink)
+            nose.tools.assert_almost_equal(geometry.lengths[index], roadlink.euclideanLength(includeShape=True))
+            nose.tools.assert_almost_equal(geometry.orientations[index], roadlink.getOrientation(usingShapepoints=False))
+            nose.tools.assert_almost_equal(geometry.orientationsAtEnd[index], roadlink.getOrientation(atEnd=True))
+            nose.tools.assert_almost_equal(geometry.orientationsAtStart[index], roadlink.getOrientation(atEnd=False))
+            centerline = roadlink.getCenterLine(wholeLineShapePoints=True)
+            start, end = geometry.centerOffsets[index], geometry.centerOffsets[index + 1]
+            assert zip(geometry.centerXs[start:end], geometry.centerYs[start:end]) == [tuple(point) for point in centerline]
+
+        indices = geometry.getLinkIndices(geometry.roadlinks[:3])
+        startXs, startYs, endXs, endYs, offsets = geometry.getCenterLineSegments(indices)
+        for position, roadlink in enumerate(geometry.roadlinks[:3]):
+            centerline = roadlink.getCenterLine(wholeLineShapePoints=True)
+            assert offsets[position + 1] - offsets[position] == len(centerline) - 1
+            assert (startXs[offsets[position]], startYs[offsets[position]]) == tuple(centerline[0])
+            assert (endXs[offsets[position + 1] - 1], endYs[offsets[position + 1] - 1]) == tuple(centerline[-1])
+
+        # the cached geometry is dropped when the geometry changes
+        net = getSimpleNet()
+        link15 = net.getLinkForNodeIdPair(1, 5)
+        geometry = net.getLinkGeometry()
+        assert link15.euclideanLength() == 100
+        assert link15.getCenterLine() == ((0.0, 82.0), (100.0, 82.0))
+
+        # changes to another network or that don't move the links don't matter
+        otherNet = getSimpleNet()
+        otherNet.getLinkGeometry()
+        otherNet.getNodeForId(1).setCoordinates(0, 0)
+        link15.setLength(500)
+        assert geometry.isCurrent()
+
+        # the arrays of the links that moved are updated in place
+        net.getNodeForId(1).setCoordinates(0, 0)
+        assert not geometry.isCurrent()
+        assert net.getLinkGeometry() is geometry
+        assert geometry.isCurrent()
+        for roadlink in geometry.roadlinks:
+            nose.tools.assert_almost_equal(geometry.lengths[geometry.getLinkIndex(roadlink)], roadlink.euclideanLength(includeShape=True))
+            centerline = roadlink.getCenterLine(wholeLineShapePoints=True)
+            start, end = geometry.centerOffsets[geometry.getLinkIndex(roadlink)], geometry.centerOffsets[geometry.getLinkIndex(roadlink) + 1]
+            assert zip(geometry.centerXs[start:end], geometry.centerYs[start:end]) == [tuple(point) for point in centerline]
+        nose.tools.assert_almost_equal(link15.euclideanLength(), math.sqrt(2) * 100)
+        assert link15.getCenterLine() == link15._computeCenterLine(False, False)
+        nose.tools.assert_almost_equal(net.getLinkGeometry().lengths[net.getLinkGeometry().getLinkIndex(link15)],
+                                       math.sqrt(2) * 100)
+
+        # a new shape point changes the size of the arrays, so they're rebuilt
+        link15.addShapePoint(0, 100)
+        assert link15.getOrientation(atEnd=True) == 90
+        assert net.getLinkGeometry() is not geometry
+        nose.tools.assert_almost_equal(net.getLinkGeometry().lengths[net.getLinkGeometry().getLinkIndex(link15)], 200)
+
+        net.removeLink(link15)
+        nose.tools.assert_raises(DtaError, net.getLinkGeometry().getLinkIndex, link15)
+
+    def test_findOverlappingLinks(self):
+
+        def getOverlappingPairs(net):
+            pairs = set()
+            for node in net.iterNodes():
+                for links, incoming in ((list(node.iterIncomingLinks()), True), (list(node.iterOutgoingLinks()), False)):
+                    for link1 in links:
+                        for link2 in links:
+                            if link1.isVirtualLink() or link2.isVirtualLink() or link1.getId() >= link2.getId(): continue
+                            if link1.isOverlapping(link2, usingShapepoints=True):
+                                pairs.add((node.getId(), incoming, link1.getId(), link2.getId()))
+            return pairs
+
+        net = getGearySubNet()
+        report = net.findOverlappingLinks()
+        assert len(report) > 0
+        assert set((node.getId(), incoming, link1.getId(), link2.getId()) for node, incoming, link1, link2, angle in report) == \
+            getOverlappingPairs(net)
+        for node, incoming, link1, link2, angle in report:
+            nose.tools.assert_almost_equal(angle, link1.getAngle(link2, usingShapepoints=True))
+
+        # links leaving node 5 just West of North, North and just East of North (to a virtual node)
+        net = getSimpleNet()
+        v5 = net.getNodeForId(5)
+        v9 = simpleRoadNodeFactory(9, 99.999, 300)
+        vn = VirtualNode(11, 101, 300)
+        net.addNode(v9)
+        net.addNode(vn)
+        net.addLink(simpleRoadLinkFactory(15, v5, v9))
+        net.addLink(simpleConnectorFactory(16, v5, vn))
+
+        report = net.findOverlappingLinks()
+        assert [(node.getId(), incoming, link1.getId(), link2.getId()) for node, incoming, link1, link2, angle in report] == \
+            [(5, False, 7, 15), (5, False, 7, 16), (5, False, 15, 16)]
+        assert net.findOverlappingLinks(nodes=[net.getNodeForId(1)]) == []
+
+        # moving the virtual node fixes the overlaps of the connector
+        assert len(net.handleOverlappingLinks(warn=True, moveVirtualNodeDist=100)) == 3
+        assert (vn.getX(), vn.getY()) == (201, 300)
+        assert [(link1.getId(), link2.getId()) for node, incoming, link1, link2, angle in net.findOverlappingLinks()] == [(7, 15)]
+
     def test_movementGetCenterLine(self):
 
         net = getSimpleNet()
@@ -1062,6 +1196,18 @@ class TestNetwork(object):
         assert l35.getCenterLine() == ((118.0, 0.0), (118.0, 100.0))
         assert l54.getCenterLine() == ((100.0, 82.0), (200.0, 82.0))
         assert mov354.getCenterLine() == [(118.0, 0.0), (118.0, 50.0), (150.0, 82.0), (200.0, 82.0)]
+
+        # a new label only drops the turn types, not the geometry
+        geometry = net.getLinkGeometry()
+        turnType = mov354.getTurnType()
+        centerLine = mov354.getCenterLine()
+        mov354.getAtNode().getConflictMatrix()
+        l35.setLabel("Another Street")
+        assert mov354._turnType is None
+        assert mov354.getTurnType() == turnType
+        assert mov354.getCenterLine() is centerLine
+        assert mov354.getAtNode()._conflictMatrix is not None
+        assert geometry.isCurrent()
         
     def test_conflictingMovements(self):
 
@@ -1101,6 +1247,37 @@ class TestNetwork(object):
         #left turn with right from same link 
         assert not mov351.isInConflict(mov354)
 
+    def test_conflictMatrix(self):
+
+        net = getSimpleNet()
+        addAllMovements(net)
+        node5 = net.getNodeForId(5)
+
+        movements, conflicts = node5.getConflictMatrix()
+        assert len(movements) == node5.getNumMovements()
+        for i, mov1 in enumerate(movements):
+            for j, mov2 in enumerate(movements):
+                assert conflicts[i, j] == (i != j and mov1._computeConflict(mov2))
+                assert mov1.isInConflict(mov2) == conflicts[i, j]
+        assert node5.getConflictMatrix()[1] is conflicts
+
+        # the center lines are cached until the geometry of the links changes
+        l35 = net.getLinkForNodeIdPair(3, 5)
+        mov354 = l35.getOutgoingMovement(4)
+        centerLine = mov354.getCenterLine()
+        assert mov354.getCenterLine() is centerLine
+
+        l35.addShifts(1, 1)
+        assert mov354.getCenterLine() == [(130.0, 0.0), (130.0, 50.0), (150.0, 82.0), (200.0, 82.0)]
+        assert node5.getConflictMatrix()[1] is not conflicts
+
+        net.getNodeForId(3).setCoordinates(0, 0)
+        assert mov354.getCenterLine()[0] != (130.0, 0.0)
+
+        # removing a movement drops it from the matrix
+        l35._removeOutgoingMovement(mov354)
+        assert mov354 not in node5.getConflictMatrix()[0]
+
     def NOtest_movementCapacity(self):
 
         net = getGearySubNet()
@@ -1145,3 +1322,536 @@ class TestNetwork(object):
         nose.tools.assert_raises(DtaError, net.findNodeForRoadLabels, ['HYDE', 'WASHINGTON'], 1.0)
 
           
+
+    def test_spatialIndex(self):
+
+        net = getGearySubNet()
+        xs = [node.getX() for node in net.iterNodes()]
+        ys = [node.getY() for node in net.iterNodes()]
+
+        points = [(min(xs) + (max(xs) - min(xs)) * i / 7.0, min(ys) + (max(ys) - min(ys)) * j / 5.0) 
+                  for i in range(-1, 9) for j in range(-1, 7)]
+
+        for x, y in points:
+            # compare with a scan of all the nodes and road links
+            bestDist = min(math.sqrt((node.getX() - x) ** 2 + (node.getY() - y) ** 2) for node in net.iterRoadNodes())
+            dist, node = net.findNodeNearestCoords(x, y)
+            assert node.isRoadNode()
+            assert abs(dist - bestDist) < 0.0001
+
+            linkDists = sorted(roadlink.getDistanceFromPoint(x, y)[0] for roadlink in net.iterRoadLinks())
+            found = net.findNRoadLinksNearestCoords(x, y, n=4)
+            assert len(found) == 4
+            for (roadlink, dist, t), bestDist in izip(found, linkDists):
+                assert abs(dist - bestDist) < 0.0001
+
+            radius = linkDists[2] + 1.0
+            assert len(net.findRoadLinksWithinRadius(x, y, radius)) == len([d for d in linkDists if d <= radius])
+
+            nodesInRadius = net.findNodesWithinRadius(x, y, 500, nodeFilter=lambda node: node.isRoadNode())
+            assert len(nodesInRadius) == len([node for node in net.iterRoadNodes() 
+                                              if math.sqrt((node.getX() - x) ** 2 + (node.getY() - y) ** 2) <= 500])
+
+        assert net.findNodeNearestCoords(min(xs) - 1000, min(ys) - 1000, quick_dist=10) == (sys.float_info.max, None)
+        assert net.findNRoadLinksNearestCoords(min(xs) - 1000, min(ys) - 1000, quick_dist=10) == (None, None, None)
+
+        centroid = net.getNodeForId(9)
+        closestCentroid, dist = dta.Algorithms.getClosestCentroid(net, centroid)
+        assert closestCentroid.isCentroid() and closestCentroid != centroid
+        assert abs(dist - min(math.sqrt((c.getX() - centroid.getX()) ** 2 + (c.getY() - centroid.getY()) ** 2) 
+                              for c in net.iterCentroids() if c != centroid)) < 0.0001
+
+        # the index follows the network edits
+        roadlink = net.getLinkForNodeIdPair(26497, 26503)
+        midNode = net.splitLink(roadlink)
+        dist, node = net.findNodeNearestCoords(midNode.getX(), midNode.getY())
+        assert node == midNode and dist == 0
+        for roadlink, dist, t in net.findNRoadLinksNearestCoords(midNode.getX(), midNode.getY(), n=3):
+            assert net.hasLinkForId(roadlink.getId())
+
+    def test_spatialIndexFollowsNodeMoves(self):
+
+        net = getSimpleNet()
+        net.findNodeNearestCoords(0, 0)
+
+        node1 = net.getNodeForId(1)
+        node1.setCoordinates(100000, 100000)
+        assert net.findNodesWithinRadius(100000, 100000, 10) == [(0, node1)]
+        assert net.findNodesWithinRadius(0, 100, 10) == []
+        roadlink, dist, t = net.findNRoadLinksNearestCoords(100000, 100000, n=1)
+        assert abs(dist - min(link.getDistanceFromPoint(100000, 100000)[0] for link in net.iterRoadLinks())) < 0.0001
+
+        # removed from the cell it was moved to
+        net.removeNode(node1)
+        assert not net.hasNodeForId(1)
+        assert net.findNodesWithinRadius(100000, 100000, 10) == []
+        assert net.findRoadLinksWithinRadius(100000, 100000, 10) == []
+
+    def test_snapPointsToRoadLinks(self):
+
+        net = getGearySubNet()
+        xs = [node.getX() for node in net.iterNodes()]
+        ys = [node.getY() for node in net.iterNodes()]
+
+        points = [(min(xs) + (max(xs) - min(xs)) * i / 7.0, min(ys) + (max(ys) - min(ys)) * j / 5.0) 
+                  for i in range(-1, 9) for j in range(-1, 7)]
+        pointXs = [x for x, y in points]
+        pointYs = [y for x, y in points]
+
+        roadlinks, distances, ts = net.snapPointsToRoadLinks(pointXs, pointYs, k=4)
+        assert roadlinks.shape == distances.shape == ts.shape == (len(points), 4)
+        for i, (x, y) in enumerate(points):
+            # compare with the distances measured by each road link
+            found = net.findNRoadLinksNearestCoords(x, y, n=4)
+            for (roadlink, dist, t), bestDist in izip(found, distances[i]):
+                assert abs(dist - bestDist) < 0.0001
+            for roadlink, dist, t in izip(roadlinks[i], distances[i], ts[i]):
+                (linkDist, linkT) = roadlink.getDistanceFromPoint(x, y)
+                assert abs(dist - linkDist) < 0.0001
+                assert abs(t - linkT) < 0.0001
+
+        # limited by distance and filtered
+        radius = 300
+        roadlinks, distances, ts = net.snapPointsToRoadLinks(pointXs, pointYs, k=3, maxDist=radius,
+                                                             linkFilter=lambda roadlink: roadlink.getNumLanes() > 1)
+        for i, (x, y) in enumerate(points):
+            numInRadius = len([roadlink for roadlink, dist, t in net.findRoadLinksWithinRadius(x, y, radius)
+                               if roadlink.getNumLanes() > 1])
+            numFound = len([roadlink for roadlink in roadlinks[i] if roadlink is not None])
+            assert numFound == min(3, numInRadius)
+            assert all(roadlink.getNumLanes() > 1 for roadlink in roadlinks[i, :numFound])
+            assert np.isnan(distances[i, numFound:]).all() and np.isnan(ts[i, numFound:]).all()
+
+    def test_simResults(self):
+
+        net = getGearySubNet()
+        simResults = net.initializeSimResults(0, 60, 15)
+        assert net.getSimResults() == simResults
+        assert simResults.getNumMovements() == len(list(net.iterMovements()))
+        assert simResults.getNumTimeBins() == 4
+
+        movements = [mov for mov in net.iterMovements() if not mov.getIncomingLink().isConnector()][:20]
+        for i, mov in enumerate(movements):
+            for start in range(0, 60, 15):
+                if (i + start) % 4 == 0: continue
+                mov.setSimOutVolume(start, start + 15, 10 + i + start)
+                mov.setSimInVolume(start, start + 15, 20 + i)
+                mov.setSimTTInMin(start, start + 15, 0.5 * (start / 15 + 1))
+
+        for i, mov in enumerate(movements):
+            bins = [start for start in range(0, 60, 15) if (i + start) % 4 != 0]
+            assert mov.getSimOutVolume(0, 60) == sum(10 + i + start for start in bins)
+            assert mov.getSimInVolume(15, 45) == sum(20 + i for start in bins if 15 <= start < 45)
+            assert mov.getSimOutFlow(0, 60) == mov.getSimOutVolume(0, 60)
+
+            expectedTT = sum((10 + i + start) * 0.5 * (start / 15 + 1) for start in bins) / float(sum(10 + i + start for start in bins))
+            assert abs(mov.getSimTTInMin(0, 60) - expectedTT) < 0.0001
+            for start in range(0, 60, 15):
+                if start in bins:
+                    assert abs(mov.getSimTTInMin(start, start + 15) - 0.5 * (start / 15 + 1)) < 0.0001
+                else:
+                    assert mov.getSimTTInMin(start, start + 15) == mov.getFreeFlowTTInMin()
+
+        volumes = simResults.getOutVolumes(0, 60)
+        for mov in movements:
+            assert volumes[mov._simResultsIndex] == mov.getSimOutVolume(0, 60)
+        assert volumes.sum() == sum(mov.getSimOutVolume(0, 60) for mov in movements)
+
+        # a bin with a volume and no travel time is an error
+        simResults.outVolume[movements[0]._simResultsIndex, :] = 5
+        simResults.resultsChanged()
+        nose.tools.assert_raises(DtaError, movements[0].getSimTTInMin, 0, 60)
+
+    def test_readSimResults(self):
+
+        net = getGearySubNet()
+        movements = [mov for mov in net.iterMovements() if not mov.getIncomingLink().isConnector()][:5]
+
+        resultsDir = tempfile.mkdtemp()
+        try:
+            net._dir = resultsDir
+
+            # flows in vph and times in seconds for four 15 minute periods
+            flows   = [[40, 0, 80, 8], [0, 0, 0, 0], [12, 16, 20, 24], [4, 4, 4, 4], [100, 0, 0, 60]]
+            times   = [[30, 0, 60, 90], [0, 0, 0, 0], [10, 20, 30, -1], [6, 6, 6, 6], [50, 0, 0, 70]]
+            flowsIn = [[44, 0, 76, 8], [0, 0, 0, 0], [12, 16, 20, 20], [4, 4, 4, 4], [96, 0, 4, 60]]
+
+            header = "\n".join(["*"] * 9) + "\n"
+            for fileName, values in ((dta.DynameqNetwork.MOVEMENT_FLOW_OUT, flows),
+                                     (dta.DynameqNetwork.MOVEMENT_TIME_OUT, times),
+                                     (dta.DynameqNetwork.MOVEMENT_FLOW_IN, flowsIn)):
+                outputStream = open(os.path.join(resultsDir, fileName), "w")
+                outputStream.write(header)
+                for mov, movValues in izip(movements, values):
+                    outputStream.write("%d %d %d %s\n" % (mov.getAtNode().getId(), mov.getIncomingLink().getStartNode().getId(),
+                                                          mov.getOutgoingLink().getEndNode().getId(), " ".join(map(str, movValues))))
+                # a movement that is not in the network
+                outputStream.write("1 2 3 %s\n" % " ".join(["1"] * 4))
+                outputStream.close()
+
+            net.readSimResults(0, 60, 15)
+
+            assert movements[0].getSimOutVolume(0, 60) == (40 + 80 + 8) / 4.0
+            assert movements[0].getSimInVolume(0, 60) == (44 + 76 + 8) / 4.0
+            assert abs(movements[0].getSimTTInMin(0, 15) - 0.5) < 0.0001
+            assert abs(movements[0].getSimTTInMin(0, 60) - (40 * 0.5 + 80 * 1.0 + 8 * 1.5) / 128.0) < 0.0001
+            assert movements[1].getSimOutVolume(0, 60) == 0
+            # the negative travel time is skipped without shifting the later periods
+            assert movements[2].getSimOutVolume(0, 60) == (12 + 16 + 20) / 4.0
+            assert movements[2].getSimOutVolume(30, 45) == 5
+            assert movements[4].getSimInVolume(30, 45) == 0
+        finally:
+            shutil.rmtree(resultsDir)
+
+    def test_resultsReport(self):
+
+        net = getGearySubNet()
+        simResults = net.initializeSimResults(0, 60, 5)
+        movements = [mov for mov in net.iterMovements() if not mov.getIncomingLink().isConnector()]
+        for i, mov in enumerate(movements):
+            for start in range(0, 60, 5):
+                if (i + start) % 3 == 0: continue
+                mov.setSimOutVolume(start, start + 5, (i * 7 + start) % 13 + 0.5)
+                mov.setSimTTInMin(start, start + 5, 0.25 * (i % 4 + 1))
+
+        # link counts, and movement counts for all or some of the movements of a link
+        countLinks = [roadlink for roadlink in net.iterRoadLinks() if roadlink.getNumOutgoingMovements() > 1]
+        for start in range(0, 45, 15):
+            countLinks[0].setObsCount(start, start + 15, 100 + start)
+            for mov in countLinks[1].iterOutgoingMovements():
+                mov.setObsCount(start, start + 15, 10 + start)
+        countLinks[0].setObsCount(15, 30, 0)
+        countLinks[2].iterOutgoingMovements().next().setObsCount(30, 45, 7)
+
+        report = dta.ResultsReport(net, 15)
+        assert report.getIntervalStartTimes() == range(0, 45, 5)
+
+        # compare with the counts and volumes of each link and movement
+        roadlinks, counts, volumes = report.getLinkCountsVsVolumes()
+        expected = []
+        for link in net.iterRoadLinks():
+            if not (link.hasCountInfo() or link.hasMovementCountInfo()): continue
+            for sTime in range(0, 59, 5):
+                if sTime + 15 >= 60: continue
+                if link.hasObsCount(sTime, sTime + 15):
+                    expected.append((link, sTime, link.getObsCount(sTime, sTime + 15), link.getSimOutVolume(sTime, sTime + 15)))
+                elif link.hasAllMovementCounts(sTime, sTime + 15):
+                    expected.append((link, sTime, link.getSumOfAllMovementCounts(sTime, sTime + 15), link.getSimOutVolume(sTime, sTime + 15)))
+        found = [(roadlinks[i], report.getIntervalStartTimes()[j], counts[i, j], volumes[i, j])
+                 for i, j in zip(*np.nonzero(~np.isnan(counts)))]
+        assert len(found) == len(expected) == 5
+        for (link1, start1, count1, volume1), (link2, start2, count2, volume2) in izip(found, expected):
+            assert link1 == link2 and start1 == start2 and count1 == count2
+            assert abs(volume1 - volume2) < 0.0001
+
+        movements, counts, volumes = report.getMovementCountsVsVolumes()
+        assert len(movements) == countLinks[1].getNumOutgoingMovements() + 1
+        for i, mov in enumerate(movements):
+            for j, start in enumerate(report.getIntervalStartTimes()):
+                assert abs(volumes[i, j] - mov.getSimOutVolume(start, start + 15)) < 0.0001
+                if mov.hasObsCount(start, start + 15):
+                    assert counts[i, j] == mov.getObsCount(start, start + 15)
+                else:
+                    assert np.isnan(counts[i, j])
+
+        reportDir = tempfile.mkdtemp()
+        try:
+            report.writeLinkCountsVsVolumes(os.path.join(reportDir, "links.csv"))
+            report.writeMovementCountsVsVolumes(os.path.join(reportDir, "movements.csv"))
+            report.writeLinkVolumes(os.path.join(reportDir, "volumes.csv"), 0, 60, [("ModelVolume0to30", 0, 30)])
+
+            lines = open(os.path.join(reportDir, "links.csv")).readlines()
+            assert lines[0] == dta.ResultsReport.LINK_COUNTS_HEADER
+            assert len(lines) == 6
+            assert lines[1].split(",")[-2:] == ["%d" % expected[0][2], "%d\n" % expected[0][3]]
+            assert len(open(os.path.join(reportDir, "movements.csv")).readlines()) == 1 + 3 * countLinks[1].getNumOutgoingMovements() + 1
+
+            lines = open(os.path.join(reportDir, "volumes.csv")).readlines()
+            assert lines[0].strip().endswith("ModelVolume,TravelTime,ModelVolume0to30")
+            assert len(lines) == 1 + net.getNumRoadLinks()
+            for line, link in izip(lines[1:], net.iterRoadLinks()):
+                fields = line.strip().split(",")
+                assert int(fields[2]) == link.getId()
+                assert int(fields[-3]) == int(link.getSimOutVolume(0, 60))
+                assert abs(float(fields[-2]) - link.getSimTTInMin(0, 60)) < 0.0001
+                assert int(fields[-1]) == int(link.getSimOutVolume(0, 30))
+        finally:
+            shutil.rmtree(reportDir)
+
+    def test_readObsCounts(self):
+
+        net = getGearySubNet()
+        net.initializeSimResults(0, 60, 5)
+        countLinks = [roadlink for roadlink in net.iterRoadLinks() if roadlink.getNumOutgoingMovements() > 1]
+        link1, link2 = countLinks[:2]
+        mov1 = link1.iterOutgoingMovements().next()
+        node = mov1.getAtNode()
+
+        countDir = tempfile.mkdtemp()
+        linkCountFile = os.path.join(countDir, "linkCounts.dat")
+        movementCountFile = os.path.join(countDir, "movementCounts.dat")
+        try:
+            times = " ".join("00:%02d" % start for start in range(0, 60, 5))
+            outputStream = open(linkCountFile, "w")
+            outputStream.write("* from to %s\n" % times)
+            outputStream.write("%d %d %s\n" % (link1.getStartNode().getId(), link1.getEndNode().getId(),
+                                               " ".join("%d.7" % start for start in range(0, 60, 5))))
+            outputStream.write("%d %d %s\n" % (link2.getStartNode().getId(), link2.getEndNode().getId(),
+                                               " ".join("-1" if start == 20 else "2" for start in range(0, 60, 5))))
+            outputStream.close()
+
+            outputStream = open(movementCountFile, "w")
+            outputStream.write("* at from to 00:00 00:15 00:30 00:45\n")
+            outputStream.write("%d %d %d 10 20 -1 40\n" % (node.getId(), mov1.getStartNode().getId(), mov1.getEndNode().getId()))
+            outputStream.close()
+
+            net.readObsLinkCounts(linkCountFile)
+            net.readObsMovementCounts(movementCountFile)
+        finally:
+            shutil.rmtree(countDir)
+
+        # fine and coarse windows of the link counts
+        assert link1.hasCountInfo() and link2.hasCountInfo()
+        assert link1.getObsCount(5, 10) == 5
+        assert link1.getObsCount(0, 15) == 0 + 5 + 10
+        assert link1.getObsCount(0, 60) == sum(range(0, 60, 5))
+        assert link2.getObsCount(0, 15) == 6
+        assert link2.getObsCount(15, 30) is None
+        assert link2.getObsCount(30, 60) == 12
+        assert not link2.hasObsCount(20, 25)
+
+        # the coarser windows must be aligned to their duration, but single bins needn't be
+        assert link1.getObsCount(5, 20) is None
+        assert link1.getObsCount(30, 60) == 30 + 35 + 40 + 45 + 50 + 55
+        assert link1.getObsCount(15, 45) is None
+        counts = link1.getObsCountArray(range(0, 45, 5), 15)
+        assert counts[::3].tolist() == [0 + 5 + 10, 15 + 20 + 25, 30 + 35 + 40]
+        assert np.isnan(counts[1]) and np.isnan(counts[2]) and np.isnan(counts[4])
+
+        # movement counts, with a missing one
+        assert mov1.hasCountInfo()
+        assert mov1.getObsCount(0, 15) == 10
+        assert mov1.getObsCount(0, 30) == 30
+        assert mov1.getObsCount(0, 60) is None
+        assert mov1.getObsCount(0, 5) is None
+
+        counts = mov1.getObsCountArray(range(0, 60, 15), 15)
+        assert counts[[0, 1, 3]].tolist() == [10, 20, 40] and np.isnan(counts[2])
+
+        # the counts set explicitly take precedence over the ones read
+        link1.setObsCount(0, 15, 1000)
+        assert link1.getObsCount(0, 15) == 1000
+        assert link1.getObsCountArray([0, 15], 15).tolist() == [1000, 15 + 20 + 25]
+
+    def test_addLinks(self):
+
+        net = getGearySubNet()
+        def getLinkOrders(network):
+            return dict((node.getId(), ([link.getId() for link in node.iterIncomingLinks()],
+                                        [link.getId() for link in node.iterOutgoingLinks()]))
+                        for node in network.iterNodes())
+
+        def copyNodes(network):
+            copied = Network(network.getScenario())
+            for node in net.iterNodes():
+                cNode = copy.copy(node)
+                cNode._incomingLinks = []
+                cNode._outgoingLinks = []
+                copied.addNode(cNode)
+            return copied
+
+        def copyLinks(network, links):
+            for link in links:
+                cLink = copy.copy(link)
+                cLink._startNode = network.getNodeForId(link.getStartNode().getId())
+                cLink._endNode = network.getNodeForId(link.getEndNode().getId())
+                if isinstance(link, dta.RoadLink):
+                    cLink._outgoingMovements = []
+                    cLink._incomingMovements = []
+                yield cLink
+
+        # in reverse order, so the links with the same angle are added the other way round
+        links = sorted(net.iterLinks(), key=lambda link: -link.getId())
+
+        oneByOne = copyNodes(net)
+        for link in copyLinks(oneByOne, links):
+            oneByOne.addLink(link)
+
+        bulk = copyNodes(net)
+        assert bulk.addLinks(copyLinks(bulk, links)) == net.getNumLinks()
+        assert getLinkOrders(bulk) == getLinkOrders(oneByOne)
+
+        # the network read in bulk has its links sorted by angle
+        for node in net.iterNodes():
+            for nodeLinks in (list(node.iterIncomingLinks()), list(node.iterOutgoingLinks())):
+                angles = [link.getReferenceAngle() for link in nodeLinks]
+                assert angles == sorted(angles)
+
+        # the lists are sorted when the outermost context exits, even after an error
+        nested = copyNodes(net)
+        try:
+            with nested.deferLinkOrdering():
+                with nested.deferLinkOrdering():
+                    nested.addLinks(copyLinks(nested, links))
+                assert nested._nodesToSort
+                raise DtaError("stop")
+        except DtaError:
+            pass
+        assert nested._nodesToSort is None
+        assert getLinkOrders(nested) == getLinkOrders(oneByOne)
+
+    def test_slottedLayout(self):
+
+        net = getGearySubNet()
+        roadlink = net.getLinkForNodeIdPair(26628, 26607)
+        movement = next(roadlink.iterOutgoingMovements())
+        roadnode = roadlink.getEndNode()
+        centroid = next(net.iterCentroids())
+        connector = next(link for link in net.iterLinks() if link.isConnector())
+        virtualLink = next(link for link in net.iterLinks() if link.isVirtualLink())
+
+        for obj in [roadnode, centroid, roadlink, connector, virtualLink, movement]:
+            assert not hasattr(obj, "__dict__")
+        nose.tools.assert_raises(AttributeError, setattr, roadlink, "label", 0)
+
+        # the result containers are only created when they are needed
+        net.initializeSimResults(0, 60, 15)
+        assert roadlink._simOutVolume is None and roadlink._obsCount is None
+        assert movement._simOutVolume is None and movement._higherPriorityMovements is None
+        assert not roadlink.hasCountInfo()
+        assert movement.getObsCount(0, 15) == None
+        roadlink.setObsCount(0, 15, 100)
+        assert roadlink.getObsCount(0, 15) == 100
+        assert roadlink.hasCountInfo()
+        assert list(movement.iterHigherPriorityMovements()) == []
+
+        # copies keep the attributes
+        cLink = copy.copy(roadlink)
+        assert cLink.getId() == roadlink.getId()
+        assert cLink.getObsCount(0, 15) == 100
+        assert cLink.getNumLanes() == roadlink.getNumLanes()
+        cMov = copy.copy(movement)
+        assert cMov.getId() == movement.getId()
+
+    def test_networkCache(self):
+
+        projectFolder = os.path.join(mainFolder, 'dynameqNetwork_gearySubset')
+        prefix = 'smallTestNet'
+        cacheDir = tempfile.mkdtemp()
+        try:
+            for fileName in os.listdir(projectFolder):
+                if fileName.startswith(prefix):
+                    shutil.copy2(os.path.join(projectFolder, fileName), cacheDir)
+
+            scenario = getTestScenario()
+            net = DynameqNetwork(scenario)
+            net.read(cacheDir, prefix, useCache=True)
+            cacheFile = os.path.join(cacheDir, DynameqNetwork.CACHE_FILE % prefix)
+            assert os.path.exists(cacheFile)
+
+            cachedNet = DynameqNetwork(scenario)
+            assert cachedNet.readCache(cacheFile, cachedNet._getSourceFileNames(cacheDir, prefix))
+
+            assert cachedNet.getNumNodes() == net.getNumNodes()
+            assert cachedNet.getNumLinks() == net.getNumLinks()
+            assert cachedNet.getNumTimePlans() == net.getNumTimePlans()
+            assert cachedNet.getScenario() is scenario
+
+            for link in net.iterLinks():
+                cachedLink = cachedNet.getLinkForId(link.getId())
+                assert cachedLink.__class__ == link.__class__
+                assert cachedLink.getStartNode() is cachedNet.getNodeForId(link.getStartNode().getId())
+                assert cachedLink.getEndNode() is cachedNet.getNodeForId(link.getEndNode().getId())
+                if not link.isRoadLink(): continue
+
+                assert cachedLink.getShapePoints() == link.getShapePoints()
+                assert cachedLink.getNumLanes() == link.getNumLanes()
+                for laneId in range(link.getNumLanes()):
+                    assert cachedLink.getLanePermission(laneId).name == link.getLanePermission(laneId).name
+                assert cachedLink.getNumOutgoingMovements() == link.getNumOutgoingMovements()
+                for mov in link.iterOutgoingMovements():
+                    cachedMov = cachedLink.getOutgoingMovement(mov.getOutgoingLink().getEndNode().getId())
+                    assert cachedMov.getIncomingLink() is cachedLink
+                    assert cachedMov.getFreeFlowTTInMin() == mov.getFreeFlowTTInMin()
+                    assert cachedMov.getVehicleClassGroup() is mov.getVehicleClassGroup() or \
+                        cachedMov.getVehicleClassGroup().name == mov.getVehicleClassGroup().name
+
+            # a source file that was touched but not modified doesn't invalidate the cache
+            baseFile = os.path.join(cacheDir, DynameqNetwork.BASE_FILE % prefix)
+            os.utime(baseFile, (os.path.getatime(baseFile), os.path.getmtime(baseFile) + 10))
+            assert DynameqNetwork(scenario).readCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+
+            # a cache for modified source files is not used
+            inputStream = open(baseFile, "r")
+            contents = inputStream.read()
+            inputStream.close()
+            outputStream = open(baseFile, "w")
+            outputStream.write(contents.replace("<VERSION_1.8>", "<VERSION_1.9>"))
+            outputStream.close()
+            assert not DynameqNetwork(scenario).readCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+
+            # reading with the cache rewrites it
+            rereadNet = DynameqNetwork(scenario)
+            rereadNet.read(cacheDir, prefix, useCache=True)
+            assert rereadNet.getNumLinks() == net.getNumLinks()
+            assert DynameqNetwork(scenario).readCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+            assert [fileName for fileName in os.listdir(cacheDir) if fileName.endswith(".tmp")] == []
+
+            # the derived attributes are not written, but rebuilt on demand
+            rereadNet.getSpatialIndex()
+            mov = next(rereadNet.iterMovements())
+            mov.getTurnType()
+            rereadNet.writeCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+            cachedNet = DynameqNetwork(scenario)
+            assert cachedNet.readCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+            assert cachedNet._spatialIndex is None
+            cachedMov = cachedNet.getLinkForId(mov.getIncomingLink().getId()).getOutgoingMovement(mov.getOutgoingLink().getEndNode().getId())
+            assert cachedMov._turnType is None
+            assert cachedMov.getTurnType() == mov.getTurnType()
+
+            # a truncated cache is ignored, and the network is read from the source files
+            inputStream = open(cacheFile, "rb")
+            contents = inputStream.read()
+            inputStream.close()
+            for length in [10, len(contents) / 2]:
+                outputStream = open(cacheFile, "wb")
+                outputStream.write(contents[:length])
+                outputStream.close()
+                emptyNet = DynameqNetwork(scenario)
+                assert not emptyNet.readCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+                assert emptyNet.getNumLinks() == 0
+            rereadNet = DynameqNetwork(scenario)
+            rereadNet.read(cacheDir, prefix, useCache=True)
+            assert rereadNet.getNumLinks() == net.getNumLinks()
+            assert DynameqNetwork(scenario).readCache(cacheFile, net._getSourceFileNames(cacheDir, prefix))
+        finally:
+            shutil.rmtree(cacheDir)
+
+    def test_readGzippedNetwork(self):
+
+        projectFolder = os.path.join(mainFolder, 'dynameqNetwork_gearySubset')
+        prefix = 'smallTestNet'
+        gzipDir = tempfile.mkdtemp()
+        try:
+            for fileName in os.listdir(projectFolder):
+                if fileName.startswith(prefix):
+                    inputStream = open(os.path.join(projectFolder, fileName), "rb")
+                    outputStream = gzip.open(os.path.join(gzipDir, fileName + ".gz"), "wb")
+                    outputStream.write(inputStream.read())
+                    outputStream.close()
+                    inputStream.close()
+
+            scenario = DynameqScenario(Time(0,0), Time(12,0))
+            scenario.read(gzipDir, prefix)
+            net = DynameqNetwork(scenario)
+            net.read(gzipDir, prefix)
+
+            plainNet = getGearySubNet()
+            assert net.getNumNodes() == plainNet.getNumNodes()
+            assert net.getNumLinks() == plainNet.getNumLinks()
+            assert sum(link.getNumShapePoints() for link in net.iterRoadLinks()) == \
+                sum(link.getNumShapePoints() for link in plainNet.iterRoadLinks())
+            assert sum(link.getNumOutgoingMovements() for link in net.iterRoadLinks()) == \
+                sum(link.getNumOutgoingMovements() for link in plainNet.iterRoadLinks())
+        finally:
+            shutil.rmtree(gzipDir)
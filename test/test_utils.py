@@ -17,7 +17,11 @@ __license__     = """
 """
 
 import datetime
+import gzip
 import os
+import nose.tools
+
+import dta
 
 from dta.DynameqScenario import DynameqScenario 
 from dta.DynameqNetwork import DynameqNetwork 
@@ -125,3 +129,44 @@ class TestTime:
         
 
         
+
+    def test_readDynameqSections(self):
+
+        contents = """<DYNAMEQ>
+<VERSION_1.8>
+<BASE_NETWORK_FILE>
+* comment
+NODES
+*id x y
+1 10.0 20.0
+2 30.0 40.0
+LINKS
+*id start end
+* another comment
+10 1 2
+
+MOVEMENTS
+"""
+        fileName = os.path.join(os.path.dirname(__file__), "sectionsTest.dqt")
+        for compressed in (False, True):
+            if compressed:
+                outputStream = gzip.open(fileName + ".gz", "wb")
+            else:
+                outputStream = open(fileName, "w")
+            outputStream.write(contents)
+            outputStream.close()
+
+            assert findDynameqFile(fileName) == (fileName + ".gz" if compressed else fileName)
+
+            records = []
+            readDynameqSections(fileName, [("NODES",     lambda fields: records.append(("NODES", fields))),
+                                           ("LINKS",     lambda fields: records.append(("LINKS", fields))),
+                                           ("MOVEMENTS", None)])
+            assert records == [("NODES", ["1", "10.0", "20.0"]),
+                               ("NODES", ["2", "30.0", "40.0"]),
+                               ("LINKS", ["10", "1", "2"])]
+
+            nose.tools.assert_raises(dta.DtaError, readDynameqSections, fileName, [("CENTROIDS", None)])
+            os.remove(findDynameqFile(fileName))
+
+        assert findDynameqFile(fileName) is None